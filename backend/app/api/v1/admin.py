@@ -0,0 +1,33 @@
+"""
+Admin endpoints
+"""
+import os
+
+from fastapi import APIRouter, Depends, Query
+
+from app.config.settings import settings
+from app.core.dependencies import get_current_admin
+from app.core.query_log import SlowQueryStats, slow_queries
+from app.models.user import User
+
+router = APIRouter()
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    order_by: str = Query("total_ms", pattern="^(" + "|".join(SlowQueryStats.ORDERINGS) + ")$"),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Slowest statement templates seen by this worker"""
+    return {
+        "pid": os.getpid(),
+        "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+        "explain_enabled": settings.SLOW_QUERY_EXPLAIN,
+        "queries": [query.to_dict() for query in slow_queries.top(limit, order_by)],
+    }
+
+@router.delete("/slow-queries")
+async def reset_slow_queries(current_admin: User = Depends(get_current_admin)):
+    """Clear the slow-query statistics of this worker"""
+    slow_queries.reset()
+    return {"message": "Slow-query statistics cleared"}
@@ -4,10 +4,11 @@ Appointment System API Endpoints
 from typing import List, Optional
 from datetime import datetime
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.dependencies import get_db, get_current_user
+from app.models.appointment import AppointmentFeedback as AppointmentFeedbackModel
 from app.models.user import User
 from app.schemas.appointment import (
     AppointmentCreate,
@@ -17,13 +18,18 @@ from app.schemas.appointment import (
     AppointmentSearchParams,
     AppointmentStats,
     DoctorAvailability,
+    EarliestSlot,
     AppointmentFeedback
 )
+from app.models.doctor import ConsultationType
+from app.schemas.doctor import DoctorSearchParams, GeoLocation
 from app.services.appointment_service import (
     create_appointment,
+    get_appointment,
     update_appointment,
     cancel_appointment,
     get_doctor_availability,
+    find_earliest_slots,
     get_appointment_stats,
     search_appointments
 )
@@ -33,7 +39,7 @@ router = APIRouter(prefix="/appointments", tags=["appointments"])
 @router.post("/", response_model=AppointmentInDB)
 async def create_new_appointment(
     appointment: AppointmentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """إنشاء موعد جديد"""
@@ -45,23 +51,18 @@ async def create_new_appointment(
                 detail="غير مصرح لك بحجز مواعيد لمرضى آخرين"
             )
     
-    return create_appointment(db, appointment)
+    return await create_appointment(db, appointment)
 
 @router.put("/{appointment_id}", response_model=AppointmentInDB)
 async def update_existing_appointment(
     appointment_id: UUID,
     update_data: AppointmentUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """تحديث موعد موجود"""
     # التحقق من الصلاحيات
-    appointment = db.query(AppointmentInDB).filter(AppointmentInDB.id == appointment_id).first()
-    if not appointment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="الموعد غير موجود"
-        )
+    appointment = await get_appointment(db, appointment_id)
     
     if current_user.role not in ["doctor", "admin"]:
         if appointment.patient_id != current_user.id:
@@ -70,23 +71,18 @@ async def update_existing_appointment(
                 detail="غير مصرح لك بتحديث هذا الموعد"
             )
     
-    return update_appointment(db, appointment_id, update_data)
+    return await update_appointment(db, appointment_id, update_data)
 
 @router.delete("/{appointment_id}", response_model=AppointmentInDB)
 async def cancel_existing_appointment(
     appointment_id: UUID,
     cancellation_reason: str = Query(..., min_length=10, max_length=500),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """إلغاء موعد"""
     # التحقق من الصلاحيات
-    appointment = db.query(AppointmentInDB).filter(AppointmentInDB.id == appointment_id).first()
-    if not appointment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="الموعد غير موجود"
-        )
+    appointment = await get_appointment(db, appointment_id)
     
     is_doctor = current_user.role == "doctor" and appointment.doctor_id == current_user.id
     is_patient = appointment.patient_id == current_user.id
@@ -98,7 +94,7 @@ async def cancel_existing_appointment(
             detail="غير مصرح لك بإلغاء هذا الموعد"
         )
     
-    return cancel_appointment(
+    return await cancel_appointment(
         db,
         appointment_id,
         cancellation_reason,
@@ -110,11 +106,48 @@ async def get_doctor_available_slots(
     doctor_id: UUID,
     start_date: datetime = Query(...),
     end_date: datetime = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """الحصول على الفترات المتاحة للطبيب"""
-    return get_doctor_availability(db, doctor_id, start_date, end_date)
+    return await get_doctor_availability(db, doctor_id, start_date, end_date)
+
+@router.get("/earliest-slots", response_model=List[EarliestSlot])
+async def get_earliest_slots(
+    start_date: datetime = Query(...),
+    end_date: datetime = Query(...),
+    specialization: Optional[str] = None,
+    city: Optional[str] = None,
+    consultation_type: Optional[ConsultationType] = None,
+    latitude: Optional[float] = Query(None, ge=-90, le=90, description="خط العرض"),
+    longitude: Optional[float] = Query(None, ge=-180, le=180, description="خط الطول"),
+    radius_km: float = Query(10.0, gt=0, description="نصف قطر البحث"),
+    duration_minutes: int = Query(30, ge=15, le=180),
+    limit: int = Query(10, ge=1, le=100),
+    per_doctor: int = Query(1, ge=1, le=20, description="أقصى عدد مواعيد لكل طبيب"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """أقرب المواعيد الحرة لدى كل الأطباء المطابقين (مثل أقرب موعد قلب هذا الأسبوع)
+
+    يُرجع 422 إذا طابقت المعايير أكثر من EARLIEST_SLOTS_MAX_DOCTORS طبيباً.
+    """
+    doctor_filter = DoctorSearchParams(
+        specialization=specialization,
+        city=city,
+        consultation_type=consultation_type,
+        location=GeoLocation(latitude=latitude, longitude=longitude) if latitude is not None and longitude is not None else None,
+        radius_km=radius_km
+    )
+    return await find_earliest_slots(
+        db,
+        doctor_filter,
+        start_date,
+        end_date,
+        duration_minutes=duration_minutes,
+        limit=limit,
+        per_doctor=per_doctor
+    )
 
 @router.get("/stats", response_model=AppointmentStats)
 async def get_appointments_statistics(
@@ -122,7 +155,7 @@ async def get_appointments_statistics(
     patient_id: Optional[UUID] = Query(None),
     start_date: Optional[datetime] = Query(None),
     end_date: Optional[datetime] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """الحصول على إحصائيات المواعيد"""
@@ -139,12 +172,16 @@ async def get_appointments_statistics(
                 detail="غير مصرح لك بعرض إحصائيات الأطباء"
             )
     
-    return get_appointment_stats(db, doctor_id, patient_id, start_date, end_date)
+    return await get_appointment_stats(db, doctor_id, patient_id, start_date, end_date)
 
 @router.post("/search", response_model=List[AppointmentInDB])
 async def search_appointments_list(
     params: AppointmentSearchParams,
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """البحث عن المواعيد"""
@@ -156,23 +193,20 @@ async def search_appointments_list(
         # الأطباء يمكنهم فقط البحث عن مواعيدهم
         params.doctor_id = current_user.id
     
-    return search_appointments(db, params)
+    page = await search_appointments(db, params, cursor, limit, include_total)
+    response.headers.update(page.headers())
+    return page.items
 
 @router.post("/{appointment_id}/feedback", response_model=AppointmentFeedback)
 async def submit_appointment_feedback(
     appointment_id: UUID,
     feedback: AppointmentFeedback,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """تقديم تقييم للموعد"""
     # التحقق من الصلاحيات
-    appointment = db.query(AppointmentInDB).filter(AppointmentInDB.id == appointment_id).first()
-    if not appointment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="الموعد غير موجود"
-        )
+    appointment = await get_appointment(db, appointment_id)
     
     if appointment.patient_id != current_user.id:
         raise HTTPException(
@@ -193,7 +227,7 @@ async def submit_appointment_feedback(
         )
     
     # حفظ التقييم
-    db_feedback = AppointmentFeedback(
+    db_feedback = AppointmentFeedbackModel(
         appointment_id=appointment_id,
         **feedback.dict(exclude={"appointment_id"})
     )
@@ -203,7 +237,7 @@ async def submit_appointment_feedback(
     # تحديث حالة التقييم في الموعد
     appointment.feedback_submitted = True
     
-    db.commit()
-    db.refresh(db_feedback)
+    await db.commit()
+    await db.refresh(db_feedback)
     
     return db_feedback
@@ -8,6 +8,7 @@ from uuid import UUID
 import json
 
 from app.core.dependencies import get_db, get_current_patient, get_current_doctor
+from app.core.responses import orm_response
 from app.services.chat_service import ChatService
 from app.models.chat import ChatType, ChatStatus
 from app.models.user import User
@@ -107,7 +108,7 @@ async def get_chat_messages(
             )
         
         messages = await chat_service.get_session_messages(session_id, limit)
-        return [ChatMessageResponse.from_orm(msg) for msg in messages]
+        return orm_response(ChatMessageResponse, messages)
     except HTTPException:
         raise
     except Exception as e:
@@ -155,7 +156,9 @@ async def chat_websocket(
                 
                 # Send response
                 await websocket.send_json({
-                    "message": ChatMessageResponse.from_orm(assistant_msg).dict(),
+                    "message": ChatMessageResponse.model_validate(
+                        assistant_msg, from_attributes=True
+                    ).model_dump(mode="json"),
                     "requires_escalation": requires_escalation
                 })
                 
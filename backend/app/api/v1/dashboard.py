@@ -4,8 +4,10 @@ Doctor Dashboard API Endpoints
 from typing import List, Optional
 from datetime import date, datetime
 from fastapi import APIRouter, Depends, Query, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config.database import get_read_db
+from app.core.query_log import query_budget
 from app.core.dependencies import get_db, get_current_doctor
 from app.models.doctor import Doctor
 from app.schemas.dashboard import (
@@ -43,7 +45,7 @@ async def get_doctor_dashboard(
     patient_groups: Optional[List[str]] = Query(None),
     conditions: Optional[List[str]] = Query(None),
     locations: Optional[List[str]] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """
@@ -85,7 +87,7 @@ async def get_doctor_dashboard(
 async def get_doctor_appointment_stats(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على إحصائيات المواعيد"""
@@ -99,7 +101,7 @@ async def get_doctor_appointment_stats(
 async def get_doctor_revenue_stats(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على إحصائيات الإيرادات"""
@@ -113,7 +115,7 @@ async def get_doctor_revenue_stats(
 async def get_doctor_patient_stats(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على إحصائيات المرضى"""
@@ -127,7 +129,7 @@ async def get_doctor_patient_stats(
 async def get_doctor_treatment_stats(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على إحصائيات العلاج"""
@@ -138,10 +140,11 @@ async def get_doctor_treatment_stats(
     return await get_treatment_stats(db, current_doctor.id, time_range)
 
 @router.get("/dashboard/chats", response_model=ChatStats)
+@query_budget(8)
 async def get_doctor_chat_stats(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على إحصائيات المحادثات"""
@@ -152,9 +155,10 @@ async def get_doctor_chat_stats(
     return await get_chat_stats(db, current_doctor.id, time_range)
 
 @router.get("/dashboard/schedule/{date}", response_model=DailySchedule)
+@query_budget(5)
 async def get_doctor_daily_schedule(
     date: date,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على الجدول اليومي"""
@@ -162,15 +166,16 @@ async def get_doctor_daily_schedule(
 
 @router.get("/dashboard/performance", response_model=List[PerformanceMetric])
 async def get_doctor_performance_metrics(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على مقاييس الأداء"""
     return await get_performance_metrics(db, current_doctor.id)
 
 @router.get("/dashboard/alerts", response_model=List[Alert])
+@query_budget(8)
 async def get_doctor_alerts(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """الحصول على التنبيهات"""
@@ -179,7 +184,7 @@ async def get_doctor_alerts(
 @router.post("/dashboard/alerts/{alert_id}/read")
 async def mark_alert_as_read(
     alert_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     """تحديد تنبيه كمقروء"""
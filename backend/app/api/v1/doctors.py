@@ -2,10 +2,12 @@
 Doctor and Hospital Search API Endpoints
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Query, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config.database import get_read_db
 from app.core.dependencies import get_db, get_current_user
+from app.core.pagination import CountMode, total_headers
 from app.schemas.doctor import (
     DoctorPublic,
     DoctorDetail,
@@ -33,6 +35,7 @@ router = APIRouter()
 
 @router.get("/doctors/search", response_model=List[DoctorPublic])
 async def search_doctors_endpoint(
+    response: Response,
     query: Optional[str] = None,
     specialization: Optional[str] = None,
     city: Optional[str] = None,
@@ -49,7 +52,8 @@ async def search_doctors_endpoint(
     distance_unit: DistanceUnit = Query(DistanceUnit.KM, description="وحدة قياس المسافة (كم/ميل)"),
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    count: CountMode = Query(CountMode.EXACT, description="طريقة حساب الإجمالي (دقيق/تقديري/تلقائي)"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     البحث عن الأطباء باستخدام معايير متعددة
@@ -89,20 +93,16 @@ async def search_doctors_endpoint(
     )
     
     # تنفيذ البحث
-    doctors, total = search_doctors(db, search_params, limit, offset)
+    doctors, total = await search_doctors(db, search_params, limit, offset, count)
     
     # إضافة معلومات الصفحات في الرأس
-    return {
-        "items": doctors,
-        "total": total,
-        "limit": limit,
-        "offset": offset
-    }
+    response.headers.update(total_headers(total))
+    return doctors
 
 @router.get("/doctors/{doctor_id}", response_model=DoctorDetail)
 async def get_doctor_details(
     doctor_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     الحصول على التفاصيل الكاملة لطبيب محدد
@@ -117,6 +117,7 @@ async def get_doctor_details(
 
 @router.get("/hospitals/search", response_model=List[HospitalPublic])
 async def search_hospitals_endpoint(
+    response: Response,
     query: Optional[str] = None,
     type: Optional[str] = None,
     city: Optional[str] = None,
@@ -129,7 +130,8 @@ async def search_hospitals_endpoint(
     radius_km: Optional[float] = Query(None, gt=0),
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    count: CountMode = Query(CountMode.EXACT, description="طريقة حساب الإجمالي (دقيق/تقديري/تلقائي)"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     البحث عن المستشفيات باستخدام معايير متعددة
@@ -158,20 +160,16 @@ async def search_hospitals_endpoint(
     )
     
     # تنفيذ البحث
-    hospitals, total = search_hospitals(db, search_params, limit, offset)
+    hospitals, total = await search_hospitals(db, search_params, limit, offset, count)
     
     # إضافة معلومات الصفحات في الرأس
-    return {
-        "items": hospitals,
-        "total": total,
-        "limit": limit,
-        "offset": offset
-    }
+    response.headers.update(total_headers(total))
+    return hospitals
 
 @router.get("/hospitals/{hospital_id}", response_model=HospitalPublic)
 async def get_hospital_details(
     hospital_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     الحصول على التفاصيل الكاملة لمستشفى محدد
@@ -189,7 +187,7 @@ async def create_review(
     doctor_id: str,
     review: ReviewCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     إنشاء تقييم جديد لطبيب
@@ -218,7 +216,7 @@ async def update_review(
     review_id: str,
     review_update: ReviewUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     تحديث تقييم موجود
@@ -244,7 +242,7 @@ async def get_doctor_reviews_endpoint(
     doctor_id: str,
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     الحصول على تقييمات طبيب محدد
@@ -5,9 +5,12 @@ from typing import List, Optional
 from datetime import datetime
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config.database import get_read_db
 from app.core.dependencies import get_db, get_current_user
+from app.models.follow_up import Interaction
 from app.models.user import User
 from app.schemas.follow_up import (
     InteractionCreate,
@@ -33,7 +36,7 @@ router = APIRouter(prefix="/follow-up", tags=["follow-up"])
 @router.post("/interactions/", response_model=InteractionInDB)
 async def create_new_interaction(
     interaction: InteractionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """إنشاء تفاعل جديد"""
@@ -45,18 +48,19 @@ async def create_new_interaction(
                 detail="غير مصرح لك بإنشاء تفاعلات لمرضى آخرين"
             )
     
-    return create_interaction(db, interaction)
+    return await create_interaction(db, interaction)
 
 @router.put("/interactions/{interaction_id}", response_model=InteractionInDB)
 async def update_existing_interaction(
     interaction_id: UUID,
     update_data: InteractionUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """تحديث تفاعل موجود"""
     # التحقق من وجود التفاعل وصلاحيات المستخدم
-    interaction = db.query(InteractionInDB).filter(InteractionInDB.id == interaction_id).first()
+    result = await db.execute(select(Interaction).where(Interaction.id == interaction_id))
+    interaction = result.scalar_one_or_none()
     if not interaction:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -70,7 +74,7 @@ async def update_existing_interaction(
                 detail="غير مصرح لك بتحديث هذا التفاعل"
             )
     
-    return update_interaction(db, interaction_id, update_data)
+    return await update_interaction(db, interaction_id, update_data)
 
 @router.get("/timeline/patient/{patient_id}", response_model=Timeline)
 async def get_patient_interaction_timeline(
@@ -78,7 +82,7 @@ async def get_patient_interaction_timeline(
     start_date: Optional[datetime] = Query(None),
     end_date: Optional[datetime] = Query(None),
     interaction_types: Optional[List[str]] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """الحصول على الجدول الزمني للمريض"""
@@ -90,7 +94,7 @@ async def get_patient_interaction_timeline(
                 detail="غير مصرح لك بعرض تفاعلات مرضى آخرين"
             )
     
-    return get_patient_timeline(
+    return await get_patient_timeline(
         db,
         patient_id,
         start_date,
@@ -103,7 +107,7 @@ async def get_interaction_analytics(
     filters: AnalyticsFilter,
     patient_id: Optional[UUID] = Query(None),
     doctor_id: Optional[UUID] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """الحصول على تحليلات التفاعلات"""
@@ -120,12 +124,12 @@ async def get_interaction_analytics(
                 detail="غير مصرح لك بعرض تحليلات الأطباء"
             )
     
-    return get_analytics_summary(db, patient_id, doctor_id, filters)
+    return await get_analytics_summary(db, patient_id, doctor_id, filters)
 
 @router.get("/summary/patient/{patient_id}", response_model=PatientSummary)
 async def get_patient_interaction_summary(
     patient_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """الحصول على ملخص المريض"""
@@ -137,12 +141,12 @@ async def get_patient_interaction_summary(
                 detail="غير مصرح لك بعرض ملخص مرضى آخرين"
             )
     
-    return get_patient_summary(db, patient_id)
+    return await get_patient_summary(db, patient_id)
 
 @router.get("/summary/doctor/{doctor_id}", response_model=DoctorSummary)
 async def get_doctor_interaction_summary(
     doctor_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """الحصول على ملخص الطبيب"""
@@ -159,4 +163,4 @@ async def get_doctor_interaction_summary(
             detail="غير مصرح لك بعرض ملخص أطباء آخرين"
         )
     
-    return get_doctor_summary(db, doctor_id) 
\ No newline at end of file
+    return await get_doctor_summary(db, doctor_id) 
\ No newline at end of file
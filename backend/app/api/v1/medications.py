@@ -4,9 +4,12 @@ Medication endpoints
 from datetime import datetime
 from typing import List, Optional, Tuple
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query, File, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, File, Response, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config.database import read_replica
+from app.core.pagination import CountMode, InvalidCursor
+from app.core.query_log import query_budget
 from app.core.dependencies import (
     get_db,
     get_current_user,
@@ -33,7 +36,7 @@ from app.services.payment_service import PaymentService
 router = APIRouter(prefix="/medications", tags=["medications"])
 
 def get_medication_service(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     notification_service: NotificationService = Depends(),
     payment_service: PaymentService = Depends()
 ) -> MedicationService:
@@ -47,34 +50,44 @@ async def create_medication(
 ):
     """Create a new medication (Admin only)"""
     try:
-        return medication_service.create_medication(medication_data)
+        return await medication_service.create_medication(medication_data)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("", response_model=List[MedicationResponse])
+@read_replica
 async def search_medications(
+    response: Response,
     query: Optional[str] = None,
     category: Optional[str] = None,
     type: Optional[str] = None,
     manufacturer: Optional[str] = None,
     requires_prescription: Optional[bool] = None,
     in_stock: Optional[bool] = None,
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = None,
     per_page: int = Query(20, ge=1, le=100),
+    include_total: bool = False,
+    count: CountMode = CountMode.EXACT,
     medication_service: MedicationService = Depends(get_medication_service)
 ):
     """Search medications with filters"""
-    medications, total = medication_service.search_medications(
-        query,
-        category,
-        type,
-        manufacturer,
-        requires_prescription,
-        in_stock,
-        page,
-        per_page
-    )
-    return medications
+    try:
+        page = await medication_service.search_medications(
+            query,
+            category,
+            type,
+            manufacturer,
+            requires_prescription,
+            in_stock,
+            cursor,
+            per_page,
+            include_total,
+            count
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(page.headers())
+    return page.items
 
 @router.get("/{medication_id}", response_model=MedicationResponse)
 async def get_medication(
@@ -82,7 +95,7 @@ async def get_medication(
     medication_service: MedicationService = Depends(get_medication_service)
 ):
     """Get medication by ID"""
-    medication = medication_service.get_medication(medication_id)
+    medication = await medication_service.get_medication(medication_id)
     if not medication:
         raise HTTPException(status_code=404, detail="Medication not found")
     return medication
@@ -96,7 +109,7 @@ async def update_medication(
 ):
     """Update medication (Admin only)"""
     try:
-        return medication_service.update_medication(
+        return await medication_service.update_medication(
             medication_id,
             medication_data
         )
@@ -111,7 +124,7 @@ async def create_inventory_transaction(
 ):
     """Create inventory transaction (Admin only)"""
     try:
-        return medication_service.create_inventory_transaction(
+        return await medication_service.create_inventory_transaction(
             transaction_data,
             current_admin.id
         )
@@ -126,26 +139,33 @@ async def create_order(
 ):
     """Create a new order"""
     try:
-        return medication_service.create_order(current_user.id, order_data)
+        return await medication_service.create_order(current_user.id, order_data)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/orders", response_model=List[OrderResponse])
 async def get_user_orders(
+    response: Response,
     status: Optional[str] = None,
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = None,
     per_page: int = Query(20, ge=1, le=100),
+    include_total: bool = False,
     current_user: User = Depends(get_current_user),
     medication_service: MedicationService = Depends(get_medication_service)
 ):
     """Get user's orders"""
-    orders, total = medication_service.get_user_orders(
-        current_user.id,
-        status,
-        page,
-        per_page
-    )
-    return orders
+    try:
+        page = await medication_service.get_user_orders(
+            current_user.id,
+            status,
+            cursor,
+            per_page,
+            include_total
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(page.headers())
+    return page.items
 
 @router.get("/orders/{order_id}", response_model=OrderResponse)
 async def get_order(
@@ -154,7 +174,7 @@ async def get_order(
     medication_service: MedicationService = Depends(get_medication_service)
 ):
     """Get order by ID"""
-    order = medication_service.get_order(order_id)
+    order = await medication_service.get_order(order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
         
@@ -164,6 +184,7 @@ async def get_order(
     return order
 
 @router.put("/orders/{order_id}/status")
+@query_budget(12)
 async def update_order_status(
     order_id: UUID,
     status: str,
@@ -173,7 +194,7 @@ async def update_order_status(
 ):
     """Update order status (Admin only)"""
     try:
-        return medication_service.update_order_status(
+        return await medication_service.update_order_status(
             order_id,
             status,
             tracking_number
@@ -190,7 +211,7 @@ async def create_prescription(
 ):
     """Create a new prescription (Doctor only)"""
     try:
-        return medication_service.create_prescription(
+        return await medication_service.create_prescription(
             current_doctor.id,
             patient_id,
             prescription_data
@@ -207,7 +228,7 @@ async def verify_prescription(
 ):
     """Verify prescription (Admin only)"""
     try:
-        return medication_service.verify_prescription(
+        return await medication_service.verify_prescription(
             prescription_id,
             current_admin.id,
             approve
@@ -217,35 +238,49 @@ async def verify_prescription(
 
 @router.get("/prescriptions", response_model=List[PrescriptionResponse])
 async def get_patient_prescriptions(
+    response: Response,
     active_only: bool = False,
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = None,
     per_page: int = Query(20, ge=1, le=100),
+    include_total: bool = False,
     current_user: User = Depends(get_current_user),
     medication_service: MedicationService = Depends(get_medication_service)
 ):
     """Get patient's prescriptions"""
-    prescriptions, total = medication_service.get_patient_prescriptions(
-        current_user.id,
-        active_only,
-        page,
-        per_page
-    )
-    return prescriptions
+    try:
+        page = await medication_service.get_patient_prescriptions(
+            current_user.id,
+            active_only,
+            cursor,
+            per_page,
+            include_total
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(page.headers())
+    return page.items
 
 @router.get("/prescriptions/doctor", response_model=List[PrescriptionResponse])
 async def get_doctor_prescriptions(
-    page: int = Query(1, ge=1),
+    response: Response,
+    cursor: Optional[str] = None,
     per_page: int = Query(20, ge=1, le=100),
+    include_total: bool = False,
     current_doctor: Doctor = Depends(get_current_doctor),
     medication_service: MedicationService = Depends(get_medication_service)
 ):
     """Get doctor's prescriptions"""
-    prescriptions, total = medication_service.get_doctor_prescriptions(
-        current_doctor.id,
-        page,
-        per_page
-    )
-    return prescriptions
+    try:
+        page = await medication_service.get_doctor_prescriptions(
+            current_doctor.id,
+            cursor,
+            per_page,
+            include_total
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(page.headers())
+    return page.items
 
 @router.get("/prescriptions/{prescription_id}", response_model=PrescriptionResponse)
 async def get_prescription(
@@ -254,7 +289,7 @@ async def get_prescription(
     medication_service: MedicationService = Depends(get_medication_service)
 ):
     """Get prescription by ID"""
-    prescription = medication_service.get_prescription(prescription_id)
+    prescription = await medication_service.get_prescription(prescription_id)
     if not prescription:
         raise HTTPException(status_code=404, detail="Prescription not found")
         
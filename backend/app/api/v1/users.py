@@ -3,7 +3,7 @@ User management API endpoints
 """
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
 from app.core.dependencies import get_db, get_current_user, get_current_active_user
@@ -34,7 +34,7 @@ async def get_current_user_info(
 async def update_current_user(
     user_data: UserUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> UserResponse:
     """تحديث معلومات المستخدم الحالي"""
     user_service = UserService(db)
@@ -44,7 +44,7 @@ async def update_current_user(
 async def get_user(
     user_id: UUID,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> UserResponse:
     """الحصول على معلومات مستخدم محدد"""
     if not current_user.is_admin and current_user.id != user_id:
@@ -69,7 +69,7 @@ async def list_users(
     limit: int = Query(10, ge=1, le=100),
     role: Optional[UserRole] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> List[UserResponse]:
     """الحصول على قائمة المستخدمين"""
     user_service = UserService(db)
@@ -78,7 +78,7 @@ async def list_users(
 @router.post("/patients", response_model=PatientResponse)
 async def create_patient(
     patient_data: PatientCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> PatientResponse:
     """إنشاء مريض جديد"""
     user_service = UserService(db)
@@ -88,7 +88,7 @@ async def create_patient(
 async def get_patient(
     patient_id: UUID,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> PatientResponse:
     """الحصول على معلومات مريض محدد"""
     if not current_user.is_admin and not current_user.is_doctor and current_user.id != patient_id:
@@ -111,7 +111,7 @@ async def update_patient(
     patient_id: UUID,
     patient_data: PatientUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> PatientResponse:
     """تحديث معلومات مريض"""
     if not current_user.is_admin and current_user.id != patient_id:
@@ -129,7 +129,7 @@ async def list_patients(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> List[PatientResponse]:
     """الحصول على قائمة المرضى"""
     user_service = UserService(db)
@@ -138,7 +138,7 @@ async def list_patients(
 @router.post("/doctors", response_model=DoctorResponse)
 async def create_doctor(
     doctor_data: DoctorCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> DoctorResponse:
     """إنشاء طبيب جديد"""
     user_service = UserService(db)
@@ -148,7 +148,7 @@ async def create_doctor(
 async def get_doctor(
     doctor_id: UUID,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> DoctorResponse:
     """الحصول على معلومات طبيب محدد"""
     user_service = UserService(db)
@@ -165,7 +165,7 @@ async def update_doctor(
     doctor_id: UUID,
     doctor_data: DoctorUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> DoctorResponse:
     """تحديث معلومات طبيب"""
     if not current_user.is_admin and current_user.id != doctor_id:
@@ -183,7 +183,7 @@ async def list_doctors(
     limit: int = Query(10, ge=1, le=100),
     specialization: Optional[str] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> List[DoctorResponse]:
     """الحصول على قائمة الأطباء"""
     user_service = UserService(db)
@@ -198,7 +198,7 @@ async def list_doctors(
 @has_permission([UserRole.ADMIN])
 async def delete_user(
     user_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> dict:
     """حذف مستخدم"""
     user_service = UserService(db)
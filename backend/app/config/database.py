@@ -1,28 +1,69 @@
 """
 Database Configuration and Connection Management
+
+Writes and lag-sensitive reads go to the primary (get_db). Read-only
+endpoints can use the replica engine (DATABASE_REPLICA_URL) in two ways:
+
+- depend on get_read_db instead of get_db, or
+- keep get_db and mark the endpoint with @read_replica, which also covers
+  dependencies that take get_db themselves (e.g. class-based services).
+
+@primary_only pins an endpoint that uses get_read_db back to the primary.
+When the replica cannot be reached, reads fall back to the primary and the
+replica is skipped for DATABASE_REPLICA_RETRY_SECONDS.
 """
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional, Sequence, TypeVar
+import asyncio
+import logging
+import time
+
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from fastapi import Request
+from sqlalchemy import Select, func, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    create_async_engine,
+    AsyncSession,
+    async_sessionmaker,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.pool import NullPool
-import logging
 
 from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
-# Create async engine
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations" / "alembic"
+
+# Create async engine (tests use NullPool, which takes no sizing arguments)
+pool_options = {"poolclass": NullPool} if settings.TESTING else {
+    "pool_size": settings.DATABASE_POOL_SIZE,
+    "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+    "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+    "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+}
 engine = create_async_engine(
-    settings.DATABASE_URL,
+    settings.database_url,
     echo=settings.DEBUG,
-    pool_size=settings.DATABASE_POOL_SIZE,
-    max_overflow=settings.DATABASE_MAX_OVERFLOW,
-    pool_timeout=settings.DATABASE_POOL_TIMEOUT,
-    pool_recycle=settings.DATABASE_POOL_RECYCLE,
-    poolclass=NullPool if settings.TESTING else None,
-    future=True
+    future=True,
+    **pool_options
 )
 
-# Create session factory
+replica_engine: Optional[AsyncEngine] = None
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        settings.DATABASE_REPLICA_URL,
+        echo=settings.DEBUG,
+        future=True,
+        **pool_options
+    )
+
+# Create session factories
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -31,12 +72,69 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False
 )
 
+ReadSessionLocal = async_sessionmaker(
+    replica_engine or engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
 # Create base class for models
 Base = declarative_base()
 
-# Database dependency
-async def get_db() -> AsyncSession:
-    """Database session dependency"""
+# Read routing
+ROUTE_ATTRIBUTE = "__db_route__"
+PRIMARY = "primary"
+REPLICA = "replica"
+
+Endpoint = TypeVar("Endpoint", bound=Callable)
+
+def read_replica(endpoint: Endpoint) -> Endpoint:
+    """Serve every get_db session of this endpoint from the replica"""
+    setattr(endpoint, ROUTE_ATTRIBUTE, REPLICA)
+    return endpoint
+
+def primary_only(endpoint: Endpoint) -> Endpoint:
+    """Keep this endpoint on the primary even where it asks for get_read_db"""
+    setattr(endpoint, ROUTE_ATTRIBUTE, PRIMARY)
+    return endpoint
+
+def endpoint_route(request: Optional[Request]) -> Optional[str]:
+    """Route set on the matched endpoint by read_replica/primary_only"""
+    if request is None:
+        return None
+    return getattr(request.scope.get("endpoint"), ROUTE_ATTRIBUTE, None)
+
+_replica_retry_at = 0.0
+
+def replica_available() -> bool:
+    return replica_engine is not None and time.monotonic() >= _replica_retry_at
+
+def mark_replica_down(error: Exception) -> None:
+    global _replica_retry_at
+    _replica_retry_at = time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+    logger.warning(
+        f"Read replica unavailable, using the primary for "
+        f"{settings.DATABASE_REPLICA_RETRY_SECONDS}s: {error}"
+    )
+
+async def open_read_session() -> AsyncSession:
+    """Replica session, or a primary session when the replica is down"""
+    if replica_available():
+        session = ReadSessionLocal()
+        try:
+            # Check out the connection now so a dead replica fails here
+            await session.connection()
+            return session
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError) as e:
+            await session.close()
+            mark_replica_down(e)
+    return AsyncSessionLocal()
+
+@asynccontextmanager
+async def primary_session() -> AsyncIterator[AsyncSession]:
+    """Primary session, committed on success and rolled back on error"""
     async with AsyncSessionLocal() as session:
         try:
             yield session
@@ -44,10 +142,40 @@ async def get_db() -> AsyncSession:
         except Exception:
             await session.rollback()
             raise
-        finally:
-            await session.close()
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
+    """Read-only session; nothing is committed"""
+    session = await open_read_session()
+    try:
+        yield session
+    finally:
+        await session.rollback()
+        await session.close()
+
+# Database dependencies
+async def get_db(request: Request = None) -> AsyncIterator[AsyncSession]:
+    """Database session dependency (primary unless the endpoint is @read_replica)"""
+    use_replica = endpoint_route(request) == REPLICA
+    async with (read_session() if use_replica else primary_session()) as session:
+        yield session
+
+async def get_read_db(request: Request = None) -> AsyncIterator[AsyncSession]:
+    """Read-only session dependency (replica unless the endpoint is @primary_only)"""
+    use_primary = endpoint_route(request) == PRIMARY
+    async with (primary_session() if use_primary else read_session()) as session:
+        yield session
 
 # Database utilities
+async def count_rows(db: AsyncSession, query: Select) -> int:
+    """Number of rows a select() would return, counted in the database"""
+    return await db.scalar(
+        select(func.count()).select_from(query.order_by(None).subquery())
+    )
+
+class SchemaVersionError(RuntimeError):
+    """The database is not at the alembic head of this build"""
+
 class DatabaseManager:
     """Database management utilities"""
     
@@ -70,9 +198,57 @@ class DatabaseManager:
         """Check database connection"""
         try:
             async with engine.begin() as conn:
-                await conn.execute("SELECT 1")
+                await conn.execute(text("SELECT 1"))
             logger.info("Database connection successful")
             return True
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    @staticmethod
+    async def check_schema_version() -> str:
+        """Fail unless the database is at the head of the migrations directory"""
+        expected = set(ScriptDirectory(str(MIGRATIONS_DIR)).get_heads())
+        async with engine.connect() as conn:
+            current = set(await conn.run_sync(
+                lambda sync_conn: MigrationContext.configure(sync_conn).get_current_heads()
+            ))
+        if current != expected:
+            raise SchemaVersionError(
+                f"Database schema is at {sorted(current) or 'no revision'}, "
+                f"migrations head is {sorted(expected)}; run `alembic upgrade head`"
+            )
+        return ", ".join(sorted(current))
+    
+    @staticmethod
+    async def prewarm(connections: int, warmup_queries: Sequence[str] = ("SELECT 1",)) -> int:
+        """Open up to `connections` pooled connections at once and run warmup queries on each"""
+        opened = 0
+        for warm_engine in filter(None, (engine, replica_engine)):
+            pool = warm_engine.sync_engine.pool
+            if not hasattr(pool, "size"):
+                # NullPool keeps nothing around to warm
+                continue
+            results = await asyncio.gather(
+                *(open_warm_connection(warm_engine, warmup_queries)
+                  for _ in range(min(connections, pool.size()))),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    logger.warning(f"Connection prewarm failed: {result}")
+                    continue
+                # closing returns the connection to the pool, still open
+                await result.close()
+                opened += 1
+        return opened
+
+async def open_warm_connection(warm_engine: AsyncEngine, warmup_queries: Sequence[str]) -> AsyncConnection:
+    conn = await warm_engine.connect()
+    try:
+        for query in warmup_queries:
+            await conn.execute(text(query))
+    except BaseException:
+        await conn.close()
+        raise
+    return conn
\ No newline at end of file
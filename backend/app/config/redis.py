@@ -0,0 +1,147 @@
+"""
+Redis Configuration and Connection Pool
+
+The whole process shares one async client backed by a bounded connection
+pool. It is created in the application lifespan hook (init_redis) and handed
+out by get_redis_client / the get_redis dependency; nothing else should
+construct Redis clients.
+
+The shared client decodes replies to str. Binary values (the slot bitmaps)
+are read through get_redis_bytes_client, a second client on its own pool that
+returns raw bytes, so they never have to be re-encoded on the server.
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+import asyncio
+import logging
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+
+from app.config.settings import settings
+from app.core.metrics import InstrumentedRedis
+
+logger = logging.getLogger(__name__)
+
+redis_pool: Optional[BlockingConnectionPool] = None
+redis_client: Optional[Redis] = None
+redis_bytes_pool: Optional[BlockingConnectionPool] = None
+redis_bytes_client: Optional[Redis] = None
+
+def create_redis_pool(decode_responses: bool = True) -> BlockingConnectionPool:
+    """Bounded pool: callers wait for a free connection instead of opening more"""
+    return BlockingConnectionPool.from_url(
+        settings.redis_url,
+        max_connections=settings.REDIS_POOL_SIZE,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        health_check_interval=30,
+        encoding="utf-8",
+        decode_responses=decode_responses,
+    )
+
+def create_client(pool: BlockingConnectionPool) -> Redis:
+    # InstrumentedRedis records per-command latency and tracing spans, each
+    # behind its own flag; a plain client skips the wrapper when both are off
+    instrumented = settings.ENABLE_PROMETHEUS or settings.TRACING_ENABLED
+    client_class = InstrumentedRedis if instrumented else Redis
+    return client_class(connection_pool=pool)
+
+async def init_redis() -> Redis:
+    """Create the shared client (idempotent)"""
+    global redis_pool, redis_client
+    if redis_client is None:
+        redis_pool = create_redis_pool()
+        redis_client = create_client(redis_pool)
+        logger.info(
+            "Redis pool created (max %d connections)", settings.REDIS_POOL_SIZE
+        )
+    return redis_client
+
+async def close_redis() -> None:
+    """Close the shared clients and disconnect every pooled connection"""
+    global redis_pool, redis_client, redis_bytes_pool, redis_bytes_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        await redis_pool.disconnect()
+        redis_client = None
+        redis_pool = None
+    if redis_bytes_client is not None:
+        await redis_bytes_client.aclose()
+        await redis_bytes_pool.disconnect()
+        redis_bytes_client = None
+        redis_bytes_pool = None
+
+async def prewarm_redis(connections: int) -> int:
+    """Open up to `connections` pooled connections and PING each of them"""
+    client = await get_redis_client()
+    pool = client.connection_pool
+    count = min(connections, pool.max_connections)
+    # Hold every connection until all are open, otherwise the pool reuses one
+    checked_out = await asyncio.gather(
+        *(pool.get_connection("PING") for _ in range(count)),
+        return_exceptions=True
+    )
+    opened = 0
+    for connection in checked_out:
+        if isinstance(connection, BaseException):
+            logger.warning("Redis prewarm failed: %s", connection)
+            continue
+        try:
+            await connection.send_command("PING")
+            await connection.read_response()
+            opened += 1
+        except Exception as e:
+            logger.warning("Redis prewarm failed: %s", e)
+        finally:
+            await pool.release(connection)
+    return opened
+
+async def get_redis_client() -> Redis:
+    """Shared async client; created on first use outside the app lifespan"""
+    return redis_client if redis_client is not None else await init_redis()
+
+async def get_redis_bytes_client() -> Redis:
+    """Shared client returning raw bytes; created on first use"""
+    global redis_bytes_pool, redis_bytes_client
+    if redis_bytes_client is None:
+        redis_bytes_pool = create_redis_pool(decode_responses=False)
+        redis_bytes_client = create_client(redis_bytes_pool)
+    return redis_bytes_client
+
+# Pipelining helpers for multi-key operations: one round trip per call
+
+@asynccontextmanager
+async def redis_pipeline(transaction: bool = False) -> AsyncIterator[Pipeline]:
+    """Queue commands on a pipeline and execute them on exit"""
+    client = await get_redis_client()
+    async with client.pipeline(transaction=transaction) as pipe:
+        yield pipe
+        await pipe.execute()
+
+async def get_many(keys: Sequence[str]) -> List[Optional[str]]:
+    """Values for many keys in one MGET (None for missing keys)"""
+    if not keys:
+        return []
+    client = await get_redis_client()
+    return await client.mget(keys)
+
+async def set_many(mapping: Dict[str, Any], ttl: Optional[int] = None) -> None:
+    """Set many keys, optionally with a TTL in seconds, in one round trip"""
+    if not mapping:
+        return
+    if ttl is None:
+        client = await get_redis_client()
+        await client.mset(mapping)
+        return
+    async with redis_pipeline() as pipe:
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ttl)
+
+async def delete_many(keys: Sequence[str]) -> int:
+    """Delete many keys without blocking Redis on large values"""
+    if not keys:
+        return 0
+    client = await get_redis_client()
+    return await client.unlink(*keys)
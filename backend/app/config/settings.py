@@ -68,6 +68,7 @@ class Settings(BaseSettings):
     SENDGRID_API_KEY: str
     TWILIO_ACCOUNT_SID: str
     TWILIO_AUTH_TOKEN: str
+    TWILIO_PHONE_NUMBER: str = ""
     GOOGLE_MAPS_API_KEY: str
     
     # AWS S3
@@ -93,10 +94,20 @@ class Settings(BaseSettings):
     DATABASE_MAX_OVERFLOW: int = 30
     DATABASE_POOL_TIMEOUT: int = 30
     DATABASE_POOL_RECYCLE: int = 3600
+    TESTING: bool = False
+    # Read replica for read-only endpoints; empty means reads use the primary
+    DATABASE_REPLICA_URL: str = ""
+    DATABASE_REPLICA_RETRY_SECONDS: int = 30  # how long a failed replica is skipped
+    # Startup: "check" requires the alembic head, "create" runs create_all (local dev)
+    DATABASE_SCHEMA_STARTUP: str = "check"
+    DATABASE_PREWARM_CONNECTIONS: int = 5
     
     # Redis
     REDIS_DB: int = 0
     REDIS_POOL_SIZE: int = 20
+    REDIS_POOL_TIMEOUT: int = 5  # seconds to wait for a free pooled connection
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_PREWARM_CONNECTIONS: int = 5
     
     # JWT Configuration
     JWT_ISSUER: str = "medical-platform"
@@ -117,6 +128,17 @@ class Settings(BaseSettings):
     RATE_LIMIT_WINDOW: int = 3600  # 1 hour
     RATE_LIMIT_AUTH_REQUESTS: int = 5
     RATE_LIMIT_AUTH_WINDOW: int = 300  # 5 minutes
+    RATE_LIMIT_ALGORITHM: str = "sliding_window"  # or "token_bucket"
+    RATE_LIMIT_MODE: str = "redis"  # or "hybrid"
+    RATE_LIMIT_SYNC_INTERVAL: float = 1.0  # seconds between hybrid batch syncs
+    RATE_LIMIT_SYNC_THRESHOLD: float = 0.1  # sync immediately within 10% of the limit
+    RATE_LIMIT_HYBRID_MIN_LIMIT: int = 50  # smaller limits always use exact checks
+    RATE_LIMIT_HYBRID_WORKERS: int = 4  # processes sharing the limits; each spends its share between syncs
+    
+    # Response Compression
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes
+    COMPRESSION_THREAD_THRESHOLD: int = 256 * 1024  # compress larger chunks off the event loop
+    COMPRESSION_ENCODINGS: Union[List[str], str] = Field(default="zstd,br,gzip")
     
     # Email Configuration
     EMAIL_FROM: str = "noreply@medical-platform.com"
@@ -149,14 +171,44 @@ class Settings(BaseSettings):
     
     # Monitoring and Telemetry
     ENABLE_PROMETHEUS: bool = True
-    PROMETHEUS_MULTIPROC_DIR: str = "/tmp"
+    PROMETHEUS_MULTIPROC_DIR: str = "/tmp/prometheus_multiproc"
     JAEGER_AGENT_HOST: str = "localhost"
     JAEGER_AGENT_PORT: int = 6831
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "otlp"  # otlp, file or memory
+    TRACING_SAMPLE_RATE: float = 1.0  # fraction of new traces recorded
+    TRACING_FILE_PATH: str = "logs/traces.jsonl"
+    TRACING_OTLP_ENDPOINT: Optional[str] = None  # defaults to http://JAEGER_AGENT_HOST:4318/v1/traces
     LOGGING_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000  # records buffered for the logging thread
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0  # fraction of successful requests logged
+    ACCESS_LOG_SLOW_THRESHOLD: float = 1.0  # seconds; slower requests are always logged
+    SLOW_QUERY_LOG_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0
+    SLOW_QUERY_MAX_TEMPLATES: int = 200  # distinct slow statements kept in memory
+    SLOW_QUERY_EXPLAIN: bool = False  # EXPLAIN (ANALYZE, BUFFERS) slow SELECTs; re-runs them
+    SLOW_QUERY_EXPLAIN_INTERVAL: int = 600  # seconds between plans of the same statement
+    QUERY_COUNT_ENABLED: bool = True  # per-request statement counts and N+1 detection
+    N_PLUS_ONE_THRESHOLD: int = 10  # same statement this often in one request is logged
+    DEFAULT_QUERY_BUDGET: Optional[int] = None  # statements per request without @query_budget
+    QUERY_BUDGET_ENFORCE: bool = False  # fail requests over budget (always on when TESTING)
+    COUNT_ESTIMATE_THRESHOLD: int = 10000  # 'auto' totals use the planner estimate above this
+    OUTBOX_BATCH_SIZE: int = 50  # events claimed per relay round
+    OUTBOX_CONCURRENCY: int = 10  # handlers running at once per relay
+    OUTBOX_POLL_INTERVAL: float = 1.0  # seconds the relay sleeps when idle
+    OUTBOX_MAX_ATTEMPTS: int = 8  # then the event is marked failed
+    OUTBOX_RETRY_BASE_SECONDS: int = 5  # doubled on every failed attempt
+    OUTBOX_RETRY_MAX_SECONDS: int = 3600
+    OUTBOX_LEASE_SECONDS: int = 300  # a claimed event no relay has finished is claimed again after this
+    REMINDER_BATCH_SIZE: int = 100  # due reminders claimed per table and round
+    REMINDER_CONCURRENCY: int = 10  # sends running at once per channel
+    REMINDER_POLL_INTERVAL: float = 5.0  # seconds the dispatcher sleeps when idle
     
     # Security Enhancements
     ENABLE_WAF: bool = True
     WAF_RULES: Union[Dict[str, bool], str] = Field(default="sql_injection:True,xss:True,csrf:True,rate_limiting:True,ip_blacklisting:True")
+    WAF_SCAN_BODY: bool = False
+    WAF_BODY_SCAN_LIMIT: int = 64 * 1024  # bytes of each request body to scan
     MAX_LOGIN_ATTEMPTS: int = 5
     LOGIN_ATTEMPT_WINDOW: int = 900  # 15 minutes
     PASSWORD_HISTORY_SIZE: int = 5
@@ -185,6 +237,12 @@ class Settings(BaseSettings):
     GEO_SEARCH_RADIUS_KM: float = 50.0
     GEO_SEARCH_MAX_RESULTS: int = 100
     
+    # Appointments
+    SLOT_BITMAP_TTL: int = 6 * 3600  # seconds a doctor's day availability stays cached
+    REGULAR_SCHEDULE_WEEKS: int = 8  # schedule history used for the regular weekly schedule
+    EARLIEST_SLOTS_MAX_DOCTORS: int = 1000  # doctors considered by one earliest-slot search
+    EARLIEST_SLOTS_MAX_DAYS: int = 31  # longest window of one earliest-slot search
+    
     # Payment Processing
     PAYMENT_PROVIDERS: Union[List[str], str] = Field(default="stripe,paypal")
     CURRENCY: str = "USD"
@@ -307,6 +365,20 @@ class Settings(BaseSettings):
         else:
             return ["stripe", "paypal"]
 
+    @field_validator('COMPRESSION_ENCODINGS', mode='before')
+    @classmethod
+    def parse_compression_encodings(cls, v):
+        """Parse COMPRESSION_ENCODINGS from string or list"""
+        if isinstance(v, str):
+            if not v.strip():  # Empty string
+                return ["zstd", "br", "gzip"]
+            # Split by comma and strip whitespace
+            return [encoding.strip() for encoding in v.split(',') if encoding.strip()]
+        elif isinstance(v, list):
+            return v
+        else:
+            return ["zstd", "br", "gzip"]
+
     @field_validator('PHI_FIELDS', mode='before')
     @classmethod
     def parse_phi_fields(cls, v):
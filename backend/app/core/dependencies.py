@@ -1,27 +1,19 @@
 """
 Core dependencies for FastAPI application
 """
-from typing import AsyncGenerator, Optional
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError
 
-from app.config.database import async_session_maker
+from app.config.database import get_db
 from app.core.security import verify_jwt_token
 from app.models.user import User
 from app.services.auth_service import AuthService
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    """Get database session"""
-    async with async_session_maker() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
-
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
@@ -101,18 +93,12 @@ async def get_current_admin(
     return current_user
 
 # Optional dependencies for rate limiting and caching
-from redis import Redis
-from app.config.settings import get_settings
-
-settings = get_settings()
+from redis.asyncio import Redis
+from app.config.redis import get_redis_client
 
-def get_redis() -> Redis:
-    """Get Redis connection"""
-    return Redis.from_url(
-        settings.REDIS_URL,
-        encoding="utf-8",
-        decode_responses=True
-    )
+async def get_redis() -> Redis:
+    """Get the shared Redis client (pooled, created in the lifespan hook)"""
+    return await get_redis_client()
 
 # Database transaction context
 from contextlib import asynccontextmanager
@@ -0,0 +1,194 @@
+"""
+Prometheus metrics
+
+Metrics are shared across gunicorn workers through prometheus_client's
+multiprocess mode: every worker writes to memory-mapped files in
+PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them at scrape time.
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+import os
+import time
+
+from app.config.settings import settings
+from app.core.tracing import SpanKind, start_span
+
+# prometheus_client picks its value storage at import time, so the
+# multiprocess directory has to exist before it is imported. Multiprocess mode
+# is only used when the environment asks for it (gunicorn.conf.py cleans the
+# same directory); a single process keeps its metrics in memory.
+_multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if _multiproc_dir:
+    os.makedirs(_multiproc_dir, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess  # noqa: E402
+from redis.asyncio import Redis  # noqa: E402
+from redis.asyncio.client import Pipeline  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0
+)
+
+# HTTP
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+# Process lifecycle
+WORKER_STARTUP_SECONDS = Gauge(
+    "worker_startup_seconds",
+    "Time from worker process start until it was ready to serve",
+    ["phase"],
+    multiprocess_mode="liveall",
+)
+
+# Database connection pools, labeled primary or replica
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out",
+    "Database connections currently checked out of the pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Database connections open beyond the configured pool size",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total",
+    "Database connection checkouts",
+    ["pool"],
+)
+
+# Redis
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# Machine learning
+ML_INFERENCE_DURATION = Histogram(
+    "ml_inference_duration_seconds",
+    "Model inference latency",
+    ["model", "operation"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# Web application firewall
+WAF_MATCHES = Counter(
+    "waf_matches_total",
+    "Requests matching a WAF signature",
+    ["rule", "location"],
+)
+
+def metrics_registry() -> CollectorRegistry:
+    """Registry to expose: aggregated over workers in multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def render_metrics() -> bytes:
+    """Serialize all metrics in the Prometheus text format"""
+    return generate_latest(metrics_registry())
+
+def instrument_engine(engine: Any, name: str = "primary") -> None:
+    """Track pool checkouts and overflow for an (async) SQLAlchemy engine, labeled `name`"""
+    pool = getattr(engine, "sync_engine", engine).pool
+    if not hasattr(pool, "checkedout"):
+        # NullPool and friends have no pool state to report
+        return
+
+    checked_out = DB_POOL_CHECKED_OUT.labels(pool=name)
+    overflow = DB_POOL_OVERFLOW.labels(pool=name)
+    checkouts = DB_POOL_CHECKOUTS.labels(pool=name)
+
+    def on_checkout(*args) -> None:
+        checkouts.inc()
+        checked_out.set(pool.checkedout())
+        overflow.set(max(0, pool.overflow()))
+
+    def on_checkin(*args) -> None:
+        # fires before the pool takes the connection back: report the state
+        # after it does, when a full idle queue discards an overflow connection
+        discarded = pool.overflow() >= pool.checkedout()
+        checked_out.set(pool.checkedout() - 1)
+        overflow.set(max(0, pool.overflow() - discarded))
+
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", on_checkin)
+
+@contextmanager
+def observe_inference(model: str, operation: str) -> Iterator[None]:
+    """Time (and trace) a model call, e.g. `with observe_inference("medical", "generate"):`"""
+    start = time.perf_counter()
+    try:
+        with start_span(f"ml.{operation}", attributes={"ml.model": model}):
+            yield
+    finally:
+        ML_INFERENCE_DURATION.labels(model=model, operation=operation).observe(
+            time.perf_counter() - start
+        )
+
+@contextmanager
+def observe_redis(command: str, attributes: Dict[str, Any]) -> Iterator[None]:
+    """
+    Time and trace one Redis round trip; the span follows TRACING_ENABLED and
+    the latency metric ENABLE_PROMETHEUS, so either can be on without the other
+    """
+    start = time.perf_counter()
+    try:
+        if settings.TRACING_ENABLED:
+            with start_span(f"redis.{command}", SpanKind.CLIENT, attributes):
+                yield
+        else:
+            yield
+    finally:
+        if settings.ENABLE_PROMETHEUS:
+            REDIS_COMMAND_DURATION.labels(command=command).observe(
+                time.perf_counter() - start
+            )
+
+class InstrumentedRedis(Redis):
+    """Async Redis client that records per-command latency and tracing spans"""
+
+    async def execute_command(self, *args, **options):
+        with observe_redis(str(args[0]).upper(), {"db.system": "redis"}):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> "InstrumentedPipeline":
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+class InstrumentedPipeline(Pipeline):
+    """Pipeline recording one PIPELINE observation per round trip"""
+
+    async def execute(self, raise_on_error: bool = True):
+        with observe_redis("PIPELINE", {
+            "db.system": "redis",
+            "redis.commands": len(self.command_stack),
+        }):
+            return await super().execute(raise_on_error)
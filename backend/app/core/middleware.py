@@ -3,73 +3,142 @@ Custom Middleware for Security, Logging, Rate Limiting, and Compression
 """
 from fastapi import Request, Response, HTTPException, status
 from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import time
 import logging
-import gzip
 import json
-from typing import Callable
+import random
+import zlib
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import asyncio
 from datetime import datetime
 
+try:
+    import brotli
+except ImportError:  # brotli support is optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
 from app.config.settings import settings
-from app.core.dependencies import get_redis_client
+from app.config.redis import get_redis_client
+from app.core.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS, WAF_MATCHES
+from app.core.rate_limiter import RateLimiter, HybridRateLimiter, create_rate_limiter
+from app.core.tracing import (
+    TRACEPARENT_HEADER,
+    SpanKind,
+    get_tracer,
+    parse_traceparent,
+    start_span,
+)
+from app.core.waf import WAFMatch, WAFScanner, is_scannable_content_type
 
 logger = logging.getLogger(__name__)
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+# Security headers are static for the lifetime of the process, so they are
+# encoded once as raw ASGI header tuples instead of being set per response.
+_CONTENT_SECURITY_POLICY = (
+    "default-src 'self'; "
+    "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+    "style-src 'self' 'unsafe-inline'; "
+    "img-src 'self' data: https:; "
+    "font-src 'self'; "
+    "connect-src 'self'; "
+    "frame-ancestors 'none';"
+)
+
+_PERMISSIONS_POLICY = (
+    "geolocation=(), microphone=(), camera=(), "
+    "payment=(), usb=(), magnetometer=(), gyroscope=()"
+)
+
+def _build_security_headers(debug: bool) -> List[Tuple[bytes, bytes]]:
+    """Build the raw security header list once at startup"""
+    headers = [
+        ("x-content-type-options", "nosniff"),
+        ("x-frame-options", "DENY"),
+        ("x-xss-protection", "1; mode=block"),
+        ("referrer-policy", "strict-origin-when-cross-origin"),
+        ("permissions-policy", _PERMISSIONS_POLICY),
+    ]
+    if not debug:
+        headers.append(
+            ("strict-transport-security", "max-age=31536000; includeSubDomains; preload")
+        )
+    headers.append(("content-security-policy", _CONTENT_SECURITY_POLICY))
+    return [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+def get_scope_client_ip(scope: Scope, headers: Headers) -> str:
+    """Get client IP address from an ASGI scope, handling proxies"""
+    forwarded_for = headers.get("x-forwarded-for")
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    
+    real_ip = headers.get("x-real-ip")
+    if real_ip:
+        return real_ip
+    
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+class SecurityHeadersMiddleware:
     """Add security headers to all responses"""
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        response = await call_next(request)
-        
-        # Security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Permissions-Policy"] = (
-            "geolocation=(), microphone=(), camera=(), "
-            "payment=(), usb=(), magnetometer=(), gyroscope=()"
-        )
-        
-        if not settings.DEBUG:
-            response.headers["Strict-Transport-Security"] = (
-                "max-age=31536000; includeSubDomains; preload"
-            )
-        
-        # Content Security Policy
-        csp = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
-            "style-src 'self' 'unsafe-inline'; "
-            "img-src 'self' data: https:; "
-            "font-src 'self'; "
-            "connect-src 'self'; "
-            "frame-ancestors 'none';"
+    def __init__(self, app: ASGIApp, debug: Optional[bool] = None):
+        self.app = app
+        self.raw_headers = _build_security_headers(
+            settings.DEBUG if debug is None else debug
         )
-        response.headers["Content-Security-Policy"] = csp
-        
-        return response
+        self.header_names = frozenset(name for name, _ in self.raw_headers)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Security headers override anything set by the endpoint
+                headers = [
+                    header for header in message.get("headers", ())
+                    if header[0].lower() not in self.header_names
+                ]
+                headers.extend(self.raw_headers)
+                message["headers"] = headers
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+class RateLimitMiddleware:
     """Rate limiting middleware"""
     
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.redis_client = None
+        self.app = app
+        self.limiter: Optional[Union[RateLimiter, HybridRateLimiter]] = None
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Initialize Redis client if not done
-        if not self.redis_client:
-            self.redis_client = await get_redis_client()
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Use the limiter the lifespan created (it is closed on shutdown),
+        # or create one if the app was started without the lifespan
+        if not self.limiter:
+            self.limiter = getattr(scope["app"].state, "rate_limiter", None) if "app" in scope else None
+            if not self.limiter:
+                self.limiter = create_rate_limiter(await get_redis_client())
         
         # Get client IP
-        client_ip = self.get_client_ip(request)
+        client_ip = get_scope_client_ip(scope, Headers(scope=scope))
         
         # Different rate limits for different endpoints
-        if request.url.path.startswith("/api/v1/auth/"):
+        if scope["path"].startswith("/api/v1/auth/"):
             limit = settings.RATE_LIMIT_AUTH_REQUESTS
             window = settings.RATE_LIMIT_AUTH_WINDOW
             key = f"rate_limit:auth:{client_ip}"
@@ -78,142 +147,410 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             window = settings.RATE_LIMIT_WINDOW
             key = f"rate_limit:api:{client_ip}"
         
-        # Check rate limit
+        # Check and consume in a single Redis round trip
         try:
-            current_count = await self.redis_client.get(key)
-            
-            if current_count is None:
-                await self.redis_client.setex(key, window, 1)
-            else:
-                current_count = int(current_count)
-                if current_count >= limit:
-                    return JSONResponse(
-                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                        content={
-                            "error": "Rate limit exceeded",
-                            "detail": f"Maximum {limit} requests per {window} seconds",
-                            "retry_after": window
-                        },
-                        headers={"Retry-After": str(window)}
-                    )
-                await self.redis_client.incr(key)
-        
+            result = await self.limiter.hit(key, limit, window)
         except Exception as e:
             logger.error(f"Rate limiting error: {e}")
             # Continue without rate limiting if Redis fails
+            await self.app(scope, receive, send)
+            return
         
-        response = await call_next(request)
+        if not result.allowed:
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "error": "Rate limit exceeded",
+                    "detail": f"Maximum {limit} requests per {window} seconds",
+                    "retry_after": result.retry_after_seconds
+                },
+                headers={
+                    "Retry-After": str(result.retry_after_seconds),
+                    **result.headers()
+                }
+            )
+            await response(scope, receive, send)
+            return
         
         # Add rate limit headers
-        try:
-            remaining_requests = max(0, limit - int(await self.redis_client.get(key) or 0))
-            response.headers["X-RateLimit-Limit"] = str(limit)
-            response.headers["X-RateLimit-Remaining"] = str(remaining_requests)
-            response.headers["X-RateLimit-Reset"] = str(int(time.time()) + window)
-        except:
-            pass
-        
-        return response
-    
-    def get_client_ip(self, request: Request) -> str:
-        """Get client IP address handling proxies"""
-        # Check for forwarded headers
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
+        rate_limit_headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in result.headers().items()
+        ]
         
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
+        async def send_with_rate_limit(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *rate_limit_headers]
+            await send(message)
         
-        return request.client.host if request.client else "unknown"
+        await self.app(scope, receive, send_with_rate_limit)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Request/response logging middleware"""
+class LoggingMiddleware:
+    """Request/response access logging middleware
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
-        
-        # Get client info
-        client_ip = self.get_client_ip(request)
-        user_agent = request.headers.get("User-Agent", "")
-        
-        # Log request
-        logger.info(
-            f"Request: {request.method} {request.url.path} "
-            f"from {client_ip} - User-Agent: {user_agent[:100]}"
+    Emits one access log line per request. Successful fast requests are
+    sampled at ACCESS_LOG_SAMPLE_RATE; server errors and requests slower
+    than ACCESS_LOG_SLOW_THRESHOLD are always logged.
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: Optional[float] = None,
+        slow_threshold: Optional[float] = None
+    ):
+        self.app = app
+        self.sample_rate = (
+            settings.ACCESS_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        )
+        self.slow_threshold = (
+            settings.ACCESS_LOG_SLOW_THRESHOLD if slow_threshold is None else slow_threshold
         )
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        status_code = 500
+        
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = time.perf_counter() - start_time
+                
+                # Add timing header
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"x-process-time", str(process_time).encode("latin-1")),
+                ]
+            await send(message)
         
         # Process request
         try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            # Log response
-            logger.info(
-                f"Response: {response.status_code} "
-                f"in {process_time:.4f}s for {request.method} {request.url.path}"
-            )
-            
-            # Add timing header
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            return response
-            
+            await self.app(scope, receive, send_with_timing)
         except Exception as e:
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
             logger.error(
-                f"Error: {str(e)} in {process_time:.4f}s "
-                f"for {request.method} {request.url.path}",
+                "Error: %s in %.4fs for %s %s",
+                e, process_time, scope["method"], scope["path"],
                 exc_info=True
             )
             raise
-    
-    def get_client_ip(self, request: Request) -> str:
-        """Get client IP address"""
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
         
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-        
-        return request.client.host if request.client else "unknown"
+        process_time = time.perf_counter() - start_time
+        if self.should_log(status_code, process_time):
+            self.log_access(scope, status_code, process_time)
+    
+    def should_log(self, status_code: int, process_time: float) -> bool:
+        """Decide whether this request produces an access log line"""
+        if not logger.isEnabledFor(logging.INFO):
+            return False
+        if status_code >= 500 or process_time >= self.slow_threshold:
+            return True
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+    
+    def log_access(self, scope: Scope, status_code: int, process_time: float) -> None:
+        headers = Headers(scope=scope)
+        logger.info(
+            "%s %s %s in %.4fs from %s - User-Agent: %s",
+            scope["method"],
+            scope["path"],
+            status_code,
+            process_time,
+            get_scope_client_ip(scope, headers),
+            headers.get("user-agent", "")[:100],
+        )
 
-class CompressionMiddleware(BaseHTTPMiddleware):
-    """Response compression middleware"""
+class MetricsMiddleware:
+    """Prometheus request metrics middleware
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        response = await call_next(request)
-        
-        # Check if client accepts gzip
-        accept_encoding = request.headers.get("Accept-Encoding", "")
-        if "gzip" not in accept_encoding.lower():
-            return response
-        
-        # Only compress JSON responses over 1KB
-        if (
-            response.headers.get("Content-Type", "").startswith("application/json") and
-            hasattr(response, "body") and
-            len(response.body) > 1024
-        ):
-            # Compress the response body
-            compressed_body = gzip.compress(response.body)
+    Latency is labeled with the matched route template (e.g.
+    /api/v1/chat/sessions/{session_id}) rather than the raw path, so label
+    cardinality stays bounded.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        method = scope["method"]
+        status_code = 500
+        
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method=method)
+        in_progress.inc()
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # The router stores the matched route on the shared scope
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=method,
+                route=getattr(route, "path", "unmatched"),
+                status=str(status_code),
+            ).observe(time.perf_counter() - start_time)
+
+class TracingMiddleware:
+    """Open a server span per request
+    
+    An incoming `traceparent` header continues the caller's trace. The
+    server span's context is echoed back in a `traceresponse` header so a
+    slow response can be looked up in the trace backend.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or get_tracer() is None:
+            await self.app(scope, receive, send)
+            return
+        
+        method = scope["method"]
+        parent = parse_traceparent(Headers(scope=scope).get(TRACEPARENT_HEADER))
+        with start_span(
+            f"{method} {scope['path']}",
+            SpanKind.SERVER,
+            {"http.method": method, "http.target": scope["path"]},
+            parent=parent,
+            root=True,
+        ) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
             
-            # Update response
-            response.headers["Content-Encoding"] = "gzip"
-            response.headers["Content-Length"] = str(len(compressed_body))
+            async def send_with_trace(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    headers = MutableHeaders(raw=list(message.get("headers", ())))
+                    headers.append("traceresponse", span.context.traceparent)
+                    message["headers"] = headers.raw
+                await send(message)
             
-            # Create new response with compressed body
-            return Response(
-                content=compressed_body,
-                status_code=response.status_code,
-                headers=response.headers,
-                media_type=response.media_type
-            )
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{method} {route.path}"
+                    span.set_attribute("http.route", route.path)
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+    
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class _BrotliCompressor:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+    
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+    
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class _ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+    
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+_COMPRESSORS = {"gzip": _GzipCompressor}
+if brotli is not None:
+    _COMPRESSORS["br"] = _BrotliCompressor
+if zstandard is not None:
+    _COMPRESSORS["zstd"] = _ZstdCompressor
+
+# Compression level per content type and codec. Structured data compresses
+# well at moderate levels; higher levels mostly cost CPU on the request path.
+COMPRESSION_LEVELS: Dict[str, Dict[str, int]] = {
+    "application/json": {"gzip": 6, "br": 5, "zstd": 3},
+    "application/problem+json": {"gzip": 6, "br": 5, "zstd": 3},
+    "application/geo+json": {"gzip": 6, "br": 5, "zstd": 3},
+    "text/csv": {"gzip": 6, "br": 5, "zstd": 3},
+    "text/html": {"gzip": 6, "br": 6, "zstd": 6},
+    "text/plain": {"gzip": 6, "br": 5, "zstd": 3},
+    "text/css": {"gzip": 9, "br": 9, "zstd": 9},
+    "application/javascript": {"gzip": 9, "br": 9, "zstd": 9},
+}
+
+@lru_cache(maxsize=256)
+def negotiate_encoding(accept_encoding: str, preference: Tuple[str, ...]) -> Optional[str]:
+    """Pick the preferred supported codec allowed by an Accept-Encoding header"""
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip()] = quality
+    
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in preference:
+        if coding not in _COMPRESSORS:
+            continue
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+class CompressionMiddleware:
+    """Streaming response compression middleware
+    
+    Negotiates zstd, brotli or gzip from Accept-Encoding and compresses the
+    body chunk by chunk, so streaming responses are never fully buffered.
+    Chunks larger than COMPRESSION_THREAD_THRESHOLD are compressed in a
+    worker thread to keep the event loop responsive.
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: Optional[int] = None,
+        thread_threshold: Optional[int] = None,
+        encodings: Optional[List[str]] = None
+    ):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MINIMUM_SIZE if minimum_size is None else minimum_size
+        self.thread_threshold = settings.COMPRESSION_THREAD_THRESHOLD if thread_threshold is None else thread_threshold
+        self.preference = tuple(encodings or settings.COMPRESSION_ENCODINGS)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Check which codec the client accepts, if any
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.preference
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
         
-        return response
+        responder = _CompressionResponder(self, send, encoding)
+        await self.app(scope, receive, responder.send)
+    
+    async def run_compressor(self, func: Callable[..., bytes], *args: bytes) -> bytes:
+        """Compress inline for small chunks, in a thread for large ones"""
+        if args and len(args[0]) >= self.thread_threshold:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+class _CompressionResponder:
+    """Per-response compression state machine"""
+    
+    def __init__(self, middleware: CompressionMiddleware, send: Send, encoding: str):
+        self.middleware = middleware
+        self.downstream = send
+        self.encoding = encoding
+        self.start_message: Optional[Message] = None
+        self.level: Optional[int] = None
+        self.compressor = None
+        self.buffer: List[bytes] = []
+        self.buffered_size = 0
+        self.passthrough = False
+    
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        
+        if message_type == "http.response.start":
+            self.start_message = message
+            self.level = self._compression_level(message)
+            self.passthrough = self.level is None
+            if self.passthrough:
+                await self.downstream(message)
+            return
+        
+        if message_type != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+        
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        
+        if self.compressor is None:
+            # Hold back only enough of the body to decide whether it is
+            # worth compressing
+            self.buffer.append(body)
+            self.buffered_size += len(body)
+            if more_body and self.buffered_size < self.middleware.minimum_size:
+                return
+            
+            body = b"".join(self.buffer)
+            self.buffer = []
+            if not more_body and self.buffered_size < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.downstream(self.start_message)
+                await self.downstream({"type": "http.response.body", "body": body})
+                return
+            
+            await self._start_compression()
+        
+        compressed = await self.middleware.run_compressor(self.compressor.compress, body)
+        if not more_body:
+            compressed += await self.middleware.run_compressor(self.compressor.finish)
+        
+        if compressed or not more_body:
+            await self.downstream({
+                "type": "http.response.body",
+                "body": compressed,
+                "more_body": more_body,
+            })
+    
+    def _compression_level(self, message: Message) -> Optional[int]:
+        """Return the level to use, or None when the response must pass through"""
+        if message["status"] < 200 or message["status"] in (204, 206, 304):
+            return None
+        headers = Headers(raw=message.get("headers", []))
+        if "content-encoding" in headers:
+            return None
+        content_type = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+        levels = COMPRESSION_LEVELS.get(content_type)
+        if levels is None:
+            return None
+        return levels.get(self.encoding)
+    
+    async def _start_compression(self) -> None:
+        self.compressor = _COMPRESSORS[self.encoding](self.level)
+        
+        headers = MutableHeaders(raw=list(self.start_message.get("headers", ())))
+        del headers["content-length"]
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        self.start_message["headers"] = headers.raw
+        await self.downstream(self.start_message)
 
 class CORSMiddleware(BaseHTTPMiddleware):
     """Custom CORS middleware with enhanced security"""
@@ -293,71 +630,69 @@ class HealthCheckMiddleware(BaseHTTPMiddleware):
         
         return await call_next(request)
 
-class SecurityAuditMiddleware(BaseHTTPMiddleware):
-    """Security audit logging middleware"""
+class SecurityAuditMiddleware:
+    """Security audit logging middleware (WAF signature scanning)"""
     
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.suspicious_patterns = [
-            # SQL injection patterns
-            r"union\s+select",
-            r"drop\s+table",
-            r"exec\s*\(",
-            # XSS patterns
-            r"<script",
-            r"javascript:",
-            r"onerror=",
-            # Path traversal
-            r"\.\./",
-            r"\.\.\\",
-            # Command injection
-            r";\s*rm\s+",
-            r";\s*cat\s+",
-        ]
+    def __init__(
+        self,
+        app: ASGIApp,
+        scanner: Optional[WAFScanner] = None,
+        scan_body: Optional[bool] = None,
+        body_limit: Optional[int] = None,
+    ):
+        self.app = app
+        # Signatures are compiled once here, not per request
+        self.scanner = scanner or WAFScanner()
+        self.scan_body = settings.WAF_SCAN_BODY if scan_body is None else scan_body
+        self.body_limit = settings.WAF_BODY_SCAN_LIMIT if body_limit is None else body_limit
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Check for suspicious patterns in URL and headers
-        suspicious_activity = self.detect_suspicious_activity(request)
-        
-        if suspicious_activity:
-            client_ip = self.get_client_ip(request)
-            logger.warning(
-                f"Suspicious activity detected from {client_ip}: "
-                f"{suspicious_activity} - URL: {request.url}"
-            )
-            
-            # Log to security audit
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        match = self.scanner.scan_request(scope)
+        if match:
+            self.report(scope, match)
             # In production, you might want to block the request
             # or add the IP to a blacklist
         
-        return await call_next(request)
-    
-    def detect_suspicious_activity(self, request: Request) -> str:
-        """Detect suspicious patterns in request"""
-        import re
+        if self.scan_body and match is None:
+            content_type = Headers(scope=scope).get("content-type", "")
+            if is_scannable_content_type(content_type):
+                receive = self.scanning_receive(scope, receive, content_type)
         
-        # Check URL path
-        url_path = str(request.url).lower()
-        for pattern in self.suspicious_patterns:
-            if re.search(pattern, url_path, re.IGNORECASE):
-                return f"Suspicious URL pattern: {pattern}"
+        await self.app(scope, receive, send)
+    
+    def scanning_receive(self, scope: Scope, receive: Receive, content_type: str) -> Receive:
+        """Scan body chunks as the endpoint reads them, up to the byte cap"""
+        body_scanner = self.scanner.body_scanner(
+            self.body_limit,
+            form_encoded=content_type.startswith("application/x-www-form-urlencoded"),
+        )
         
-        # Check headers
-        for header_name, header_value in request.headers.items():
-            header_value_lower = header_value.lower()
-            for pattern in self.suspicious_patterns:
-                if re.search(pattern, header_value_lower, re.IGNORECASE):
-                    return f"Suspicious header pattern in {header_name}: {pattern}"
+        async def receive_and_scan() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and not body_scanner.done:
+                match = body_scanner.feed(message.get("body", b""))
+                if match:
+                    self.report(scope, match)
+            return message
         
-        return ""
+        return receive_and_scan
     
-    def get_client_ip(self, request: Request) -> str:
-        """Get client IP address"""
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        return request.client.host if request.client else "unknown"
+    def report(self, scope: Scope, match: WAFMatch) -> None:
+        WAF_MATCHES.labels(rule=match.rule, location=match.location.split(":", 1)[0]).inc()
+        logger.warning(
+            "Suspicious activity detected from %s: rule=%s location=%s "
+            "fragment=%r - %s %s",
+            get_scope_client_ip(scope, Headers(scope=scope)),
+            match.rule,
+            match.location,
+            match.fragment,
+            scope.get("method"),
+            scope.get("path"),
+        )
 
 class DatabaseTransactionMiddleware(BaseHTTPMiddleware):
     """Database transaction management middleware"""
@@ -0,0 +1,216 @@
+"""
+Transactional outbox
+
+Side effects that call external systems (Stripe refunds, order/prescription
+emails and pushes) used to run inline after the business write, so every
+request waited on Stripe, SMTP or Firebase, and a crash between the commit
+and the call lost the side effect.
+
+Now the business code records an event instead:
+
+    await enqueue(db, "payment.refund", {"payment_id": ..., "reason": ...})
+
+The event row is written through the operation's unit of work, so it commits
+or rolls back together with the change that caused it. A relay worker
+(`python -m app.workers.outbox_relay`) claims due events in batches: a short
+transaction picks them with `SELECT ... FOR UPDATE SKIP LOCKED`, so any
+number of relays can run side by side without taking the same event, counts
+the attempt and leases them (`locked_until`) before committing. No row lock
+is held while the handlers call Stripe, SMTP or Firebase. The outcomes are
+written in a second transaction: sent, a retry with exponential backoff, or
+failed once OUTBOX_MAX_ATTEMPTS is reached.
+
+Delivery is at least once: an event whose relay died (or outlived its
+OUTBOX_LEASE_SECONDS lease) before recording the outcome is claimed again
+when the lease expires, so handlers must tolerate repeats (they get the event
+id for idempotency keys). The late relay's outcome is then discarded.
+
+The relay reads and updates outbox_events through its table, not through the
+ORM, so it does not depend on the mappers of the models the handlers use.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.core.unit_of_work import unit_of_work
+from app.models.outbox import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+# handler(db, payload, event_id); db is a session of its own, committed after the handler returns
+Handler = Callable[[AsyncSession, Dict[str, Any], str], Awaitable[None]]
+
+_handlers: Dict[str, Handler] = {}
+
+def outbox_handler(topic: str) -> Callable[[Handler], Handler]:
+    """Register the function that carries out events of `topic`"""
+    def register(handler: Handler) -> Handler:
+        if topic in _handlers:
+            raise ValueError(f"Outbox topic {topic!r} already has a handler")
+        _handlers[topic] = handler
+        return handler
+    return register
+
+def handler_for(topic: str) -> Optional[Handler]:
+    return _handlers.get(topic)
+
+async def enqueue(
+    db: AsyncSession,
+    topic: str,
+    payload: Dict[str, Any],
+    delay: Optional[timedelta] = None,
+) -> None:
+    """Record a side effect in the transaction of the current operation"""
+    now = datetime.utcnow()
+    async with unit_of_work(db) as uow:
+        uow.insert(OutboxEvent, [dict(
+            topic=topic,
+            payload=jsonable_encoder(payload),
+            status=PENDING,
+            attempts=0,
+            available_at=now + delay if delay else now,
+            created_at=now,
+        )])
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff before the next attempt of an event that failed `attempts` times"""
+    seconds = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_RETRY_MAX_SECONDS))
+
+class OutboxRelay:
+    """Claims due outbox events and dispatches them to their handlers"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.semaphore = asyncio.Semaphore(concurrency or settings.OUTBOX_CONCURRENCY)
+        self._stopping = asyncio.Event()
+
+    async def claim(self, db: AsyncSession, now: datetime) -> List[Row]:
+        """Lease a batch of due events and count the attempt; commit to release the row locks"""
+        events = OutboxEvent.__table__
+        due = (
+            select(events.c.id)
+            .where(
+                events.c.status == PENDING,
+                events.c.available_at <= now,
+                or_(events.c.locked_until.is_(None), events.c.locked_until <= now),
+            )
+            .order_by(events.c.available_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            update(events)
+            .where(events.c.id.in_(due))
+            .values(
+                locked_until=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+                attempts=events.c.attempts + 1,
+            )
+            .returning(
+                events.c.id, events.c.topic, events.c.payload,
+                events.c.attempts, events.c.available_at, events.c.locked_until,
+            )
+        )
+        return list(result)
+
+    async def dispatch(self, event: Row) -> Optional[str]:
+        """Run the handler of one event; the error message if it failed"""
+        handler = handler_for(event.topic)
+        if handler is None:
+            return f"No handler for topic {event.topic!r}"
+
+        async with self.semaphore:
+            try:
+                async with self.session_factory() as db:
+                    await handler(db, event.payload, str(event.id))
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"Outbox event {event.id} ({event.topic}) failed: {e}")
+                return f"{type(e).__name__}: {e}"
+        return None
+
+    def record(self, event: Row, error: Optional[str], now: datetime) -> Tuple[str, Dict[str, Any]]:
+        """The outcome of one attempt (sent, retry or failed) and the new values of the event row"""
+        attempts = event.attempts  # counted when the event was claimed
+        if error is None:
+            return SENT, dict(status=SENT, last_error=None, available_at=event.available_at, sent_at=now)
+
+        if handler_for(event.topic) is None or attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Outbox event {event.id} ({event.topic}) gave up after {attempts} attempts: {error}")
+            return FAILED, dict(status=FAILED, last_error=error, available_at=event.available_at, sent_at=None)
+
+        return "retry", dict(
+            status=PENDING, last_error=error, available_at=now + retry_delay(attempts), sent_at=None
+        )
+
+    async def run_once(self) -> Tuple[int, Dict[str, int]]:
+        """Process one batch; returns the number of events claimed and outcomes by status"""
+        outcomes: Dict[str, int] = {}
+        async with self.session_factory() as db:
+            events = await self.claim(db, datetime.utcnow())
+            await db.commit()
+        if not events:
+            return 0, outcomes
+
+        errors = await asyncio.gather(*(self.dispatch(event) for event in events))
+        now = datetime.utcnow()
+        rows = []
+        for event, error in zip(events, errors):
+            status, values = self.record(event, error, now)
+            values["locked_until"] = None
+            outcomes[status] = outcomes.get(status, 0) + 1
+            rows.append(dict(
+                {f"new_{name}": value for name, value in values.items()},
+                event_id=event.id,
+                lease=event.locked_until,
+            ))
+
+        # one executemany UPDATE for the whole batch; events whose lease expired
+        # meanwhile belong to the relay that claimed them again
+        table = OutboxEvent.__table__
+        async with self.session_factory() as db:
+            await db.execute(
+                update(table)
+                .where(table.c.id == bindparam("event_id"), table.c.locked_until == bindparam("lease"))
+                .values({name: bindparam(f"new_{name}") for name in values}),
+                rows,
+            )
+            await db.commit()
+        return len(events), outcomes
+
+    async def run(self, poll_interval: Optional[float] = None) -> None:
+        """Relay until stop() is called; sleeps only when there was nothing to do"""
+        poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL
+        while not self._stopping.is_set():
+            try:
+                claimed, outcomes = await self.run_once()
+                if outcomes:
+                    logger.info(f"Outbox relayed {claimed} events: {outcomes}")
+            except Exception as e:
+                logger.error(f"Outbox relay batch failed: {e}")
+                claimed = 0
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self) -> None:
+        self._stopping.set()
@@ -0,0 +1,273 @@
+"""
+Keyset (cursor) pagination
+
+OFFSET pagination makes the database walk and throw away every row before the
+requested page, so deep pages get linearly slower, and list endpoints paid for
+a full `count(*)` on every page as well.
+
+`paginate()` instead orders by a sort key with the primary key as tie-breaker
+and continues from the last row of the previous page:
+
+    WHERE (created_at, id) < (:last_created_at, :last_id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT :limit + 1
+
+which an index on (..., sort key, id) answers by seeking straight to the
+position. The extra row only tells whether there is a next page.
+
+The position travels as an opaque cursor (url-safe base64 JSON) that records
+the sort key it belongs to, so a cursor from one listing is rejected by
+another. The sort key must not be NULL for rows in the listing.
+
+Totals are only computed when asked for, in one of three `CountMode`s:
+
+- exact: `count(*) OVER()` is added to the page query, so the page and the
+  total come back in one statement instead of running the filtered query
+  twice (a separate count is only needed past the first keyset page, or
+  when an OFFSET is past the last row).
+- estimated: the planner's row estimate from `EXPLAIN (FORMAT JSON)`. It
+  costs no scan at all but can be far off for selective filters.
+- auto: the estimate when it is at least COUNT_ESTIMATE_THRESHOLD (broad
+  queries, where an exact count is expensive and nobody pages to the end),
+  exact otherwise.
+
+`Total.exact` tells the caller which one it got.
+"""
+import base64
+import binascii
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Generic, List, Optional, Tuple, TypeVar
+from uuid import UUID
+
+from sqlalchemy import Select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+from app.config.database import count_rows
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_EXACT_HEADER = "X-Total-Count-Exact"
+TOTAL_COLUMN = "total_count"
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed or belongs to a different listing"""
+
+class CountMode(str, Enum):
+    """How the total of a listing is computed"""
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    AUTO = "auto"
+
+@dataclass
+class Total:
+    value: int
+    exact: bool = True
+
+def total_headers(total: Optional[Total]) -> dict:
+    if total is None:
+        return {}
+    return {
+        TOTAL_COUNT_HEADER: str(total.value),
+        TOTAL_EXACT_HEADER: "true" if total.exact else "false",
+    }
+
+@dataclass
+class Page(Generic[T]):
+    """One page of a keyset-paginated listing"""
+    items: List[T]
+    next_cursor: Optional[str] = None
+    total: Optional[Total] = None
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+    def headers(self) -> dict:
+        """Response headers carrying the cursor and total for list endpoints"""
+        headers = total_headers(self.total)
+        if self.next_cursor:
+            headers[NEXT_CURSOR_HEADER] = self.next_cursor
+        return headers
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, UUID):
+        return {"uuid": str(value)}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "uuid" in value:
+            return UUID(value["uuid"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+        raise InvalidCursor("Unknown cursor value")
+    return value
+
+def encode_cursor(key: str, values: List[Any]) -> str:
+    """Opaque cursor for the position `values` of the listing ordered by `key`"""
+    payload = json.dumps(
+        {"k": key, "v": [_encode_value(value) for value in values]},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, key: str) -> List[Any]:
+    """Position stored in `cursor`; raises InvalidCursor if it is not for `key`"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [_decode_value(value) for value in payload["v"]]
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+
+    if payload.get("k") != key or len(values) != 2:
+        raise InvalidCursor("Cursor does not belong to this listing")
+    return values
+
+# Totals
+
+def with_window_total(query: Select) -> Select:
+    """`query` with the total row count (before LIMIT/OFFSET) as its last column"""
+    return query.add_columns(func.count().over().label(TOTAL_COLUMN))
+
+async def estimate_rows(db: AsyncSession, query: Select) -> Optional[int]:
+    """Planner row estimate for `query`, or None where it is not available"""
+    conn = await db.connection()
+    if conn.dialect.name != "postgresql":
+        return None
+
+    compiled = query.order_by(None).compile(dialect=conn.dialect)
+    parameters = compiled.params
+    if compiled.positiontup is not None:
+        parameters = tuple(parameters[name] for name in compiled.positiontup)
+    try:
+        # a failed EXPLAIN must not abort the transaction the page runs in
+        async with conn.begin_nested():
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", parameters)
+            plan = result.scalar()
+    except Exception as e:
+        logger.warning(f"Could not estimate row count: {e}")
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+async def estimated_total(
+    db: AsyncSession,
+    query: Select,
+    count_mode: CountMode,
+) -> Optional[Total]:
+    """The estimated total if `count_mode` settles for one, else None (count exactly)"""
+    if count_mode == CountMode.EXACT:
+        return None
+    estimate = await estimate_rows(db, query)
+    if estimate is None:
+        return None
+    if count_mode == CountMode.ESTIMATED or estimate >= settings.COUNT_ESTIMATE_THRESHOLD:
+        return Total(estimate, exact=False)
+    return None
+
+async def page_with_total(
+    db: AsyncSession,
+    query: Select,
+    limit: int,
+    offset: int = 0,
+    count_mode: CountMode = CountMode.EXACT,
+) -> Tuple[List[tuple], Total]:
+    """
+    One OFFSET page of `query` (already ordered) and the total of all its rows.
+
+    Rows are returned as tuples of the selected columns.
+    """
+    total = await estimated_total(db, query, count_mode)
+    if total is not None:
+        result = await db.execute(query.offset(offset).limit(limit))
+        return [tuple(row) for row in result.all()], total
+
+    result = await db.execute(with_window_total(query).offset(offset).limit(limit))
+    rows = [tuple(row) for row in result.all()]
+    if rows:
+        return [row[:-1] for row in rows], Total(rows[0][-1])
+    # an empty page has no row to carry the window count
+    return [], Total(await count_rows(db, query) if offset else 0)
+
+def cursor_key(sort_column: InstrumentedAttribute, descending: bool) -> str:
+    return f"{sort_column.class_.__tablename__}.{sort_column.key}:{'desc' if descending else 'asc'}"
+
+async def paginate(
+    db: AsyncSession,
+    query: Select,
+    sort_column: InstrumentedAttribute,
+    id_column: InstrumentedAttribute,
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = True,
+    with_total: bool = False,
+    count_mode: CountMode = CountMode.EXACT,
+) -> Page:
+    """
+    Run `query` one page at a time, ordered by (sort_column, id_column).
+
+    `query` must select the mapped entity and must not carry its own ORDER BY,
+    LIMIT or OFFSET.
+    """
+    key = cursor_key(sort_column, descending)
+    # reject a bad cursor before counting anything
+    after = tuple_(*decode_cursor(cursor, key)) if cursor else None
+    total = None
+    if with_total:
+        total = await estimated_total(db, query, count_mode)
+        if total is None and cursor:
+            # past the first page the window would only count the rows after the cursor
+            total = Total(await count_rows(db, query))
+    window = with_total and total is None
+
+    page_query = with_window_total(query) if window else query
+    if cursor:
+        position = tuple_(sort_column, id_column)
+        page_query = page_query.where(position < after if descending else position > after)
+
+    if descending:
+        page_query = page_query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        page_query = page_query.order_by(sort_column.asc(), id_column.asc())
+
+    result = await db.execute(page_query.limit(limit + 1))
+    if window:
+        rows = result.all()
+        total = Total(rows[0][-1] if rows else 0)
+        items = [row[0] for row in rows]
+    else:
+        items = list(result.scalars().all())
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(
+            key,
+            [getattr(last, sort_column.key), getattr(last, id_column.key)],
+        )
+
+    return Page(items=items, next_cursor=next_cursor, total=total)
@@ -0,0 +1,373 @@
+"""
+Slow-query log
+
+Every statement run by an instrumented engine is timed with cursor events.
+Statements slower than SLOW_QUERY_THRESHOLD_MS are logged with:
+
+- the normalized SQL (literals and placeholders replaced by `?`, IN lists
+  collapsed) so repeated executions group under one template,
+- the shapes of the parameters (types and list lengths, never values),
+- the route template of the request and the service function that ran it,
+- optionally an `EXPLAIN (ANALYZE, BUFFERS)` plan, captured on a separate
+  connection in a background task so the request never waits for it.
+
+Templates are aggregated in memory (bounded by SLOW_QUERY_MAX_TEMPLATES) and
+served by the admin endpoint GET /api/v1/admin/slow-queries.
+
+Query counting: every request also counts its statements per template.
+
+- A template repeated N_PLUS_ONE_THRESHOLD times in one request is logged as
+  a likely N+1 (a query issued per row of an earlier result).
+- In DEBUG the count is returned in the X-DB-Queries response header.
+- @query_budget(n) caps the statements of an endpoint. A request that runs
+  more fails with QueryBudgetExceeded when QUERY_BUDGET_ENFORCE or TESTING
+  is set, and is logged otherwise. `count_queries()` applies the same
+  counting to a block of code in tests.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+import asyncio
+import logging
+import re
+import sys
+import threading
+import time
+
+import greenlet
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Scope of the request being served; the router adds the matched route to it
+_request_scope: ContextVar[Optional[Scope]] = ContextVar("request_scope", default=None)
+# Set inside the EXPLAIN task so its own statement is not logged again
+_explaining: ContextVar[bool] = ContextVar("explaining", default=False)
+
+# Query counting
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+BUDGET_ATTRIBUTE = "__query_budget__"
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more statements than its endpoint's query budget"""
+
+@dataclass
+class QueryCount:
+    """Statements run by one request (or one count_queries block)"""
+    total: int = 0
+    templates: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, statement: str) -> None:
+        self.total += 1
+        template = normalize_sql(statement)
+        self.templates[template] = self.templates.get(template, 0) + 1
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Templates run at least `threshold` times"""
+        return {sql: n for sql, n in self.templates.items() if n >= threshold}
+
+_query_count: ContextVar[Optional[QueryCount]] = ContextVar("query_count", default=None)
+
+Endpoint = TypeVar("Endpoint", bound=Callable)
+
+def query_budget(max_queries: int) -> Callable[[Endpoint], Endpoint]:
+    """Cap the number of statements a request to this endpoint may run"""
+    def decorator(endpoint: Endpoint) -> Endpoint:
+        setattr(endpoint, BUDGET_ATTRIBUTE, max_queries)
+        return endpoint
+    return decorator
+
+def endpoint_budget(scope: Scope) -> Optional[int]:
+    return getattr(scope.get("endpoint"), BUDGET_ATTRIBUTE, settings.DEFAULT_QUERY_BUDGET)
+
+@contextmanager
+def count_queries() -> Iterator[QueryCount]:
+    """Count the statements run inside the block (nested blocks count separately)"""
+    count = QueryCount()
+    token = _query_count.set(count)
+    try:
+        yield count
+    finally:
+        _query_count.reset(token)
+
+def check_query_count(count: QueryCount, route: Optional[str], budget: Optional[int]) -> None:
+    """Log likely N+1 patterns and enforce the query budget"""
+    for template, times in count.repeated(settings.N_PLUS_ONE_THRESHOLD).items():
+        logger.warning(f"Possible N+1 on {route}: {times}x {template[:500]}")
+    if budget is None or count.total <= budget:
+        return
+    message = f"{route} ran {count.total} queries, budget is {budget}"
+    if settings.QUERY_BUDGET_ENFORCE or settings.TESTING:
+        breakdown = "\n".join(
+            f"  {times}x {template[:300]}"
+            for template, times in sorted(count.templates.items(), key=lambda item: -item[1])
+        )
+        raise QueryBudgetExceeded(f"{message}:\n{breakdown}")
+    logger.warning(message)
+
+class RequestScopeMiddleware:
+    """Make the request visible to database event hooks and count its statements"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        count = QueryCount() if settings.QUERY_COUNT_ENABLED else None
+
+        async def send_with_count(message: Message) -> None:
+            if message["type"] == "http.response.start" and count is not None and settings.DEBUG:
+                MutableHeaders(scope=message).append(QUERY_COUNT_HEADER, str(count.total))
+            await send(message)
+
+        scope_token = _request_scope.set(scope)
+        count_token = _query_count.set(count)
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _query_count.reset(count_token)
+            _request_scope.reset(scope_token)
+        if count is not None:
+            check_query_count(count, route_path(scope), endpoint_budget(scope))
+
+def route_path(scope: Scope) -> Optional[str]:
+    """Matched route template, or the raw path before routing"""
+    return getattr(scope.get("route"), "path", None) or scope.get("path")
+
+def current_route() -> Optional[str]:
+    scope = _request_scope.get()
+    return route_path(scope) if scope is not None else None
+
+# Normalization
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+\b|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=4096)
+def normalize_sql(statement: str) -> str:
+    """Statement template: literals and bind placeholders become `?`"""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+def _value_shape(value: Any) -> str:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+def parameter_shapes(parameters: Any, executemany: bool = False) -> Any:
+    """Types (and sizes) of bound parameters; values are never recorded"""
+    if executemany:
+        rows = list(parameters or ())
+        return {"rows": len(rows), "row": parameter_shapes(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: _value_shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_value_shape(value) for value in parameters]
+    return None
+
+# Caller lookup
+
+_CALLER_PACKAGES = ("app.services.", "app.api.")
+
+def _frames():
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while True:
+        while frame is not None:
+            yield frame
+            frame = frame.f_back
+        # Async engines run the DBAPI call in a child greenlet; the awaiting
+        # coroutines are on the parent greenlet's stack
+        current = current.parent
+        if current is None:
+            return
+        frame = current.gr_frame
+
+def calling_function() -> Optional[str]:
+    """First service or endpoint function on the stack, as module.function"""
+    for frame in _frames():
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith(_CALLER_PACKAGES):
+            return f"{module}.{frame.f_code.co_name}"
+    return None
+
+# Aggregation
+
+@dataclass
+class SlowQuery:
+    statement: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+    last_seen: float = 0.0
+    routes: Dict[str, int] = field(default_factory=dict)
+    callers: Dict[str, int] = field(default_factory=dict)
+    parameter_shapes: Any = None
+    plan: Optional[str] = None
+    plan_captured_at: Optional[float] = None
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["mean_ms"] = round(self.mean_ms, 3)
+        return data
+
+class SlowQueryStats:
+    """Slow statements grouped by template, keeping the costliest ones"""
+
+    ORDERINGS = ("total_ms", "max_ms", "mean_ms", "count")
+
+    def __init__(self, max_templates: int):
+        self.max_templates = max_templates
+        self._queries: Dict[str, SlowQuery] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        statement: str,
+        duration_ms: float,
+        route: Optional[str] = None,
+        caller: Optional[str] = None,
+        shapes: Any = None,
+    ) -> SlowQuery:
+        with self._lock:
+            entry = self._queries.get(statement)
+            if entry is None:
+                if len(self._queries) >= self.max_templates:
+                    cheapest = min(self._queries.values(), key=lambda q: q.total_ms)
+                    del self._queries[cheapest.statement]
+                entry = self._queries[statement] = SlowQuery(statement)
+            entry.count += 1
+            entry.total_ms += duration_ms
+            entry.max_ms = max(entry.max_ms, duration_ms)
+            entry.last_ms = duration_ms
+            entry.last_seen = time.time()
+            entry.parameter_shapes = shapes
+            if route:
+                entry.routes[route] = entry.routes.get(route, 0) + 1
+            if caller:
+                entry.callers[caller] = entry.callers.get(caller, 0) + 1
+            return entry
+
+    def top(self, limit: int = 20, order_by: str = "total_ms") -> List[SlowQuery]:
+        if order_by not in self.ORDERINGS:
+            raise ValueError(f"order_by must be one of {', '.join(self.ORDERINGS)}")
+        with self._lock:
+            queries = list(self._queries.values())
+        return sorted(queries, key=lambda q: getattr(q, order_by), reverse=True)[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._queries.clear()
+
+slow_queries = SlowQueryStats(settings.SLOW_QUERY_MAX_TEMPLATES)
+
+# EXPLAIN capture
+
+def _explainable(statement: str) -> bool:
+    # ANALYZE executes the statement, so only plain reads are explained
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return head in ("SELECT", "WITH") and not re.search(
+        r"\b(INSERT|UPDATE|DELETE|FOR\s+UPDATE|FOR\s+SHARE)\b", statement, re.IGNORECASE
+    )
+
+def _should_explain(entry: SlowQuery) -> bool:
+    if entry.plan_captured_at is None:
+        return True
+    return time.time() - entry.plan_captured_at >= settings.SLOW_QUERY_EXPLAIN_INTERVAL
+
+async def capture_plan(engine: Any, entry: SlowQuery, statement: str, parameters: Any) -> None:
+    """Run EXPLAIN (ANALYZE, BUFFERS) for a slow statement on its own connection"""
+    token = _explaining.set(True)
+    try:
+        async with engine.connect() as conn:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+            )
+            plan = "\n".join(row[0] for row in result)
+        entry.plan = plan
+        logger.warning(f"Plan for slow query {entry.statement[:200]}:\n{plan}")
+    except Exception as e:
+        logger.warning(f"Could not capture plan for slow query: {e}")
+    finally:
+        _explaining.reset(token)
+
+def _schedule_explain(engine: Any, entry: SlowQuery, statement: str, parameters: Any) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    # Claimed now so concurrent slow executions do not explain it twice
+    entry.plan_captured_at = time.time()
+    loop.create_task(capture_plan(engine, entry, statement, parameters))
+
+# Engine hooks
+
+def instrument_slow_queries(engine: Any) -> None:
+    """Time every statement of an (async) engine and record slow ones"""
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    explain_engine = engine if isinstance(engine, AsyncEngine) else None
+    threshold_ms = settings.SLOW_QUERY_THRESHOLD_MS
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None or _explaining.get():
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < threshold_ms:
+            return
+        template = normalize_sql(statement)
+        route = current_route()
+        caller = calling_function()
+        shapes = parameter_shapes(parameters, executemany)
+        entry = slow_queries.record(template, duration_ms, route, caller, shapes)
+        logger.warning(
+            f"Slow query {duration_ms:.1f}ms route={route} caller={caller} "
+            f"params={shapes}: {template[:2048]}"
+        )
+        if (
+            settings.SLOW_QUERY_EXPLAIN
+            and explain_engine is not None
+            and not executemany
+            and _explainable(statement)
+            and _should_explain(entry)
+        ):
+            _schedule_explain(explain_engine, entry, statement, parameters)
+
+def instrument_query_counting(engine: Any) -> None:
+    """Count the statements of an (async) engine against the current request"""
+    from sqlalchemy import event
+
+    @event.listens_for(getattr(engine, "sync_engine", engine), "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        count = _query_count.get()
+        if count is not None and not _explaining.get():
+            count.add(statement)
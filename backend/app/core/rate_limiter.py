@@ -0,0 +1,398 @@
+"""
+Redis rate limiters
+
+RateLimiter runs each check as a single Lua script, so testing the limit,
+consuming a request and reading the remaining budget and reset time costs
+exactly one Redis round trip and cannot race with other workers.
+HybridRateLimiter keeps per-worker counts in memory and reconciles them
+with Redis in periodic batches for high-volume limits, approximating the
+same sliding window from the current and previous fixed windows.
+"""
+from dataclasses import dataclass
+from enum import Enum
+from hashlib import sha1
+from typing import Any, Dict, List, Optional, Tuple, Union
+import asyncio
+import inspect
+import logging
+import math
+import time
+import uuid
+
+from redis.exceptions import NoScriptError
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class RateLimitAlgorithm(str, Enum):
+    SLIDING_WINDOW = "sliding_window"
+    TOKEN_BUCKET = "token_bucket"
+
+# Sliding window log: one sorted-set member per accepted request, scored by
+# its timestamp. Redis server time is used so worker clocks cannot skew it.
+# Returns {allowed, remaining, reset_ms, retry_after_ms}.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local member = ARGV[4]
+
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+
+local allowed = 0
+if count + cost <= limit then
+    for i = 1, cost do
+        redis.call('ZADD', key, now, member .. ':' .. i)
+    end
+    count = count + cost
+    allowed = 1
+end
+redis.call('PEXPIRE', key, window)
+
+local reset = window
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window - now
+end
+
+local retry_after = 0
+if allowed == 0 then
+    retry_after = reset
+end
+
+return {allowed, limit - count, reset, retry_after}
+"""
+
+# Token bucket: capacity `limit`, refilled continuously so that a full
+# bucket is restored over one window. Stored as a two-field hash.
+# Returns {allowed, remaining, reset_ms, retry_after_ms}.
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local rate = capacity / window
+
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+
+local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = math.ceil((cost - tokens) / rate)
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, window)
+
+local reset = math.ceil((capacity - tokens) / rate)
+return {allowed, math.floor(tokens), reset, retry_after}
+"""
+
+_SCRIPTS = {
+    RateLimitAlgorithm.SLIDING_WINDOW: (SLIDING_WINDOW_SCRIPT, "sw"),
+    RateLimitAlgorithm.TOKEN_BUCKET: (TOKEN_BUCKET_SCRIPT, "tb"),
+}
+
+_SCRIPT_SHAS = {
+    script: sha1(script.encode("utf-8")).hexdigest()
+    for script, _ in _SCRIPTS.values()
+}
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a single rate limit check"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+    retry_after: float
+
+    @property
+    def reset_at(self) -> int:
+        """Unix timestamp at which the full limit is available again"""
+        return int(time.time() + self.reset_after)
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Whole seconds a rejected client should wait before retrying"""
+        return max(1, math.ceil(self.retry_after))
+
+    def headers(self) -> Dict[str, str]:
+        """Standard X-RateLimit-* response headers"""
+        return {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset_at),
+        }
+
+class RateLimiter:
+    """Single round-trip rate limiter backed by a Redis Lua script"""
+
+    def __init__(
+        self,
+        redis_client: Any,
+        algorithm: Union[RateLimitAlgorithm, str, None] = None
+    ):
+        self.redis_client = redis_client
+        self.algorithm = RateLimitAlgorithm(algorithm or settings.RATE_LIMIT_ALGORITHM)
+        self.script, self.key_suffix = _SCRIPTS[self.algorithm]
+        self.script_sha = _SCRIPT_SHAS[self.script]
+
+    async def hit(
+        self,
+        key: str,
+        limit: int,
+        window: int,
+        cost: int = 1
+    ) -> RateLimitResult:
+        """Consume `cost` requests from `key` if `limit` per `window` seconds allows it"""
+        # The algorithm is part of the key so switching algorithms never
+        # collides with a key holding a different Redis data type
+        redis_key = f"{key}:{self.key_suffix}"
+        args = [limit, window * 1000, cost]
+        if self.algorithm == RateLimitAlgorithm.SLIDING_WINDOW:
+            args.append(uuid.uuid4().hex)
+
+        allowed, remaining, reset_ms, retry_after_ms = await self._evaluate(redis_key, args)
+
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=limit,
+            remaining=max(0, int(remaining)),
+            reset_after=int(reset_ms) / 1000,
+            retry_after=int(retry_after_ms) / 1000,
+        )
+
+    async def _evaluate(self, key: str, args: list):
+        """Run the script by SHA, loading it on the first call per Redis server"""
+        try:
+            return await _maybe_await(
+                self.redis_client.evalsha(self.script_sha, 1, key, *args)
+            )
+        except NoScriptError:
+            return await _maybe_await(
+                self.redis_client.eval(self.script, 1, key, *args)
+            )
+
+    async def close(self) -> None:
+        """Nothing is buffered; here so either limiter can be closed on shutdown"""
+
+async def _maybe_await(result: Any) -> Any:
+    """Support both redis.asyncio and synchronous redis clients"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+class _LocalBucket:
+    """Per-key, per-window state held in worker memory"""
+    __slots__ = (
+        "redis_key", "previous_key", "window", "window_id",
+        "synced_count", "previous_count", "pending", "expires",
+    )
+
+    def __init__(self, key: str, window: int, window_id: int, previous_count: int = 0):
+        self.redis_key = f"{key}:hy:{window}:{window_id}"
+        self.previous_key = f"{key}:hy:{window}:{window_id - 1}"
+        self.window = window
+        self.window_id = window_id
+        self.synced_count = 0  # fleet-wide count as of the last sync
+        self.previous_count = previous_count  # fleet-wide count of the previous window
+        self.pending = 0  # consumed locally, not yet pushed to Redis
+        self.expires = False  # TTL already set on the Redis counter
+
+class HybridRateLimiter:
+    """Two-tier rate limiter: local counts reconciled with Redis in batches
+
+    Requests are counted in fixed windows, and a check weighs the previous
+    window's count by the share of it still inside the sliding window (the
+    sliding window counter approximation). This keeps the exact limiter's
+    sliding semantics: a burst at the end of one window cannot be followed
+    by a full limit at the start of the next.
+
+    Each worker decides locally from the fleet-wide counts it last saw plus
+    its own unsynced consumption. Consumed counts are pushed to per-window
+    Redis counters in one pipeline every `sync_interval` seconds. A key is
+    synced immediately once the worker has spent its share (1/`worker_count`)
+    of what was left below `sync_threshold` of the limit at its last sync, so
+    workers that start from the same view (all at 0 after a restart or when
+    a new window begins) cannot together overshoot the limit. Limits below
+    `min_limit` (e.g. auth endpoints) go straight to the atomic limiter.
+    """
+
+    def __init__(
+        self,
+        redis_client: Any,
+        sync_interval: Optional[float] = None,
+        sync_threshold: Optional[float] = None,
+        min_limit: Optional[int] = None,
+        worker_count: Optional[int] = None
+    ):
+        self.redis_client = redis_client
+        self.sync_interval = sync_interval or settings.RATE_LIMIT_SYNC_INTERVAL
+        self.sync_threshold = (
+            settings.RATE_LIMIT_SYNC_THRESHOLD if sync_threshold is None else sync_threshold
+        )
+        self.min_limit = settings.RATE_LIMIT_HYBRID_MIN_LIMIT if min_limit is None else min_limit
+        self.worker_count = max(1, worker_count or settings.RATE_LIMIT_HYBRID_WORKERS)
+        self.exact_limiter = RateLimiter(redis_client)
+        self.buckets: Dict[Tuple[str, int, int], _LocalBucket] = {}
+        self._sync_task: Optional[asyncio.Task] = None
+
+    async def hit(
+        self,
+        key: str,
+        limit: int,
+        window: int,
+        cost: int = 1
+    ) -> RateLimitResult:
+        """Consume `cost` requests from `key`, touching Redis only near the limit"""
+        if limit < self.min_limit:
+            return await self.exact_limiter.hit(key, limit, window, cost)
+
+        self._ensure_sync_task()
+
+        now = time.time()
+        window_id = int(now // window)
+        bucket = self.buckets.get((key, window, window_id))
+        if bucket is None:
+            # Until the first sync reads it from Redis, the previous window's
+            # count is what this worker last knew of it
+            previous = self.buckets.get((key, window, window_id - 1))
+            bucket = self.buckets[(key, window, window_id)] = _LocalBucket(
+                key, window, window_id,
+                previous.synced_count + previous.pending if previous else 0
+            )
+
+        reset_after = (window_id + 1) * window - now
+        # share of the previous window still inside the sliding window
+        weight = reset_after / window
+
+        def synced_used() -> float:
+            return bucket.previous_count * weight + bucket.synced_count
+
+        # The other workers may be spending from the same view: past its
+        # share of the headroom this worker reconciles the key, and close to
+        # the limit it does so on every hit. Once the fleet count reaches the
+        # limit the key stays exhausted locally, with no more syncs, until
+        # the previous window's share has decayed enough.
+        headroom = limit * (1 - self.sync_threshold) - synced_used()
+        if (
+            synced_used() < limit
+            and bucket.pending + cost > headroom / self.worker_count
+        ):
+            try:
+                await self._sync([bucket])
+            except Exception as e:
+                logger.error(f"Rate limit sync error: {e}")
+        used = synced_used() + bucket.pending
+
+        if used + cost > limit:
+            # the previous window's share decays linearly until the window ends
+            retry_after = reset_after
+            if bucket.previous_count:
+                retry_after = min(reset_after, (used + cost - limit) * window / bucket.previous_count)
+            return RateLimitResult(
+                allowed=False,
+                limit=limit,
+                remaining=max(0, math.floor(limit - used)),
+                reset_after=reset_after,
+                retry_after=retry_after,
+            )
+
+        bucket.pending += cost
+        return RateLimitResult(
+            allowed=True,
+            limit=limit,
+            remaining=max(0, math.floor(limit - used - cost)),
+            reset_after=reset_after,
+            retry_after=0,
+        )
+
+    def _ensure_sync_task(self) -> None:
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop())
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                # Pending counts are kept and retried on the next tick
+                logger.error(f"Rate limit sync error: {e}")
+
+    async def flush(self) -> None:
+        """Push all pending consumption to Redis and drop windows no longer weighed"""
+        now = time.time()
+        pending = []
+        for bucket_key, bucket in list(self.buckets.items()):
+            if bucket.pending:
+                pending.append(bucket)
+            elif bucket.window_id < int(now // bucket.window) - 1:
+                # the current window's bucket still reads the previous one
+                del self.buckets[bucket_key]
+
+        if pending:
+            await self._sync(pending)
+
+    async def _sync(self, buckets: List[_LocalBucket]) -> None:
+        """INCRBY every pending count and read the previous windows in one pipelined round trip"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        expiring = []
+        for bucket in buckets:
+            pipe.incrby(bucket.redis_key, bucket.pending)
+        for bucket in buckets:
+            pipe.get(bucket.previous_key)
+        for bucket in buckets:
+            if not bucket.expires:
+                pipe.expire(bucket.redis_key, bucket.window * 2)
+                expiring.append(bucket)
+
+        # Counts are detached before awaiting so hits during the round trip
+        # are kept for the next sync instead of being lost or double counted
+        sent = [bucket.pending for bucket in buckets]
+        for bucket in buckets:
+            bucket.pending = 0
+        try:
+            results = await _maybe_await(pipe.execute())
+        except Exception:
+            for bucket, count in zip(buckets, sent):
+                bucket.pending += count
+            raise
+
+        # Fleet counts only grow: a concurrent sync of the same key that
+        # finishes later with an older total must not lower them
+        totals, previous_totals = results[:len(buckets)], results[len(buckets):2 * len(buckets)]
+        for bucket, total, previous in zip(buckets, totals, previous_totals):
+            bucket.synced_count = max(bucket.synced_count, int(total))
+            bucket.previous_count = max(bucket.previous_count, int(previous or 0))
+        for bucket in expiring:
+            bucket.expires = True
+
+    async def close(self) -> None:
+        """Stop the background sync and flush what is left"""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        await self.flush()
+
+def create_rate_limiter(redis_client: Any) -> Union[RateLimiter, HybridRateLimiter]:
+    """Build the limiter selected by RATE_LIMIT_MODE"""
+    if settings.RATE_LIMIT_MODE == "hybrid":
+        return HybridRateLimiter(redis_client)
+    return RateLimiter(redis_client)
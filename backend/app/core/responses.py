@@ -0,0 +1,76 @@
+"""
+Fast JSON response path
+
+The default path for `return [Schema.from_orm(obj) for obj in rows]` builds
+one model per row, has FastAPI validate the list again against
+response_model, converts it to plain Python objects and finally encodes them
+with the stdlib json module.
+
+The helpers here are opt-in for hot list endpoints:
+
+- `orm_response(Schema, rows)` validates the ORM objects once through a
+  cached TypeAdapter and serializes them straight to JSON bytes in
+  pydantic-core. FastAPI passes Response objects through untouched, so
+  response_model is still used for the OpenAPI schema but not re-applied.
+- `FastJSONResponse` encodes already-built dicts/lists with orjson.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from starlette.background import BackgroundTask
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when it is installed"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+class PrerenderedJSONResponse(JSONResponse):
+    """JSON response whose body has already been encoded"""
+
+    def render(self, content: bytes) -> bytes:
+        return content
+
+@lru_cache(maxsize=None)
+def get_type_adapter(type_: Any) -> TypeAdapter:
+    """TypeAdapter for `type_`, built once per type (building one is costly)"""
+    return TypeAdapter(type_)
+
+def list_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    return get_type_adapter(List[schema])
+
+def serialize_orm(schema: Type[BaseModel], rows: Iterable[Any]) -> bytes:
+    """Validate ORM rows against `schema` once and encode them as a JSON array"""
+    adapter = list_adapter(schema)
+    items = adapter.validate_python(
+        rows if isinstance(rows, list) else list(rows),
+        from_attributes=True,
+    )
+    return adapter.dump_json(items)
+
+def orm_response(
+    schema: Type[BaseModel],
+    rows: Iterable[Any],
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+    background: Optional[BackgroundTask] = None,
+) -> PrerenderedJSONResponse:
+    """Response with `rows` serialized through `schema`, skipping re-validation"""
+    return PrerenderedJSONResponse(
+        serialize_orm(schema, rows),
+        status_code=status_code,
+        headers=headers,
+        background=background,
+    )
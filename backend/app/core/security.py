@@ -20,6 +20,7 @@ from cryptography.fernet import Fernet
 from app.config.settings import get_settings
 
 from app.config.settings import settings
+from app.core.rate_limiter import RateLimiter
 from app.models.user import User, UserSession
 
 logger = logging.getLogger(__name__)
@@ -335,17 +336,8 @@ async def is_rate_limited(
     window: int
 ) -> bool:
     """Check if action is rate limited"""
-    current_count = await redis_client.get(key)
-    
-    if current_count is None:
-        await redis_client.setex(key, window, 1)
-        return False
-    
-    if int(current_count) >= limit:
-        return True
-    
-    await redis_client.incr(key)
-    return False
+    result = await RateLimiter(redis_client).hit(key, limit, window)
+    return not result.allowed
 
 # New functions from the code block
 def get_password_hash(password: str) -> str:
@@ -412,10 +404,9 @@ def generate_random_key(length: int = 32) -> str:
 # Rate limiting decorator
 from functools import wraps
 from fastapi import HTTPException, Request
-from redis import Redis
 import time
 
-redis_client = Redis.from_url(settings.REDIS_URL)
+from app.config.redis import get_redis_client
 
 def rate_limit(
     requests: int = 100,
@@ -430,17 +421,15 @@ def rate_limit(
             client_ip = request.client.host
             key = f"{key_prefix}:{client_ip}"
             
-            # Check rate limit
-            current = redis_client.get(key)
-            if current is None:
-                redis_client.setex(key, window, 1)
-            else:
-                if int(current) >= requests:
-                    raise HTTPException(
-                        status_code=429,
-                        detail="Too many requests"
-                    )
-                redis_client.incr(key)
+            # Check rate limit on the shared async pool
+            limiter = RateLimiter(await get_redis_client())
+            result = await limiter.hit(key, requests, window)
+            if not result.allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(result.retry_after_seconds)}
+                )
             
             return await func(request, *args, **kwargs)
         return wrapper
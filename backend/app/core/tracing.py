@@ -0,0 +1,497 @@
+"""
+Request tracing
+
+A small W3C Trace Context compatible tracer. The server span opened by
+TracingMiddleware is kept in a context variable; SQLAlchemy statements, Redis
+commands, model inference and calls to Stripe/SMTP/Twilio open child spans
+under it, and the Stripe and Twilio HTTP clients send the client span's
+traceparent on with the call. Finished spans are handed to a pluggable exporter:
+
+- "memory": kept in a list, for tests and local debugging
+- "file": appended as JSON lines to TRACING_FILE_PATH
+- "otlp": posted as OTLP/HTTP JSON to the Jaeger collector
+
+File and OTLP exports run on a background thread so the event loop never
+waits on the exporter.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+class SpanKind(str, Enum):
+    """Span kinds, numbered as in OTLP"""
+    INTERNAL = "internal"
+    SERVER = "server"
+    CLIENT = "client"
+
+_OTLP_KINDS = {SpanKind.INTERNAL: 1, SpanKind.SERVER: 2, SpanKind.CLIENT: 3}
+
+class SpanContext:
+    """Identifiers carried between services in the traceparent header"""
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Parse a W3C traceparent header, returning None when it is invalid"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    if (
+        len(version) != 2 or version == "ff"
+        or len(trace_id) != 32 or trace_id == "0" * 32
+        or len(span_id) != 16 or span_id == "0" * 16
+        or len(flags) != 2
+    ):
+        return None
+    try:
+        int(trace_id, 16)
+        int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    return SpanContext(trace_id.lower(), span_id.lower(), sampled)
+
+class Span:
+    """A timed operation within a trace"""
+    __slots__ = (
+        "name", "kind", "context", "parent_id", "attributes",
+        "start_ns", "end_ns", "error", "_tracer",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        kind: SpanKind,
+        context: SpanContext,
+        parent_id: Optional[str],
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self._tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.context.trace_id
+
+    @property
+    def span_id(self) -> str:
+        return self.context.span_id
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+        self.attributes["exception.type"] = type(exc).__name__
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self._tracer.on_end(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind.value,
+            "start_time_unix_nano": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+class SpanExporter:
+    """Base exporter: receives batches of finished spans"""
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps finished spans in memory"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+    def get_trace(self, trace_id: str) -> List[Span]:
+        return [span for span in self.spans if span.trace_id == trace_id]
+
+class JSONFileSpanExporter(SpanExporter):
+    """Appends one JSON object per span to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+class OTLPHttpSpanExporter(SpanExporter):
+    """Posts spans as OTLP/HTTP JSON (accepted by Jaeger's collector)"""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        import httpx
+
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=timeout)
+
+    def export(self, spans: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({
+                    "service.name": self.service_name,
+                    "deployment.environment": settings.ENVIRONMENT,
+                })},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [_otlp_span(span) for span in spans],
+                }],
+            }]
+        }
+        response = self._client.post(self.endpoint, json=payload)
+        response.raise_for_status()
+
+    def shutdown(self) -> None:
+        self._client.close()
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    otlp_span = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": _OTLP_KINDS[span.kind],
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp_span["parentSpanId"] = span.parent_id
+    return otlp_span
+
+class _BatchExportThread:
+    """Exports finished spans in batches from a daemon thread"""
+
+    def __init__(self, exporter: SpanExporter, max_queue_size: int,
+                 batch_size: int, flush_interval: float):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def put(self, span: Span) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            # Never block a request on the exporter
+            self.dropped += 1
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                span = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                pass
+            else:
+                if span is None:
+                    self._export(batch)
+                    return
+                batch.append(span)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._export(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _export(self, batch: List[Span]) -> None:
+        if not batch:
+            return
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning("Span export failed, dropping %d spans: %s", len(batch), e)
+
+    def shutdown(self) -> None:
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+        self.exporter.shutdown()
+
+class Tracer:
+    """Creates spans and hands finished, sampled spans to the exporter"""
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        sample_rate: float = 1.0,
+        batch: bool = True,
+        max_queue_size: int = 10000,
+        batch_size: int = 512,
+        flush_interval: float = 2.0,
+    ):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self._batcher = (
+            _BatchExportThread(exporter, max_queue_size, batch_size, flush_interval)
+            if batch else None
+        )
+
+    def start_span(
+        self,
+        name: str,
+        kind: SpanKind = SpanKind.INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+        parent: Optional[SpanContext] = None,
+        root: bool = False,
+    ) -> Optional[Span]:
+        """
+        Start a span under `parent` or the current span.
+
+        Without either, a new trace is only started when `root` is set, so
+        database and Redis calls made outside a request are not traced.
+        """
+        parent_span = None
+        if parent is None:
+            parent_span = _current_span.get()
+            if parent_span is not None:
+                parent = parent_span.context
+
+        if parent is None:
+            if not root or random.random() >= self.sample_rate:
+                return None
+            context = SpanContext(_random_id(16), _random_id(8))
+        elif not parent.sampled:
+            return None
+        else:
+            context = SpanContext(parent.trace_id, _random_id(8))
+
+        return Span(
+            self, name, kind, context,
+            parent.span_id if parent is not None else None,
+            attributes,
+        )
+
+    def on_end(self, span: Span) -> None:
+        if self._batcher is not None:
+            self._batcher.put(span)
+        else:
+            self.exporter.export([span])
+
+    def shutdown(self) -> None:
+        if self._batcher is not None:
+            self._batcher.shutdown()
+        else:
+            self.exporter.shutdown()
+
+def _random_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+_tracer: Optional[Tracer] = None
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+def create_exporter(name: Optional[str] = None) -> SpanExporter:
+    """Build the exporter selected by settings.TRACING_EXPORTER"""
+    name = (name or settings.TRACING_EXPORTER).lower()
+    if name == "memory":
+        return InMemorySpanExporter()
+    if name == "file":
+        return JSONFileSpanExporter(settings.TRACING_FILE_PATH)
+    if name == "otlp":
+        endpoint = settings.TRACING_OTLP_ENDPOINT or (
+            f"http://{settings.JAEGER_AGENT_HOST}:4318/v1/traces"
+        )
+        return OTLPHttpSpanExporter(endpoint, settings.APP_NAME)
+    raise ValueError(f"Unknown tracing exporter: {name}")
+
+def configure_tracing(exporter: Optional[SpanExporter] = None,
+                      sample_rate: Optional[float] = None) -> Tracer:
+    """Install the process-wide tracer"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.shutdown()
+    exporter = exporter or create_exporter()
+    _tracer = Tracer(
+        exporter,
+        sample_rate=settings.TRACING_SAMPLE_RATE if sample_rate is None else sample_rate,
+        # The in-memory exporter is cheap enough to call inline
+        batch=not isinstance(exporter, InMemorySpanExporter),
+    )
+    return _tracer
+
+def shutdown_tracing() -> None:
+    """Flush pending spans and uninstall the tracer"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.shutdown()
+        _tracer = None
+
+@contextmanager
+def start_span(
+    name: str,
+    kind: SpanKind = SpanKind.INTERNAL,
+    attributes: Optional[Dict[str, Any]] = None,
+    parent: Optional[SpanContext] = None,
+    root: bool = False,
+) -> Iterator[Optional[Span]]:
+    """
+    Trace a block as the current span, e.g.
+    `with start_span("stripe.Refund.create", SpanKind.CLIENT):`
+
+    Yields None (and costs next to nothing) when tracing is off or the
+    trace is not sampled.
+    """
+    span = _tracer.start_span(name, kind, attributes, parent, root) if _tracer else None
+    if span is None:
+        yield None
+        return
+
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.record_exception(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+def client_span(service: str, operation: str, **attributes: Any):
+    """Span around a call to an external service"""
+    attributes["peer.service"] = service
+    return start_span(f"{service}.{operation}", SpanKind.CLIENT, attributes)
+
+def inject_traceparent(headers: Dict[str, str]) -> Dict[str, str]:
+    """Add the current traceparent to outgoing HTTP headers"""
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.context.traceparent
+    return headers
+
+def instrument_engine_tracing(engine: Any) -> None:
+    """Open a client span around every statement run by an (async) engine"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    db_system = sync_engine.dialect.name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _tracer is None:
+            return
+        span = _tracer.start_span(
+            f"db.{_statement_operation(statement)}",
+            SpanKind.CLIENT,
+            {
+                "db.system": db_system,
+                "db.statement": statement[:2048],
+                "db.executemany": executemany,
+            },
+        )
+        if span is not None:
+            context._trace_span = span
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None) if context is not None else None
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.end()
+
+def _statement_operation(statement: str) -> str:
+    parts = statement.lstrip().split(None, 1)
+    return parts[0].upper() if parts else "QUERY"
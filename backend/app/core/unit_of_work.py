@@ -0,0 +1,107 @@
+"""
+Unit of work: one transaction per business operation
+
+Booking an appointment used to commit the appointment, then its reminders,
+then each notification, each commit being a round trip and a WAL flush of its
+own. `unit_of_work(db)` collects the writes of one operation and commits
+them once at the end:
+
+    async with unit_of_work(db) as uow:
+        uow.add(appointment)
+        uow.insert(AppointmentReminder, [{...}, {...}])
+
+- ORM objects added with `uow.add()` are flushed by the session, which
+  already batches INSERTs of the same mapper.
+- Rows nobody needs back as objects go through `uow.insert()` and are
+  written as one executemany INSERT per table after the ORM flush, so they
+  may reference the objects added before them.
+
+Helpers that write open their own `unit_of_work(db)`: called on their own
+they commit, called inside an operation's unit of work they join it and the
+outermost block commits (or rolls back everything if anything raised).
+Work that must only happen once the data is committed (cache updates) is
+registered with `uow.after_commit()` and runs after the outermost commit.
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Tuple
+import logging
+
+from sqlalchemy import Table, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "unit_of_work"
+
+class UnitOfWork:
+    """Writes of one operation, flushed and committed together"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        # insertion order is kept so parents are written before children
+        self._rows: Dict[Table, List[Dict[str, Any]]] = {}
+        self._after_commit: List[Tuple[Callable[..., Awaitable[Any]], tuple]] = []
+
+    def add(self, instance: Any) -> None:
+        self.db.add(instance)
+
+    def add_all(self, instances: Iterable[Any]) -> None:
+        self.db.add_all(instances)
+
+    def insert(self, model: Any, rows: Iterable[Dict[str, Any]]) -> None:
+        """Queue plain rows (column name -> value) for a bulk INSERT into `model`"""
+        self._rows.setdefault(model.__table__, []).extend(rows)
+
+    def after_commit(self, callback: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        """Run `await callback(*args)` once the operation has been committed"""
+        self._after_commit.append((callback, args))
+
+    @property
+    def pending_rows(self) -> int:
+        return sum(len(rows) for rows in self._rows.values())
+
+    async def flush(self) -> None:
+        """Write everything collected so far without committing"""
+        await self.db.flush()
+        rows_by_table, self._rows = self._rows, {}
+        for table, rows in rows_by_table.items():
+            if rows:
+                await self.db.execute(insert(table), rows)
+
+    async def commit(self) -> None:
+        await self.flush()
+        await self.db.commit()
+
+    async def rollback(self) -> None:
+        self._rows = {}
+        self._after_commit = []
+        await self.db.rollback()
+
+    async def run_after_commit(self) -> None:
+        """The data is already committed, so a failing callback is only logged"""
+        callbacks, self._after_commit = self._after_commit, []
+        for callback, args in callbacks:
+            try:
+                await callback(*args)
+            except Exception as e:
+                logger.warning(f"after_commit {getattr(callback, '__name__', callback)} failed: {e}")
+
+@asynccontextmanager
+async def unit_of_work(db: AsyncSession) -> AsyncIterator[UnitOfWork]:
+    """The unit of work running on `db`, or a new one committed when the block ends"""
+    current = db.info.get(SESSION_KEY)
+    if current is not None:
+        yield current
+        return
+
+    uow = UnitOfWork(db)
+    db.info[SESSION_KEY] = uow
+    try:
+        yield uow
+        await uow.commit()
+    except BaseException:
+        await uow.rollback()
+        raise
+    finally:
+        db.info.pop(SESSION_KEY, None)
+    await uow.run_after_commit()
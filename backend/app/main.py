@@ -1,22 +1,45 @@
+import time
+
+# Taken before the imports below, so the reported worker startup time includes them
+IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI ,Request ,status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
-import time
+from prometheus_client import CONTENT_TYPE_LATEST
+from sqlalchemy import text
+import asyncio
 import logging
+import os
 from contextlib import asynccontextmanager
 
 from app.config.settings import settings
-from app.config.database import engine, Base
+from app.config.database import DatabaseManager, engine, replica_engine
 from app.core.middleware import (
     SecurityHeadersMiddleware,
     RateLimitMiddleware,
     LoggingMiddleware,
     CompressionMiddleware,
+    MetricsMiddleware,
+    SecurityAuditMiddleware,
+    TracingMiddleware,
+)
+from app.core.metrics import (
+    WORKER_STARTUP_SECONDS,
+    instrument_engine,
+    render_metrics,
 )
-from app.core.dependencies import get_redis_client
+from app.core.rate_limiter import create_rate_limiter
+from app.core.tracing import configure_tracing, instrument_engine_tracing, shutdown_tracing
+from app.core.query_log import (
+    RequestScopeMiddleware,
+    instrument_query_counting,
+    instrument_slow_queries,
+)
+from app.config.redis import close_redis, init_redis, prewarm_redis
 from app.api.v1 import (
     auth,
     users,
@@ -25,9 +48,10 @@ from app.api.v1 import (
     medications,
     chat,
     dashboard,
+    admin,
 )
 
-from app.utils.logger import setup_logging
+from app.utils.logger import setup_logging, shutdown_logging
 from app.utils.validators import validation_exception_handler
 
 # setup logging
@@ -38,25 +62,57 @@ logger =logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Application lifespan context manager."""
     # startup 
+    # restarts the log listener stopped by a previous lifespan
+    setup_logging()
     logger.info("Starting Medical Platform API...")
+    started = time.perf_counter()
     
-    # create database tables
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Migrations own the schema; create_all on boot is for local development only
+    if settings.DATABASE_SCHEMA_STARTUP == "create":
+        await DatabaseManager.create_tables()
+    else:
+        revision = await DatabaseManager.check_schema_version()
+        logger.info(f"Database schema at revision {revision}")
+    schema_ready = time.perf_counter()
         
-    # Initialize Redis connection
-    redis_client = await get_redis_client()
-    app.state.redis = redis_client
+    # Initialize the shared Redis connection pool
+    app.state.redis = await init_redis()
+    # Shared with RateLimitMiddleware so its pending counts are flushed on shutdown
+    app.state.rate_limiter = create_rate_limiter(app.state.redis)
+    
+    # Open pooled connections now so the first requests do not pay for them
+    db_connections, redis_connections = await asyncio.gather(
+        DatabaseManager.prewarm(settings.DATABASE_PREWARM_CONNECTIONS),
+        prewarm_redis(settings.REDIS_PREWARM_CONNECTIONS),
+    )
+    ready = time.perf_counter()
     
-    logger.info("Application started complete")
+    startup_seconds = {
+        "imports": started - IMPORT_STARTED,
+        "schema": schema_ready - started,
+        "prewarm": ready - schema_ready,
+        "total": ready - IMPORT_STARTED,
+    }
+    if settings.ENABLE_PROMETHEUS:
+        for phase, seconds in startup_seconds.items():
+            WORKER_STARTUP_SECONDS.labels(phase).set(seconds)
+    logger.info(
+        f"Worker {os.getpid()} started in {startup_seconds['total']:.2f}s "
+        f"(imports {startup_seconds['imports']:.2f}s, "
+        f"schema {startup_seconds['schema']:.2f}s, "
+        f"prewarm {startup_seconds['prewarm']:.2f}s: "
+        f"{db_connections} database / {redis_connections} Redis connections)"
+    )
     
     yield
     
     # shutdown
     logger.info("Shutting down Medical Platform API...")
-    if hasattr(app.state, 'redis'):
-        await app.state.redis.close()
+    await app.state.rate_limiter.close()
+    await close_redis()
     logger.info("Shutting down Medical Platform API...")
+    shutdown_tracing()
+    shutdown_logging()
     
 # Create FastAPI application
 app = FastAPI(
@@ -86,10 +142,41 @@ app.add_middleware(
 
 # Custom Middleware
 app.add_middleware(SecurityHeadersMiddleware)
+if settings.ENABLE_WAF:
+    app.add_middleware(SecurityAuditMiddleware)
 app.add_middleware(RateLimitMiddleware)
 app.add_middleware(LoggingMiddleware)
 app.add_middleware(CompressionMiddleware)
 
+if settings.ENABLE_PROMETHEUS:
+    instrument_engine(engine)
+    if replica_engine is not None:
+        instrument_engine(replica_engine, "replica")
+
+if settings.SLOW_QUERY_LOG_ENABLED:
+    instrument_slow_queries(engine)
+    if replica_engine is not None:
+        instrument_slow_queries(replica_engine)
+
+if settings.QUERY_COUNT_ENABLED:
+    instrument_query_counting(engine)
+    if replica_engine is not None:
+        instrument_query_counting(replica_engine)
+
+if settings.SLOW_QUERY_LOG_ENABLED or settings.QUERY_COUNT_ENABLED:
+    app.add_middleware(RequestScopeMiddleware)
+
+if settings.TRACING_ENABLED:
+    configure_tracing()
+    instrument_engine_tracing(engine)
+    if replica_engine is not None:
+        instrument_engine_tracing(replica_engine)
+    app.add_middleware(TracingMiddleware)
+
+# Added last, so it is outermost and latency covers the whole middleware stack
+if settings.ENABLE_PROMETHEUS:
+    app.add_middleware(MetricsMiddleware)
+
 # Exception Handlers
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -142,7 +229,7 @@ async def detailed_health_check():
  # Check database connection
     try:
         async with engine.begin() as conn:
-            await conn.execute("SELECT 1")
+            await conn.execute(text("SELECT 1"))
         checks["database"] = "healthy"
     except Exception as e:
         logger.error(f"Database health check failed: {e}")
@@ -167,6 +254,13 @@ async def detailed_health_check():
     
     return checks
 
+# Metrics Endpoint
+if settings.ENABLE_PROMETHEUS:
+    @app.get(settings.PROMETHEUS_METRICS_PATH, include_in_schema=False)
+    async def metrics():
+        """Prometheus metrics aggregated across all workers"""
+        return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 # API Routes
 app.include_router(
     auth.router,
@@ -210,6 +304,12 @@ app.include_router(
     tags=["Dashboard"]
 )
 
+app.include_router(
+    admin.router,
+    prefix="/api/v1/admin",
+    tags=["Admin"]
+)
+
 # Root endpoint
 @app.get("/", tags=["Root"])
 async def root():
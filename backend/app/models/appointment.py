@@ -3,8 +3,8 @@ Appointment System Models
 """
 from datetime import datetime, time
 from typing import Dict, Any
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, JSON, Time, Index, CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, JSON, Time, Index, CheckConstraint, Computed, DDL, event, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY, TSRANGE, ExcludeConstraint
 from sqlalchemy.orm import relationship
 import uuid
 from enum import Enum
@@ -30,6 +30,8 @@ class PaymentStatus(str, Enum):
     REFUNDED = "REFUNDED"
     FAILED = "FAILED"
 
+OVERLAP_CONSTRAINT = "ex_appointments_doctor_time"
+
 class Appointment(Base):
     """نموذج الموعد في قاعدة البيانات"""
     __tablename__ = "appointments"
@@ -57,6 +59,11 @@ class Appointment(Base):
     cancellation_reason = Column(String)
     reminder_sent = Column(Boolean, default=False)
     feedback_submitted = Column(Boolean, default=False)
+    # فترة الموعد [البداية، النهاية) تحسبها قاعدة البيانات لقيد منع التداخل
+    time_range = Column(
+        TSRANGE,
+        Computed("tsrange(scheduled_at, scheduled_at + duration_minutes * interval '1 minute', '[)')", persisted=True)
+    )
 
     # العلاقات
     doctor = relationship("User", foreign_keys=[doctor_id], back_populates="doctor_appointments")
@@ -72,8 +79,23 @@ class Appointment(Base):
         Index('ix_appointments_doctor_scheduled', 'doctor_id', 'scheduled_at'),
         Index('ix_appointments_patient_scheduled', 'patient_id', 'scheduled_at'),
         Index('ix_appointments_status_date', 'status', 'scheduled_at'),
+        # لا يمكن حجز فترتين متداخلتين لنفس الطبيب (المواعيد النشطة فقط)
+        ExcludeConstraint(
+            ('doctor_id', '='),
+            ('time_range', '&&'),
+            name=OVERLAP_CONSTRAINT,
+            using='gist',
+            where=text("status IN ('PENDING', 'CONFIRMED')")
+        ),
     )
 
+# عامل '=' على doctor_id داخل فهرس GiST يحتاج btree_gist
+event.listen(
+    Appointment.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql")
+)
+
 class AppointmentFeedback(Base):
     """نموذج تقييم الموعد في قاعدة البيانات"""
     __tablename__ = "appointment_feedbacks"
@@ -163,7 +185,7 @@ class AppointmentNotification(Base):
     message = Column(String, nullable=False)
     status = Column(String, default="pending")
     scheduled_time = Column(DateTime)
-    metadata = Column(JSONB, default={})
+    meta = Column("metadata", JSONB, default={})  # "metadata" is reserved by declarative
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -2,7 +2,7 @@
 Chat model and related models
 """
 from enum import Enum
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, JSON, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Text, JSON, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -37,7 +37,7 @@ class ChatSession(Base):
     title = Column(String(255), nullable=True)
     summary = Column(Text, nullable=True)
     context = Column(JSON, default=dict)
-    metadata = Column(JSON, default=dict)
+    meta = Column("metadata", JSON, default=dict)  # "metadata" is reserved by declarative
     started_at = Column(DateTime, default=datetime.utcnow)
     ended_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -61,7 +61,7 @@ class ChatMessage(Base):
     sender_id = Column(String(36), ForeignKey("users.id"), nullable=True)
     message_type = Column(SQLEnum(MessageType), nullable=False)
     content = Column(Text, nullable=False)
-    metadata = Column(JSON, default=dict)
+    meta = Column("metadata", JSON, default=dict)  # "metadata" is reserved by declarative
     is_read = Column(Boolean, default=False)
     read_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -86,7 +86,7 @@ class ChatAttachment(Base):
     file_size = Column(Integer, nullable=False)
     file_url = Column(String(255), nullable=False)
     thumbnail_url = Column(String(255), nullable=True)
-    metadata = Column(JSON, default=dict)
+    meta = Column("metadata", JSON, default=dict)  # "metadata" is reserved by declarative
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -1,8 +1,9 @@
 """
 Doctor and Related Models
 """
-from sqlalchemy import Column, String, Boolean, DateTime, Enum, Text, JSON, ForeignKey, Numeric, Integer, Float, Table
+from sqlalchemy import Column, Computed, String, Boolean, DateTime, Enum, Text, JSON, ForeignKey, Index, Numeric, Integer, Float, Table, cast
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from geoalchemy2 import Geography, Geometry
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -10,6 +11,16 @@ import enum
 
 from app.config.database import Base
 
+# يُحسب الموقع من خطَّي العرض والطول، وفهرس GiST على (location::geography)
+# يخدم ST_DWithin في البحث الجغرافي
+LOCATION_FROM_COORDINATES = "ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)"
+# geography بلا typmod حتى يطابق تعبيرُ الاستعلام تعبيرَ الفهرس (location::geography)
+GEOGRAPHY = Geography(geometry_type=None)
+
+def trgm_index(name: str, column: str) -> Index:
+    """فهرس pg_trgm للبحث بـ ilike('%q%')"""
+    return Index(name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"})
+
 class DoctorStatus(enum.Enum):
     ACTIVE = "active"
     INACTIVE = "inactive"
@@ -111,6 +122,17 @@ class Doctor(Base):
     reviews = relationship("DoctorReview", back_populates="doctor")
     appointments = relationship("Appointment", back_populates="doctor")
 
+    # فهارس البحث (مرجعها الهجرة 20261016_0002)
+    __table_args__ = (
+        Index("ix_doctors_specializations_gin", "specializations", postgresql_using="gin"),
+        Index("ix_doctors_languages_gin", "languages", postgresql_using="gin"),
+        Index("ix_doctors_insurance_providers_gin", "insurance_providers", postgresql_using="gin"),
+        Index("ix_doctors_consultation_types_gin", "consultation_types", postgresql_using="gin"),
+        trgm_index("ix_doctors_first_name_trgm", "first_name"),
+        trgm_index("ix_doctors_last_name_trgm", "last_name"),
+        trgm_index("ix_doctors_bio_trgm", "bio"),
+    )
+
 class DoctorClinic(Base):
     """نموذج عيادة الطبيب"""
     __tablename__ = "doctor_clinics"
@@ -132,6 +154,7 @@ class DoctorClinic(Base):
     # الموقع الجغرافي
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    location = Column(Geometry("POINT", srid=4326, spatial_index=False), Computed(LOCATION_FROM_COORDINATES))
     
     # معلومات الاتصال
     phone = Column(String(20), nullable=False)
@@ -163,6 +186,10 @@ class DoctorClinic(Base):
     # العلاقات
     doctor = relationship("Doctor", back_populates="clinics")
 
+    __table_args__ = (
+        Index("ix_doctor_clinics_location_gist", cast(location, GEOGRAPHY), postgresql_using="gist"),
+    )
+
 class Hospital(Base):
     """نموذج المستشفى"""
     __tablename__ = "hospitals"
@@ -184,6 +211,7 @@ class Hospital(Base):
     # الموقع الجغرافي
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    location = Column(Geometry("POINT", srid=4326, spatial_index=False), Computed(LOCATION_FROM_COORDINATES))
     
     # معلومات الاتصال
     phone = Column(String(20), nullable=False)
@@ -236,6 +264,14 @@ class Hospital(Base):
     # العلاقات
     doctor_affiliations = relationship("DoctorHospital", back_populates="hospital")
 
+    __table_args__ = (
+        Index("ix_hospitals_specialties_gin", "specialties", postgresql_using="gin"),
+        Index("ix_hospitals_departments_gin", "departments", postgresql_using="gin"),
+        Index("ix_hospitals_insurance_providers_gin", "insurance_providers", postgresql_using="gin"),
+        trgm_index("ix_hospitals_name_trgm", "name"),
+        Index("ix_hospitals_location_gist", cast(location, GEOGRAPHY), postgresql_using="gist"),
+    )
+
 class DoctorHospital(Base):
     """نموذج علاقة الطبيب بالمستشفى"""
     __tablename__ = "doctor_hospitals"
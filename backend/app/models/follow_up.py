@@ -3,7 +3,7 @@ Follow-Up System Models
 """
 from datetime import datetime
 from typing import Dict, Any
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON, Index
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Index, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 import uuid
@@ -19,7 +19,7 @@ class Interaction(Base):
     type = Column(String, nullable=False)
     title = Column(String, nullable=False)
     description = Column(String)
-    metadata = Column(JSONB, default={})
+    meta = Column("metadata", JSONB, default={})  # "metadata" is reserved by declarative
     timestamp = Column(DateTime, nullable=False)
     status = Column(String, nullable=False)
     importance = Column(Integer, nullable=False)
@@ -44,6 +44,8 @@ class Interaction(Base):
         Index("ix_interactions_doctor_timestamp", "doctor_id", "timestamp"),
         Index("ix_interactions_reference", "reference_id", "reference_type"),
         Index("ix_interactions_type_status", "type", "status"),
+        # has_key (?) على metadata
+        Index("ix_interactions_metadata_gin", "metadata", postgresql_using="gin"),
     )
 
 class FollowUpRule(Base):
@@ -227,6 +229,10 @@ class FollowUpReminder(Base):
     follow_up = relationship("FollowUp", back_populates="reminders")
     recipient = relationship("User")
 
+    __table_args__ = (
+        Index('ix_follow_up_reminders_scheduled', 'scheduled_at', 'status'),
+    )
+
     def __repr__(self):
         return f"<FollowUpReminder {self.id}>"
 
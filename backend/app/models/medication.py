@@ -2,12 +2,13 @@
 Medication model and related models
 """
 from enum import Enum
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, JSON, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Index, Text, JSON, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
 
 from app.config.database import Base
+from app.schemas.medication import PaymentStatus
 
 class MedicationType(str, Enum):
     TABLET = "TABLET"
@@ -34,6 +35,7 @@ class Medication(Base):
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String(255), nullable=False)
     generic_name = Column(String(255), nullable=True)
+    brand_name = Column(String(255), nullable=True)
     manufacturer = Column(String(255), nullable=True)
     description = Column(Text, nullable=True)
     medication_type = Column(SQLEnum(MedicationType), nullable=False)
@@ -56,6 +58,12 @@ class Medication(Base):
     orders = relationship("MedicationOrder", back_populates="medication")
     interactions = relationship("DrugInteraction", back_populates="medication")
 
+    # pg_trgm indexes for the ilike('%q%') search (migration 20261016_0002)
+    __table_args__ = tuple(
+        Index(f"ix_medications_{column}_trgm", column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"})
+        for column in ("name", "generic_name", "brand_name", "description")
+    )
+
     def __repr__(self):
         return f"<Medication {self.name}>"
 
@@ -0,0 +1,35 @@
+"""
+Transactional outbox model
+"""
+from datetime import datetime
+import uuid
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.config.database import Base
+
+class OutboxEvent(Base):
+    """A side effect recorded in the transaction of the change that caused it"""
+    __tablename__ = "outbox_events"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    topic = Column(String(100), nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, default="pending")  # pending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime)  # lease of the relay that claimed the event
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        # the relay only ever looks at pending events that are due
+        Index(
+            'ix_outbox_events_pending',
+            'available_at',
+            postgresql_where=(status == 'pending'),
+        ),
+    )
@@ -0,0 +1,53 @@
+"""
+Payment model
+"""
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, String, Text
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.config.database import Base
+
+class Payment(Base):
+    """A Stripe payment intent and what became of it"""
+    __tablename__ = "payments"
+
+    id = Column(String(255), primary_key=True)  # Stripe payment intent id
+    user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
+    amount = Column(Float, nullable=False)
+    currency = Column(String(3), nullable=False)
+    payment_type = Column(String(20), nullable=False)  # APPOINTMENT, MEDICATION
+    status = Column(String(30), nullable=False)  # Stripe intent status, then succeeded, failed, refunded
+    charge_id = Column(String(255))
+    meta = Column("metadata", JSONB, default=dict)  # "metadata" is reserved by declarative
+    error = Column(Text)
+    refund_amount = Column(Float)
+    refund_reason = Column(String(100))
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime)
+    refunded_at = Column(DateTime)
+
+    __table_args__ = (
+        # payment history pages by user, newest first
+        Index('ix_payments_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "amount": self.amount,
+            "currency": self.currency,
+            "payment_type": self.payment_type,
+            "status": self.status,
+            "metadata": self.meta or {},
+            "refund_amount": self.refund_amount,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "refunded_at": self.refunded_at.isoformat() if self.refunded_at else None,
+        }
+
+    def __repr__(self):
+        return f"<Payment {self.id}>"
@@ -3,7 +3,7 @@ User model and related enums
 """
 from enum import Enum
 from typing import Optional, List
-from sqlalchemy import Column, String, Boolean, DateTime, Enum as SQLEnum, JSON, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, Text, Boolean, DateTime, Enum as SQLEnum, JSON, ForeignKey
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -32,6 +32,7 @@ class User(Base):
     two_fa_secret = Column(String(32), nullable=True)
     preferences = Column(JSON, default=dict)
     last_login = Column(DateTime, nullable=True)
+    stripe_customer_id = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -121,6 +122,20 @@ class UserSession(Base):
     def __repr__(self):
         return f"<UserSession {self.user_id}>"
 
+class FCMToken(Base):
+    """Firebase Cloud Messaging token of one of a user's devices"""
+    __tablename__ = "fcm_tokens"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(36), ForeignKey("users.id"), nullable=False, index=True)
+    token = Column(String(255), unique=True, nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<FCMToken {self.user_id}>"
+
 class AuditLog(Base):
     """Audit log model"""
     __tablename__ = "audit_logs"
@@ -0,0 +1,143 @@
+"""
+Appointment System Schemas
+"""
+from typing import List, Optional, Dict
+from datetime import datetime, time
+from uuid import UUID
+from pydantic import BaseModel, conint, confloat
+from enum import Enum
+
+class AppointmentStatus(str, Enum):
+    """حالة الموعد"""
+    PENDING = "PENDING"
+    CONFIRMED = "CONFIRMED"
+    CANCELLED = "CANCELLED"
+    COMPLETED = "COMPLETED"
+    NO_SHOW = "NO_SHOW"
+
+class AppointmentType(str, Enum):
+    """نوع الموعد"""
+    IN_PERSON = "IN_PERSON"
+    VIDEO = "VIDEO"
+    PHONE = "PHONE"
+
+class PaymentStatus(str, Enum):
+    """حالة الدفع"""
+    PENDING = "PENDING"
+    PAID = "PAID"
+    REFUNDED = "REFUNDED"
+    FAILED = "FAILED"
+
+class TimeSlot(BaseModel):
+    """نموذج الفترة الزمنية"""
+    start_time: time
+    end_time: time
+    is_available: bool = True
+
+# Appointment Schemas
+class AppointmentBase(BaseModel):
+    """النموذج الأساسي للموعد"""
+    doctor_id: UUID
+    patient_id: UUID
+    appointment_type: AppointmentType
+    scheduled_at: datetime
+    duration_minutes: conint(ge=15, le=180) = 30
+    reason: str
+    notes: Optional[str] = None
+    virtual_meeting_link: Optional[str] = None
+    symptoms: List[str] = []
+    medical_history_required: bool = False
+    insurance_required: bool = False
+    fee: confloat(ge=0)
+
+class AppointmentCreate(AppointmentBase):
+    """نموذج إنشاء موعد جديد"""
+    pass
+
+class AppointmentUpdate(BaseModel):
+    """نموذج تحديث الموعد"""
+    appointment_type: Optional[AppointmentType] = None
+    scheduled_at: Optional[datetime] = None
+    duration_minutes: Optional[conint(ge=15, le=180)] = None
+    reason: Optional[str] = None
+    notes: Optional[str] = None
+    virtual_meeting_link: Optional[str] = None
+    symptoms: Optional[List[str]] = None
+    status: Optional[AppointmentStatus] = None
+
+class AppointmentInDB(AppointmentBase):
+    """نموذج الموعد في قاعدة البيانات"""
+    id: UUID
+    status: AppointmentStatus
+    payment_status: PaymentStatus
+    payment_id: Optional[UUID] = None
+    created_at: datetime
+    updated_at: datetime
+    cancelled_at: Optional[datetime] = None
+    cancellation_reason: Optional[str] = None
+    reminder_sent: bool = False
+    feedback_submitted: bool = False
+
+    class Config:
+        from_attributes = True
+
+class AppointmentFeedback(BaseModel):
+    """نموذج تقييم الموعد"""
+    appointment_id: Optional[UUID] = None
+    rating: conint(ge=1, le=5)
+    comments: Optional[str] = None
+    wait_time_rating: conint(ge=1, le=5)
+    doctor_rating: conint(ge=1, le=5)
+    facility_rating: conint(ge=1, le=5)
+    would_recommend: bool
+    areas_of_improvement: List[str] = []
+
+    class Config:
+        from_attributes = True
+
+class AppointmentSearchParams(BaseModel):
+    """نموذج معايير البحث عن المواعيد"""
+    doctor_id: Optional[UUID] = None
+    patient_id: Optional[UUID] = None
+    status: Optional[List[AppointmentStatus]] = None
+    appointment_type: Optional[List[AppointmentType]] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    payment_status: Optional[List[PaymentStatus]] = None
+
+class AppointmentStats(BaseModel):
+    """إحصائيات المواعيد"""
+    total_appointments: int
+    completed_appointments: int
+    cancelled_appointments: int
+    no_show_appointments: int
+    average_duration: float
+    total_revenue: float
+    most_common_type: Optional[AppointmentType] = None
+    busiest_day: str
+    average_rating: float
+    patient_satisfaction: float
+
+class DoctorAvailability(BaseModel):
+    """نموذج توفر الطبيب"""
+    doctor_id: UUID
+    available_dates: List[datetime]
+    available_slots: Dict[str, List[TimeSlot]]
+    next_available_slot: Optional[datetime] = None
+    regular_schedule: Dict[str, List[TimeSlot]]
+    vacation_dates: List[datetime] = []
+    max_daily_appointments: Optional[int] = None
+    appointment_buffer_minutes: int = 15
+
+class EarliestSlot(BaseModel):
+    """نموذج موعد حر في البحث عن أقرب المواعيد"""
+    doctor_id: UUID
+    start_time: datetime
+    end_time: datetime
+
+class AppointmentConflictCheck(BaseModel):
+    """نموذج التحقق من تعارض المواعيد"""
+    doctor_id: UUID
+    scheduled_at: datetime
+    duration_minutes: conint(ge=15, le=180)
+    exclude_appointment_id: Optional[UUID] = None
@@ -1,7 +1,7 @@
 """
 Chat schemas
 """
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from uuid import UUID
@@ -37,7 +37,8 @@ class ChatSessionResponse(ChatSessionBase):
 class ChatMessageBase(BaseModel):
     """Base chat message schema"""
     content: str = Field(..., max_length=4096)
-    metadata: Optional[Dict[str, Any]] = None
+    # the ORM attribute is `meta` ("metadata" is reserved by declarative)
+    metadata: Optional[Dict[str, Any]] = Field(None, validation_alias=AliasChoices("meta", "metadata"))
 
 class ChatMessageCreate(ChatMessageBase):
     """Chat message creation schema"""
@@ -103,7 +103,7 @@ class DoctorInDB(DoctorBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class DoctorDistance(BaseModel):
     """نموذج المسافة للطبيب"""
@@ -145,7 +145,7 @@ class DoctorPublic(DoctorBase):
     distance: Optional[DoctorDistance] = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class DoctorDetail(DoctorPublic):
     """نموذج تفاصيل الطبيب"""
@@ -210,7 +210,7 @@ class ClinicInDB(ClinicBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 # Hospital Schemas
 class HospitalBase(BaseModel):
@@ -272,7 +272,7 @@ class HospitalInDB(HospitalBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class HospitalPublic(HospitalBase):
     """نموذج المستشفى العام"""
@@ -285,7 +285,7 @@ class HospitalPublic(HospitalBase):
     logo: Optional[HttpUrl]
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 # Doctor-Hospital Affiliation Schemas
 class DoctorHospitalBase(BaseModel):
@@ -325,7 +325,7 @@ class DoctorHospitalInDB(DoctorHospitalBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 # Review Schemas
 class ReviewBase(BaseModel):
@@ -371,7 +371,7 @@ class ReviewInDB(ReviewBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 # Search Schemas
 class HospitalSearchParams(BaseModel):
@@ -4,7 +4,7 @@ Follow-Up System Schemas
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from uuid import UUID
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field
 
 class InteractionType(str):
     APPOINTMENT = "appointment"
@@ -19,7 +19,8 @@ class InteractionBase(BaseModel):
     type: InteractionType
     title: str
     description: str
-    metadata: Dict[str, Any]
+    # خاصية النموذج اسمها meta (metadata محجوزة في declarative)
+    metadata: Dict[str, Any] = Field(validation_alias=AliasChoices("meta", "metadata"))
     timestamp: datetime
     status: str
     importance: int = Field(ge=1, le=5)
@@ -54,7 +55,7 @@ class InteractionInDB(InteractionBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class TimelineEntry(BaseModel):
     """نموذج عنصر الجدول الزمني"""
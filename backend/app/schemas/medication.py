@@ -118,7 +118,7 @@ class MedicationResponse(MedicationBase):
     updated_at: Optional[datetime]
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class InventoryTransactionType(str, Enum):
     PURCHASE = "purchase"
@@ -149,7 +149,7 @@ class InventoryTransactionResponse(InventoryTransactionCreate):
     created_by: UUID
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class OrderStatus(str, Enum):
     PENDING = "pending"
@@ -202,7 +202,7 @@ class OrderItemResponse(OrderItemCreate):
     medication: MedicationResponse
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class OrderResponse(BaseModel):
     id: UUID
@@ -233,7 +233,7 @@ class OrderResponse(BaseModel):
     cancelled_at: Optional[datetime]
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class PrescriptionStatus(str, Enum):
     PENDING = "pending"
@@ -269,7 +269,7 @@ class PrescriptionMedicationResponse(PrescriptionMedicationCreate):
     medication: MedicationResponse
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class PrescriptionResponse(BaseModel):
     id: UUID
@@ -292,4 +292,4 @@ class PrescriptionResponse(BaseModel):
     updated_at: Optional[datetime]
 
     class Config:
-        orm_mode = True
+        from_attributes = True
@@ -51,7 +51,7 @@ class UserResponse(UserBase):
     last_login: Optional[datetime]
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class PatientBase(BaseModel):
     """Base schema for patient data"""
@@ -88,7 +88,7 @@ class PatientResponse(PatientBase):
     updated_at: Optional[datetime]
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class DoctorBase(BaseModel):
     """Base schema for doctor data"""
@@ -126,7 +126,7 @@ class DoctorResponse(DoctorBase):
     updated_at: Optional[datetime]
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class Token(BaseModel):
     """Schema for authentication tokens"""
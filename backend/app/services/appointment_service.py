@@ -2,18 +2,25 @@
 Appointment System Service
 """
 from typing import List, Optional, Dict, Any, Tuple
+import calendar
 from datetime import datetime, timedelta, time
-from uuid import UUID
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func, between
+from uuid import UUID, uuid4
+from sqlalchemy import and_, desc, func, between, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 
+from app.config.settings import settings
+from app.core.outbox import enqueue
+from app.core.pagination import InvalidCursor, Page, paginate
+from app.core.unit_of_work import UnitOfWork, unit_of_work
 from app.models.appointment import (
     Appointment,
     AppointmentFeedback,
     DoctorSchedule,
     AppointmentReminder,
-    AppointmentNotification
+    AppointmentNotification,
+    OVERLAP_CONSTRAINT
 )
 from app.schemas.appointment import (
     AppointmentCreate,
@@ -24,27 +31,45 @@ from app.schemas.appointment import (
     AppointmentStats,
     DoctorAvailability,
     AppointmentConflictCheck,
+    EarliestSlot,
     TimeSlot
 )
-from app.services.notification_service import send_notification
-from app.services.payment_service import process_payment, refund_payment
+from app.models.doctor import Doctor, DoctorClinic
+from app.schemas.doctor import DoctorSearchParams
+from app.services.geo_service import apply_doctor_filters
+from app.services.slot_bitmap import (
+    DayBitmap,
+    appointment_slots,
+    booked_masks,
+    earliest_slots,
+    get_day_bitmaps,
+    get_doctors_bitmaps,
+    held_span,
+    update_appointment_slots,
+    utc_naive
+)
 
-def create_appointment(
-    db: Session,
+async def create_appointment(
+    db: AsyncSession,
     appointment: AppointmentCreate,
     check_availability: bool = True
 ) -> Appointment:
-    """إنشاء موعد جديد"""
+    """إنشاء موعد جديد
+
+    التحقق من خريطة التوفر فحص سريع فقط؛ قيد الاستبعاد في قاعدة البيانات
+    هو ما يمنع حجزين متزامنين لنفس الفترة (409 للطلب الخاسر).
+    """
     # التحقق من توفر الموعد
     if check_availability:
-        if not is_slot_available(db, appointment.doctor_id, appointment.scheduled_at, appointment.duration_minutes):
+        if not await is_slot_available(db, appointment.doctor_id, appointment.scheduled_at, appointment.duration_minutes):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="الموعد المطلوب غير متاح"
             )
     
-    # إنشاء الموعد
+    # إنشاء الموعد (المعرف يُولَّد هنا لتُكتب التذكيرات والإشعارات في نفس المعاملة)
     db_appointment = Appointment(
+        id=uuid4(),
         doctor_id=appointment.doctor_id,
         patient_id=appointment.patient_id,
         appointment_type=appointment.appointment_type,
@@ -59,26 +84,34 @@ def create_appointment(
         fee=appointment.fee
     )
     
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
-    
-    # إنشاء التذكيرات
-    create_appointment_reminders(db, db_appointment)
-    
-    # إرسال الإشعارات
-    notify_appointment_creation(db, db_appointment)
+    async with unit_of_work(db) as uow:
+        uow.add(db_appointment)
+        await flush_booking(uow)
+        
+        # إنشاء التذكيرات
+        await create_appointment_reminders(db, db_appointment)
+        
+        # إرسال الإشعارات
+        await notify_appointment_creation(db, db_appointment)
+        
+        # حجز الفترات في خريطة التوفر بعد الحفظ
+        uow.after_commit(
+            update_appointment_slots,
+            db_appointment.doctor_id,
+            None,
+            (db_appointment.scheduled_at, db_appointment.duration_minutes)
+        )
     
     return db_appointment
 
-def update_appointment(
-    db: Session,
+async def update_appointment(
+    db: AsyncSession,
     appointment_id: UUID,
     update_data: AppointmentUpdate,
     check_availability: bool = True
 ) -> Appointment:
     """تحديث موعد"""
-    appointment = get_appointment(db, appointment_id)
+    appointment = await get_appointment(db, appointment_id)
     
     # التحقق من إمكانية التحديث
     if appointment.status in [AppointmentStatus.COMPLETED, AppointmentStatus.CANCELLED]:
@@ -89,7 +122,7 @@ def update_appointment(
     
     # التحقق من توفر الموعد الجديد
     if update_data.scheduled_at and check_availability:
-        if not is_slot_available(
+        if not await is_slot_available(
             db,
             appointment.doctor_id,
             update_data.scheduled_at,
@@ -101,30 +134,36 @@ def update_appointment(
                 detail="الموعد المطلوب غير متاح"
             )
     
-    # تحديث البيانات
-    for field, value in update_data.dict(exclude_unset=True).items():
-        setattr(appointment, field, value)
-    
-    # معالجة تغيير الحالة
-    if update_data.status:
-        handle_status_change(db, appointment, update_data.status)
+    held_before = held_span(appointment)
     
-    db.commit()
-    db.refresh(appointment)
-    
-    # إرسال الإشعارات
-    notify_appointment_update(db, appointment)
+    async with unit_of_work(db) as uow:
+        # تحديث البيانات
+        for field, value in update_data.dict(exclude_unset=True).items():
+            setattr(appointment, field, value)
+        
+        # معالجة تغيير الحالة
+        if update_data.status:
+            await handle_status_change(db, appointment, update_data.status)
+        
+        await flush_booking(uow)
+        
+        # إرسال الإشعارات
+        await notify_appointment_update(db, appointment)
+        
+        uow.after_commit(
+            update_appointment_slots, appointment.doctor_id, held_before, held_span(appointment)
+        )
     
     return appointment
 
-def cancel_appointment(
-    db: Session,
+async def cancel_appointment(
+    db: AsyncSession,
     appointment_id: UUID,
     cancellation_reason: str,
     cancelled_by_doctor: bool = False
 ) -> Appointment:
     """إلغاء موعد"""
-    appointment = get_appointment(db, appointment_id)
+    appointment = await get_appointment(db, appointment_id)
     
     # التحقق من إمكانية الإلغاء
     if appointment.status != AppointmentStatus.CONFIRMED:
@@ -137,95 +176,161 @@ def cancel_appointment(
     cancellation_time = datetime.utcnow()
     hours_until_appointment = (appointment.scheduled_at - cancellation_time).total_seconds() / 3600
     
-    # التحقق من سياسة الإلغاء
-    if not cancelled_by_doctor and hours_until_appointment < 24:
-        # تطبيق رسوم الإلغاء المتأخر
-        apply_late_cancellation_fee(db, appointment)
-    
-    # تحديث الموعد
-    appointment.status = AppointmentStatus.CANCELLED
-    appointment.cancelled_at = cancellation_time
-    appointment.cancellation_reason = cancellation_reason
-    
-    # إلغاء التذكيرات المجدولة
-    cancel_appointment_reminders(db, appointment)
-    
-    # استرجاع المدفوعات إذا كان ذلك مناسباً
-    if appointment.payment_status == PaymentStatus.PAID:
-        process_refund(db, appointment)
+    held_before = held_span(appointment)
     
-    db.commit()
-    db.refresh(appointment)
-    
-    # إرسال الإشعارات
-    notify_appointment_cancellation(db, appointment)
+    async with unit_of_work(db) as uow:
+        # التحقق من سياسة الإلغاء
+        if not cancelled_by_doctor and hours_until_appointment < 24:
+            # تطبيق رسوم الإلغاء المتأخر
+            await apply_late_cancellation_fee(db, appointment)
+        
+        # تحديث الموعد
+        appointment.status = AppointmentStatus.CANCELLED
+        appointment.cancelled_at = cancellation_time
+        appointment.cancellation_reason = cancellation_reason
+        
+        # إلغاء التذكيرات المجدولة
+        await cancel_appointment_reminders(db, appointment)
+        
+        # استرجاع المدفوعات إذا كان ذلك مناسباً
+        if appointment.payment_status == PaymentStatus.PAID:
+            await process_refund(db, appointment)
+        
+        # إرسال الإشعارات
+        await notify_appointment_cancellation(db, appointment)
+        
+        # تحرير الفترات في خريطة التوفر بعد الحفظ
+        uow.after_commit(update_appointment_slots, appointment.doctor_id, held_before, None)
     
     return appointment
 
-def get_doctor_availability(
-    db: Session,
+async def get_doctor_availability(
+    db: AsyncSession,
     doctor_id: UUID,
     start_date: datetime,
     end_date: datetime
 ) -> DoctorAvailability:
     """الحصول على توفر الطبيب"""
-    # الحصول على جدول الطبيب
-    schedules = db.query(DoctorSchedule).filter(
-        and_(
-            DoctorSchedule.doctor_id == doctor_id,
-            DoctorSchedule.date.between(start_date, end_date),
-            DoctorSchedule.is_available == True
-        )
-    ).all()
-    
-    # الحصول على المواعيد الحالية
-    appointments = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == doctor_id,
-            Appointment.scheduled_at.between(start_date, end_date),
-            Appointment.status.in_([
-                AppointmentStatus.CONFIRMED,
-                AppointmentStatus.PENDING
-            ])
-        )
-    ).all()
+    # خرائط التوفر لأيام النطاق (الجدول مطروحاً منه الاستراحات والمواعيد)
+    bitmaps = await get_day_bitmaps(db, doctor_id, start_date.date(), end_date.date())
     
     # تحليل الفترات المتاحة
-    available_slots = analyze_available_slots(schedules, appointments)
+    available_slots = analyze_available_slots(bitmaps)
     
     return DoctorAvailability(
         doctor_id=doctor_id,
-        available_dates=[s.date for s in schedules],
+        available_dates=[datetime.combine(day, time.min) for day, bitmap in bitmaps.items() if bitmap.open],
         available_slots=available_slots,
         next_available_slot=find_next_available_slot(available_slots),
-        regular_schedule=get_regular_schedule(db, doctor_id),
-        vacation_dates=get_vacation_dates(db, doctor_id),
-        max_daily_appointments=get_max_daily_appointments(db, doctor_id),
+        regular_schedule=await get_regular_schedule(db, doctor_id),
+        vacation_dates=await get_vacation_dates(db, doctor_id),
+        max_daily_appointments=await get_max_daily_appointments(db, doctor_id),
         appointment_buffer_minutes=15
     )
 
-def get_appointment_stats(
-    db: Session,
+async def find_earliest_slots(
+    db: AsyncSession,
+    doctor_filter: DoctorSearchParams,
+    start_date: datetime,
+    end_date: datetime,
+    duration_minutes: int = 30,
+    limit: int = 10,
+    per_doctor: int = 1
+) -> List[EarliestSlot]:
+    """
+    أقرب المواعيد الحرة لدى كل الأطباء المطابقين للمعايير
+
+    استعلام واحد للأطباء، ثم خرائط توفرهم لكل أيام النطاق دفعة واحدة
+    (جولة Redis واحدة واستعلامان للأيام غير المخزنة)، ثم دمج تدفقات
+    مواعيدهم الحرة في كومة.
+
+    إذا طابقت المعايير أكثر من EARLIEST_SLOTS_MAX_DOCTORS طبيباً يُرفض
+    البحث (422)، فأي مجموعة جزئية قد تُسقط صاحب أقرب موعد.
+    """
+    start_date = max(utc_naive(start_date), datetime.utcnow())
+    end_date = min(
+        utc_naive(end_date),
+        start_date + timedelta(days=settings.EARLIEST_SLOTS_MAX_DAYS)
+    )
+    if end_date <= start_date:
+        return []
+    
+    # الأطباء المطابقون (معرّف المستخدم هو المستخدم في المواعيد والجداول)
+    query = apply_doctor_filters(select(Doctor.user_id).join(DoctorClinic), doctor_filter)
+    max_doctors = settings.EARLIEST_SLOTS_MAX_DOCTORS
+    result = await db.execute(query.distinct().limit(max_doctors + 1))
+    doctor_ids = result.scalars().all()
+    if not doctor_ids:
+        return []
+    if len(doctor_ids) > max_doctors:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"المعايير تطابق أكثر من {max_doctors} طبيب، حدد التخصص أو المدينة أو نطاق الموقع"
+        )
+    
+    bitmaps = await get_doctors_bitmaps(db, doctor_ids, start_date.date(), end_date.date())
+    
+    return [
+        EarliestSlot(
+            doctor_id=doctor_id,
+            start_time=slot_start,
+            end_time=slot_start + timedelta(minutes=duration_minutes)
+        )
+        for doctor_id, slot_start in earliest_slots(
+            bitmaps, start_date, end_date, duration_minutes, limit, per_doctor
+        )
+    ]
+
+async def get_appointment_stats(
+    db: AsyncSession,
     doctor_id: Optional[UUID] = None,
     patient_id: Optional[UUID] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None
 ) -> AppointmentStats:
-    """الحصول على إحصائيات المواعيد"""
-    query = db.query(Appointment)
+    """الحصول على إحصائيات المواعيد
+
+    تُجمَّع في قاعدة البيانات حسب النوع ويوم الأسبوع (21 صفاً على الأكثر)
+    مع التقييمات، فلا تُحمَّل المواعيد مهما طال النطاق الزمني.
+    """
+    # على الجداول مباشرة، فلا يلزم إعداد علاقات النماذج
+    appointments = Appointment.__table__
+    feedbacks = AppointmentFeedback.__table__
+    weekday = func.extract('dow', appointments.c.scheduled_at)
+    query = (
+        select(
+            appointments.c.appointment_type,
+            weekday.label("weekday"),
+            func.count().label("total"),
+            func.count().filter(appointments.c.status == AppointmentStatus.COMPLETED).label("completed"),
+            func.count().filter(appointments.c.status == AppointmentStatus.CANCELLED).label("cancelled"),
+            func.count().filter(appointments.c.status == AppointmentStatus.NO_SHOW).label("no_show"),
+            func.sum(appointments.c.duration_minutes).label("duration"),
+            func.sum(appointments.c.fee).filter(appointments.c.payment_status == PaymentStatus.PAID).label("revenue"),
+            # لكل موعد تقييم واحد على الأكثر، فالربط لا يكرر المواعيد
+            func.count(feedbacks.c.id).label("feedbacks"),
+            func.sum(feedbacks.c.rating).label("rating"),
+            func.count(feedbacks.c.id).filter(feedbacks.c.would_recommend.is_(True)).label("recommended")
+        )
+        .select_from(appointments.outerjoin(feedbacks, feedbacks.c.appointment_id == appointments.c.id))
+        .group_by(appointments.c.appointment_type, weekday)
+    )
     
     if doctor_id:
-        query = query.filter(Appointment.doctor_id == doctor_id)
+        query = query.where(appointments.c.doctor_id == doctor_id)
     if patient_id:
-        query = query.filter(Appointment.patient_id == patient_id)
+        query = query.where(appointments.c.patient_id == patient_id)
     if start_date:
-        query = query.filter(Appointment.scheduled_at >= start_date)
+        query = query.where(appointments.c.scheduled_at >= start_date)
     if end_date:
-        query = query.filter(Appointment.scheduled_at <= end_date)
+        query = query.where(appointments.c.scheduled_at <= end_date)
     
-    appointments = query.all()
-    
-    if not appointments:
+    result = await db.execute(query)
+    return summarize_appointment_stats(result.all())
+
+def summarize_appointment_stats(groups: List[Any]) -> AppointmentStats:
+    """دمج صفوف التجميع (نوع × يوم الأسبوع) في إحصائيات واحدة"""
+    if not groups:
         return AppointmentStats(
             total_appointments=0,
             completed_appointments=0,
@@ -239,135 +344,146 @@ def get_appointment_stats(
             patient_satisfaction=0
         )
     
-    # حساب الإحصائيات الأساسية
-    total = len(appointments)
-    completed = sum(1 for a in appointments if a.status == AppointmentStatus.COMPLETED)
-    cancelled = sum(1 for a in appointments if a.status == AppointmentStatus.CANCELLED)
-    no_show = sum(1 for a in appointments if a.status == AppointmentStatus.NO_SHOW)
-    
-    # حساب متوسط المدة
-    avg_duration = sum(a.duration_minutes for a in appointments) / total
-    
-    # حساب الإيرادات
-    total_revenue = sum(a.fee for a in appointments if a.payment_status == PaymentStatus.PAID)
+    total = sum(g.total for g in groups)
     
-    # تحليل النوع الأكثر شيوعاً
+    # تحليل النوع الأكثر شيوعاً واليوم الأكثر ازدحاماً
     type_counts = {}
-    for a in appointments:
-        type_counts[a.appointment_type] = type_counts.get(a.appointment_type, 0) + 1
-    most_common_type = max(type_counts.items(), key=lambda x: x[1])[0]
-    
-    # تحليل اليوم الأكثر ازدحاماً
     day_counts = {}
-    for a in appointments:
-        day = a.scheduled_at.strftime("%A")
-        day_counts[day] = day_counts.get(day, 0) + 1
-    busiest_day = max(day_counts.items(), key=lambda x: x[1])[0]
+    for g in groups:
+        type_counts[g.appointment_type] = type_counts.get(g.appointment_type, 0) + g.total
+        # dow: 0 = الأحد
+        day = calendar.day_name[(int(g.weekday) - 1) % 7]
+        day_counts[day] = day_counts.get(day, 0) + g.total
     
     # حساب متوسط التقييم ورضا المرضى
-    feedbacks = db.query(AppointmentFeedback).filter(
-        AppointmentFeedback.appointment_id.in_([a.id for a in appointments])
-    ).all()
-    
+    feedbacks = sum(g.feedbacks for g in groups)
     avg_rating = 0
     patient_satisfaction = 0
-    
     if feedbacks:
-        avg_rating = sum(f.rating for f in feedbacks) / len(feedbacks)
-        patient_satisfaction = sum(1 for f in feedbacks if f.would_recommend) / len(feedbacks) * 100
+        avg_rating = sum(g.rating or 0 for g in groups) / feedbacks
+        patient_satisfaction = sum(g.recommended for g in groups) / feedbacks * 100
     
     return AppointmentStats(
         total_appointments=total,
-        completed_appointments=completed,
-        cancelled_appointments=cancelled,
-        no_show_appointments=no_show,
-        average_duration=avg_duration,
-        total_revenue=total_revenue,
-        most_common_type=most_common_type,
-        busiest_day=busiest_day,
+        completed_appointments=sum(g.completed for g in groups),
+        cancelled_appointments=sum(g.cancelled for g in groups),
+        no_show_appointments=sum(g.no_show for g in groups),
+        average_duration=sum(g.duration for g in groups) / total,
+        total_revenue=sum(g.revenue or 0 for g in groups),
+        most_common_type=max(type_counts.items(), key=lambda x: x[1])[0],
+        busiest_day=max(day_counts.items(), key=lambda x: x[1])[0],
         average_rating=avg_rating,
         patient_satisfaction=patient_satisfaction
     )
 
-def search_appointments(
-    db: Session,
-    params: AppointmentSearchParams
-) -> List[Appointment]:
-    """البحث عن المواعيد"""
-    query = db.query(Appointment)
+async def search_appointments(
+    db: AsyncSession,
+    params: AppointmentSearchParams,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    with_total: bool = False
+) -> Page[Appointment]:
+    """البحث عن المواعيد (صفحة واحدة مرتبة حسب وقت الموعد)"""
+    query = select(Appointment)
     
     if params.doctor_id:
-        query = query.filter(Appointment.doctor_id == params.doctor_id)
+        query = query.where(Appointment.doctor_id == params.doctor_id)
     if params.patient_id:
-        query = query.filter(Appointment.patient_id == params.patient_id)
+        query = query.where(Appointment.patient_id == params.patient_id)
     if params.status:
-        query = query.filter(Appointment.status.in_(params.status))
+        query = query.where(Appointment.status.in_(params.status))
     if params.appointment_type:
-        query = query.filter(Appointment.appointment_type.in_(params.appointment_type))
+        query = query.where(Appointment.appointment_type.in_(params.appointment_type))
     if params.start_date:
-        query = query.filter(Appointment.scheduled_at >= params.start_date)
+        query = query.where(Appointment.scheduled_at >= params.start_date)
     if params.end_date:
-        query = query.filter(Appointment.scheduled_at <= params.end_date)
+        query = query.where(Appointment.scheduled_at <= params.end_date)
     if params.payment_status:
-        query = query.filter(Appointment.payment_status.in_(params.payment_status))
+        query = query.where(Appointment.payment_status.in_(params.payment_status))
     
-    return query.order_by(Appointment.scheduled_at).all()
+    try:
+        return await paginate(
+            db, query, Appointment.scheduled_at, Appointment.id,
+            limit, cursor, descending=False, with_total=with_total
+        )
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="مؤشر الصفحة غير صالح"
+        )
 
 # Helper Functions
 
-def is_slot_available(
-    db: Session,
+EXCLUSION_VIOLATION = "23P01"
+
+def is_overlap_violation(error: IntegrityError) -> bool:
+    """هل رفضت قاعدة البيانات الكتابة لتداخلها مع موعد نشط آخر للطبيب"""
+    sqlstate = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    return sqlstate == EXCLUSION_VIOLATION and OVERLAP_CONSTRAINT in str(error.orig)
+
+async def flush_booking(uow: UnitOfWork) -> None:
+    """كتابة الموعد الآن ليُطبَّق قيد منع التداخل قبل بقية العملية"""
+    try:
+        await uow.flush()
+    except IntegrityError as e:
+        if not is_overlap_violation(e):
+            raise
+        # تُلغى المعاملة كاملة عند خروج الاستثناء من unit_of_work
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="تم حجز هذا الموعد للتو، يرجى اختيار وقت آخر"
+        )
+
+async def is_slot_available(
+    db: AsyncSession,
     doctor_id: UUID,
     scheduled_at: datetime,
     duration_minutes: int,
     exclude_appointment_id: Optional[UUID] = None
 ) -> bool:
-    """التحقق من توفر الموعد"""
-    # التحقق من جدول الطبيب
-    schedule = db.query(DoctorSchedule).filter(
-        and_(
-            DoctorSchedule.doctor_id == doctor_id,
-            DoctorSchedule.date == scheduled_at.date(),
-            DoctorSchedule.is_available == True
-        )
-    ).first()
-    
-    if not schedule:
-        return False
+    """التحقق من توفر الموعد: الفترات المطلوبة ضمن الجدول وغير محجوزة"""
+    slots = appointment_slots(scheduled_at, duration_minutes)
+    bitmaps = await get_day_bitmaps(db, doctor_id, min(slots), max(slots))
     
-    # التحقق من الفترة المطلوبة
-    slot_end = scheduled_at + timedelta(minutes=duration_minutes)
-    
-    # التحقق من تعارض المواعيد
-    query = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == doctor_id,
-            Appointment.status.in_([AppointmentStatus.CONFIRMED, AppointmentStatus.PENDING]),
-            or_(
-                and_(
-                    Appointment.scheduled_at <= scheduled_at,
-                    Appointment.scheduled_at + timedelta(minutes=Appointment.duration_minutes) > scheduled_at
-                ),
+    # الموعد الجاري تعديله لا يتعارض مع نفسه
+    if exclude_appointment_id:
+        result = await db.execute(
+            select(Appointment.scheduled_at, Appointment.duration_minutes).where(
                 and_(
-                    Appointment.scheduled_at < slot_end,
-                    Appointment.scheduled_at + timedelta(minutes=Appointment.duration_minutes) >= slot_end
+                    Appointment.id == exclude_appointment_id,
+                    Appointment.doctor_id == doctor_id,
+                    Appointment.status.in_([AppointmentStatus.CONFIRMED, AppointmentStatus.PENDING])
                 )
             )
         )
-    )
-    
-    if exclude_appointment_id:
-        query = query.filter(Appointment.id != exclude_appointment_id)
-    
-    conflicting_appointments = query.count()
+        excluded = result.first()
+        if excluded:
+            # خلايا الحافة قد يشغلها أيضاً موعد مجاور غير مضبوط على 5 دقائق،
+            # فلا يُحرَّر إلا ما ينفرد به الموعد المستثنى
+            excluded_end = excluded.scheduled_at + timedelta(minutes=excluded.duration_minutes)
+            result = await db.execute(
+                select(Appointment.doctor_id, Appointment.scheduled_at, Appointment.duration_minutes).where(
+                    and_(
+                        Appointment.doctor_id == doctor_id,
+                        Appointment.id != exclude_appointment_id,
+                        Appointment.scheduled_at >= excluded.scheduled_at - timedelta(days=1),
+                        Appointment.scheduled_at < excluded_end,
+                        Appointment.status.in_([AppointmentStatus.CONFIRMED, AppointmentStatus.PENDING])
+                    )
+                )
+            )
+            neighbours = booked_masks(result)
+            for day, span in appointment_slots(*excluded).items():
+                if day in bitmaps:
+                    bitmaps[day] = bitmaps[day].release(*span, keep=neighbours.get((doctor_id, day), 0))
     
-    return conflicting_appointments == 0
+    return all(bitmaps[day].is_free(start, end) for day, (start, end) in slots.items())
 
-def create_appointment_reminders(db: Session, appointment: Appointment) -> None:
+async def create_appointment_reminders(db: AsyncSession, appointment: Appointment) -> None:
     """إنشاء تذكيرات الموعد"""
     reminders = [
         # تذكير قبل يوم
-        AppointmentReminder(
+        dict(
             appointment_id=appointment.id,
             recipient_id=appointment.patient_id,
             reminder_type="email",
@@ -375,7 +491,7 @@ def create_appointment_reminders(db: Session, appointment: Appointment) -> None:
             message=f"تذكير: لديك موعد غداً في {appointment.scheduled_at.strftime('%H:%M')}"
         ),
         # تذكير قبل ساعتين
-        AppointmentReminder(
+        dict(
             appointment_id=appointment.id,
             recipient_id=appointment.patient_id,
             reminder_type="sms",
@@ -384,19 +500,19 @@ def create_appointment_reminders(db: Session, appointment: Appointment) -> None:
         )
     ]
     
-    db.add_all(reminders)
-    db.commit()
+    async with unit_of_work(db) as uow:
+        uow.insert(AppointmentReminder, reminders)
 
-def notify_appointment_creation(db: Session, appointment: Appointment) -> None:
+async def notify_appointment_creation(db: AsyncSession, appointment: Appointment) -> None:
     """إرسال إشعارات إنشاء الموعد"""
     notifications = [
         # إشعار للمريض
-        AppointmentNotification(
+        dict(
             appointment_id=appointment.id,
             notification_type="email",
             recipient_id=appointment.patient_id,
             message="تم إنشاء موعدك بنجاح",
-            metadata={
+            meta={
                 "appointment_details": {
                     "date": appointment.scheduled_at.strftime("%Y-%m-%d"),
                     "time": appointment.scheduled_at.strftime("%H:%M"),
@@ -405,12 +521,12 @@ def notify_appointment_creation(db: Session, appointment: Appointment) -> None:
             }
         ),
         # إشعار للطبيب
-        AppointmentNotification(
+        dict(
             appointment_id=appointment.id,
             notification_type="system",
             recipient_id=appointment.doctor_id,
             message="تم حجز موعد جديد",
-            metadata={
+            meta={
                 "appointment_details": {
                     "date": appointment.scheduled_at.strftime("%Y-%m-%d"),
                     "time": appointment.scheduled_at.strftime("%H:%M"),
@@ -420,11 +536,11 @@ def notify_appointment_creation(db: Session, appointment: Appointment) -> None:
         )
     ]
     
-    db.add_all(notifications)
-    db.commit()
+    async with unit_of_work(db) as uow:
+        uow.insert(AppointmentNotification, notifications)
 
-def handle_status_change(
-    db: Session,
+async def handle_status_change(
+    db: AsyncSession,
     appointment: Appointment,
     new_status: AppointmentStatus
 ) -> None:
@@ -433,67 +549,41 @@ def handle_status_change(
     
     if new_status == AppointmentStatus.CONFIRMED and old_status == AppointmentStatus.PENDING:
         # إنشاء تذكيرات الموعد
-        create_appointment_reminders(db, appointment)
+        await create_appointment_reminders(db, appointment)
         
     elif new_status == AppointmentStatus.COMPLETED:
         # إنشاء طلب تقييم
-        create_feedback_request(db, appointment)
+        await create_feedback_request(db, appointment)
         
     elif new_status == AppointmentStatus.CANCELLED:
         # إلغاء التذكيرات
-        cancel_appointment_reminders(db, appointment)
+        await cancel_appointment_reminders(db, appointment)
         
         # معالجة المدفوعات
         if appointment.payment_status == PaymentStatus.PAID:
-            process_refund(db, appointment)
-
-def analyze_available_slots(
-    schedules: List[DoctorSchedule],
-    appointments: List[Appointment]
-) -> Dict[str, List[TimeSlot]]:
-    """تحليل الفترات المتاحة"""
-    available_slots = {}
-    
-    for schedule in schedules:
-        date_str = schedule.date.strftime("%Y-%m-%d")
-        day_slots = []
-        
-        # تحويل فترات الجدول إلى قائمة من الفترات المتاحة
-        for slot in schedule.time_slots:
-            start = datetime.combine(schedule.date, slot["start_time"])
-            end = datetime.combine(schedule.date, slot["end_time"])
-            
-            # التحقق من تعارض المواعيد
-            is_available = True
-            for appointment in appointments:
-                if (
-                    appointment.scheduled_at >= start and
-                    appointment.scheduled_at < end
-                ):
-                    is_available = False
-                    break
-            
-            if is_available:
-                day_slots.append(
-                    TimeSlot(
-                        start_time=slot["start_time"],
-                        end_time=slot["end_time"],
-                        is_available=True
-                    )
-                )
-        
-        available_slots[date_str] = day_slots
-    
-    return available_slots
+            await process_refund(db, appointment)
+
+def analyze_available_slots(bitmaps: Dict[Any, DayBitmap]) -> Dict[str, List[TimeSlot]]:
+    """تحليل الفترات المتاحة: الفترات الحرة المتصلة لكل يوم عمل"""
+    return {
+        bitmap.day.strftime("%Y-%m-%d"): bitmap.time_slots()
+        for bitmap in bitmaps.values()
+        if bitmap.open
+    }
 
-def get_regular_schedule(db: Session, doctor_id: UUID) -> Dict[str, List[TimeSlot]]:
-    """الحصول على الجدول المنتظم للطبيب"""
-    schedules = db.query(DoctorSchedule).filter(
-        and_(
-            DoctorSchedule.doctor_id == doctor_id,
-            DoctorSchedule.is_available == True
+async def get_regular_schedule(db: AsyncSession, doctor_id: UUID) -> Dict[str, List[TimeSlot]]:
+    """الحصول على الجدول المنتظم للطبيب (من الأسابيع الأخيرة فقط)"""
+    since = datetime.utcnow() - timedelta(weeks=settings.REGULAR_SCHEDULE_WEEKS)
+    result = await db.execute(
+        select(DoctorSchedule.date, DoctorSchedule.time_slots).where(
+            and_(
+                DoctorSchedule.doctor_id == doctor_id,
+                DoctorSchedule.is_available == True,
+                DoctorSchedule.date >= since
+            )
         )
-    ).all()
+    )
+    schedules = result.all()
     
     regular_schedule = {}
     days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
@@ -515,3 +605,120 @@ def get_regular_schedule(db: Session, doctor_id: UUID) -> Dict[str, List[TimeSlo
             regular_schedule[day] = []
     
     return regular_schedule
+
+async def get_appointment(db: AsyncSession, appointment_id: UUID) -> Appointment:
+    """الحصول على موعد"""
+    result = await db.execute(select(Appointment).where(Appointment.id == appointment_id))
+    appointment = result.scalar_one_or_none()
+    if not appointment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="الموعد غير موجود"
+        )
+    return appointment
+
+async def add_appointment_notification(
+    db: AsyncSession,
+    appointment: Appointment,
+    recipient_id: UUID,
+    message: str,
+    notification_type: str = "system"
+) -> None:
+    """حفظ إشعار مرتبط بالموعد"""
+    async with unit_of_work(db) as uow:
+        uow.insert(AppointmentNotification, [dict(
+            appointment_id=appointment.id,
+            notification_type=notification_type,
+            recipient_id=recipient_id,
+            message=message,
+            meta={
+                "appointment_details": {
+                    "date": appointment.scheduled_at.strftime("%Y-%m-%d"),
+                    "time": appointment.scheduled_at.strftime("%H:%M"),
+                    "status": appointment.status
+                }
+            }
+        )])
+
+async def notify_appointment_update(db: AsyncSession, appointment: Appointment) -> None:
+    """إرسال إشعارات تحديث الموعد"""
+    async with unit_of_work(db):
+        await add_appointment_notification(
+            db, appointment, appointment.patient_id, "تم تحديث موعدك", notification_type="email"
+        )
+        await add_appointment_notification(db, appointment, appointment.doctor_id, "تم تحديث موعد")
+
+async def notify_appointment_cancellation(db: AsyncSession, appointment: Appointment) -> None:
+    """إرسال إشعارات إلغاء الموعد"""
+    async with unit_of_work(db):
+        await add_appointment_notification(
+            db, appointment, appointment.patient_id, "تم إلغاء موعدك", notification_type="email"
+        )
+        await add_appointment_notification(db, appointment, appointment.doctor_id, "تم إلغاء موعد")
+
+async def create_feedback_request(db: AsyncSession, appointment: Appointment) -> None:
+    """إنشاء طلب تقييم للمريض"""
+    await add_appointment_notification(
+        db, appointment, appointment.patient_id, "يرجى تقييم موعدك الأخير", notification_type="email"
+    )
+
+async def apply_late_cancellation_fee(db: AsyncSession, appointment: Appointment) -> None:
+    """تطبيق رسوم الإلغاء المتأخر"""
+    await add_appointment_notification(
+        db,
+        appointment,
+        appointment.patient_id,
+        "تم الإلغاء قبل أقل من 24 ساعة من الموعد وقد تُطبق رسوم الإلغاء المتأخر",
+        notification_type="email"
+    )
+
+async def cancel_appointment_reminders(db: AsyncSession, appointment: Appointment) -> None:
+    """إلغاء التذكيرات المجدولة"""
+    await db.execute(
+        update(AppointmentReminder)
+        .where(
+            and_(
+                AppointmentReminder.appointment_id == appointment.id,
+                AppointmentReminder.status == "pending"
+            )
+        )
+        .values(status="cancelled")
+    )
+
+async def process_refund(db: AsyncSession, appointment: Appointment) -> None:
+    """استرجاع مبلغ الموعد (ينفذه مُرحِّل صندوق الصادر بعد حفظ الإلغاء)"""
+    await enqueue(db, "payment.refund", {
+        "payment_id": appointment.payment_id,
+        "reason": "requested_by_customer"
+    })
+
+def find_next_available_slot(available_slots: Dict[str, List[TimeSlot]]) -> Optional[datetime]:
+    """أقرب فترة متاحة"""
+    for date_str in sorted(available_slots):
+        slots = [s for s in available_slots[date_str] if s.is_available]
+        if slots:
+            day = datetime.strptime(date_str, "%Y-%m-%d").date()
+            return datetime.combine(day, min(s.start_time for s in slots))
+    return None
+
+async def get_vacation_dates(db: AsyncSession, doctor_id: UUID) -> List[datetime]:
+    """الحصول على أيام إجازة الطبيب القادمة"""
+    result = await db.execute(
+        select(DoctorSchedule.date).where(
+            and_(
+                DoctorSchedule.doctor_id == doctor_id,
+                DoctorSchedule.is_available == False,
+                DoctorSchedule.date >= datetime.utcnow()
+            )
+        ).order_by(DoctorSchedule.date)
+    )
+    return result.scalars().all()
+
+async def get_max_daily_appointments(db: AsyncSession, doctor_id: UUID) -> Optional[int]:
+    """الحد الأقصى للمواعيد اليومية"""
+    result = await db.execute(
+        select(func.max(DoctorSchedule.max_appointments)).where(
+            DoctorSchedule.doctor_id == doctor_id
+        )
+    )
+    return result.scalar()
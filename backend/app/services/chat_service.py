@@ -18,6 +18,7 @@ from app.models.chat import (
     MessageRole
 )
 from app.models.user import User
+from app.core.metrics import observe_inference
 from app.core.security import encrypt_data, decrypt_data
 from app.utils.logger import get_logger
 from app.config.settings import get_settings
@@ -123,7 +124,7 @@ class ChatService:
             session_id=session_id,
             role=role,
             content=content,
-            metadata=metadata or {}
+            meta=metadata or {}
         )
         
         # Generate embedding for semantic search
@@ -253,7 +254,8 @@ class ChatService:
     
     def _generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text"""
-        return self.embedding_model.encode(text).tolist()
+        with observe_inference("embedding", "encode"):
+            return self.embedding_model.encode(text).tolist()
     
     async def _generate_response(
         self,
@@ -270,18 +272,20 @@ class ChatService:
             # Choose model based on chat type
             model = self.medical_model if session.chat_type == ChatType.MEDICAL else self.general_model
             tokenizer = self.medical_tokenizer if session.chat_type == ChatType.MEDICAL else self.general_tokenizer
+            model_name = "medical" if session.chat_type == ChatType.MEDICAL else "general"
             
             # Generate response
-            inputs = tokenizer(context, return_tensors="pt").to(model.device)
-            outputs = model.generate(
-                **inputs,
-                max_length=1024,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True
-            )
-            
-            response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+            with observe_inference(model_name, "generate"):
+                inputs = tokenizer(context, return_tensors="pt").to(model.device)
+                outputs = model.generate(
+                    **inputs,
+                    max_length=1024,
+                    temperature=0.7,
+                    top_p=0.9,
+                    do_sample=True
+                )
+                
+                response = tokenizer.decode(outputs[0], skip_special_tokens=True)
             
             # Calculate confidence score
             confidence = outputs.sequences_scores.item() if hasattr(outputs, 'sequences_scores') else 0.8
@@ -4,10 +4,12 @@ Doctor Dashboard Service
 from typing import List, Dict, Optional
 from datetime import datetime, date, timedelta
 from uuid import UUID
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, desc
+from sqlalchemy import func, and_, or_, desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from fastapi import HTTPException, status
 
+from app.config.database import count_rows
 from app.models.doctor import Doctor
 from app.models.appointment import Appointment
 from app.models.chat import ChatSession
@@ -28,33 +30,34 @@ from app.schemas.dashboard import (
     DashboardResponse
 )
 
-def get_appointment_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> AppointmentStats:
+async def get_appointment_stats(db: AsyncSession, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> AppointmentStats:
     """حساب إحصائيات المواعيد"""
-    query = db.query(Appointment).filter(Appointment.doctor_id == doctor_id)
+    query = select(Appointment).where(Appointment.doctor_id == doctor_id)
     
     if time_range:
-        query = query.filter(
+        query = query.where(
             and_(
                 Appointment.scheduled_at >= time_range.start_date,
                 Appointment.scheduled_at <= time_range.end_date
             )
         )
     
-    total = query.count()
-    completed = query.filter(Appointment.status == "completed").count()
-    cancelled = query.filter(Appointment.status == "cancelled").count()
-    upcoming = query.filter(
+    total = await count_rows(db, query)
+    completed = await count_rows(db, query.where(Appointment.status == "completed"))
+    cancelled = await count_rows(db, query.where(Appointment.status == "cancelled"))
+    upcoming = await count_rows(db, query.where(
         and_(
             Appointment.status == "scheduled",
             Appointment.scheduled_at > datetime.now()
         )
-    ).count()
+    ))
     
     completion_rate = (completed / total) * 100 if total > 0 else 0
     cancellation_rate = (cancelled / total) * 100 if total > 0 else 0
     
     # حساب متوسط مدة المواعيد
-    completed_appointments = query.filter(Appointment.status == "completed").all()
+    result = await db.execute(query.where(Appointment.status == "completed"))
+    completed_appointments = result.scalars().all()
     total_duration = sum((apt.end_time - apt.start_time).total_seconds() / 3600 
                         for apt in completed_appointments if apt.end_time)
     avg_duration = total_duration / len(completed_appointments) if completed_appointments else 0
@@ -69,9 +72,9 @@ def get_appointment_stats(db: Session, doctor_id: UUID, time_range: Optional[Tim
         avg_duration=avg_duration
     )
 
-def get_revenue_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> RevenueStats:
+async def get_revenue_stats(db: AsyncSession, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> RevenueStats:
     """حساب إحصائيات الإيرادات"""
-    query = db.query(Appointment).filter(
+    query = select(Appointment).where(
         and_(
             Appointment.doctor_id == doctor_id,
             Appointment.status == "completed",
@@ -80,31 +83,31 @@ def get_revenue_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRan
     )
     
     if time_range:
-        query = query.filter(
+        query = query.where(
             and_(
                 Appointment.scheduled_at >= time_range.start_date,
                 Appointment.scheduled_at <= time_range.end_date
             )
         )
     
+    # المواعيد المدفوعة تُجلب مرة واحدة وتُستخدم لكل التصنيفات
+    result = await db.execute(query)
+    appointments = result.scalars().all()
+    
     # حساب الإيرادات الإجمالية
-    total_revenue = sum(apt.fee for apt in query.all())
+    total_revenue = sum(apt.fee for apt in appointments)
     
     # حساب إيرادات الشهر الحالي
     current_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     current_month_revenue = sum(
-        apt.fee for apt in query.filter(Appointment.scheduled_at >= current_month_start).all()
+        apt.fee for apt in appointments if apt.scheduled_at >= current_month_start
     )
     
     # حساب إيرادات الشهر السابق
     last_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
     last_month_revenue = sum(
-        apt.fee for apt in query.filter(
-            and_(
-                Appointment.scheduled_at >= last_month_start,
-                Appointment.scheduled_at < current_month_start
-            )
-        ).all()
+        apt.fee for apt in appointments
+        if last_month_start <= apt.scheduled_at < current_month_start
     )
     
     # حساب معدل النمو
@@ -113,13 +116,13 @@ def get_revenue_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRan
     
     # تصنيف الإيرادات حسب نوع الخدمة
     revenue_by_service = {}
-    for apt in query.all():
+    for apt in appointments:
         service_type = apt.consultation_type
         revenue_by_service[service_type] = revenue_by_service.get(service_type, 0) + apt.fee
     
     # تصنيف الإيرادات حسب الشهر
     revenue_by_month = {}
-    for apt in query.all():
+    for apt in appointments:
         month_key = apt.scheduled_at.strftime("%Y-%m")
         revenue_by_month[month_key] = revenue_by_month.get(month_key, 0) + apt.fee
     
@@ -132,50 +135,59 @@ def get_revenue_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRan
         by_month=revenue_by_month
     )
 
-def get_patient_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> PatientStats:
+async def get_patient_stats(db: AsyncSession, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> PatientStats:
     """حساب إحصائيات المرضى"""
     # الحصول على جميع المرضى
-    patient_query = db.query(User).join(Appointment).filter(Appointment.doctor_id == doctor_id)
+    patient_query = select(User).join(Appointment, Appointment.patient_id == User.id).where(
+        Appointment.doctor_id == doctor_id
+    )
     
     if time_range:
-        patient_query = patient_query.filter(
+        patient_query = patient_query.where(
             and_(
                 Appointment.scheduled_at >= time_range.start_date,
                 Appointment.scheduled_at <= time_range.end_date
             )
         )
     
-    total_patients = patient_query.distinct(User.id).count()
+    total_patients = await count_rows(db, patient_query.distinct(User.id))
     
     # حساب المرضى الجدد
-    new_patients = patient_query.filter(
+    new_patients = await count_rows(db, patient_query.where(
         User.created_at >= (datetime.now() - timedelta(days=30))
-    ).distinct(User.id).count()
+    ).distinct(User.id))
     
     # حساب المرضى العائدين
-    returning_patients = db.query(User).join(Appointment).filter(
+    returning_patients = await count_rows(db, select(User.id).join(
+        Appointment, Appointment.patient_id == User.id
+    ).where(
         and_(
             Appointment.doctor_id == doctor_id,
             Appointment.status == "completed"
         )
-    ).group_by(User.id).having(func.count(Appointment.id) > 1).count()
+    ).group_by(User.id).having(func.count(Appointment.id) > 1))
     
     # حساب معدل الاحتفاظ
     retention_rate = (returning_patients / total_patients * 100) if total_patients > 0 else 0
     
     # حساب متوسط التقييم ومعدل الرضا
-    ratings = db.query(Appointment).filter(
+    ratings = select(Appointment).where(
         and_(
             Appointment.doctor_id == doctor_id,
             Appointment.rating.isnot(None)
         )
     )
-    avg_rating = ratings.with_entities(func.avg(Appointment.rating)).scalar() or 0
-    satisfaction_rate = ratings.filter(Appointment.rating >= 4).count() / ratings.count() * 100 if ratings.count() > 0 else 0
+    result = await db.execute(ratings.with_only_columns(func.avg(Appointment.rating)))
+    avg_rating = result.scalar() or 0
+    rated_count = await count_rows(db, ratings)
+    satisfaction_rate = (
+        await count_rows(db, ratings.where(Appointment.rating >= 4)) / rated_count * 100
+    ) if rated_count > 0 else 0
     
     # حساب الديموغرافيا
     demographics = {}
-    for user in patient_query.all():
+    result = await db.execute(patient_query)
+    for user in result.scalars().all():
         age_group = calculate_age_group(user.date_of_birth)
         demographics[age_group] = demographics.get(age_group, 0) + 1
     
@@ -189,9 +201,9 @@ def get_patient_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRan
         demographics=demographics
     )
 
-def get_treatment_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> TreatmentStats:
+async def get_treatment_stats(db: AsyncSession, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> TreatmentStats:
     """حساب إحصائيات العلاج"""
-    query = db.query(Appointment).filter(
+    query = select(Appointment).where(
         and_(
             Appointment.doctor_id == doctor_id,
             Appointment.status == "completed"
@@ -199,33 +211,37 @@ def get_treatment_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeR
     )
     
     if time_range:
-        query = query.filter(
+        query = query.where(
             and_(
                 Appointment.scheduled_at >= time_range.start_date,
                 Appointment.scheduled_at <= time_range.end_date
             )
         )
     
-    total_treatments = query.count()
+    total_treatments = await count_rows(db, query)
     
     # حساب معدل النجاح
-    successful_treatments = query.filter(Appointment.treatment_outcome == "successful").count()
+    successful_treatments = await count_rows(db, query.where(Appointment.treatment_outcome == "successful"))
     success_rate = (successful_treatments / total_treatments * 100) if total_treatments > 0 else 0
     
     # حساب الحالات الشائعة
+    result = await db.execute(query)
+    treatments = result.scalars().all()
     common_conditions = {}
-    for apt in query.all():
+    for apt in treatments:
         for condition in apt.diagnosis or []:
             common_conditions[condition] = common_conditions.get(condition, 0) + 1
     
     # حساب متوسط وقت التعافي
-    recovery_times = [apt.recovery_time.total_seconds() / (24 * 3600) for apt in query.all() if apt.recovery_time]
+    recovery_times = [apt.recovery_time.total_seconds() / (24 * 3600) for apt in treatments if apt.recovery_time]
     avg_recovery_time = sum(recovery_times) / len(recovery_times) if recovery_times else 0
     
     # حساب فعالية الأدوية
     medication_effectiveness = {}
-    prescriptions = db.query(Prescription).filter(Prescription.doctor_id == doctor_id)
-    for prescription in prescriptions.all():
+    result = await db.execute(
+        select(Prescription).where(Prescription.doctor_id == doctor_id)
+    )
+    for prescription in result.scalars().all():
         if prescription.effectiveness_rating:
             medication_effectiveness[prescription.medication_name] = (
                 medication_effectiveness.get(prescription.medication_name, 0) + 
@@ -240,23 +256,27 @@ def get_treatment_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeR
         medication_effectiveness=medication_effectiveness
     )
 
-def get_chat_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> ChatStats:
+async def get_chat_stats(db: AsyncSession, doctor_id: UUID, time_range: Optional[TimeRange] = None) -> ChatStats:
     """حساب إحصائيات المحادثات"""
-    query = db.query(ChatSession).filter(ChatSession.doctor_id == doctor_id)
+    query = select(ChatSession).where(ChatSession.doctor_id == doctor_id)
     
     if time_range:
-        query = query.filter(
+        query = query.where(
             and_(
                 ChatSession.created_at >= time_range.start_date,
                 ChatSession.created_at <= time_range.end_date
             )
         )
     
-    total_chats = query.count()
+    total_chats = await count_rows(db, query)
+    
+    # الرسائل تُحمّل مسبقاً لأن التحميل الكسول غير متاح مع الجلسات غير المتزامنة
+    result = await db.execute(query.options(selectinload(ChatSession.messages)))
+    chats = result.scalars().all()
     
     # حساب متوسط وقت الاستجابة
     response_times = []
-    for chat in query.all():
+    for chat in chats:
         messages = sorted(chat.messages, key=lambda x: x.timestamp)
         for i in range(1, len(messages)):
             if messages[i].sender_type == "doctor" and messages[i-1].sender_type == "patient":
@@ -266,19 +286,20 @@ def get_chat_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRange]
     avg_response_time = sum(response_times) / len(response_times) if response_times else 0
     
     # حساب معدل الرضا
+    rated_chats = await count_rows(db, query.where(ChatSession.satisfaction_rating.isnot(None)))
     satisfaction_rate = (
-        query.filter(ChatSession.satisfaction_rating >= 4).count() / 
-        query.filter(ChatSession.satisfaction_rating.isnot(None)).count() * 100
-    ) if query.filter(ChatSession.satisfaction_rating.isnot(None)).count() > 0 else 0
+        await count_rows(db, query.where(ChatSession.satisfaction_rating >= 4)) / 
+        rated_chats * 100
+    ) if rated_chats > 0 else 0
     
     # حساب المواضيع الشائعة
     common_topics = {}
-    for chat in query.all():
+    for chat in chats:
         for topic in chat.topics or []:
             common_topics[topic] = common_topics.get(topic, 0) + 1
     
     # حساب معدل التصعيد
-    escalated_chats = query.filter(ChatSession.was_escalated == True).count()
+    escalated_chats = await count_rows(db, query.where(ChatSession.was_escalated == True))
     escalation_rate = (escalated_chats / total_chats * 100) if total_chats > 0 else 0
     
     return ChatStats(
@@ -289,15 +310,18 @@ def get_chat_stats(db: Session, doctor_id: UUID, time_range: Optional[TimeRange]
         escalation_rate=escalation_rate
     )
 
-def get_daily_schedule(db: Session, doctor_id: UUID, date: date) -> DailySchedule:
+async def get_daily_schedule(db: AsyncSession, doctor_id: UUID, date: date) -> DailySchedule:
     """الحصول على الجدول اليومي"""
     # الحصول على المواعيد
-    appointments = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == doctor_id,
-            func.date(Appointment.scheduled_at) == date
-        )
-    ).order_by(Appointment.scheduled_at).all()
+    result = await db.execute(
+        select(Appointment).where(
+            and_(
+                Appointment.doctor_id == doctor_id,
+                func.date(Appointment.scheduled_at) == date
+            )
+        ).options(selectinload(Appointment.patient)).order_by(Appointment.scheduled_at)
+    )
+    appointments = result.scalars().all()
     
     # تحويل المواعيد إلى قائمة
     appointments_list = [
@@ -313,7 +337,8 @@ def get_daily_schedule(db: Session, doctor_id: UUID, date: date) -> DailySchedul
     ]
     
     # حساب الفترات المتاحة
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+    result = await db.execute(select(Doctor).where(Doctor.id == doctor_id))
+    doctor = result.scalar_one_or_none()
     working_hours = doctor.working_hours.get(date.strftime("%A").lower())
     
     available_slots = []
@@ -375,27 +400,33 @@ def get_daily_schedule(db: Session, doctor_id: UUID, date: date) -> DailySchedul
         total_hours=total_hours
     )
 
-def get_performance_metrics(db: Session, doctor_id: UUID) -> List[PerformanceMetric]:
+async def get_performance_metrics(db: AsyncSession, doctor_id: UUID) -> List[PerformanceMetric]:
     """الحصول على مقاييس الأداء"""
     metrics = []
     
     # متوسط التقييم
-    current_rating = db.query(func.avg(Appointment.rating)).filter(
-        and_(
-            Appointment.doctor_id == doctor_id,
-            Appointment.rating.isnot(None),
-            Appointment.scheduled_at >= datetime.now() - timedelta(days=30)
+    result = await db.execute(
+        select(func.avg(Appointment.rating)).where(
+            and_(
+                Appointment.doctor_id == doctor_id,
+                Appointment.rating.isnot(None),
+                Appointment.scheduled_at >= datetime.now() - timedelta(days=30)
+            )
         )
-    ).scalar() or 0
+    )
+    current_rating = result.scalar() or 0
     
-    previous_rating = db.query(func.avg(Appointment.rating)).filter(
-        and_(
-            Appointment.doctor_id == doctor_id,
-            Appointment.rating.isnot(None),
-            Appointment.scheduled_at >= datetime.now() - timedelta(days=60),
-            Appointment.scheduled_at < datetime.now() - timedelta(days=30)
+    result = await db.execute(
+        select(func.avg(Appointment.rating)).where(
+            and_(
+                Appointment.doctor_id == doctor_id,
+                Appointment.rating.isnot(None),
+                Appointment.scheduled_at >= datetime.now() - timedelta(days=60),
+                Appointment.scheduled_at < datetime.now() - timedelta(days=30)
+            )
         )
-    ).scalar() or 0
+    )
+    previous_rating = result.scalar() or 0
     
     rating_change = ((current_rating - previous_rating) / previous_rating * 100) if previous_rating > 0 else 0
     
@@ -405,14 +436,14 @@ def get_performance_metrics(db: Session, doctor_id: UUID) -> List[PerformanceMet
             current_value=current_rating,
             previous_value=previous_rating,
             change_percentage=rating_change,
-            trend=get_rating_trend(db, doctor_id),
+            trend=await get_rating_trend(db, doctor_id),
             benchmark=4.5
         )
     )
     
     # معدل إكمال المواعيد
-    current_completion = get_completion_rate(db, doctor_id, days=30)
-    previous_completion = get_completion_rate(db, doctor_id, days=60, offset=30)
+    current_completion = await get_completion_rate(db, doctor_id, days=30)
+    previous_completion = await get_completion_rate(db, doctor_id, days=60, offset=30)
     completion_change = ((current_completion - previous_completion) / previous_completion * 100) if previous_completion > 0 else 0
     
     metrics.append(
@@ -421,25 +452,28 @@ def get_performance_metrics(db: Session, doctor_id: UUID) -> List[PerformanceMet
             current_value=current_completion,
             previous_value=previous_completion,
             change_percentage=completion_change,
-            trend=get_completion_trend(db, doctor_id),
+            trend=await get_completion_trend(db, doctor_id),
             benchmark=90
         )
     )
     
     return metrics
 
-def get_alerts(db: Session, doctor_id: UUID) -> List[Alert]:
+async def get_alerts(db: AsyncSession, doctor_id: UUID) -> List[Alert]:
     """الحصول على التنبيهات"""
     alerts = []
     
     # تنبيهات المواعيد القادمة
-    upcoming_appointments = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == doctor_id,
-            Appointment.scheduled_at > datetime.now(),
-            Appointment.scheduled_at <= datetime.now() + timedelta(hours=24)
-        )
-    ).all()
+    result = await db.execute(
+        select(Appointment).where(
+            and_(
+                Appointment.doctor_id == doctor_id,
+                Appointment.scheduled_at > datetime.now(),
+                Appointment.scheduled_at <= datetime.now() + timedelta(hours=24)
+            )
+        ).options(selectinload(Appointment.patient))
+    )
+    upcoming_appointments = result.scalars().all()
     
     for apt in upcoming_appointments:
         alerts.append(
@@ -456,13 +490,16 @@ def get_alerts(db: Session, doctor_id: UUID) -> List[Alert]:
         )
     
     # تنبيهات التقييمات المنخفضة
-    low_ratings = db.query(Appointment).filter(
-        and_(
-            Appointment.doctor_id == doctor_id,
-            Appointment.rating <= 3,
-            Appointment.scheduled_at >= datetime.now() - timedelta(days=7)
-        )
-    ).all()
+    result = await db.execute(
+        select(Appointment).where(
+            and_(
+                Appointment.doctor_id == doctor_id,
+                Appointment.rating <= 3,
+                Appointment.scheduled_at >= datetime.now() - timedelta(days=7)
+            )
+        ).options(selectinload(Appointment.patient))
+    )
+    low_ratings = result.scalars().all()
     
     for apt in low_ratings:
         alerts.append(
@@ -479,13 +516,16 @@ def get_alerts(db: Session, doctor_id: UUID) -> List[Alert]:
         )
     
     # تنبيهات المحادثات غير المجاب عليها
-    unanswered_chats = db.query(ChatSession).filter(
-        and_(
-            ChatSession.doctor_id == doctor_id,
-            ChatSession.status == "pending",
-            ChatSession.created_at >= datetime.now() - timedelta(hours=2)
-        )
-    ).all()
+    result = await db.execute(
+        select(ChatSession).where(
+            and_(
+                ChatSession.doctor_id == doctor_id,
+                ChatSession.status == "pending",
+                ChatSession.created_at >= datetime.now() - timedelta(hours=2)
+            )
+        ).options(selectinload(ChatSession.patient))
+    )
+    unanswered_chats = result.scalars().all()
     
     for chat in unanswered_chats:
         alerts.append(
@@ -503,14 +543,15 @@ def get_alerts(db: Session, doctor_id: UUID) -> List[Alert]:
     
     return sorted(alerts, key=lambda x: x.created_at, reverse=True)
 
-def get_dashboard_overview(
-    db: Session,
+async def get_dashboard_overview(
+    db: AsyncSession,
     doctor_id: UUID,
     filters: Optional[DashboardFilter] = None
 ) -> DashboardResponse:
     """الحصول على نظرة عامة على لوحة التحكم"""
     # التحقق من وجود الطبيب
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+    result = await db.execute(select(Doctor).where(Doctor.id == doctor_id))
+    doctor = result.scalar_one_or_none()
     if not doctor:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -518,12 +559,12 @@ def get_dashboard_overview(
         )
     
     # الحصول على الإحصائيات
-    appointment_stats = get_appointment_stats(db, doctor_id, filters.time_range if filters else None)
-    revenue_stats = get_revenue_stats(db, doctor_id, filters.time_range if filters else None)
-    patient_stats = get_patient_stats(db, doctor_id, filters.time_range if filters else None)
-    treatment_stats = get_treatment_stats(db, doctor_id, filters.time_range if filters else None)
-    chat_stats = get_chat_stats(db, doctor_id, filters.time_range if filters else None)
-    today_schedule = get_daily_schedule(db, doctor_id, date.today())
+    appointment_stats = await get_appointment_stats(db, doctor_id, filters.time_range if filters else None)
+    revenue_stats = await get_revenue_stats(db, doctor_id, filters.time_range if filters else None)
+    patient_stats = await get_patient_stats(db, doctor_id, filters.time_range if filters else None)
+    treatment_stats = await get_treatment_stats(db, doctor_id, filters.time_range if filters else None)
+    chat_stats = await get_chat_stats(db, doctor_id, filters.time_range if filters else None)
+    today_schedule = await get_daily_schedule(db, doctor_id, date.today())
     
     # تجميع النظرة العامة
     overview = DashboardOverview(
@@ -536,8 +577,8 @@ def get_dashboard_overview(
     )
     
     # الحصول على مقاييس الأداء والتنبيهات
-    performance_metrics = get_performance_metrics(db, doctor_id)
-    alerts = get_alerts(db, doctor_id)
+    performance_metrics = await get_performance_metrics(db, doctor_id)
+    alerts = await get_alerts(db, doctor_id)
     
     return DashboardResponse(
         overview=overview,
@@ -566,55 +607,58 @@ def calculate_age_group(birth_date: date) -> str:
     else:
         return "60 فأكثر"
 
-def get_rating_trend(db: Session, doctor_id: UUID, months: int = 6) -> List[float]:
+async def get_rating_trend(db: AsyncSession, doctor_id: UUID, months: int = 6) -> List[float]:
     """الحصول على اتجاه التقييمات"""
     trend = []
     for i in range(months - 1, -1, -1):
         start_date = datetime.now() - timedelta(days=(i + 1) * 30)
         end_date = datetime.now() - timedelta(days=i * 30)
         
-        avg_rating = db.query(func.avg(Appointment.rating)).filter(
-            and_(
-                Appointment.doctor_id == doctor_id,
-                Appointment.rating.isnot(None),
-                Appointment.scheduled_at >= start_date,
-                Appointment.scheduled_at < end_date
+        result = await db.execute(
+            select(func.avg(Appointment.rating)).where(
+                and_(
+                    Appointment.doctor_id == doctor_id,
+                    Appointment.rating.isnot(None),
+                    Appointment.scheduled_at >= start_date,
+                    Appointment.scheduled_at < end_date
+                )
             )
-        ).scalar() or 0
+        )
+        avg_rating = result.scalar() or 0
         
         trend.append(float(avg_rating))
     
     return trend
 
-def get_completion_rate(db: Session, doctor_id: UUID, days: int = 30, offset: int = 0) -> float:
+async def get_completion_rate(db: AsyncSession, doctor_id: UUID, days: int = 30, offset: int = 0) -> float:
     """حساب معدل إكمال المواعيد"""
     start_date = datetime.now() - timedelta(days=days + offset)
     end_date = datetime.now() - timedelta(days=offset)
     
-    total = db.query(Appointment).filter(
+    total = await count_rows(db, select(Appointment).where(
         and_(
             Appointment.doctor_id == doctor_id,
             Appointment.scheduled_at >= start_date,
             Appointment.scheduled_at < end_date
         )
-    ).count()
+    ))
     
-    completed = db.query(Appointment).filter(
+    completed = await count_rows(db, select(Appointment).where(
         and_(
             Appointment.doctor_id == doctor_id,
             Appointment.status == "completed",
             Appointment.scheduled_at >= start_date,
             Appointment.scheduled_at < end_date
         )
-    ).count()
+    ))
     
     return (completed / total * 100) if total > 0 else 0
 
-def get_completion_trend(db: Session, doctor_id: UUID, months: int = 6) -> List[float]:
+async def get_completion_trend(db: AsyncSession, doctor_id: UUID, months: int = 6) -> List[float]:
     """الحصول على اتجاه معدل إكمال المواعيد"""
     trend = []
     for i in range(months - 1, -1, -1):
-        completion_rate = get_completion_rate(db, doctor_id, days=30, offset=i * 30)
+        completion_rate = await get_completion_rate(db, doctor_id, days=30, offset=i * 30)
         trend.append(completion_rate)
     
     return trend 
\ No newline at end of file
@@ -4,10 +4,11 @@ Follow-Up System Service
 from typing import List, Dict, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from uuid import UUID
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func
+from sqlalchemy import and_, or_, desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 
+from app.config.database import count_rows
 from app.models.follow_up import (
     Interaction,
     FollowUpRule,
@@ -26,13 +27,13 @@ from app.schemas.follow_up import (
     InteractionType
 )
 
-def create_interaction(db: Session, interaction: InteractionCreate) -> Interaction:
+async def create_interaction(db: AsyncSession, interaction: InteractionCreate) -> Interaction:
     """إنشاء تفاعل جديد"""
     db_interaction = Interaction(
         type=interaction.type,
         title=interaction.title,
         description=interaction.description,
-        metadata=interaction.metadata,
+        meta=interaction.metadata,
         timestamp=interaction.timestamp,
         status=interaction.status,
         importance=interaction.importance,
@@ -45,21 +46,24 @@ def create_interaction(db: Session, interaction: InteractionCreate) -> Interacti
     )
     
     db.add(db_interaction)
-    db.commit()
-    db.refresh(db_interaction)
+    await db.commit()
+    await db.refresh(db_interaction)
     
     # تطبيق قواعد المتابعة
-    apply_follow_up_rules(db, db_interaction)
+    await apply_follow_up_rules(db, db_interaction)
     
     return db_interaction
 
-def update_interaction(
-    db: Session,
+async def update_interaction(
+    db: AsyncSession,
     interaction_id: UUID,
     update_data: InteractionUpdate
 ) -> Interaction:
     """تحديث تفاعل"""
-    interaction = db.query(Interaction).filter(Interaction.id == interaction_id).first()
+    result = await db.execute(
+        select(Interaction).where(Interaction.id == interaction_id)
+    )
+    interaction = result.scalar_one_or_none()
     if not interaction:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -67,31 +71,33 @@ def update_interaction(
         )
     
     for field, value in update_data.dict(exclude_unset=True).items():
-        setattr(interaction, field, value)
+        # عمود metadata اسمه في النموذج meta
+        setattr(interaction, "meta" if field == "metadata" else field, value)
     
-    db.commit()
-    db.refresh(interaction)
+    await db.commit()
+    await db.refresh(interaction)
     return interaction
 
-def get_patient_timeline(
-    db: Session,
+async def get_patient_timeline(
+    db: AsyncSession,
     patient_id: UUID,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     interaction_types: Optional[List[str]] = None
 ) -> Timeline:
     """الحصول على الجدول الزمني للمريض"""
-    query = db.query(Interaction).filter(Interaction.patient_id == patient_id)
+    query = select(Interaction).where(Interaction.patient_id == patient_id)
     
     if start_date:
-        query = query.filter(Interaction.timestamp >= start_date)
+        query = query.where(Interaction.timestamp >= start_date)
     if end_date:
-        query = query.filter(Interaction.timestamp <= end_date)
+        query = query.where(Interaction.timestamp <= end_date)
     if interaction_types:
-        query = query.filter(Interaction.type.in_(interaction_types))
+        query = query.where(Interaction.type.in_(interaction_types))
     
     query = query.order_by(desc(Interaction.timestamp))
-    interactions = query.all()
+    result = await db.execute(query)
+    interactions = result.scalars().all()
     
     # تجميع التفاعلات حسب اليوم
     timeline_entries = []
@@ -138,31 +144,32 @@ def get_patient_timeline(
         statistics=generate_timeline_statistics(interactions)
     )
 
-def get_analytics_summary(
-    db: Session,
+async def get_analytics_summary(
+    db: AsyncSession,
     patient_id: Optional[UUID] = None,
     doctor_id: Optional[UUID] = None,
     filters: Optional[AnalyticsFilter] = None
 ) -> AnalyticsSummary:
     """الحصول على ملخص التحليلات"""
-    query = db.query(Interaction)
+    query = select(Interaction)
     
     if patient_id:
-        query = query.filter(Interaction.patient_id == patient_id)
+        query = query.where(Interaction.patient_id == patient_id)
     if doctor_id:
-        query = query.filter(Interaction.doctor_id == doctor_id)
+        query = query.where(Interaction.doctor_id == doctor_id)
     
     if filters:
-        query = query.filter(
+        query = query.where(
             and_(
                 Interaction.timestamp >= filters.start_date,
                 Interaction.timestamp <= filters.end_date
             )
         )
         if filters.interaction_types:
-            query = query.filter(Interaction.type.in_(filters.interaction_types))
+            query = query.where(Interaction.type.in_(filters.interaction_types))
     
-    interactions = query.all()
+    result = await db.execute(query)
+    interactions = result.scalars().all()
     
     # حساب الإحصائيات
     total = len(interactions)
@@ -212,53 +219,59 @@ def get_analytics_summary(
         common_patterns=patterns
     )
 
-def get_patient_summary(db: Session, patient_id: UUID) -> PatientSummary:
+async def get_patient_summary(db: AsyncSession, patient_id: UUID) -> PatientSummary:
     """الحصول على ملخص المريض"""
     # الحصول على المواعيد
-    appointments = db.query(Interaction).filter(
-        and_(
-            Interaction.patient_id == patient_id,
-            Interaction.type == InteractionType.APPOINTMENT
-        )
-    ).order_by(desc(Interaction.timestamp)).all()
+    result = await db.execute(
+        select(Interaction).where(
+            and_(
+                Interaction.patient_id == patient_id,
+                Interaction.type == InteractionType.APPOINTMENT
+            )
+        ).order_by(desc(Interaction.timestamp))
+    )
+    appointments = result.scalars().all()
     
     # الحصول على الوصفات الطبية النشطة
-    active_prescriptions = db.query(Interaction).filter(
+    active_prescriptions = await count_rows(db, select(Interaction).where(
         and_(
             Interaction.patient_id == patient_id,
             Interaction.type == InteractionType.PRESCRIPTION,
             Interaction.status == "active"
         )
-    ).count()
+    ))
     
     # حساب معدل الالتزام
-    total_required = db.query(Interaction).filter(
+    total_required = await count_rows(db, select(Interaction).where(
         and_(
             Interaction.patient_id == patient_id,
             Interaction.requires_action == True
         )
-    ).count()
+    ))
     
-    completed_required = db.query(Interaction).filter(
+    completed_required = await count_rows(db, select(Interaction).where(
         and_(
             Interaction.patient_id == patient_id,
             Interaction.requires_action == True,
             Interaction.status == "completed"
         )
-    ).count()
+    ))
     
     compliance_rate = (completed_required / total_required * 100) if total_required > 0 else 0
     
     # تحليل عوامل الخطر
-    risk_factors = analyze_risk_factors(db, patient_id)
+    risk_factors = await analyze_risk_factors(db, patient_id)
     
     # الحصول على التفاعلات الأخيرة
-    recent_interactions = db.query(Interaction).filter(
-        Interaction.patient_id == patient_id
-    ).order_by(desc(Interaction.timestamp)).limit(5).all()
+    result = await db.execute(
+        select(Interaction).where(
+            Interaction.patient_id == patient_id
+        ).order_by(desc(Interaction.timestamp)).limit(5)
+    )
+    recent_interactions = result.scalars().all()
     
     # تحليل الاتجاهات الصحية
-    health_trends = analyze_health_trends(db, patient_id)
+    health_trends = await analyze_health_trends(db, patient_id)
     
     return PatientSummary(
         total_visits=len(appointments),
@@ -271,49 +284,49 @@ def get_patient_summary(db: Session, patient_id: UUID) -> PatientSummary:
         health_trends=health_trends
     )
 
-def get_doctor_summary(db: Session, doctor_id: UUID) -> DoctorSummary:
+async def get_doctor_summary(db: AsyncSession, doctor_id: UUID) -> DoctorSummary:
     """الحصول على ملخص الطبيب"""
     # عدد المرضى الكلي
-    total_patients = db.query(Interaction.patient_id).filter(
+    total_patients = await count_rows(db, select(Interaction.patient_id).where(
         Interaction.doctor_id == doctor_id
-    ).distinct().count()
+    ).distinct())
     
     # الحالات النشطة
-    active_cases = db.query(TreatmentPlan).filter(
+    active_cases = await count_rows(db, select(TreatmentPlan).where(
         and_(
             TreatmentPlan.doctor_id == doctor_id,
             TreatmentPlan.status == "active"
         )
-    ).count()
+    ))
     
     # معدل المتابعة
-    follow_ups = db.query(Interaction).filter(
+    follow_ups = await count_rows(db, select(Interaction).where(
         and_(
             Interaction.doctor_id == doctor_id,
             Interaction.type == InteractionType.FOLLOW_UP
         )
-    ).count()
+    ))
     
-    total_appointments = db.query(Interaction).filter(
+    total_appointments = await count_rows(db, select(Interaction).where(
         and_(
             Interaction.doctor_id == doctor_id,
             Interaction.type == InteractionType.APPOINTMENT
         )
-    ).count()
+    ))
     
     follow_up_rate = (follow_ups / total_appointments * 100) if total_appointments > 0 else 0
     
     # متوسط الفترة بين الزيارات
-    visit_intervals = calculate_visit_intervals(db, doctor_id)
+    visit_intervals = await calculate_visit_intervals(db, doctor_id)
     
     # نتائج العلاج
-    treatment_outcomes = analyze_treatment_outcomes(db, doctor_id)
+    treatment_outcomes = await analyze_treatment_outcomes(db, doctor_id)
     
     # رضا المرضى
-    satisfaction = calculate_patient_satisfaction(db, doctor_id)
+    satisfaction = await calculate_patient_satisfaction(db, doctor_id)
     
     # توزيع العمل
-    workload = analyze_workload_distribution(db, doctor_id)
+    workload = await analyze_workload_distribution(db, doctor_id)
     
     return DoctorSummary(
         total_patients=total_patients,
@@ -327,18 +340,21 @@ def get_doctor_summary(db: Session, doctor_id: UUID) -> DoctorSummary:
 
 # Helper Functions
 
-def apply_follow_up_rules(db: Session, interaction: Interaction) -> None:
+async def apply_follow_up_rules(db: AsyncSession, interaction: Interaction) -> None:
     """تطبيق قواعد المتابعة"""
-    rules = db.query(FollowUpRule).filter(
-        and_(
-            FollowUpRule.trigger_type == interaction.type,
-            FollowUpRule.is_active == True
-        )
-    ).order_by(FollowUpRule.priority).all()
+    result = await db.execute(
+        select(FollowUpRule).where(
+            and_(
+                FollowUpRule.trigger_type == interaction.type,
+                FollowUpRule.is_active == True
+            )
+        ).order_by(FollowUpRule.priority)
+    )
+    rules = result.scalars().all()
     
     for rule in rules:
         if evaluate_rule_conditions(interaction, rule.conditions):
-            execute_rule_actions(db, interaction, rule.actions)
+            await execute_rule_actions(db, interaction, rule.actions)
 
 def generate_day_summary(interactions: List[Interaction]) -> str:
     """توليد ملخص لليوم"""
@@ -423,44 +439,53 @@ def analyze_patterns(interactions: List[Interaction]) -> List[Dict[str, Any]]:
     
     return patterns
 
-def analyze_risk_factors(db: Session, patient_id: UUID) -> List[str]:
+async def analyze_risk_factors(db: AsyncSession, patient_id: UUID) -> List[str]:
     """تحليل عوامل الخطر"""
     risk_factors = []
     
     # تحليل التفاعلات الهامة
-    critical_interactions = db.query(Interaction).filter(
-        and_(
-            Interaction.patient_id == patient_id,
-            Interaction.importance >= 4
-        )
-    ).order_by(desc(Interaction.timestamp)).limit(10).all()
+    result = await db.execute(
+        select(Interaction).where(
+            and_(
+                Interaction.patient_id == patient_id,
+                Interaction.importance >= 4
+            )
+        ).order_by(desc(Interaction.timestamp)).limit(10)
+    )
+    critical_interactions = result.scalars().all()
     
     if critical_interactions:
         risk_factors.append("تفاعلات حرجة متكررة")
     
     # تحليل معدل الالتزام
-    compliance_rate = calculate_compliance_rate(db, patient_id)
+    compliance_rate = await calculate_compliance_rate(db, patient_id)
     if compliance_rate < 70:
         risk_factors.append("معدل التزام منخفض")
     
     # تحليل المقاييس الصحية
-    health_metrics = db.query(HealthMetric).filter(
-        HealthMetric.patient_id == patient_id
-    ).order_by(desc(HealthMetric.timestamp)).all()
+    result = await db.execute(
+        select(HealthMetric).where(
+            HealthMetric.patient_id == patient_id
+        ).order_by(desc(HealthMetric.timestamp))
+    )
+    health_metrics = result.scalars().all()
     
     abnormal_metrics = analyze_health_metrics(health_metrics)
     risk_factors.extend(abnormal_metrics)
     
     return risk_factors
 
-def analyze_health_trends(db: Session, patient_id: UUID) -> Dict[str, List[float]]:
+async def analyze_health_trends(db: AsyncSession, patient_id: UUID) -> Dict[str, List[float]]:
     """تحليل الاتجاهات الصحية"""
     trends = {}
     
     # الحصول على المقاييس الصحية
-    metrics = db.query(HealthMetric).filter(
-        HealthMetric.patient_id == patient_id
-    ).order_by(HealthMetric.timestamp).all()
+    result = await db.execute(
+        select(HealthMetric).where(
+            HealthMetric.patient_id == patient_id
+        ).order_by(HealthMetric.timestamp)
+    )
+    metrics = result.scalars().all()
     
     # تجميع المقاييس حسب النوع
     metric_groups = {}
@@ -483,15 +508,18 @@ def analyze_health_trends(db: Session, patient_id: UUID) -> Dict[str, List[float
     
     return trends
 
-def calculate_visit_intervals(db: Session, doctor_id: UUID) -> float:
+async def calculate_visit_intervals(db: AsyncSession, doctor_id: UUID) -> float:
     """حساب متوسط الفترة بين الزيارات"""
-    appointments = db.query(Interaction).filter(
-        and_(
-            Interaction.doctor_id == doctor_id,
-            Interaction.type == InteractionType.APPOINTMENT,
-            Interaction.status == "completed"
-        )
-    ).order_by(Interaction.timestamp).all()
+    result = await db.execute(
+        select(Interaction).where(
+            and_(
+                Interaction.doctor_id == doctor_id,
+                Interaction.type == InteractionType.APPOINTMENT,
+                Interaction.status == "completed"
+            )
+        ).order_by(Interaction.timestamp)
+    )
+    appointments = result.scalars().all()
     
     if len(appointments) < 2:
         return 0
@@ -503,14 +531,17 @@ def calculate_visit_intervals(db: Session, doctor_id: UUID) -> float:
     
     return sum(intervals) / len(intervals)
 
-def analyze_treatment_outcomes(db: Session, doctor_id: UUID) -> Dict[str, float]:
+async def analyze_treatment_outcomes(db: AsyncSession, doctor_id: UUID) -> Dict[str, float]:
     """تحليل نتائج العلاج"""
-    treatment_plans = db.query(TreatmentPlan).filter(
-        and_(
-            TreatmentPlan.doctor_id == doctor_id,
-            TreatmentPlan.status.in_(["completed", "failed"])
+    result = await db.execute(
+        select(TreatmentPlan).where(
+            and_(
+                TreatmentPlan.doctor_id == doctor_id,
+                TreatmentPlan.status.in_(["completed", "failed"])
+            )
         )
-    ).all()
+    )
+    treatment_plans = result.scalars().all()
     
     outcomes = {
         "success_rate": 0,
@@ -544,37 +575,43 @@ def analyze_treatment_outcomes(db: Session, doctor_id: UUID) -> Dict[str, float]
     
     return outcomes
 
-def calculate_patient_satisfaction(db: Session, doctor_id: UUID) -> float:
+async def calculate_patient_satisfaction(db: AsyncSession, doctor_id: UUID) -> float:
     """حساب رضا المرضى"""
-    interactions = db.query(Interaction).filter(
-        and_(
-            Interaction.doctor_id == doctor_id,
-            Interaction.type.in_([InteractionType.APPOINTMENT, InteractionType.FOLLOW_UP]),
-            Interaction.metadata.has_key("satisfaction_rating")
+    result = await db.execute(
+        select(Interaction).where(
+            and_(
+                Interaction.doctor_id == doctor_id,
+                Interaction.type.in_([InteractionType.APPOINTMENT, InteractionType.FOLLOW_UP]),
+                Interaction.meta.has_key("satisfaction_rating")
+            )
         )
-    ).all()
+    )
+    interactions = result.scalars().all()
     
     if not interactions:
         return 0
     
     ratings = []
     for interaction in interactions:
-        rating = interaction.metadata.get("satisfaction_rating")
+        rating = interaction.meta.get("satisfaction_rating")
         if isinstance(rating, (int, float)):
             ratings.append(float(rating))
     
     return sum(ratings) / len(ratings) if ratings else 0
 
-def analyze_workload_distribution(db: Session, doctor_id: UUID) -> Dict[str, int]:
+async def analyze_workload_distribution(db: AsyncSession, doctor_id: UUID) -> Dict[str, int]:
     """تحليل توزيع العمل"""
     # الحصول على التفاعلات في الشهر الحالي
     start_date = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    interactions = db.query(Interaction).filter(
-        and_(
-            Interaction.doctor_id == doctor_id,
-            Interaction.timestamp >= start_date
+    result = await db.execute(
+        select(Interaction).where(
+            and_(
+                Interaction.doctor_id == doctor_id,
+                Interaction.timestamp >= start_date
+            )
         )
-    ).all()
+    )
+    interactions = result.scalars().all()
     
     distribution = {
         "appointments": 0,
@@ -2,13 +2,13 @@
 Geo-Search Service for Doctors and Hospitals
 """
 from typing import List, Optional, Tuple
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, select, Select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.expression import cast
-from geoalchemy2 import Geography
 from math import radians, sin, cos, sqrt, atan2
 
-from app.models.doctor import Doctor, DoctorClinic, Hospital
+from app.core.pagination import CountMode, Total, page_with_total
+from app.models.doctor import GEOGRAPHY, Doctor, DoctorClinic, Hospital
 from app.schemas.doctor import (
     DoctorSearchParams,
     HospitalSearchParams,
@@ -53,22 +53,19 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
 
     return distance
 
-def search_doctors(
-    db: Session,
-    params: DoctorSearchParams,
-    limit: int = 10,
-    offset: int = 0
-) -> Tuple[List[Doctor], int]:
+def location_point(location: GeoLocation):
+    """نقطة البحث بنظام الإحداثيات 4326"""
+    return func.ST_SetSRID(func.ST_MakePoint(location.longitude, location.latitude), 4326)
+
+def apply_doctor_filters(query: Select, params: DoctorSearchParams) -> Select:
     """
-    البحث عن الأطباء باستخدام معايير متعددة
-    يدعم البحث الجغرافي والتصفية حسب التخصص والتقييم والسعر وغيرها
+    تطبيق معايير البحث على استعلام يضم Doctor و DoctorClinic
+    (يستخدمه البحث عن الأطباء والبحث عن أقرب المواعيد)
     """
-    query = db.query(Doctor).join(DoctorClinic)
-    
     # البحث النصي
     if params.query:
         search_term = f"%{params.query}%"
-        query = query.filter(
+        query = query.where(
             or_(
                 Doctor.first_name.ilike(search_term),
                 Doctor.last_name.ilike(search_term),
@@ -79,23 +76,23 @@ def search_doctors(
     
     # التصفية حسب التخصص
     if params.specialization:
-        query = query.filter(Doctor.specializations.any(params.specialization))
+        query = query.where(Doctor.specializations.contains([params.specialization]))
     
     # التصفية حسب المدينة
     if params.city:
-        query = query.filter(DoctorClinic.city == params.city)
+        query = query.where(DoctorClinic.city == params.city)
     
     # التصفية حسب نوع الاستشارة
     if params.consultation_type:
-        query = query.filter(Doctor.consultation_types.any(params.consultation_type))
+        query = query.where(Doctor.consultation_types.contains([params.consultation_type]))
     
     # التصفية حسب التقييم
     if params.min_rating is not None:
-        query = query.filter(Doctor.rating >= params.min_rating)
+        query = query.where(Doctor.rating >= params.min_rating)
     
     # التصفية حسب السعر
     if params.max_price is not None:
-        query = query.filter(
+        query = query.where(
             or_(
                 Doctor.consultation_fees['in_person'].astext.cast(float) <= params.max_price,
                 Doctor.consultation_fees['video'].astext.cast(float) <= params.max_price,
@@ -105,15 +102,15 @@ def search_doctors(
     
     # التصفية حسب شركة التأمين
     if params.insurance_provider:
-        query = query.filter(Doctor.insurance_providers.any(params.insurance_provider))
+        query = query.where(Doctor.insurance_providers.contains([params.insurance_provider]))
     
     # التصفية حسب اللغة
     if params.language:
-        query = query.filter(Doctor.languages.any(params.language))
+        query = query.where(Doctor.languages.contains([params.language]))
     
     # التصفية حسب الجنس
     if params.gender:
-        query = query.filter(Doctor.gender == params.gender)
+        query = query.where(Doctor.gender == params.gender)
     
     # البحث الجغرافي
     if params.location:
@@ -122,60 +119,79 @@ def search_doctors(
         if params.distance_unit == DistanceUnit.MILES:
             search_radius_km = params.radius_km / KM_TO_MILES
         
-        # تحويل نقطة البحث إلى جغرافيا
-        search_point = func.ST_SetSRID(
-            func.ST_MakePoint(params.location.longitude, params.location.latitude),
-            4326
+        # تصفية النتائج بـ ST_DWithin حتى يُستخدم فهرس GiST على الموقع
+        query = query.where(
+            func.ST_DWithin(
+                cast(DoctorClinic.location, GEOGRAPHY),
+                cast(location_point(params.location), GEOGRAPHY),
+                search_radius_km * 1000
+            )
         )
+    
+    return query
+
+async def search_doctors(
+    db: AsyncSession,
+    params: DoctorSearchParams,
+    limit: int = 10,
+    offset: int = 0,
+    count_mode: CountMode = CountMode.EXACT
+) -> Tuple[List[Doctor], Total]:
+    """
+    البحث عن الأطباء باستخدام معايير متعددة
+    يدعم البحث الجغرافي والتصفية حسب التخصص والتقييم والسعر وغيرها
+    """
+    query = apply_doctor_filters(select(Doctor).join(DoctorClinic), params)
+    
+    # البحث الجغرافي
+    if params.location:
+        search_point = location_point(params.location)
         
-        # حساب المسافة وتصفية النتائج
+        # حساب المسافة
         distance = func.ST_Distance(
-            cast(DoctorClinic.location, Geography),
-            cast(search_point, Geography)
+            cast(DoctorClinic.location, GEOGRAPHY),
+            cast(search_point, GEOGRAPHY)
         ) / 1000  # تحويل من متر إلى كيلومتر
         
-        query = query.filter(distance <= search_radius_km)
-        
         # إضافة المسافة إلى النتائج
         query = query.add_columns(distance.label('distance_km'))
         query = query.order_by(distance)
     
-    # حساب إجمالي النتائج
-    total = query.count()
-    
-    # تطبيق الترتيب والتقسيم
+    # تطبيق الترتيب
     if not params.location:
         query = query.order_by(Doctor.rating.desc())
-    query = query.offset(offset).limit(limit)
+    
+    # الصفحة وإجمالي النتائج في استعلام واحد
+    rows, total = await page_with_total(db, query, limit, offset, count_mode)
     
     # تجهيز النتائج
+    if not params.location:
+        return [doctor for doctor, in rows], total
+    
     results = []
-    for row in query.all():
-        if params.location:
-            doctor, distance_km = row
-            doctor.distance = format_distance(distance_km, params.distance_unit)
-            results.append(doctor)
-        else:
-            results.append(row)
+    for doctor, distance_km in rows:
+        doctor.distance = format_distance(distance_km, params.distance_unit)
+        results.append(doctor)
     
     return results, total
 
-def search_hospitals(
-    db: Session,
+async def search_hospitals(
+    db: AsyncSession,
     params: HospitalSearchParams,
     limit: int = 10,
-    offset: int = 0
-) -> Tuple[List[Hospital], int]:
+    offset: int = 0,
+    count_mode: CountMode = CountMode.EXACT
+) -> Tuple[List[Hospital], Total]:
     """
     البحث عن المستشفيات باستخدام معايير متعددة
     يدعم البحث الجغرافي والتصفية حسب التخصص والتقييم وغيرها
     """
-    query = db.query(Hospital)
+    query = select(Hospital)
     
     # البحث النصي
     if params.query:
         search_term = f"%{params.query}%"
-        query = query.filter(
+        query = query.where(
             or_(
                 Hospital.name.ilike(search_term),
                 Hospital.departments.any(search_term),
@@ -185,27 +201,27 @@ def search_hospitals(
     
     # التصفية حسب النوع
     if params.type:
-        query = query.filter(Hospital.type == params.type)
+        query = query.where(Hospital.type == params.type)
     
     # التصفية حسب المدينة
     if params.city:
-        query = query.filter(Hospital.city == params.city)
+        query = query.where(Hospital.city == params.city)
     
     # التصفية حسب التخصص
     if params.specialty:
-        query = query.filter(Hospital.specialties.any(params.specialty))
+        query = query.where(Hospital.specialties.contains([params.specialty]))
     
     # التصفية حسب التقييم
     if params.min_rating is not None:
-        query = query.filter(Hospital.rating >= params.min_rating)
+        query = query.where(Hospital.rating >= params.min_rating)
     
     # التصفية حسب شركة التأمين
     if params.insurance_provider:
-        query = query.filter(Hospital.insurance_providers.any(params.insurance_provider))
+        query = query.where(Hospital.insurance_providers.contains([params.insurance_provider]))
     
     # التصفية حسب توفر قسم الطوارئ
     if params.has_emergency:
-        query = query.filter(Hospital.emergency_phone.isnot(None))
+        query = query.where(Hospital.emergency_phone.isnot(None))
     
     # البحث الجغرافي
     if params.location and params.radius_km:
@@ -215,20 +231,25 @@ def search_hospitals(
             4326
         )
         
-        # حساب المسافة وتصفية النتائج
-        distance = func.ST_Distance(
-            cast(Hospital.location, Geography),
-            cast(search_point, Geography)
+        # تصفية النتائج بـ ST_DWithin حتى يُستخدم فهرس GiST على الموقع
+        query = query.where(
+            func.ST_DWithin(
+                cast(Hospital.location, GEOGRAPHY),
+                cast(search_point, GEOGRAPHY),
+                params.radius_km * 1000  # تحويل إلى أمتار
+            )
         )
         
-        query = query.filter(distance <= params.radius_km * 1000)  # تحويل إلى أمتار
+        # الترتيب حسب المسافة
+        distance = func.ST_Distance(
+            cast(Hospital.location, GEOGRAPHY),
+            cast(search_point, GEOGRAPHY)
+        )
         query = query.order_by(distance)
     
-    # حساب إجمالي النتائج
-    total = query.count()
-    
-    # تطبيق الترتيب والتقسيم
+    # تطبيق الترتيب
     query = query.order_by(Hospital.rating.desc())
-    query = query.offset(offset).limit(limit)
     
-    return query.all(), total
+    # الصفحة وإجمالي النتائج في استعلام واحد
+    rows, total = await page_with_total(db, query, limit, offset, count_mode)
+    return [hospital for hospital, in rows], total
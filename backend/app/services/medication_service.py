@@ -2,12 +2,16 @@
 Medication service
 """
 from datetime import datetime
-from typing import List, Optional, Dict, Tuple
+from typing import List, Optional, Dict
 from uuid import UUID
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 import shortuuid
 
+from app.core.outbox import enqueue
+from app.core.pagination import CountMode, Page, paginate
+from app.core.unit_of_work import unit_of_work
 from app.models.medication import (
     Medication, InventoryTransaction, Order, OrderItem,
     Prescription, PrescriptionMedication
@@ -23,7 +27,7 @@ from app.services.payment_service import PaymentService
 class MedicationService:
     def __init__(
         self,
-        db: Session,
+        db: AsyncSession,
         notification_service: NotificationService,
         payment_service: PaymentService
     ):
@@ -31,11 +35,21 @@ class MedicationService:
         self.notification_service = notification_service
         self.payment_service = payment_service
 
-    def get_medication(self, medication_id: UUID) -> Optional[Medication]:
+    async def get_medication(self, medication_id: UUID) -> Optional[Medication]:
         """Get medication by ID"""
-        return self.db.query(Medication).filter(Medication.id == medication_id).first()
+        result = await self.db.execute(
+            select(Medication).where(Medication.id == medication_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def get_medications(self, medication_ids: List[UUID]) -> Dict[UUID, Medication]:
+        """Get several medications in one query, keyed by ID"""
+        result = await self.db.execute(
+            select(Medication).where(Medication.id.in_(set(medication_ids)))
+        )
+        return {medication.id: medication for medication in result.scalars().all()}
 
-    def search_medications(
+    async def search_medications(
         self,
         query: Optional[str] = None,
         category: Optional[str] = None,
@@ -43,14 +57,16 @@ class MedicationService:
         manufacturer: Optional[str] = None,
         requires_prescription: Optional[bool] = None,
         in_stock: Optional[bool] = None,
-        page: int = 1,
-        per_page: int = 20
-    ) -> Tuple[List[Medication], int]:
+        cursor: Optional[str] = None,
+        per_page: int = 20,
+        with_total: bool = False,
+        count_mode: CountMode = CountMode.EXACT
+    ) -> Page[Medication]:
         """Search medications with filters"""
-        query_obj = self.db.query(Medication)
+        query_obj = select(Medication)
         
         if query:
-            query_obj = query_obj.filter(
+            query_obj = query_obj.where(
                 or_(
                     Medication.name.ilike(f"%{query}%"),
                     Medication.generic_name.ilike(f"%{query}%"),
@@ -60,63 +76,64 @@ class MedicationService:
             )
             
         if category:
-            query_obj = query_obj.filter(Medication.category == category)
+            query_obj = query_obj.where(Medication.category == category)
             
         if type:
-            query_obj = query_obj.filter(Medication.type == type)
+            query_obj = query_obj.where(Medication.type == type)
             
         if manufacturer:
-            query_obj = query_obj.filter(Medication.manufacturer == manufacturer)
+            query_obj = query_obj.where(Medication.manufacturer == manufacturer)
             
         if requires_prescription is not None:
-            query_obj = query_obj.filter(
+            query_obj = query_obj.where(
                 Medication.prescription_requirement == "required"
                 if requires_prescription else
                 Medication.prescription_requirement != "required"
             )
             
         if in_stock is not None:
-            query_obj = query_obj.filter(
+            query_obj = query_obj.where(
                 Medication.stock_quantity > 0 if in_stock else Medication.stock_quantity == 0
             )
 
-        total = query_obj.count()
-        medications = query_obj.offset((page - 1) * per_page).limit(per_page).all()
-        
-        return medications, total
+        return await paginate(
+            self.db, query_obj, Medication.name, Medication.id,
+            per_page, cursor, descending=False,
+            with_total=with_total, count_mode=count_mode
+        )
 
-    def create_medication(self, medication_data: MedicationCreate) -> Medication:
+    async def create_medication(self, medication_data: MedicationCreate) -> Medication:
         """Create a new medication"""
         medication = Medication(**medication_data.dict())
         self.db.add(medication)
-        self.db.commit()
-        self.db.refresh(medication)
+        await self.db.commit()
+        await self.db.refresh(medication)
         return medication
 
-    def update_medication(
+    async def update_medication(
         self,
         medication_id: UUID,
         medication_data: MedicationUpdate
     ) -> Medication:
         """Update a medication"""
-        medication = self.get_medication(medication_id)
+        medication = await self.get_medication(medication_id)
         if not medication:
             raise ValueError("Medication not found")
 
         for field, value in medication_data.dict(exclude_unset=True).items():
             setattr(medication, field, value)
 
-        self.db.commit()
-        self.db.refresh(medication)
+        await self.db.commit()
+        await self.db.refresh(medication)
         return medication
 
-    def create_inventory_transaction(
+    async def create_inventory_transaction(
         self,
         transaction_data: InventoryTransactionCreate,
         user_id: UUID
     ) -> InventoryTransaction:
         """Create an inventory transaction"""
-        medication = self.get_medication(transaction_data.medication_id)
+        medication = await self.get_medication(transaction_data.medication_id)
         if not medication:
             raise ValueError("Medication not found")
 
@@ -143,16 +160,16 @@ class MedicationService:
         elif transaction_data.type == "return":
             medication.stock_quantity += transaction_data.quantity
 
-        self.db.commit()
-        self.db.refresh(transaction)
+        await self.db.commit()
+        await self.db.refresh(transaction)
 
         # Send notifications for low stock
         if medication.stock_quantity <= medication.minimum_stock:
-            self.notification_service.send_low_stock_notification(medication)
+            await self.notification_service.send_low_stock_notification(medication)
 
         return transaction
 
-    def create_order(
+    async def create_order(
         self,
         user_id: UUID,
         order_data: OrderCreate
@@ -166,9 +183,12 @@ class MedicationService:
         tax = 0
         items = []
         requires_prescription = False
+        medications = await self.get_medications(
+            [item_data.medication_id for item_data in order_data.items]
+        )
 
         for item_data in order_data.items:
-            medication = self.get_medication(item_data.medication_id)
+            medication = medications.get(item_data.medication_id)
             if not medication:
                 raise ValueError(f"Medication {item_data.medication_id} not found")
 
@@ -242,27 +262,23 @@ class MedicationService:
             insurance_policy_number=order_data.insurance_policy_number
         )
 
-        self.db.add(order)
-        self.db.commit()
+        # Order and items are written in one transaction
+        async with unit_of_work(self.db) as uow:
+            uow.add(order)
+            await uow.flush()
 
-        # Add items to order
-        for item in items:
-            item.order_id = order.id
-            self.db.add(item)
+            for item in items:
+                item.order_id = order.id
+            uow.add_all(items)
 
-        self.db.commit()
-        self.db.refresh(order)
-
-        # Create payment
-        self.payment_service.create_payment(
-            order_id=order.id,
-            amount=order.total,
-            user_id=user_id,
-            payment_method=order_data.payment_method
-        )
-
-        # Send notifications
-        self.notification_service.send_order_created_notification(order)
+            # Payment and notification are carried out by the outbox relay
+            await enqueue(self.db, "payment.create", {
+                "order_id": order.id,
+                "amount": order.total,
+                "user_id": user_id,
+                "payment_method": order_data.payment_method
+            })
+            await enqueue(self.db, "notification.order_created", {"order_id": order.id})
 
         return order
 
@@ -281,51 +297,74 @@ class MedicationService:
         else:  # pickup
             return 0.0
 
-    def get_order(self, order_id: UUID) -> Optional[Order]:
+    async def get_order(self, order_id: UUID) -> Optional[Order]:
         """Get order by ID"""
-        return self.db.query(Order).filter(Order.id == order_id).first()
+        # items are read when the status changes; lazy loading is not available on AsyncSession
+        result = await self.db.execute(
+            select(Order).where(Order.id == order_id).options(selectinload(Order.items))
+        )
+        return result.scalar_one_or_none()
 
-    def get_user_orders(
+    async def get_user_orders(
         self,
         user_id: UUID,
         status: Optional[str] = None,
-        page: int = 1,
-        per_page: int = 20
-    ) -> Tuple[List[Order], int]:
+        cursor: Optional[str] = None,
+        per_page: int = 20,
+        with_total: bool = False
+    ) -> Page[Order]:
         """Get user's orders"""
-        query = self.db.query(Order).filter(Order.user_id == user_id)
+        query = select(Order).where(Order.user_id == user_id)
         
         if status:
-            query = query.filter(Order.status == status)
-            
-        total = query.count()
-        orders = query.order_by(Order.created_at.desc())\
-            .offset((page - 1) * per_page)\
-            .limit(per_page)\
-            .all()
+            query = query.where(Order.status == status)
             
-        return orders, total
+        return await paginate(
+            self.db, query, Order.created_at, Order.id,
+            per_page, cursor, with_total=with_total
+        )
 
-    def update_order_status(
+    async def update_order_status(
         self,
         order_id: UUID,
         status: str,
         tracking_number: Optional[str] = None
     ) -> Order:
         """Update order status"""
-        order = self.get_order(order_id)
+        order = await self.get_order(order_id)
         if not order:
             raise ValueError("Order not found")
 
         old_status = order.status
+        async with unit_of_work(self.db):
+            await self._apply_order_status(order, old_status, status, tracking_number)
+
+            await enqueue(self.db, "notification.order_status", {
+                "order_id": order.id,
+                "old_status": old_status,
+                "new_status": status
+            })
+
+        await self.db.refresh(order)
+        return order
+
+    async def _apply_order_status(
+        self,
+        order: Order,
+        old_status: str,
+        status: str,
+        tracking_number: Optional[str]
+    ) -> None:
+        """Apply a status change and its stock/refund consequences to an order"""
         order.status = status
 
         if status == OrderStatus.CONFIRMED:
             order.confirmed_at = datetime.now()
             
             # Update stock quantities
+            medications = await self.get_medications([item.medication_id for item in order.items])
             for item in order.items:
-                medication = self.get_medication(item.medication_id)
+                medication = medications[item.medication_id]
                 if medication.stock_quantity < item.quantity:
                     raise ValueError(
                         f"Insufficient stock for medication {medication.name}"
@@ -345,27 +384,17 @@ class MedicationService:
             
             # Restore stock quantities if order was confirmed
             if old_status == OrderStatus.CONFIRMED:
+                medications = await self.get_medications(
+                    [item.medication_id for item in order.items]
+                )
                 for item in order.items:
-                    medication = self.get_medication(item.medication_id)
-                    medication.stock_quantity += item.quantity
+                    medications[item.medication_id].stock_quantity += item.quantity
 
             # Handle refund if payment was made
             if order.payment_status == PaymentStatus.PAID:
-                self.payment_service.refund_payment(order.payment_id)
+                await enqueue(self.db, "payment.refund", {"payment_id": order.payment_id})
 
-        self.db.commit()
-        self.db.refresh(order)
-
-        # Send notifications
-        self.notification_service.send_order_status_notification(
-            order,
-            old_status,
-            status
-        )
-
-        return order
-
-    def create_prescription(
+    async def create_prescription(
         self,
         doctor_id: UUID,
         patient_id: UUID,
@@ -388,39 +417,42 @@ class MedicationService:
             image_urls=prescription_data.image_urls,
             verification_status=PrescriptionStatus.PENDING
         )
-        self.db.add(prescription)
-        self.db.commit()
-
-        # Add medications to prescription
+        medications = await self.get_medications(
+            [med_data.medication_id for med_data in prescription_data.medications]
+        )
         for med_data in prescription_data.medications:
-            medication = self.get_medication(med_data.medication_id)
-            if not medication:
+            if med_data.medication_id not in medications:
                 raise ValueError(f"Medication {med_data.medication_id} not found")
 
-            prescription_med = PrescriptionMedication(
-                prescription_id=prescription.id,
-                **med_data.dict()
-            )
-            self.db.add(prescription_med)
+        # Prescription and its medications are written in one transaction
+        async with unit_of_work(self.db) as uow:
+            uow.add(prescription)
+            await uow.flush()
 
-        self.db.commit()
-        self.db.refresh(prescription)
+            uow.insert(PrescriptionMedication, [
+                dict(prescription_id=prescription.id, **med_data.dict())
+                for med_data in prescription_data.medications
+            ])
 
-        # Send notifications
-        self.notification_service.send_prescription_created_notification(prescription)
+            await enqueue(
+                self.db, "notification.prescription_created", {"prescription_id": prescription.id}
+            )
 
         return prescription
 
-    def verify_prescription(
+    async def verify_prescription(
         self,
         prescription_id: UUID,
         verified_by: UUID,
         approve: bool
     ) -> Prescription:
         """Verify a prescription"""
-        prescription = self.db.query(Prescription).filter(
-            Prescription.id == prescription_id
-        ).first()
+        result = await self.db.execute(
+            select(Prescription).where(
+                Prescription.id == prescription_id
+            )
+        )
+        prescription = result.scalar_one_or_none()
         
         if not prescription:
             raise ValueError("Prescription not found")
@@ -431,66 +463,65 @@ class MedicationService:
         prescription.verified_by = verified_by
         prescription.verified_at = datetime.now()
 
-        self.db.commit()
-        self.db.refresh(prescription)
+        await self.db.commit()
+        await self.db.refresh(prescription)
 
         # Send notifications
-        self.notification_service.send_prescription_verified_notification(
+        await self.notification_service.send_prescription_verified_notification(
             prescription,
             approve
         )
 
         return prescription
 
-    def get_prescription(self, prescription_id: UUID) -> Optional[Prescription]:
+    async def get_prescription(self, prescription_id: UUID) -> Optional[Prescription]:
         """Get prescription by ID"""
-        return self.db.query(Prescription).filter(
-            Prescription.id == prescription_id
-        ).first()
+        result = await self.db.execute(
+            select(Prescription).where(
+                Prescription.id == prescription_id
+            )
+        )
+        return result.scalar_one_or_none()
 
-    def get_patient_prescriptions(
+    async def get_patient_prescriptions(
         self,
         patient_id: UUID,
         active_only: bool = False,
-        page: int = 1,
-        per_page: int = 20
-    ) -> Tuple[List[Prescription], int]:
+        cursor: Optional[str] = None,
+        per_page: int = 20,
+        with_total: bool = False
+    ) -> Page[Prescription]:
         """Get patient's prescriptions"""
-        query = self.db.query(Prescription).filter(
+        query = select(Prescription).where(
             Prescription.patient_id == patient_id
         )
         
         if active_only:
-            query = query.filter(
+            query = query.where(
                 Prescription.is_valid == True,
                 Prescription.expiry_date > datetime.now(),
                 Prescription.times_used < Prescription.max_uses,
                 Prescription.verification_status == PrescriptionStatus.VERIFIED
             )
             
-        total = query.count()
-        prescriptions = query.order_by(Prescription.created_at.desc())\
-            .offset((page - 1) * per_page)\
-            .limit(per_page)\
-            .all()
-            
-        return prescriptions, total
+        return await paginate(
+            self.db, query, Prescription.created_at, Prescription.id,
+            per_page, cursor, with_total=with_total
+        )
 
-    def get_doctor_prescriptions(
+    async def get_doctor_prescriptions(
         self,
         doctor_id: UUID,
-        page: int = 1,
-        per_page: int = 20
-    ) -> Tuple[List[Prescription], int]:
+        cursor: Optional[str] = None,
+        per_page: int = 20,
+        with_total: bool = False
+    ) -> Page[Prescription]:
         """Get doctor's prescriptions"""
-        query = self.db.query(Prescription).filter(
+        query = select(Prescription).where(
             Prescription.doctor_id == doctor_id
         )
         
-        total = query.count()
-        prescriptions = query.order_by(Prescription.created_at.desc())\
-            .offset((page - 1) * per_page)\
-            .limit(per_page)\
-            .all()
-            
-        return prescriptions, total
+        return await paginate(
+            self.db, query, Prescription.created_at, Prescription.id,
+            per_page, cursor, with_total=with_total
+        )
@@ -3,26 +3,43 @@ Notification service for handling all types of notifications
 """
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import asyncio
 import json
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-from fastapi import HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import BackgroundTasks, Depends, HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from firebase_admin import messaging
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
 
+from app.config.database import get_db
 from app.config.settings import settings
-from app.models.user import User
+from app.core.pagination import InvalidCursor, paginate
+from app.core.tracing import client_span, inject_traceparent
+from app.models.user import FCMToken, User
 from app.utils.logger import logger
 from app.utils.helpers import render_template
 
+class TracedTwilioClient(TwilioHttpClient):
+    """Twilio HTTP client that sends the traceparent of the current client span"""
+
+    def request(self, method, url, params=None, data=None, headers=None, **kwargs):
+        return super().request(
+            method, url, params=params, data=data,
+            headers=inject_traceparent(dict(headers or {})), **kwargs
+        )
+
 class NotificationService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession = Depends(get_db)):
         self.db = db
-        self.email_sender = settings.EMAIL_SENDER
-        self.email_password = settings.EMAIL_PASSWORD
-        self.smtp_server = settings.SMTP_SERVER
+        self.email_sender = settings.EMAIL_FROM
+        self.smtp_user = settings.SMTP_USER
+        self.email_password = settings.SMTP_PASSWORD
+        self.smtp_server = settings.SMTP_HOST
         self.smtp_port = settings.SMTP_PORT
 
     async def send_notification(
@@ -36,7 +53,8 @@ class NotificationService:
     ) -> Dict[str, Any]:
         """Send notification to user through multiple channels"""
         try:
-            user = self.db.query(User).filter(User.id == user_id).first()
+            result = await self.db.execute(select(User).where(User.id == user_id))
+            user = result.scalar_one_or_none()
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
 
@@ -50,7 +68,7 @@ class NotificationService:
             }
 
             # Store notification in database
-            notification = self._store_notification(notification_data)
+            notification = await self._store_notification(notification_data)
 
             # Send through different channels based on user preferences
             if background_tasks:
@@ -92,7 +110,7 @@ class NotificationService:
                 detail=f"Failed to send notification: {str(e)}"
             )
 
-    def _store_notification(self, notification_data: Dict[str, Any]) -> Any:
+    async def _store_notification(self, notification_data: Dict[str, Any]) -> Any:
         """Store notification in database"""
         try:
             notification = Notification(
@@ -104,12 +122,12 @@ class NotificationService:
                 created_at=notification_data["created_at"]
             )
             self.db.add(notification)
-            self.db.commit()
-            self.db.refresh(notification)
+            await self.db.commit()
+            await self.db.refresh(notification)
             return notification
         except Exception as e:
             logger.error(f"Error storing notification: {str(e)}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
 
     async def send_email_notification(
@@ -133,11 +151,9 @@ class NotificationService:
             )
             msg.attach(MIMEText(html_content, "html"))
 
-            # Connect to SMTP server and send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email_sender, self.email_password)
-                server.send_message(msg)
+            # Connect to SMTP server and send email (blocking, so off the event loop)
+            with client_span("smtp", "send_message", **{"net.peer.name": self.smtp_server}):
+                await asyncio.to_thread(self._send_smtp, msg)
 
             logger.info(f"Email notification sent to {email}")
 
@@ -145,20 +161,27 @@ class NotificationService:
             logger.error(f"Error sending email notification: {str(e)}")
             raise
 
+    def _send_smtp(self, msg: MIMEMultipart) -> None:
+        with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            if settings.SMTP_TLS:
+                server.starttls()
+            server.login(self.smtp_user, self.email_password)
+            server.send_message(msg)
+
     async def send_push_notification(
         self,
         user_id: str,
         title: str,
         body: str,
         data: Optional[Dict[str, Any]] = None
-    ) -> None:
-        """Send push notification using Firebase"""
+    ) -> int:
+        """Send push notification using Firebase; returns the number of devices reached"""
         try:
             # Get user's FCM tokens
-            user_tokens = self._get_user_fcm_tokens(user_id)
+            user_tokens = await self._get_user_fcm_tokens(user_id)
             if not user_tokens:
                 logger.warning(f"No FCM tokens found for user {user_id}")
-                return
+                return 0
 
             message = messaging.MulticastMessage(
                 tokens=user_tokens,
@@ -169,7 +192,7 @@ class NotificationService:
                 data=data or {}
             )
 
-            response = messaging.send_multicast(message)
+            response = await asyncio.to_thread(messaging.send_multicast, message)
             logger.info(
                 f"Push notification sent to {len(user_tokens)} devices. "
                 f"Success: {response.success_count}, Failure: {response.failure_count}"
@@ -177,7 +200,9 @@ class NotificationService:
 
             # Handle failed tokens
             if response.failure_count > 0:
-                self._handle_failed_tokens(user_id, response.responses, user_tokens)
+                await self._handle_failed_tokens(user_id, response.responses, user_tokens)
+
+            return response.success_count
 
         except Exception as e:
             logger.error(f"Error sending push notification: {str(e)}")
@@ -187,34 +212,39 @@ class NotificationService:
         """Send SMS notification using Twilio"""
         try:
             # Initialize Twilio client
-            client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-
-            # Send SMS
-            message = client.messages.create(
-                body=message,
-                from_=settings.TWILIO_PHONE_NUMBER,
-                to=phone
+            client = Client(
+                settings.TWILIO_ACCOUNT_SID,
+                settings.TWILIO_AUTH_TOKEN,
+                http_client=TracedTwilioClient()
             )
 
+            # Send SMS (blocking HTTP call, so off the event loop)
+            with client_span("twilio", "messages.create"):
+                message = await asyncio.to_thread(
+                    client.messages.create,
+                    body=message,
+                    from_=settings.TWILIO_PHONE_NUMBER,
+                    to=phone
+                )
+
             logger.info(f"SMS notification sent to {phone}, SID: {message.sid}")
 
         except Exception as e:
             logger.error(f"Error sending SMS notification: {str(e)}")
             raise
 
-    def _get_user_fcm_tokens(self, user_id: str) -> List[str]:
-        """Get user's FCM tokens from database"""
-        try:
-            tokens = self.db.query(FCMToken).filter(
-                FCMToken.user_id == user_id,
-                FCMToken.is_active == True
-            ).all()
-            return [token.token for token in tokens]
-        except Exception as e:
-            logger.error(f"Error getting FCM tokens: {str(e)}")
-            return []
+    async def _get_user_fcm_tokens(self, user_id: str) -> List[str]:
+        """Get user's FCM tokens from database; a failed lookup raises instead of reading as no tokens"""
+        tokens = FCMToken.__table__
+        result = await self.db.execute(
+            select(tokens.c.token).where(
+                tokens.c.user_id == user_id,
+                tokens.c.is_active == True
+            )
+        )
+        return list(result.scalars().all())
 
-    def _handle_failed_tokens(
+    async def _handle_failed_tokens(
         self,
         user_id: str,
         responses: List[Any],
@@ -222,22 +252,27 @@ class NotificationService:
     ) -> None:
         """Handle failed FCM tokens"""
         try:
-            for idx, response in enumerate(responses):
-                if not response.success:
-                    token = tokens[idx]
-                    if (
-                        response.exception
-                        and isinstance(response.exception, messaging.UnregisteredError)
-                    ):
-                        # Token is no longer valid, deactivate it
-                        self.db.query(FCMToken).filter(
-                            FCMToken.token == token
-                        ).update({"is_active": False})
-
-            self.db.commit()
+            stale_tokens = [
+                tokens[idx]
+                for idx, response in enumerate(responses)
+                if not response.success
+                and response.exception
+                and isinstance(response.exception, messaging.UnregisteredError)
+            ]
+
+            # Tokens that are no longer valid are deactivated in one statement
+            if stale_tokens:
+                table = FCMToken.__table__
+                await self.db.execute(
+                    update(table)
+                    .where(table.c.token.in_(stale_tokens))
+                    .values(is_active=False)
+                )
+
+            await self.db.commit()
         except Exception as e:
             logger.error(f"Error handling failed tokens: {str(e)}")
-            self.db.rollback()
+            await self.db.rollback()
 
     def _get_enabled_channels(self, user: User) -> List[str]:
         """Get list of enabled notification channels for user"""
@@ -256,31 +291,35 @@ class NotificationService:
     async def get_user_notifications(
         self,
         user_id: str,
-        page: int = 1,
+        cursor: Optional[str] = None,
         per_page: int = 20,
-        notification_type: Optional[str] = None
+        notification_type: Optional[str] = None,
+        with_total: bool = False
     ) -> Dict[str, Any]:
         """Get user's notifications with pagination"""
         try:
-            query = self.db.query(Notification).filter(
+            query = select(Notification).where(
                 Notification.user_id == user_id
             )
 
             if notification_type:
-                query = query.filter(Notification.type == notification_type)
+                query = query.where(Notification.type == notification_type)
 
-            total = query.count()
-            notifications = query.order_by(
-                Notification.created_at.desc()
-            ).offset((page - 1) * per_page).limit(per_page).all()
+            page = await paginate(
+                self.db, query, Notification.created_at, Notification.id,
+                per_page, cursor, with_total=with_total
+            )
 
             return {
-                "total": total,
-                "page": page,
+                "total": page.total.value if page.total else None,
+                "total_exact": page.total.exact if page.total else None,
                 "per_page": per_page,
-                "notifications": [notification.to_dict() for notification in notifications]
+                "next_cursor": page.next_cursor,
+                "notifications": [notification.to_dict() for notification in page.items]
             }
 
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error getting user notifications: {str(e)}")
             raise HTTPException(
@@ -295,10 +334,13 @@ class NotificationService:
     ) -> Dict[str, Any]:
         """Mark notification as read"""
         try:
-            notification = self.db.query(Notification).filter(
-                Notification.id == notification_id,
-                Notification.user_id == user_id
-            ).first()
+            result = await self.db.execute(
+                select(Notification).where(
+                    Notification.id == notification_id,
+                    Notification.user_id == user_id
+                )
+            )
+            notification = result.scalar_one_or_none()
 
             if not notification:
                 raise HTTPException(
@@ -308,7 +350,7 @@ class NotificationService:
 
             notification.is_read = True
             notification.read_at = datetime.utcnow()
-            self.db.commit()
+            await self.db.commit()
 
             return {"status": "success", "message": "Notification marked as read"}
 
@@ -328,10 +370,13 @@ class NotificationService:
     ) -> Dict[str, Any]:
         """Delete notification"""
         try:
-            notification = self.db.query(Notification).filter(
-                Notification.id == notification_id,
-                Notification.user_id == user_id
-            ).first()
+            result = await self.db.execute(
+                select(Notification).where(
+                    Notification.id == notification_id,
+                    Notification.user_id == user_id
+                )
+            )
+            notification = result.scalar_one_or_none()
 
             if not notification:
                 raise HTTPException(
@@ -339,8 +384,8 @@ class NotificationService:
                     detail="Notification not found"
                 )
 
-            self.db.delete(notification)
-            self.db.commit()
+            await self.db.delete(notification)
+            await self.db.commit()
 
             return {"status": "success", "message": "Notification deleted"}
 
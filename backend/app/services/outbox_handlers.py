@@ -0,0 +1,74 @@
+"""
+Outbox handlers
+
+The side effects recorded with app.core.outbox.enqueue, carried out by the
+outbox relay worker. Each handler gets a session of its own, committed after
+it returns, and may run more than once for the same event.
+"""
+from typing import Any, Dict
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.outbox import outbox_handler
+from app.services.payment_service import PaymentService
+from app.utils.logger import logger
+
+def medication_service(db: AsyncSession):
+    # imported on first use so the payment handlers, and the relay, do not
+    # depend on the medication and notification modules loading
+    from app.services.medication_service import MedicationService
+    from app.services.notification_service import NotificationService
+
+    return MedicationService(db, NotificationService(db), PaymentService(db))
+
+@outbox_handler("payment.refund")
+async def refund_payment(db: AsyncSession, payload: Dict[str, Any], event_id: str) -> None:
+    try:
+        await PaymentService(db).refund_payment(
+            payload["payment_id"],
+            amount=payload.get("amount"),
+            reason=payload.get("reason"),
+            idempotency_key=f"refund-{event_id}"
+        )
+    except HTTPException as e:
+        # only succeeded payments are refunded: a repeat finds it refunded already
+        if e.status_code != 404:
+            raise
+        logger.info(f"Outbox {event_id}: payment {payload['payment_id']} has nothing to refund")
+
+@outbox_handler("payment.create")
+async def create_payment(db: AsyncSession, payload: Dict[str, Any], event_id: str) -> None:
+    await PaymentService(db).create_payment(
+        order_id=payload["order_id"],
+        amount=payload["amount"],
+        user_id=payload["user_id"],
+        payment_method=payload["payment_method"],
+        # a repeated event gets the same payment intent back from Stripe
+        idempotency_key=f"payment-{event_id}"
+    )
+
+@outbox_handler("notification.order_created")
+async def notify_order_created(db: AsyncSession, payload: Dict[str, Any], event_id: str) -> None:
+    service = medication_service(db)
+    order = await service.get_order(payload["order_id"])
+    if order:
+        await service.notification_service.send_order_created_notification(order)
+
+@outbox_handler("notification.order_status")
+async def notify_order_status(db: AsyncSession, payload: Dict[str, Any], event_id: str) -> None:
+    service = medication_service(db)
+    order = await service.get_order(payload["order_id"])
+    if order:
+        await service.notification_service.send_order_status_notification(
+            order,
+            payload["old_status"],
+            payload["new_status"]
+        )
+
+@outbox_handler("notification.prescription_created")
+async def notify_prescription_created(db: AsyncSession, payload: Dict[str, Any], event_id: str) -> None:
+    service = medication_service(db)
+    prescription = await service.get_prescription(payload["prescription_id"])
+    if prescription:
+        await service.notification_service.send_prescription_created_notification(prescription)
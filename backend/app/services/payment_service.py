@@ -1,21 +1,39 @@
 """
 Payment service for handling all payment operations
+
+Creating payment intents and refunds, which the outbox relay runs, reads and
+writes the payments and users rows through their tables rather than the ORM.
 """
 from typing import Dict, Any, Optional
 from datetime import datetime
 import stripe
-from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config.database import get_db
 from app.config.settings import settings
+from app.core.pagination import InvalidCursor, paginate
+from app.core.tracing import client_span, inject_traceparent
+from app.models.appointment import Appointment
+from app.models.medication import MedicationOrder
+from app.models.payment import Payment
 from app.models.user import User
 from app.utils.logger import logger
 
+class TracedStripeClient(stripe.http_client.RequestsClient):
+    """Stripe HTTP client that sends the traceparent of the current client span"""
+
+    def request(self, method, url, headers, post_data=None):
+        return super().request(method, url, inject_traceparent(dict(headers or {})), post_data)
+
 # Initialize Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe.api_key = settings.STRIPE_API_KEY
+stripe.default_http_client = TracedStripeClient()
 
 class PaymentService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession = Depends(get_db)):
         self.db = db
 
     async def create_payment_intent(
@@ -24,40 +42,59 @@ class PaymentService:
         currency: str,
         user_id: str,
         payment_type: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Create a payment intent"""
+        """Create a payment intent
+
+        Stripe returns the same intent for a repeated idempotency_key, so a
+        retried call does not charge twice.
+        """
         try:
             # Get user
-            user = self.db.query(User).filter(User.id == user_id).first()
+            users = User.__table__
+            result = await self.db.execute(
+                select(
+                    users.c.id, users.c.email, users.c.first_name,
+                    users.c.last_name, users.c.stripe_customer_id
+                ).where(users.c.id == user_id)
+            )
+            user = result.first()
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
 
             # Create payment intent
-            intent = stripe.PaymentIntent.create(
-                amount=int(amount * 100),  # Convert to cents
-                currency=currency,
-                customer=self._get_or_create_customer(user),
-                metadata={
-                    "user_id": user_id,
-                    "payment_type": payment_type,
-                    **(metadata or {})
-                }
-            )
+            customer_id = await self._get_or_create_customer(user)
+            with client_span("stripe", "PaymentIntent.create"):
+                intent = stripe.PaymentIntent.create(
+                    amount=int(amount * 100),  # Convert to cents
+                    currency=currency,
+                    customer=customer_id,
+                    metadata={
+                        "user_id": user_id,
+                        "payment_type": payment_type,
+                        **(metadata or {})
+                    },
+                    idempotency_key=idempotency_key
+                )
 
-            # Store payment intent in database
-            payment = Payment(
-                id=intent.id,
-                user_id=user_id,
-                amount=amount,
-                currency=currency,
-                payment_type=payment_type,
-                status=intent.status,
-                metadata=metadata or {},
-                created_at=datetime.utcnow()
-            )
-            self.db.add(payment)
-            self.db.commit()
+            # Store payment intent in database, once per intent
+            payments = Payment.__table__
+            stored = await self.db.scalar(select(payments.c.id).where(payments.c.id == intent.id))
+            if stored is None:
+                now = datetime.utcnow()
+                await self.db.execute(insert(payments).values(
+                    id=intent.id,
+                    user_id=user_id,
+                    amount=amount,
+                    currency=currency,
+                    payment_type=payment_type,
+                    status=intent.status,
+                    metadata=metadata or {},
+                    created_at=now,
+                    updated_at=now
+                ))
+                await self.db.commit()
 
             return {
                 "client_secret": intent.client_secret,
@@ -65,6 +102,8 @@ class PaymentService:
                 "status": intent.status
             }
 
+        except HTTPException:
+            raise
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error: {str(e)}")
             raise HTTPException(
@@ -78,22 +117,46 @@ class PaymentService:
                 detail="Failed to create payment"
             )
 
-    def _get_or_create_customer(self, user: User) -> str:
+    async def create_payment(
+        self,
+        order_id: str,
+        amount: float,
+        user_id: str,
+        payment_method: str,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Create the payment intent of a medication order"""
+        return await self.create_payment_intent(
+            amount=amount,
+            currency=settings.CURRENCY,
+            user_id=user_id,
+            payment_type="MEDICATION",
+            metadata={"order_id": str(order_id), "payment_method": payment_method},
+            idempotency_key=idempotency_key
+        )
+
+    async def _get_or_create_customer(self, user: Row) -> str:
         """Get existing Stripe customer or create new one"""
         try:
             if user.stripe_customer_id:
                 return user.stripe_customer_id
 
             # Create new customer
-            customer = stripe.Customer.create(
-                email=user.email,
-                name=f"{user.first_name} {user.last_name}",
-                metadata={"user_id": user.id}
-            )
+            with client_span("stripe", "Customer.create"):
+                customer = stripe.Customer.create(
+                    email=user.email,
+                    name=f"{user.first_name} {user.last_name}",
+                    metadata={"user_id": user.id}
+                )
 
             # Update user with Stripe customer ID
-            user.stripe_customer_id = customer.id
-            self.db.commit()
+            users = User.__table__
+            await self.db.execute(
+                update(users)
+                .where(users.c.id == user.id)
+                .values(stripe_customer_id=customer.id)
+            )
+            await self.db.commit()
 
             return customer.id
 
@@ -130,14 +193,18 @@ class PaymentService:
         """Handle successful payment"""
         try:
             # Update payment status in database
-            payment = self.db.query(Payment).filter(
-                Payment.id == payment_intent["id"]
-            ).first()
+            result = await self.db.execute(
+                select(Payment).where(
+                    Payment.id == payment_intent["id"]
+                )
+            )
+            payment = result.scalar_one_or_none()
 
             if payment:
                 payment.status = "succeeded"
+                payment.charge_id = payment_intent.get("latest_charge")
                 payment.completed_at = datetime.utcnow()
-                self.db.commit()
+                await self.db.commit()
 
                 # Update related records based on payment type
                 if payment.payment_type == "APPOINTMENT":
@@ -153,15 +220,18 @@ class PaymentService:
         """Handle failed payment"""
         try:
             # Update payment status in database
-            payment = self.db.query(Payment).filter(
-                Payment.id == payment_intent["id"]
-            ).first()
+            result = await self.db.execute(
+                select(Payment).where(
+                    Payment.id == payment_intent["id"]
+                )
+            )
+            payment = result.scalar_one_or_none()
 
             if payment:
                 payment.status = "failed"
                 payment.error = payment_intent.get("last_payment_error", {}).get("message")
                 payment.updated_at = datetime.utcnow()
-                self.db.commit()
+                await self.db.commit()
 
         except Exception as e:
             logger.error(f"Error handling payment failure: {str(e)}")
@@ -171,14 +241,17 @@ class PaymentService:
         """Handle refund"""
         try:
             # Update payment status in database
-            payment = self.db.query(Payment).filter(
-                Payment.charge_id == charge["id"]
-            ).first()
+            result = await self.db.execute(
+                select(Payment).where(
+                    Payment.charge_id == charge["id"]
+                )
+            )
+            payment = result.scalar_one_or_none()
 
             if payment:
                 payment.status = "refunded"
                 payment.refunded_at = datetime.utcnow()
-                self.db.commit()
+                await self.db.commit()
 
                 # Update related records based on payment type
                 if payment.payment_type == "APPOINTMENT":
@@ -193,16 +266,19 @@ class PaymentService:
     async def _update_appointment_payment(self, payment: Any) -> None:
         """Update appointment after successful payment"""
         try:
-            appointment_id = payment.metadata.get("appointment_id")
+            appointment_id = (payment.meta or {}).get("appointment_id")
             if appointment_id:
-                appointment = self.db.query(Appointment).filter(
-                    Appointment.id == appointment_id
-                ).first()
+                result = await self.db.execute(
+                    select(Appointment).where(
+                        Appointment.id == appointment_id
+                    )
+                )
+                appointment = result.scalar_one_or_none()
 
                 if appointment:
                     appointment.payment_status = "PAID"
                     appointment.status = "CONFIRMED"
-                    self.db.commit()
+                    await self.db.commit()
 
         except Exception as e:
             logger.error(f"Error updating appointment payment: {str(e)}")
@@ -211,16 +287,19 @@ class PaymentService:
     async def _update_medication_order_payment(self, payment: Any) -> None:
         """Update medication order after successful payment"""
         try:
-            order_id = payment.metadata.get("order_id")
+            order_id = (payment.meta or {}).get("order_id")
             if order_id:
-                order = self.db.query(MedicationOrder).filter(
-                    MedicationOrder.id == order_id
-                ).first()
+                result = await self.db.execute(
+                    select(MedicationOrder).where(
+                        MedicationOrder.id == order_id
+                    )
+                )
+                order = result.scalar_one_or_none()
 
                 if order:
                     order.payment_status = "PAID"
                     order.status = "PROCESSING"
-                    self.db.commit()
+                    await self.db.commit()
 
         except Exception as e:
             logger.error(f"Error updating medication order payment: {str(e)}")
@@ -229,16 +308,19 @@ class PaymentService:
     async def _update_appointment_refund(self, payment: Any) -> None:
         """Update appointment after refund"""
         try:
-            appointment_id = payment.metadata.get("appointment_id")
+            appointment_id = (payment.meta or {}).get("appointment_id")
             if appointment_id:
-                appointment = self.db.query(Appointment).filter(
-                    Appointment.id == appointment_id
-                ).first()
+                result = await self.db.execute(
+                    select(Appointment).where(
+                        Appointment.id == appointment_id
+                    )
+                )
+                appointment = result.scalar_one_or_none()
 
                 if appointment:
                     appointment.payment_status = "REFUNDED"
                     appointment.status = "CANCELLED"
-                    self.db.commit()
+                    await self.db.commit()
 
         except Exception as e:
             logger.error(f"Error updating appointment refund: {str(e)}")
@@ -247,16 +329,19 @@ class PaymentService:
     async def _update_medication_order_refund(self, payment: Any) -> None:
         """Update medication order after refund"""
         try:
-            order_id = payment.metadata.get("order_id")
+            order_id = (payment.meta or {}).get("order_id")
             if order_id:
-                order = self.db.query(MedicationOrder).filter(
-                    MedicationOrder.id == order_id
-                ).first()
+                result = await self.db.execute(
+                    select(MedicationOrder).where(
+                        MedicationOrder.id == order_id
+                    )
+                )
+                order = result.scalar_one_or_none()
 
                 if order:
                     order.payment_status = "REFUNDED"
                     order.status = "CANCELLED"
-                    self.db.commit()
+                    await self.db.commit()
 
         except Exception as e:
             logger.error(f"Error updating medication order refund: {str(e)}")
@@ -265,29 +350,33 @@ class PaymentService:
     async def get_payment_history(
         self,
         user_id: str,
-        page: int = 1,
+        cursor: Optional[str] = None,
         per_page: int = 20,
-        payment_type: Optional[str] = None
+        payment_type: Optional[str] = None,
+        with_total: bool = False
     ) -> Dict[str, Any]:
         """Get user's payment history"""
         try:
-            query = self.db.query(Payment).filter(Payment.user_id == user_id)
+            query = select(Payment).where(Payment.user_id == user_id)
 
             if payment_type:
-                query = query.filter(Payment.payment_type == payment_type)
+                query = query.where(Payment.payment_type == payment_type)
 
-            total = query.count()
-            payments = query.order_by(
-                Payment.created_at.desc()
-            ).offset((page - 1) * per_page).limit(per_page).all()
+            page = await paginate(
+                self.db, query, Payment.created_at, Payment.id,
+                per_page, cursor, with_total=with_total
+            )
 
             return {
-                "total": total,
-                "page": page,
+                "total": page.total.value if page.total else None,
+                "total_exact": page.total.exact if page.total else None,
                 "per_page": per_page,
-                "payments": [payment.to_dict() for payment in payments]
+                "next_cursor": page.next_cursor,
+                "payments": [payment.to_dict() for payment in page.items]
             }
 
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error getting payment history: {str(e)}")
             raise HTTPException(
@@ -299,14 +388,19 @@ class PaymentService:
         self,
         payment_id: str,
         amount: Optional[float] = None,
-        reason: Optional[str] = None
+        reason: Optional[str] = None,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Refund payment"""
+        """Refund payment; a repeated idempotency_key gets Stripe's first refund back"""
         try:
-            payment = self.db.query(Payment).filter(
-                Payment.id == payment_id,
-                Payment.status == "succeeded"
-            ).first()
+            payments = Payment.__table__
+            result = await self.db.execute(
+                select(payments.c.amount).where(
+                    payments.c.id == payment_id,
+                    payments.c.status == "succeeded"
+                )
+            )
+            payment = result.first()
 
             if not payment:
                 raise HTTPException(
@@ -322,21 +416,31 @@ class PaymentService:
             if amount:
                 refund_params["amount"] = int(amount * 100)
 
-            refund = stripe.Refund.create(**refund_params)
+            with client_span("stripe", "Refund.create"):
+                refund = stripe.Refund.create(**refund_params, idempotency_key=idempotency_key)
 
             # Update payment status
-            payment.status = "refunded"
-            payment.refunded_at = datetime.utcnow()
-            payment.refund_amount = amount or payment.amount
-            payment.refund_reason = reason
-            self.db.commit()
+            refund_amount = amount or payment.amount
+            await self.db.execute(
+                update(payments)
+                .where(payments.c.id == payment_id)
+                .values(
+                    status="refunded",
+                    refunded_at=datetime.utcnow(),
+                    refund_amount=refund_amount,
+                    refund_reason=reason
+                )
+            )
+            await self.db.commit()
 
             return {
                 "refund_id": refund.id,
                 "status": refund.status,
-                "amount": payment.refund_amount
+                "amount": refund_amount
             }
 
+        except HTTPException:
+            raise
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error refunding payment: {str(e)}")
             raise HTTPException(
@@ -0,0 +1,72 @@
+"""
+Reminder senders, one per channel
+
+Each sender gets all due reminders of its channel from one dispatcher batch.
+Email and SMS load the recipients' contact details with one query for the
+group; push looks up each recipient's device tokens in a session of its own
+because the sends run concurrently.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+
+from app.models.user import User
+from app.services.notification_service import NotificationService
+from app.services.reminder_dispatcher import DueReminder, SessionFactory, reminder_channel, send_each
+
+async def contacts(session_factory: SessionFactory, reminders: List[DueReminder]) -> Dict[str, Any]:
+    """Email and phone of every recipient, by user id"""
+    users = User.__table__
+    ids = {reminder.recipient_id for reminder in reminders}
+    async with session_factory() as db:
+        result = await db.execute(select(users.c.id, users.c.email, users.c.phone).where(users.c.id.in_(ids)))
+        return {str(row.id): row for row in result}
+
+@reminder_channel("email")
+async def send_emails(
+    session_factory: SessionFactory, reminders: List[DueReminder], limit: asyncio.Semaphore
+) -> List[Optional[str]]:
+    recipients = await contacts(session_factory, reminders)
+    service = NotificationService(db=None)
+
+    async def send(reminder: DueReminder) -> None:
+        recipient = recipients.get(reminder.recipient_id)
+        if recipient is None or not recipient.email:
+            raise LookupError(f"No email address for user {reminder.recipient_id}")
+        await service.send_email_notification(recipient.email, reminder.title, reminder.message, "reminder")
+
+    return await send_each(reminders, limit, send)
+
+@reminder_channel("sms")
+async def send_sms(
+    session_factory: SessionFactory, reminders: List[DueReminder], limit: asyncio.Semaphore
+) -> List[Optional[str]]:
+    recipients = await contacts(session_factory, reminders)
+    service = NotificationService(db=None)
+
+    async def send(reminder: DueReminder) -> None:
+        recipient = recipients.get(reminder.recipient_id)
+        if recipient is None or not recipient.phone:
+            raise LookupError(f"No phone number for user {reminder.recipient_id}")
+        await service.send_sms_notification(recipient.phone, reminder.message)
+
+    return await send_each(reminders, limit, send)
+
+@reminder_channel("push")
+async def send_pushes(
+    session_factory: SessionFactory, reminders: List[DueReminder], limit: asyncio.Semaphore
+) -> List[Optional[str]]:
+    async def send(reminder: DueReminder) -> None:
+        async with session_factory() as db:
+            delivered = await NotificationService(db).send_push_notification(
+                reminder.recipient_id,
+                reminder.title,
+                reminder.message,
+                {"reminder_id": str(reminder.id)},
+            )
+        # no active device token, or every device rejected the push
+        if not delivered:
+            raise LookupError(f"Push reached no device of user {reminder.recipient_id}")
+
+    return await send_each(reminders, limit, send)
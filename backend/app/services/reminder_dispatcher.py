@@ -0,0 +1,256 @@
+"""
+Reminder dispatcher
+
+Appointment bookings write AppointmentReminder rows (scheduled_time, status)
+and follow-ups have FollowUpReminder rows (scheduled_at, status), but nothing
+sent them. The dispatcher worker (`python -m app.workers.reminder_dispatcher`)
+claims due reminders of both tables in batches with
+`SELECT ... FOR UPDATE SKIP LOCKED` on the (scheduled time, status) indexes,
+so any number of dispatchers can run side by side without sending a reminder
+twice.
+
+A batch is grouped by channel (email, sms, push) and each group is handed to
+the sender registered for its channel with `@reminder_channel`. Sends of one
+channel run concurrently up to REMINDER_CONCURRENCY, so a slow SMS provider
+does not hold up the emails. The outcomes are written with one bulk UPDATE per
+table and outcome, in the transaction that holds the row locks.
+
+Reminders are not retried: a failed send marks the reminder failed (with the
+error, for follow-up reminders which have a column for it). A dispatcher that
+dies before committing its batch releases the locks and the reminders are
+sent again by the next one.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.appointment import AppointmentReminder
+from app.models.follow_up import FollowUp, FollowUpReminder
+
+logger = logging.getLogger(__name__)
+
+APPOINTMENT = "appointment"
+FOLLOW_UP = "follow_up"
+SENT = "sent"
+FAILED = "failed"
+
+# status values of each table: (pending, sent, failed)
+STATUSES = {
+    APPOINTMENT: ("pending", "sent", "failed"),
+    FOLLOW_UP: ("PENDING", "SENT", "FAILED"),
+}
+
+@dataclass(frozen=True)
+class DueReminder:
+    """A claimed reminder, whichever table it came from"""
+    source: str
+    id: Any
+    recipient_id: str
+    channel: str
+    title: str
+    message: str
+
+SessionFactory = Callable[[], AsyncSession]
+# sender(session_factory, reminders, limit) -> the error message (or None) of each reminder
+Sender = Callable[[SessionFactory, List[DueReminder], asyncio.Semaphore], Awaitable[List[Optional[str]]]]
+
+_senders: Dict[str, Sender] = {}
+
+def reminder_channel(channel: str) -> Callable[[Sender], Sender]:
+    """Register the function that sends the reminders of `channel`"""
+    def register(sender: Sender) -> Sender:
+        if channel in _senders:
+            raise ValueError(f"Reminder channel {channel!r} already has a sender")
+        _senders[channel] = sender
+        return sender
+    return register
+
+def sender_for(channel: str) -> Optional[Sender]:
+    return _senders.get(channel)
+
+async def send_each(
+    reminders: List[DueReminder],
+    limit: asyncio.Semaphore,
+    send: Callable[[DueReminder], Awaitable[None]],
+) -> List[Optional[str]]:
+    """Run `send(reminder)` for every reminder, at most `limit` at once"""
+    async def attempt(reminder: DueReminder) -> Optional[str]:
+        async with limit:
+            try:
+                await send(reminder)
+            except Exception as e:
+                logger.warning(f"Reminder {reminder.id} ({reminder.channel}) failed: {e}")
+                return f"{type(e).__name__}: {e}"
+        return None
+
+    return list(await asyncio.gather(*(attempt(reminder) for reminder in reminders)))
+
+class ReminderDispatcher:
+    """Claims due reminders and sends them through their channel"""
+
+    def __init__(
+        self,
+        session_factory: SessionFactory,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+        self.concurrency = concurrency or settings.REMINDER_CONCURRENCY
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._stopping = asyncio.Event()
+
+    async def claim(self, db: AsyncSession, now: datetime) -> List[DueReminder]:
+        """Lock up to batch_size due reminders of each table, skipping those other dispatchers hold"""
+        reminders = AppointmentReminder.__table__
+        result = await db.execute(
+            select(reminders.c.id, reminders.c.recipient_id, reminders.c.reminder_type, reminders.c.message)
+            .where(
+                reminders.c.scheduled_time <= now,
+                reminders.c.status == STATUSES[APPOINTMENT][0],
+            )
+            .order_by(reminders.c.scheduled_time)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        due = [
+            DueReminder(APPOINTMENT, row.id, str(row.recipient_id), row.reminder_type.lower(), "تذكير بموعدك", row.message)
+            for row in result
+        ]
+
+        reminders, follow_ups = FollowUpReminder.__table__, FollowUp.__table__
+        result = await db.execute(
+            select(
+                reminders.c.id,
+                reminders.c.recipient_id,
+                reminders.c.reminder_type,
+                follow_ups.c.title,
+                follow_ups.c.scheduled_date,
+            )
+            .join_from(reminders, follow_ups, reminders.c.follow_up_id == follow_ups.c.id)
+            .where(
+                reminders.c.scheduled_at <= now,
+                reminders.c.status == STATUSES[FOLLOW_UP][0],
+            )
+            .order_by(reminders.c.scheduled_at)
+            .limit(self.batch_size)
+            .with_for_update(of=reminders, skip_locked=True)
+        )
+        due.extend(
+            DueReminder(
+                FOLLOW_UP, row.id, str(row.recipient_id), row.reminder_type.lower(), row.title,
+                f"Reminder: {row.title} is scheduled for {row.scheduled_date:%Y-%m-%d %H:%M}"
+            )
+            for row in result
+        )
+        return due
+
+    def limit(self, channel: str) -> asyncio.Semaphore:
+        if channel not in self._limits:
+            self._limits[channel] = asyncio.Semaphore(self.concurrency)
+        return self._limits[channel]
+
+    async def send_channel(self, channel: str, reminders: List[DueReminder]) -> List[Optional[str]]:
+        sender = sender_for(channel)
+        if sender is None:
+            return [f"No sender for channel {channel!r}"] * len(reminders)
+        try:
+            return await sender(self.session_factory, reminders, self.limit(channel))
+        except Exception as e:
+            logger.warning(f"Reminder channel {channel} failed: {e}")
+            return [f"{type(e).__name__}: {e}"] * len(reminders)
+
+    async def dispatch(self, reminders: List[DueReminder]) -> List[Optional[str]]:
+        """Send every channel's group concurrently; the error of each reminder, in order"""
+        groups: Dict[str, List[int]] = {}
+        for position, reminder in enumerate(reminders):
+            groups.setdefault(reminder.channel, []).append(position)
+
+        results = await asyncio.gather(*(
+            self.send_channel(channel, [reminders[p] for p in positions])
+            for channel, positions in groups.items()
+        ))
+        errors: List[Optional[str]] = [None] * len(reminders)
+        for positions, channel_errors in zip(groups.values(), results):
+            for position, error in zip(positions, channel_errors):
+                errors[position] = error
+        return errors
+
+    async def record(
+        self,
+        db: AsyncSession,
+        reminders: List[DueReminder],
+        errors: List[Optional[str]],
+        now: datetime,
+    ) -> Dict[str, int]:
+        """Mark the reminders sent or failed, one UPDATE per table and outcome"""
+        outcomes: Dict[str, int] = {}
+        for source, table in (
+            (APPOINTMENT, AppointmentReminder.__table__),
+            (FOLLOW_UP, FollowUpReminder.__table__),
+        ):
+            _, sent_status, failed_status = STATUSES[source]
+            sent = [r.id for r, error in zip(reminders, errors) if r.source == source and error is None]
+            failed = [(r.id, error) for r, error in zip(reminders, errors) if r.source == source and error]
+
+            if sent:
+                await db.execute(
+                    update(table).where(table.c.id.in_(sent)).values(status=sent_status, sent_at=now)
+                )
+            if failed and "error" in table.c:
+                # the errors differ per row: one executemany
+                await db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("reminder_id"))
+                    .values(status=failed_status, error=bindparam("reminder_error")),
+                    [{"reminder_id": id, "reminder_error": error} for id, error in failed],
+                )
+            elif failed:
+                await db.execute(
+                    update(table).where(table.c.id.in_([id for id, _ in failed])).values(status=failed_status)
+                )
+
+            for status, ids in ((SENT, sent), (FAILED, failed)):
+                if ids:
+                    outcomes[status] = outcomes.get(status, 0) + len(ids)
+        return outcomes
+
+    async def run_once(self) -> Tuple[int, Dict[str, int]]:
+        """Process one batch; returns the number of reminders claimed and outcomes by status"""
+        async with self.session_factory() as db:
+            reminders = await self.claim(db, datetime.utcnow())
+            if not reminders:
+                await db.rollback()
+                return 0, {}
+
+            # the row locks are held until the outcomes are committed
+            errors = await self.dispatch(reminders)
+            outcomes = await self.record(db, reminders, errors, datetime.utcnow())
+            await db.commit()
+        return len(reminders), outcomes
+
+    async def run(self, poll_interval: Optional[float] = None) -> None:
+        """Dispatch until stop() is called; sleeps only when there was nothing to do"""
+        poll_interval = poll_interval or settings.REMINDER_POLL_INTERVAL
+        while not self._stopping.is_set():
+            try:
+                claimed, outcomes = await self.run_once()
+                if outcomes:
+                    logger.info(f"Dispatched {claimed} reminders: {outcomes}")
+            except Exception as e:
+                logger.error(f"Reminder batch failed: {e}")
+                claimed = 0
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self) -> None:
+        self._stopping.set()
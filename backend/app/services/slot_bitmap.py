@@ -0,0 +1,469 @@
+"""
+خرائط بتات توفر الأطباء
+
+يُمثَّل كل يوم لطبيب بخريطتي بتات بدقة 5 دقائق (288 بتاً لليوم):
+- open: فترات الجدول (time_slots) بعد طرح الاستراحات (break_times)
+- booked: المواعيد المؤكدة والمعلقة
+الفترات الحرة هي open & ~booked، فالتحقق من التوفر أو التعارض عملية بتات
+واحدة بدل مقارنة كل موعد بكل فترة.
+
+تُخزَّن خريطتا اليوم في Redis في مفتاح واحد لكل طبيب ويوم (36 بايت لكل
+خريطة، بترتيب بتات Redis: الفترة 0 هي البت الأعلى في البايت الأول)، ويُضاف
+الحجز الجديد إليها بـ SETBIT بعد حفظه. أما تحرير وقت موعد (إلغاء أو نقل)
+فيحذف أيامه لتُبنى من جديد: المواعيد غير مضبوطة على 5 دقائق، فقد تتشارك
+خلية الحافة مع موعد مجاور ما زال محجوزاً. الأيام الغائبة عن
+Redis تُبنى من قاعدة البيانات باستعلامين لكامل نطاق الأيام، وتُقرأ خرائط عدة
+أطباء وتُخزَّن في جولة Redis واحدة. القراءة MGET لكل طبيب عبر عميل يعيد
+البايتات كما هي، فلا يعمل الخادم على القيم سوى نسخها.
+
+عداد إصدار لكل طبيب يمنع سباق البناء مع الكتابة: كل تحديث يزيده، ولا تُخزَّن
+خريطة مبنية إلا إذا لم يتغير العداد منذ قُرئ قبل استعلام قاعدة البيانات،
+فلا تُكتب خريطة فاتها حجز حُفظ أثناء بنائها.
+"""
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time, timedelta, timezone
+from hashlib import sha1
+from math import ceil, floor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+import heapq
+import logging
+import re
+
+from redis.exceptions import NoScriptError, RedisError
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.redis import get_redis_bytes_client, get_redis_client
+from app.config.settings import settings
+from app.models.appointment import Appointment, DoctorSchedule
+from app.schemas.appointment import AppointmentStatus, TimeSlot
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DAY_BYTES = SLOTS_PER_DAY // 8
+
+# الحالات التي تشغل وقت الطبيب
+ACTIVE_STATUSES = (AppointmentStatus.CONFIRMED, AppointmentStatus.PENDING)
+
+# (وقت البداية، المدة بالدقائق) لموعد يشغل وقت الطبيب
+Span = Tuple[datetime, int]
+
+_FREE_RUN = re.compile("1+")
+
+def slot_mask(start: int, end: int) -> int:
+    """قناع الفترات [start, end) من اليوم"""
+    start, end = max(start, 0), min(end, SLOTS_PER_DAY)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << (SLOTS_PER_DAY - end)
+
+def slot_time(slot: int) -> time:
+    """وقت بداية الفترة (نهاية اليوم تُمثَّل بـ time.max)"""
+    minutes = slot * SLOT_MINUTES
+    if minutes >= 24 * 60:
+        return time.max
+    return time(minutes // 60, minutes % 60)
+
+def _minutes(value: Any) -> int:
+    """دقائق منذ منتصف الليل لوقت مخزن في JSONB ("09:30") أو كائن time"""
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.hour * 60 + value.minute
+
+def utc_naive(moment: datetime) -> datetime:
+    """المواعيد والجداول مخزنة بتوقيت UTC دون منطقة زمنية"""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def appointment_slots(scheduled_at: datetime, duration_minutes: int) -> Dict[date, Tuple[int, int]]:
+    """الفترات [start, end) التي يشغلها موعد في كل يوم يمتد عليه"""
+    start = utc_naive(scheduled_at)
+    day = start.date()
+    # دقائق منذ منتصف ليل اليوم الأول
+    begin = start.hour * 60 + start.minute + start.second / 60
+    end = begin + duration_minutes
+    if end <= 24 * 60:
+        return {day: (floor(begin / SLOT_MINUTES), ceil(end / SLOT_MINUTES))}
+    slots = {}
+    while end > 0:
+        slots[day] = (floor(max(begin, 0) / SLOT_MINUTES), min(ceil(end / SLOT_MINUTES), SLOTS_PER_DAY))
+        day += timedelta(days=1)
+        begin -= 24 * 60
+        end -= 24 * 60
+    return slots
+
+@dataclass(frozen=True)
+class DayBitmap:
+    """توفر طبيب في يوم واحد"""
+    day: date
+    open: int = 0
+    booked: int = 0
+
+    @property
+    def free(self) -> int:
+        return self.open & ~self.booked
+
+    def is_free(self, start: int, end: int) -> bool:
+        mask = slot_mask(start, end)
+        return mask != 0 and self.free & mask == mask
+
+    def release(self, start: int, end: int, keep: int = 0) -> "DayBitmap":
+        """نسخة دون حجز الفترات [start, end) عدا ما في keep (لاستثناء الموعد الجاري تعديله)"""
+        return replace(self, booked=self.booked & ~(slot_mask(start, end) & ~keep))
+
+    def free_runs(self) -> List[Tuple[int, int]]:
+        """الفترات الحرة المتصلة [start, end)"""
+        bits = format(self.free, f"0{SLOTS_PER_DAY}b")
+        return [match.span() for match in _FREE_RUN.finditer(bits)]
+
+    def time_slots(self) -> List[TimeSlot]:
+        return [
+            TimeSlot(start_time=slot_time(start), end_time=slot_time(end), is_available=True)
+            for start, end in self.free_runs()
+        ]
+
+    def to_bytes(self) -> bytes:
+        return self.open.to_bytes(DAY_BYTES, "big") + self.booked.to_bytes(DAY_BYTES, "big")
+
+    @classmethod
+    def from_bytes(cls, day: date, data: bytes) -> "DayBitmap":
+        data = data.ljust(2 * DAY_BYTES, b"\0")
+        return cls(
+            day,
+            open=int.from_bytes(data[:DAY_BYTES], "big"),
+            booked=int.from_bytes(data[DAY_BYTES:2 * DAY_BYTES], "big"),
+        )
+
+def open_mask(schedule: Any) -> int:
+    """فترات صف الجدول (أو None) بعد طرح الاستراحات"""
+    mask = 0
+    if schedule is None:
+        return mask
+    # لا تُعد فترة جزئية متاحة: تُقرَّب البداية للأعلى والنهاية للأسفل
+    for slot in schedule.time_slots or []:
+        end = _minutes(slot["end_time"]) or 24 * 60
+        mask |= slot_mask(ceil(_minutes(slot["start_time"]) / SLOT_MINUTES), end // SLOT_MINUTES)
+    for pause in schedule.break_times or []:
+        end = _minutes(pause["end_time"]) or 24 * 60
+        mask &= ~slot_mask(_minutes(pause["start_time"]) // SLOT_MINUTES, ceil(end / SLOT_MINUTES))
+    return mask
+
+def booked_masks(appointments: Iterable[Any]) -> Dict[Tuple[UUID, date], int]:
+    """قناع الحجز لكل (طبيب، يوم) من صفوف المواعيد النشطة"""
+    masks: Dict[Tuple[UUID, date], int] = {}
+    for row in appointments:
+        for day, span in appointment_slots(row.scheduled_at, row.duration_minutes).items():
+            key = (row.doctor_id, day)
+            masks[key] = masks.get(key, 0) | slot_mask(*span)
+    return masks
+
+def build_day(day: date, schedule: Any, appointments: Iterable[Any]) -> DayBitmap:
+    """بناء خريطة يوم من صف الجدول (أو None) ومواعيده النشطة"""
+    booked = 0
+    for appointment in appointments:
+        span = appointment_slots(appointment.scheduled_at, appointment.duration_minutes).get(day)
+        if span:
+            booked |= slot_mask(*span)
+    return DayBitmap(day, open=open_mask(schedule), booked=booked)
+
+def days_between(first: date, last: date) -> List[date]:
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+async def build_bitmaps(
+    db: AsyncSession,
+    doctor_ids: Sequence[UUID],
+    first: date,
+    last: date
+) -> Dict[Tuple[UUID, date], DayBitmap]:
+    """خرائط الأيام [first, last] للأطباء من قاعدة البيانات باستعلامين"""
+    window_start = datetime.combine(first, time.min)
+    window_end = datetime.combine(last + timedelta(days=1), time.min)
+
+    result = await db.execute(
+        select(
+            DoctorSchedule.doctor_id,
+            DoctorSchedule.date,
+            DoctorSchedule.time_slots,
+            DoctorSchedule.break_times
+        ).where(
+            and_(
+                DoctorSchedule.doctor_id.in_(doctor_ids),
+                DoctorSchedule.date >= window_start,
+                DoctorSchedule.date < window_end,
+                DoctorSchedule.is_available == True
+            )
+        )
+    )
+    schedules = {(row.doctor_id, row.date.date()): row for row in result}
+
+    # موعد بدأ في اليوم السابق قد يمتد إلى أول يوم في النطاق
+    result = await db.execute(
+        select(
+            Appointment.doctor_id,
+            Appointment.scheduled_at,
+            Appointment.duration_minutes
+        ).where(
+            and_(
+                Appointment.doctor_id.in_(doctor_ids),
+                Appointment.scheduled_at >= window_start - timedelta(days=1),
+                Appointment.scheduled_at < window_end,
+                Appointment.status.in_(ACTIVE_STATUSES)
+            )
+        )
+    )
+    booked = booked_masks(result)
+
+    return {
+        (doctor_id, day): DayBitmap(
+            day,
+            open=open_mask(schedules.get((doctor_id, day))),
+            booked=booked.get((doctor_id, day), 0)
+        )
+        for doctor_id in doctor_ids
+        for day in days_between(first, last)
+    }
+
+# ARGV: الإصدار المقروء قبل البناء، مدة البقاء، ثم قيمة كل يوم
+STORE_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[i + 1], 'EX', ARGV[2])
+end
+return 1
+"""
+
+# ARGV: قيمة البت، مدة بقاء الإصدار، ثم أول وآخر بت لكل يوم؛ الأيام غير المخزنة تُترك.
+# التحرير (البت 0) يحذف الأيام بدل مسح بتاتها، فخلية يشاركها موعد مجاور لا تُعد حرة
+MARK_SCRIPT = """
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+local bit = tonumber(ARGV[1])
+for i = 2, #KEYS do
+    if bit == 0 then
+        redis.call('UNLINK', KEYS[i])
+    elseif redis.call('EXISTS', KEYS[i]) == 1 then
+        for offset = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i]) - 1 do
+            redis.call('SETBIT', KEYS[i], offset, bit)
+        end
+    end
+end
+return 1
+"""
+
+_SCRIPT_SHAS = {script: sha1(script.encode()).hexdigest() for script in (STORE_SCRIPT, MARK_SCRIPT)}
+
+class SlotBitmapCache:
+    """خرائط التوفر في Redis؛ كل دفعة عمليات جولة واحدة (الكتابة عبر سكربتات Lua)"""
+
+    def __init__(self, redis_client: Any, ttl: Optional[int] = None, bytes_client: Any = None):
+        self.redis_client = redis_client
+        # القراءة بعميل لا يفك ترميز الردود؛ دونه يجب ألا يفكه redis_client
+        self.bytes_client = bytes_client or redis_client
+        self.ttl = ttl or settings.SLOT_BITMAP_TTL
+
+    @staticmethod
+    def day_key(doctor_id: UUID, day: date) -> str:
+        return f"slots:{doctor_id}:{day.isoformat()}"
+
+    @staticmethod
+    def version_key(doctor_id: UUID) -> str:
+        return f"slots:{doctor_id}:version"
+
+    async def _evaluate_many(self, script: str, calls: List[Tuple[List[str], List[Any]]]) -> List[Any]:
+        """تنفيذ السكربت مرة لكل (keys, args) في pipeline واحد، مع تحميله إن لم يكن على الخادم"""
+        if not calls:
+            return []
+        try:
+            return await self._pipeline(_SCRIPT_SHAS[script], calls)
+        except NoScriptError:
+            await self.redis_client.script_load(script)
+            return await self._pipeline(_SCRIPT_SHAS[script], calls)
+
+    async def _pipeline(self, sha: str, calls: List[Tuple[List[str], List[Any]]]) -> List[Any]:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for keys, args in calls:
+                pipe.evalsha(sha, len(keys), *keys, *args)
+            return await pipe.execute()
+
+    async def read(
+        self,
+        doctor_ids: Sequence[UUID],
+        days: Sequence[date]
+    ) -> Dict[UUID, Tuple[str, Dict[date, DayBitmap]]]:
+        """لكل طبيب: إصداره الحالي وأيامه المخزنة من `days`"""
+        if not doctor_ids:
+            return {}
+        # MGET واحد لكل طبيب يقرأ إصداره وأيامه معاً، وكلها في جولة واحدة
+        async with self.bytes_client.pipeline(transaction=False) as pipe:
+            for doctor_id in doctor_ids:
+                pipe.mget([self.version_key(doctor_id)] + [self.day_key(doctor_id, day) for day in days])
+            results = await pipe.execute()
+
+        cached = {}
+        for doctor_id, (version, *values) in zip(doctor_ids, results):
+            cached[doctor_id] = (version or b"0").decode(), {
+                day: DayBitmap.from_bytes(day, value)
+                for day, value in zip(days, values)
+                if value is not None
+            }
+        return cached
+
+    async def store(self, built: Dict[UUID, Tuple[str, Sequence[DayBitmap]]]) -> Dict[UUID, bool]:
+        """تخزين خرائط مبنية لكل طبيب لم تتغير مواعيده منذ قراءة إصداره"""
+        calls = [
+            (
+                [self.version_key(doctor_id)] + [self.day_key(doctor_id, b.day) for b in bitmaps],
+                [version, self.ttl] + [b.to_bytes() for b in bitmaps]
+            )
+            for doctor_id, (version, bitmaps) in built.items()
+        ]
+        stored = await self._evaluate_many(STORE_SCRIPT, calls)
+        return {doctor_id: bool(ok) for doctor_id, ok in zip(built, stored)}
+
+    async def mark(self, doctor_id: UUID, slots: Dict[date, Tuple[int, int]], booked: bool) -> None:
+        """حجز الفترات في الأيام المخزنة، أو تحريرها بحذف الأيام لتُبنى من جديد"""
+        keys = [self.version_key(doctor_id)]
+        args: List[Any] = [int(booked), 2 * self.ttl]
+        for day, (start, end) in slots.items():
+            keys.append(self.day_key(doctor_id, day))
+            # خريطة الحجز تلي خريطة الجدول في القيمة نفسها
+            args += [SLOTS_PER_DAY + start, SLOTS_PER_DAY + end]
+        await self._evaluate_many(MARK_SCRIPT, [(keys, args)])
+
+async def get_cache() -> SlotBitmapCache:
+    return SlotBitmapCache(await get_redis_client(), bytes_client=await get_redis_bytes_client())
+
+async def get_doctors_bitmaps(
+    db: AsyncSession,
+    doctor_ids: Sequence[UUID],
+    first: date,
+    last: date
+) -> Dict[UUID, Dict[date, DayBitmap]]:
+    """خرائط الأيام [first, last] لعدة أطباء: من Redis، والغائب منها يُبنى ويُخزَّن"""
+    days = days_between(first, last)
+    cache = await get_cache()
+    cached: Dict[UUID, Tuple[str, Dict[date, DayBitmap]]] = {}
+    try:
+        cached = await cache.read(doctor_ids, days)
+    except RedisError as e:
+        # قاعدة البيانات تبقى المرجع عند تعطل Redis
+        logger.warning(f"Slot bitmap read failed for {len(doctor_ids)} doctors: {e}")
+        cache = None
+
+    bitmaps = {doctor_id: cached.get(doctor_id, ("0", {}))[1] for doctor_id in doctor_ids}
+    incomplete = [doctor_id for doctor_id in doctor_ids if len(bitmaps[doctor_id]) < len(days)]
+    if incomplete:
+        built = await build_bitmaps(db, incomplete, first, last)
+        fresh = {}
+        for doctor_id in incomplete:
+            missing = [built[(doctor_id, day)] for day in days if day not in bitmaps[doctor_id]]
+            bitmaps[doctor_id].update((b.day, b) for b in missing)
+            fresh[doctor_id] = (cached.get(doctor_id, ("0", {}))[0], missing)
+        if cache is not None:
+            try:
+                await cache.store(fresh)
+            except RedisError as e:
+                logger.warning(f"Slot bitmap store failed for {len(fresh)} doctors: {e}")
+
+    return {doctor_id: {day: bitmaps[doctor_id][day] for day in days} for doctor_id in doctor_ids}
+
+async def get_day_bitmaps(
+    db: AsyncSession,
+    doctor_id: UUID,
+    first: date,
+    last: date
+) -> Dict[date, DayBitmap]:
+    """خرائط الأيام [first, last] لطبيب واحد"""
+    return (await get_doctors_bitmaps(db, [doctor_id], first, last))[doctor_id]
+
+def free_slot_starts(
+    bitmaps: Dict[date, DayBitmap],
+    start: datetime,
+    end: datetime,
+    duration_minutes: int
+) -> Iterator[datetime]:
+    """بدايات المواعيد الحرة المتتالية بطول `duration_minutes` ضمن [start, end) بالترتيب"""
+    length = ceil(duration_minutes / SLOT_MINUTES)
+    start, end = utc_naive(start), utc_naive(end)
+    for day in sorted(bitmaps):
+        day_start = datetime.combine(day, time.min)
+        low = max(ceil((start - day_start).total_seconds() / 60 / SLOT_MINUTES), 0)
+        high = min(floor((end - day_start).total_seconds() / 60 / SLOT_MINUTES), SLOTS_PER_DAY)
+        if high - low < length:
+            continue
+        for run_start, run_end in bitmaps[day].free_runs():
+            slot, run_end = max(run_start, low), min(run_end, high)
+            while slot + length <= run_end:
+                yield day_start + timedelta(minutes=slot * SLOT_MINUTES)
+                slot += length
+
+def earliest_slots(
+    bitmaps: Dict[UUID, Dict[date, DayBitmap]],
+    start: datetime,
+    end: datetime,
+    duration_minutes: int,
+    limit: int,
+    per_doctor: int = 1
+) -> List[Tuple[UUID, datetime]]:
+    """
+    أقرب `limit` موعد حر لدى كل الأطباء بدمج تدفقاتهم في كومة واحدة
+
+    كل طبيب تدفق مرتب من بدايات المواعيد يُولَّد عند الحاجة، فالتكلفة
+    O((D + limit) log D) ولا تُحسب إلا الفترات التي تصل إلى النتيجة.
+    """
+    heap = []
+    streams = {}
+    for doctor_id, days in bitmaps.items():
+        stream = free_slot_starts(days, start, end, duration_minutes)
+        first = next(stream, None)
+        if first is not None:
+            streams[doctor_id] = stream
+            heap.append((first, str(doctor_id), doctor_id))
+    heapq.heapify(heap)
+
+    found: List[Tuple[UUID, datetime]] = []
+    taken: Dict[UUID, int] = {}
+    while heap and len(found) < limit:
+        slot_start, _, doctor_id = heapq.heappop(heap)
+        found.append((doctor_id, slot_start))
+        taken[doctor_id] = taken.get(doctor_id, 0) + 1
+        if taken[doctor_id] < per_doctor:
+            following = next(streams[doctor_id], None)
+            if following is not None:
+                heapq.heappush(heap, (following, str(doctor_id), doctor_id))
+    return found
+
+def held_span(appointment: Appointment) -> Optional[Span]:
+    """وقت الطبيب الذي يشغله الموعد بحالته الحالية"""
+    if appointment.status in ACTIVE_STATUSES:
+        return appointment.scheduled_at, appointment.duration_minutes
+    return None
+
+async def update_appointment_slots(
+    doctor_id: UUID,
+    before: Optional[Span],
+    after: Optional[Span]
+) -> None:
+    """تحديث الخرائط المخزنة بعد حفظ موعد: تحرير وقته السابق وحجز الجديد"""
+    if before == after:
+        return
+    cache = await get_cache()
+    try:
+        if before is not None:
+            await cache.mark(doctor_id, appointment_slots(*before), booked=False)
+        if after is not None:
+            await cache.mark(doctor_id, appointment_slots(*after), booked=True)
+    except RedisError as e:
+        logger.warning(f"Slot bitmap update failed for doctor {doctor_id}: {e}")
+        # محاولة حذف الأيام المتأثرة لتُبنى من جديد؛ وإلا بقيت قديمة حتى انتهاء مدة بقائها
+        days = {day for span in (before, after) if span for day in appointment_slots(*span)}
+        try:
+            await cache.redis_client.unlink(*(cache.day_key(doctor_id, day) for day in days))
+        except RedisError:
+            pass
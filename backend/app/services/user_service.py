@@ -8,8 +8,8 @@ import pyotp
 import qrcode
 import io
 import jwt
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
@@ -21,14 +21,14 @@ from app.core.config import settings
 from app.utils.logger import logger
 
 class UserService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.ph = PasswordHasher()
     
-    def create_user(self, user_data: UserCreate) -> User:
+    async def create_user(self, user_data: UserCreate) -> User:
         """إنشاء مستخدم جديد"""
         # التحقق من وجود البريد الإلكتروني
-        if self.get_user_by_email(user_data.email):
+        if await self.get_user_by_email(user_data.email):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="البريد الإلكتروني مستخدم بالفعل"
@@ -45,25 +45,25 @@ class UserService:
         
         try:
             self.db.add(db_user)
-            self.db.commit()
-            self.db.refresh(db_user)
+            await self.db.commit()
+            await self.db.refresh(db_user)
             
             # إرسال بريد التحقق
             self._send_verification_email(db_user)
             
             return db_user
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             logger.error(f"خطأ في إنشاء المستخدم: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="حدث خطأ أثناء إنشاء المستخدم"
             )
     
-    def create_patient(self, patient_data: PatientCreate) -> Patient:
+    async def create_patient(self, patient_data: PatientCreate) -> Patient:
         """إنشاء مريض جديد"""
         # إنشاء المستخدم أولاً
-        user = self.create_user(patient_data.user)
+        user = await self.create_user(patient_data.user)
         
         # إنشاء المريض
         db_patient = Patient(
@@ -84,24 +84,24 @@ class UserService:
         
         try:
             self.db.add(db_patient)
-            self.db.commit()
-            self.db.refresh(db_patient)
+            await self.db.commit()
+            await self.db.refresh(db_patient)
             return db_patient
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             # حذف المستخدم في حالة فشل إنشاء المريض
-            self.db.delete(user)
-            self.db.commit()
+            await self.db.delete(user)
+            await self.db.commit()
             logger.error(f"خطأ في إنشاء المريض: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="حدث خطأ أثناء إنشاء المريض"
             )
     
-    def create_doctor(self, doctor_data: DoctorCreate) -> Doctor:
+    async def create_doctor(self, doctor_data: DoctorCreate) -> Doctor:
         """إنشاء طبيب جديد"""
         # إنشاء المستخدم أولاً
-        user = self.create_user(doctor_data.user)
+        user = await self.create_user(doctor_data.user)
         
         # إنشاء الطبيب
         db_doctor = Doctor(
@@ -121,23 +121,23 @@ class UserService:
         
         try:
             self.db.add(db_doctor)
-            self.db.commit()
-            self.db.refresh(db_doctor)
+            await self.db.commit()
+            await self.db.refresh(db_doctor)
             return db_doctor
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             # حذف المستخدم في حالة فشل إنشاء الطبيب
-            self.db.delete(user)
-            self.db.commit()
+            await self.db.delete(user)
+            await self.db.commit()
             logger.error(f"خطأ في إنشاء الطبيب: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="حدث خطأ أثناء إنشاء الطبيب"
             )
     
-    def authenticate_user(self, email: str, password: str) -> Tuple[User, str, str]:
+    async def authenticate_user(self, email: str, password: str) -> Tuple[User, str, str]:
         """مصادقة المستخدم وإنشاء توكن"""
-        user = self.get_user_by_email(email)
+        user = await self.get_user_by_email(email)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -152,13 +152,13 @@ class UserService:
         
         try:
             if not verify_password(password, user.password_hash):
-                self._handle_failed_login(user)
+                await self._handle_failed_login(user)
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="البريد الإلكتروني أو كلمة المرور غير صحيحة"
                 )
         except VerifyMismatchError:
-            self._handle_failed_login(user)
+            await self._handle_failed_login(user)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="البريد الإلكتروني أو كلمة المرور غير صحيحة"
@@ -168,11 +168,11 @@ class UserService:
         if user.failed_login_attempts > 0:
             user.failed_login_attempts = 0
             user.account_locked_until = None
-            self.db.commit()
+            await self.db.commit()
         
         # تحديث آخر تسجيل دخول
         user.last_login = datetime.utcnow()
-        self.db.commit()
+        await self.db.commit()
         
         # إنشاء توكن
         access_token = create_jwt_token(
@@ -185,21 +185,23 @@ class UserService:
         )
         
         # حفظ الجلسة
-        self._create_session(user, access_token, refresh_token)
+        await self._create_session(user, access_token, refresh_token)
         
         return user, access_token, refresh_token
     
-    def get_user_by_id(self, user_id: UUID) -> Optional[User]:
+    async def get_user_by_id(self, user_id: UUID) -> Optional[User]:
         """الحصول على المستخدم بواسطة المعرف"""
-        return self.db.query(User).filter(User.id == user_id).first()
+        result = await self.db.execute(select(User).where(User.id == user_id))
+        return result.scalar_one_or_none()
     
-    def get_user_by_email(self, email: str) -> Optional[User]:
+    async def get_user_by_email(self, email: str) -> Optional[User]:
         """الحصول على المستخدم بواسطة البريد الإلكتروني"""
-        return self.db.query(User).filter(User.email == email).first()
+        result = await self.db.execute(select(User).where(User.email == email))
+        return result.scalar_one_or_none()
     
-    def update_user(self, user_id: UUID, user_data: UserUpdate) -> User:
+    async def update_user(self, user_id: UUID, user_data: UserUpdate) -> User:
         """تحديث بيانات المستخدم"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -211,20 +213,20 @@ class UserService:
             setattr(user, field, value)
         
         try:
-            self.db.commit()
-            self.db.refresh(user)
+            await self.db.commit()
+            await self.db.refresh(user)
             return user
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             logger.error(f"خطأ في تحديث المستخدم: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="حدث خطأ أثناء تحديث المستخدم"
             )
     
-    def delete_user(self, user_id: UUID) -> bool:
+    async def delete_user(self, user_id: UUID) -> bool:
         """حذف المستخدم"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -232,20 +234,20 @@ class UserService:
             )
         
         try:
-            self.db.delete(user)
-            self.db.commit()
+            await self.db.delete(user)
+            await self.db.commit()
             return True
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             logger.error(f"خطأ في حذف المستخدم: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="حدث خطأ أثناء حذف المستخدم"
             )
     
-    def setup_2fa(self, user_id: UUID) -> Dict[str, Any]:
+    async def setup_2fa(self, user_id: UUID) -> Dict[str, Any]:
         """إعداد المصادقة الثنائية"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -274,7 +276,7 @@ class UserService:
         
         # حفظ السر في قاعدة البيانات
         user.two_fa_secret = secret
-        self.db.commit()
+        await self.db.commit()
         
         return {
             "secret": secret,
@@ -282,9 +284,9 @@ class UserService:
             "provisioning_uri": provisioning_uri
         }
     
-    def verify_2fa(self, user_id: UUID, code: str) -> bool:
+    async def verify_2fa(self, user_id: UUID, code: str) -> bool:
         """التحقق من رمز المصادقة الثنائية"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user or not user.two_fa_secret:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -300,11 +302,11 @@ class UserService:
         
         # تفعيل المصادقة الثنائية
         user.two_fa_enabled = True
-        self.db.commit()
+        await self.db.commit()
         
         return True
     
-    def _handle_failed_login(self, user: User) -> None:
+    async def _handle_failed_login(self, user: User) -> None:
         """معالجة محاولة تسجيل الدخول الفاشلة"""
         user.failed_login_attempts += 1
         
@@ -312,9 +314,9 @@ class UserService:
         if user.failed_login_attempts >= 5:
             user.account_locked_until = datetime.utcnow() + timedelta(minutes=30)
         
-        self.db.commit()
+        await self.db.commit()
     
-    def _create_session(self, user: User, access_token: str, refresh_token: str) -> UserSession:
+    async def _create_session(self, user: User, access_token: str, refresh_token: str) -> UserSession:
         """إنشاء جلسة مستخدم جديدة"""
         session = UserSession(
             user_id=user.id,
@@ -324,7 +326,7 @@ class UserService:
         )
         
         self.db.add(session)
-        self.db.commit()
+        await self.db.commit()
         return session
     
     def _send_verification_email(self, user: User) -> None:
@@ -0,0 +1,58 @@
+"""
+Running async database code against sqlite in tests
+
+Importing this module teaches sqlite the postgres-only column types (JSONB
+is stored as JSON, UUID as CHAR) so the real tables can be created, and
+SyncBackedSession stands in for an AsyncSession over a sync sqlite session.
+"""
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+
+@compiles(JSONB, "sqlite")
+def compile_jsonb(element, compiler, **kw):
+    return "JSON"
+
+@compiles(UUID, "sqlite")
+def compile_uuid(element, compiler, **kw):
+    return "CHAR(32)"
+
+class SyncBackedSession:
+    """AsyncSession facade over a sync (sqlite) session; records executed statements"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.info = session.info
+        self.statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.session.close()
+
+    def add(self, instance):
+        self.session.add(instance)
+
+    def add_all(self, instances):
+        self.session.add_all(instances)
+
+    async def flush(self):
+        self.session.flush()
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        return self.session.execute(statement, params)
+
+    async def scalar(self, statement):
+        self.statements.append(statement)
+        return self.session.scalar(statement)
+
+    async def connection(self):
+        return self.session.connection()
+
+    async def commit(self):
+        self.session.commit()
+
+    async def rollback(self):
+        self.session.rollback()
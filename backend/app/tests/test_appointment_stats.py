@@ -0,0 +1,69 @@
+"""
+Appointment statistics tests: aggregated in the database, folded in Python
+"""
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.services.appointment_service import get_appointment_stats, summarize_appointment_stats
+
+pytestmark = pytest.mark.asyncio
+
+def group(appointment_type, weekday, total, **counts):
+    values = dict(
+        completed=0, cancelled=0, no_show=0, duration=30 * total,
+        revenue=None, feedbacks=0, rating=None, recommended=0
+    )
+    values.update(counts)
+    return SimpleNamespace(appointment_type=appointment_type, weekday=weekday, total=total, **values)
+
+class RecordingSession:
+    """Returns canned aggregate rows and keeps the statements executed"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(all=lambda: self.rows)
+
+async def test_stats_are_one_grouped_query():
+    db = RecordingSession([group("VIDEO", 1, 2)])
+    stats = await get_appointment_stats(db, doctor_id=uuid4())
+
+    assert len(db.statements) == 1
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    assert "GROUP BY" in sql
+    assert "FILTER (WHERE" in sql
+    assert "LEFT OUTER JOIN appointment_feedbacks" in sql
+    assert stats.total_appointments == 2
+
+async def test_groups_are_folded():
+    stats = summarize_appointment_stats([
+        # Monday
+        group("IN_PERSON", 1, 3, completed=2, revenue=200.0, feedbacks=2, rating=9, recommended=2),
+        group("VIDEO", 1, 1, cancelled=1, duration=60),
+        # Sunday
+        group("VIDEO", 0, 2, no_show=1, revenue=50.0, feedbacks=2, rating=5, recommended=1),
+        group("VIDEO", 0, 1, completed=1),
+    ])
+
+    assert stats.total_appointments == 7
+    assert stats.completed_appointments == 3
+    assert stats.cancelled_appointments == 1
+    assert stats.no_show_appointments == 1
+    assert stats.average_duration == (90 + 60 + 60 + 30) / 7
+    assert stats.total_revenue == 250.0
+    assert stats.most_common_type == "VIDEO"
+    assert stats.busiest_day == "Monday"
+    assert stats.average_rating == 3.5
+    assert stats.patient_satisfaction == 75.0
+
+async def test_no_appointments():
+    stats = summarize_appointment_stats([])
+    assert stats.total_appointments == 0
+    assert stats.most_common_type is None
+    assert stats.busiest_day == ""
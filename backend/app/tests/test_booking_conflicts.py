@@ -0,0 +1,58 @@
+"""
+Booking conflict tests: exclusion constraint violations become a 409
+"""
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+from app.models.appointment import OVERLAP_CONSTRAINT
+from app.services.appointment_service import flush_booking, is_overlap_violation
+
+pytestmark = pytest.mark.asyncio
+
+class DriverError(Exception):
+    """Stands in for the asyncpg error SQLAlchemy wraps"""
+
+    def __init__(self, message: str, sqlstate: str):
+        super().__init__(message)
+        self.sqlstate = sqlstate
+
+def integrity_error(message: str, sqlstate: str) -> IntegrityError:
+    return IntegrityError("INSERT INTO appointments ...", {}, DriverError(message, sqlstate))
+
+OVERLAP = integrity_error(
+    f'conflicting key value violates exclusion constraint "{OVERLAP_CONSTRAINT}"', "23P01"
+)
+FOREIGN_KEY = integrity_error(
+    'insert or update on table "appointments" violates foreign key constraint', "23503"
+)
+
+class FailingUnitOfWork:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.flushes = 0
+
+    async def flush(self) -> None:
+        self.flushes += 1
+        if self.error:
+            raise self.error
+
+async def test_overlap_violation_is_detected():
+    assert is_overlap_violation(OVERLAP)
+    assert not is_overlap_violation(FOREIGN_KEY)
+    # another exclusion constraint is not a double booking
+    assert not is_overlap_violation(integrity_error('violates exclusion constraint "other"', "23P01"))
+
+async def test_flush_booking_turns_overlap_into_conflict():
+    uow = FailingUnitOfWork(OVERLAP)
+    with pytest.raises(HTTPException) as raised:
+        await flush_booking(uow)
+    assert raised.value.status_code == 409
+
+async def test_flush_booking_keeps_other_errors():
+    with pytest.raises(IntegrityError):
+        await flush_booking(FailingUnitOfWork(FOREIGN_KEY))
+
+    uow = FailingUnitOfWork()
+    await flush_booking(uow)
+    assert uow.flushes == 1
@@ -0,0 +1,74 @@
+"""
+Logging queue tests: the background listener across application lifespans
+"""
+import logging
+import threading
+
+import pytest
+
+from app.config.settings import settings
+from app.utils import logger as logger_module
+from app.utils.logger import NonBlockingQueueHandler, setup_logging, shutdown_logging
+
+pytestmark = pytest.mark.asyncio
+
+class BlockingHandler(logging.Handler):
+    """Records messages, holding the listener thread until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.busy = threading.Event()
+        self.unblocked = threading.Event()
+
+    def emit(self, record):
+        self.busy.set()
+        self.unblocked.wait(5)
+        self.messages.append(record.getMessage())
+
+@pytest.fixture
+def fresh_logging(monkeypatch):
+    """Run setup_logging as on a fresh process, stdout only"""
+    root = logging.getLogger()
+    level = root.level
+    monkeypatch.setattr(logger_module, "_queue_listener", None)
+    monkeypatch.setattr(logger_module, "_listener_running", False)
+    yield
+    shutdown_logging()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    root.setLevel(level)
+
+async def test_second_lifespan_still_logs(fresh_logging, capsys):
+    log = logging.getLogger("app.lifespan")
+
+    setup_logging("INFO", log_to_file=False)
+    log.info("first lifespan")
+    shutdown_logging()
+
+    setup_logging("INFO", log_to_file=False)
+    log.info("second lifespan")
+    shutdown_logging()
+
+    out = capsys.readouterr().out
+    assert "first lifespan" in out
+    assert "second lifespan" in out
+
+async def test_shutdown_with_a_full_queue_flushes_every_record(fresh_logging, monkeypatch):
+    monkeypatch.setattr(settings, "LOG_QUEUE_SIZE", 2)
+    setup_logging("INFO", log_to_file=False, log_to_stdout=False)
+    handler = BlockingHandler()
+    logger_module._queue_listener.handlers = (handler,)
+
+    log = logging.getLogger("app.busy")
+    # the listener holds the first record, the next two fill the queue
+    log.info("record %d", 0)
+    assert handler.busy.wait(5)
+    log.info("record %d", 1)
+    log.info("record %d", 2)
+
+    threading.Timer(0.1, handler.unblocked.set).start()
+    shutdown_logging()
+
+    assert handler.messages == ["record 0", "record 1", "record 2"]
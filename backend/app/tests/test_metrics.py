@@ -0,0 +1,135 @@
+"""
+Prometheus metrics tests
+"""
+import importlib.util
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from prometheus_client import REGISTRY, multiprocess
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from app.core.metrics import instrument_engine, metrics_registry, render_metrics
+from app.core.middleware import MetricsMiddleware
+
+pytestmark = pytest.mark.asyncio
+
+GUNICORN_CONF = Path(__file__).resolve().parents[2] / "gunicorn.conf.py"
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def requests_seen(method: str, route: str, status: str) -> float:
+    return sample("http_request_duration_seconds_count", method=method, route=route, status=status)
+
+def load_gunicorn_conf():
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", GUNICORN_CONF)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def test_requests_are_labeled_by_route_template():
+    app = FastAPI()
+    in_flight = []
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        in_flight.append(sample("http_requests_in_progress", method="GET"))
+        return {"id": item_id}
+
+    @app.post("/items")
+    async def create_item():
+        raise RuntimeError("boom")
+
+    app.add_middleware(MetricsMiddleware)
+    before = {
+        "item": requests_seen("GET", "/items/{item_id}", "200"),
+        "invalid": requests_seen("GET", "/items/{item_id}", "422"),
+        "unmatched": requests_seen("GET", "unmatched", "404"),
+        "error": requests_seen("POST", "/items", "500"),
+    }
+    idle = sample("http_requests_in_progress", method="GET")
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        assert (await client.get("/items/1")).status_code == 200
+        assert (await client.get("/items/2")).status_code == 200
+        assert (await client.get("/items/abc")).status_code == 422
+        assert (await client.get("/nowhere/7")).status_code == 404
+        with pytest.raises(RuntimeError):
+            await client.post("/items")
+
+    assert requests_seen("GET", "/items/{item_id}", "200") == before["item"] + 2
+    assert requests_seen("GET", "/items/{item_id}", "422") == before["invalid"] + 1
+    assert requests_seen("GET", "unmatched", "404") == before["unmatched"] + 1
+    assert requests_seen("POST", "/items", "500") == before["error"] + 1
+    # raw paths never become label values
+    assert sample("http_request_duration_seconds_count", method="GET", route="/items/1", status="200") == 0
+    assert sample("http_request_duration_seconds_count", method="GET", route="/nowhere/7", status="404") == 0
+
+    assert in_flight == [idle + 1, idle + 1]
+    assert sample("http_requests_in_progress", method="GET") == idle
+
+async def test_registry_aggregates_workers_in_multiprocess_mode(monkeypatch, tmp_path):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    assert metrics_registry() is REGISTRY
+    assert b"http_request_duration_seconds" in render_metrics()
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    registry = metrics_registry()
+    assert registry is not REGISTRY
+    assert any(
+        isinstance(collector, multiprocess.MultiProcessCollector)
+        for collector in registry._collector_to_names
+    )
+    # nothing written to the directory yet: an empty but valid exposition
+    assert render_metrics() == b""
+
+async def test_gunicorn_hooks_reset_the_multiprocess_directory(monkeypatch, tmp_path):
+    conf = load_gunicorn_conf()
+    multiproc_dir = tmp_path / "prometheus"
+    multiproc_dir.mkdir()
+    (multiproc_dir / "gauge_livesum_123.db").write_bytes(b"stale")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(multiproc_dir))
+
+    conf.on_starting(server=None)
+    assert multiproc_dir.is_dir()
+    assert list(multiproc_dir.iterdir()) == []
+
+    dead = []
+    monkeypatch.setattr(multiprocess, "mark_process_dead", dead.append)
+    conf.child_exit(server=None, worker=SimpleNamespace(pid=123))
+    assert dead == [123]
+
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR")
+    conf.child_exit(server=None, worker=SimpleNamespace(pid=456))
+    assert dead == [123]
+
+async def test_pool_gauges_follow_checkouts_per_engine(tmp_path):
+    """Primary and replica pools report under their own label"""
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}", poolclass=QueuePool, pool_size=1, max_overflow=2)
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", poolclass=QueuePool, pool_size=1, max_overflow=2)
+    instrument_engine(primary)
+    instrument_engine(replica, "replica")
+    checkouts = sample("db_pool_checkouts_total", pool="primary")
+
+    first, second = primary.connect(), primary.connect()
+    assert sample("db_pool_connections_checked_out", pool="primary") == 2
+    assert sample("db_pool_overflow", pool="primary") == 1
+    assert sample("db_pool_checkouts_total", pool="primary") == checkouts + 2
+
+    with replica.connect():
+        assert sample("db_pool_connections_checked_out", pool="replica") == 1
+        # the replica's checkout does not overwrite the primary series
+        assert sample("db_pool_connections_checked_out", pool="primary") == 2
+    assert sample("db_pool_connections_checked_out", pool="replica") == 0
+
+    second.close()
+    # the idle queue had room, so the pool still holds one connection beyond its size
+    assert sample("db_pool_connections_checked_out", pool="primary") == 1
+    assert sample("db_pool_overflow", pool="primary") == 1
+    first.close()
+    assert sample("db_pool_connections_checked_out", pool="primary") == 0
+    assert sample("db_pool_overflow", pool="primary") == 0
@@ -0,0 +1,193 @@
+"""
+ASGI middleware tests
+"""
+import asyncio
+import gzip
+import json
+import logging
+import pytest
+import zlib
+from typing import List
+
+from starlette.responses import JSONResponse, StreamingResponse
+
+from app.core.middleware import (
+    CompressionMiddleware,
+    SecurityAuditMiddleware,
+    SecurityHeadersMiddleware,
+    negotiate_encoding,
+)
+from app.core.waf import WAFScanner
+
+pytestmark = pytest.mark.asyncio
+
+def make_scope(headers: List[tuple] = (), method: str = "GET", path: str = "/",
+               query_string: bytes = b"") -> dict:
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": list(headers),
+        "client": ("127.0.0.1", 1234),
+    }
+
+async def call_app(app, headers: List[tuple] = (), method: str = "GET",
+                   body_chunks: List[bytes] = (b"",)) -> List[dict]:
+    """Run one request through an ASGI app and collect sent messages"""
+    scope = make_scope(headers, method)
+    messages = []
+    pending = list(body_chunks)
+
+    async def receive():
+        if not pending:
+            # Block like a real server until the client disconnects
+            await asyncio.Event().wait()
+        chunk = pending.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+def response_headers(messages: List[dict]) -> dict:
+    return {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+
+def response_body(messages: List[dict]) -> bytes:
+    return b"".join(m.get("body", b"") for m in messages[1:])
+
+async def test_negotiate_encoding_respects_preference_and_quality():
+    """Server preference wins among accepted codecs, q=0 excludes a codec"""
+    assert negotiate_encoding("gzip, br, zstd", ("zstd", "br", "gzip")) == "zstd"
+    assert negotiate_encoding("gzip, br", ("zstd", "br", "gzip")) == "br"
+    assert negotiate_encoding("gzip, deflate", ("zstd", "br", "gzip")) == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity", ("gzip",)) is None
+    assert negotiate_encoding("", ("gzip",)) is None
+    assert negotiate_encoding("*", ("gzip",)) == "gzip"
+
+async def test_security_headers_are_added_once():
+    """Endpoint-set security headers are replaced, not duplicated"""
+    endpoint = JSONResponse({"ok": True}, headers={"X-Frame-Options": "SAMEORIGIN"})
+    messages = await call_app(SecurityHeadersMiddleware(endpoint, debug=False))
+
+    names = [name for name, _ in messages[0]["headers"]]
+    assert names.count(b"x-frame-options") == 1
+    headers = response_headers(messages)
+    assert headers["x-frame-options"] == "DENY"
+    assert "strict-transport-security" in headers
+
+async def test_small_json_response_is_not_compressed():
+    """Bodies below the size threshold pass through untouched"""
+    app = CompressionMiddleware(JSONResponse({"ok": True}), minimum_size=1024)
+    messages = await call_app(app, [(b"accept-encoding", b"gzip")])
+
+    assert "content-encoding" not in response_headers(messages)
+    assert json.loads(response_body(messages)) == {"ok": True}
+
+async def test_zero_minimum_size_compresses_everything():
+    """An explicit 0 is a threshold, not a request for the default"""
+    app = CompressionMiddleware(JSONResponse({"ok": True}), minimum_size=0, thread_threshold=0, encodings=["gzip"])
+    assert (app.minimum_size, app.thread_threshold) == (0, 0)
+    messages = await call_app(app, [(b"accept-encoding", b"gzip")])
+
+    assert response_headers(messages)["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response_body(messages))) == {"ok": True}
+
+async def test_large_json_response_is_gzipped():
+    """Large JSON bodies are compressed and Content-Length is dropped"""
+    payload = {"items": [{"id": i, "name": f"doctor {i}"} for i in range(500)]}
+    app = CompressionMiddleware(JSONResponse(payload), minimum_size=1024, encodings=["gzip"])
+    messages = await call_app(app, [(b"accept-encoding", b"gzip")])
+
+    headers = response_headers(messages)
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert "Accept-Encoding" in headers["vary"]
+    assert json.loads(gzip.decompress(response_body(messages))) == payload
+
+async def test_streaming_response_is_compressed_chunk_by_chunk():
+    """Streaming JSON is compressed incrementally rather than buffered"""
+    chunks = [json.dumps({"row": i, "pad": "x" * 200}).encode() + b"\n" for i in range(50)]
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    endpoint = StreamingResponse(stream(), media_type="application/json")
+    app = CompressionMiddleware(endpoint, minimum_size=512, encodings=["gzip"])
+    messages = await call_app(app, [(b"accept-encoding", b"gzip")])
+
+    body_messages = messages[1:]
+    assert len(body_messages) > 1
+    assert body_messages[-1].get("more_body", False) is False
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(response_body(messages)) == b"".join(chunks)
+
+async def test_already_encoded_response_passes_through():
+    """Responses that set Content-Encoding themselves are not recompressed"""
+    body = gzip.compress(b"{}" * 2000)
+    endpoint = JSONResponse(None, headers={"Content-Encoding": "gzip"})
+    endpoint.body = body
+    endpoint.init_headers({"Content-Encoding": "gzip"})
+    messages = await call_app(CompressionMiddleware(endpoint), [(b"accept-encoding", b"gzip")])
+
+    assert response_body(messages) == body
+
+async def test_waf_scanner_reports_rule_and_location():
+    """One pass over URL and headers identifies the rule and where it hit"""
+    scanner = WAFScanner()
+    scope = make_scope(
+        [(b"accept", b"application/json"), (b"user-agent", b"x; DROP  TABLE users")],
+        path="/api/v1/doctors",
+    )
+    match = scanner.scan_request(scope)
+
+    assert match.rule == "sql_injection.drop_table"
+    assert match.location == "header:user-agent"
+    assert scanner.scan_request(make_scope([(b"user-agent", b"Mozilla/5.0")])) is None
+
+async def test_waf_scanner_decodes_query_and_honours_rules():
+    """Encoded query payloads are caught unless their category is disabled"""
+    scope = make_scope(query_string=b"q=1%20UNION+SELECT%20password")
+
+    assert WAFScanner().scan_request(scope).location == "query"
+    assert WAFScanner({"sql_injection": False}).scan_request(scope) is None
+
+async def test_waf_body_scanner_spans_chunks_and_stops_at_limit():
+    """Signatures split across chunks are found; bytes past the cap are not scanned"""
+    scanner = WAFScanner()
+
+    body = scanner.body_scanner(limit=1024)
+    assert body.feed(b'{"comment": "<scr') is None
+    assert body.feed(b'ipt>alert(1)"}').rule == "xss.script_tag"
+
+    capped = scanner.body_scanner(limit=16)
+    assert capped.feed(b"a" * 32 + b"<script>") is None
+    assert capped.done
+
+async def test_security_audit_middleware_logs_body_match(caplog):
+    """Body scanning reports the matched rule while the endpoint reads the body"""
+    received = []
+
+    async def endpoint(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message["body"])
+            if not message["more_body"]:
+                break
+        await JSONResponse({"ok": True})(scope, receive, send)
+
+    app = SecurityAuditMiddleware(endpoint, scan_body=True, body_limit=4096)
+    with caplog.at_level(logging.WARNING, logger="app.core.middleware"):
+        messages = await call_app(
+            app,
+            [(b"content-type", b"application/json")],
+            method="POST",
+            body_chunks=[b'{"path": "../', b'../etc/passwd"}'],
+        )
+
+    assert messages[0]["status"] == 200
+    assert b"".join(received) == b'{"path": "../../etc/passwd"}'
+    assert "rule=path_traversal.dot_dot_slash location=body" in caplog.text
@@ -0,0 +1,152 @@
+"""
+Transactional outbox tests
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import Session
+
+from app.config.settings import settings
+from app.core import outbox
+from app.core.outbox import FAILED, PENDING, SENT, OutboxRelay, enqueue, retry_delay
+from app.core.unit_of_work import unit_of_work
+from app.models.outbox import OutboxEvent
+from app.tests.sqlite_support import SyncBackedSession
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    OutboxEvent.__table__.create(engine)
+    return engine
+
+@pytest.fixture
+def session_factory(engine):
+    return lambda: SyncBackedSession(Session(engine, expire_on_commit=False))
+
+@pytest.fixture
+def handlers(monkeypatch):
+    registry = {}
+    monkeypatch.setattr(outbox, "_handlers", registry)
+    return registry
+
+async def events(session_factory):
+    async with session_factory() as db:
+        return list(await db.execute(select(OutboxEvent.__table__)))
+
+async def test_enqueue_commits_with_the_operation(session_factory):
+    async with session_factory() as db:
+        with pytest.raises(RuntimeError):
+            async with unit_of_work(db):
+                await enqueue(db, "payment.refund", {"payment_id": "p1"})
+                raise RuntimeError("order update failed")
+    assert await events(session_factory) == []
+
+    async with session_factory() as db:
+        async with unit_of_work(db):
+            await enqueue(db, "payment.refund", {"payment_id": "p1"})
+    [event] = await events(session_factory)
+    assert (event.topic, event.payload, event.status) == ("payment.refund", {"payment_id": "p1"}, PENDING)
+
+async def test_relay_sends_and_retries(session_factory, handlers):
+    calls = []
+
+    @outbox.outbox_handler("ok")
+    async def ok(db, payload, event_id):
+        calls.append(payload["n"])
+
+    @outbox.outbox_handler("flaky")
+    async def flaky(db, payload, event_id):
+        raise ConnectionError("stripe unavailable")
+
+    async with session_factory() as db:
+        await enqueue(db, "ok", {"n": 1})
+        await enqueue(db, "flaky", {"n": 2})
+        await enqueue(db, "ok", {"n": 3}, delay=timedelta(hours=1))
+
+    claimed, outcomes = await OutboxRelay(session_factory).run_once()
+    assert claimed == 2
+    assert outcomes == {SENT: 1, "retry": 1}
+    assert calls == [1]
+
+    by_topic = {(e.topic, e.payload["n"]): e for e in await events(session_factory)}
+    assert by_topic[("ok", 1)].sent_at is not None
+    retried = by_topic[("flaky", 2)]
+    assert (retried.status, retried.attempts, retried.locked_until) == (PENDING, 1, None)
+    assert "stripe unavailable" in retried.last_error
+    assert retried.available_at > datetime.utcnow()
+
+    # nothing else is due yet
+    assert await OutboxRelay(session_factory).run_once() == (0, {})
+
+async def test_claimed_events_are_leased_until_the_lease_expires(session_factory, handlers):
+    @outbox.outbox_handler("ok")
+    async def ok(db, payload, event_id):
+        pass
+
+    async with session_factory() as db:
+        await enqueue(db, "ok", {"n": 1})
+
+    # a relay claims the event and dies before recording the outcome
+    async with session_factory() as db:
+        [claimed] = await OutboxRelay(session_factory).claim(db, datetime.utcnow())
+        await db.commit()
+    assert claimed.attempts == 1
+    assert claimed.locked_until > datetime.utcnow()
+    assert await OutboxRelay(session_factory).run_once() == (0, {})
+
+    async with session_factory() as db:
+        await db.execute(update(OutboxEvent.__table__).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+    assert await OutboxRelay(session_factory).run_once() == (1, {SENT: 1})
+    [event] = await events(session_factory)
+    assert (event.status, event.attempts, event.locked_until) == (SENT, 2, None)
+
+async def test_outcome_after_an_expired_lease_is_discarded(session_factory, handlers, monkeypatch):
+    # every lease has expired by the time its handler returns
+    monkeypatch.setattr(settings, "OUTBOX_LEASE_SECONDS", -1)
+    calls = []
+
+    @outbox.outbox_handler("slow")
+    async def slow(db, payload, event_id):
+        calls.append(event_id)
+        if len(calls) == 1:
+            # another relay takes the event over and delivers it meanwhile
+            assert await OutboxRelay(session_factory).run_once() == (1, {SENT: 1})
+            raise TimeoutError("smtp timed out")
+
+    async with session_factory() as db:
+        await enqueue(db, "slow", {})
+
+    assert await OutboxRelay(session_factory).run_once() == (1, {"retry": 1})
+    [event] = await events(session_factory)
+    assert len(calls) == 2
+    assert (event.status, event.attempts, event.last_error) == (SENT, 2, None)
+
+async def test_gives_up_after_max_attempts(handlers):
+    relay = OutboxRelay(lambda: None)
+    now = datetime.utcnow()
+    event = SimpleNamespace(id="e1", topic="unknown", payload={}, attempts=1, available_at=now)
+    assert relay.record(event, "No handler", now)[0] == FAILED
+
+    @outbox.outbox_handler("flaky")
+    async def flaky(db, payload, event_id):
+        pass
+
+    event = SimpleNamespace(id="e2", topic="flaky", payload={}, attempts=settings.OUTBOX_MAX_ATTEMPTS - 1, available_at=now)
+    assert relay.record(event, "boom", now)[0] == "retry"
+
+    # attempts already counts the one that just failed
+    event = SimpleNamespace(id="e3", topic="flaky", payload={}, attempts=settings.OUTBOX_MAX_ATTEMPTS, available_at=now)
+    status, values = relay.record(event, "boom", now)
+    assert status == FAILED
+    assert values["status"] == FAILED
+
+async def test_retry_delay_backs_off():
+    assert retry_delay(1) == timedelta(seconds=settings.OUTBOX_RETRY_BASE_SECONDS)
+    assert retry_delay(3) == timedelta(seconds=settings.OUTBOX_RETRY_BASE_SECONDS * 4)
+    assert retry_delay(50) == timedelta(seconds=settings.OUTBOX_RETRY_MAX_SECONDS)
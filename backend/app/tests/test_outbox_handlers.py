@@ -0,0 +1,135 @@
+"""
+Outbox handler tests: repeated events must not repeat the side effect
+"""
+from types import SimpleNamespace
+
+import pytest
+import stripe
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.config.settings import settings
+from app.models.payment import Payment
+from app.models.user import User
+from app.services import outbox_handlers
+from app.services.payment_service import PaymentService
+from app.tests.sqlite_support import SyncBackedSession
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.fixture
+def refunds(monkeypatch):
+    """Refunds a succeeded payment once, like PaymentService.refund_payment"""
+    calls = []
+    refunded = set()
+
+    async def refund_payment(self, payment_id, amount=None, reason=None, idempotency_key=None):
+        calls.append((payment_id, idempotency_key))
+        if payment_id in refunded:
+            raise HTTPException(status_code=404, detail="Payment not found or cannot be refunded")
+        refunded.add(payment_id)
+        return {"refund_id": "re_1", "status": "succeeded", "amount": amount}
+
+    monkeypatch.setattr(PaymentService, "refund_payment", refund_payment)
+    return calls
+
+async def test_refund_runs_twice_on_the_same_event(refunds):
+    payload = {"payment_id": "pi_1", "reason": "requested_by_customer"}
+    await outbox_handlers.refund_payment(None, payload, "e1")
+    # the relay died before recording the outcome and runs the event again
+    await outbox_handlers.refund_payment(None, payload, "e1")
+
+    assert refunds == [("pi_1", "refund-e1"), ("pi_1", "refund-e1")]
+
+async def test_refund_of_a_stored_payment_reaches_stripe_once(monkeypatch):
+    payments = Payment.__table__
+    engine = create_engine("sqlite://")
+    payments.create(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(payments).values(
+            id="pi_1", user_id="user-1", amount=80.0, currency="usd",
+            payment_type="APPOINTMENT", status="succeeded"
+        ))
+
+    refunds = []
+
+    def create_refund(**params):
+        refunds.append(params)
+        return SimpleNamespace(id="re_1", status="succeeded")
+
+    monkeypatch.setattr(stripe.Refund, "create", create_refund)
+    payload = {"payment_id": "pi_1", "reason": "requested_by_customer"}
+    for _ in range(2):
+        async with SyncBackedSession(Session(engine, expire_on_commit=False)) as db:
+            await outbox_handlers.refund_payment(db, payload, "e1")
+
+    assert refunds == [dict(
+        payment_intent="pi_1", reason="requested_by_customer", idempotency_key="refund-e1"
+    )]
+    with engine.connect() as connection:
+        payment = connection.execute(select(payments).where(payments.c.id == "pi_1")).one()
+    assert (payment.status, payment.refund_amount) == ("refunded", 80.0)
+
+async def test_refund_failure_is_retried(monkeypatch):
+    async def refund_payment(self, payment_id, **kwargs):
+        raise HTTPException(status_code=500, detail="Failed to process refund")
+
+    monkeypatch.setattr(PaymentService, "refund_payment", refund_payment)
+    with pytest.raises(HTTPException):
+        await outbox_handlers.refund_payment(None, {"payment_id": "pi_1"}, "e1")
+
+async def test_create_payment_uses_the_event_as_idempotency_key(monkeypatch):
+    intents = []
+
+    async def create_payment_intent(self, **kwargs):
+        intents.append(kwargs)
+        return {"client_secret": "secret", "payment_id": "pi_1", "status": "requires_payment_method"}
+
+    monkeypatch.setattr(PaymentService, "create_payment_intent", create_payment_intent)
+    payload = {"order_id": "order-1", "amount": 42.5, "user_id": "user-1", "payment_method": "card"}
+    await outbox_handlers.create_payment(None, payload, "e2")
+    await outbox_handlers.create_payment(None, payload, "e2")
+
+    assert intents[0] == intents[1] == dict(
+        amount=42.5,
+        currency=settings.CURRENCY,
+        user_id="user-1",
+        payment_type="MEDICATION",
+        metadata={"order_id": "order-1", "payment_method": "card"},
+        idempotency_key="payment-e2",
+    )
+
+async def test_create_payment_stores_the_intent_once(monkeypatch):
+    users, payments = User.__table__, Payment.__table__
+    engine = create_engine("sqlite://")
+    users.create(engine)
+    payments.create(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(users).values(
+            id="user-1", email="patient@example.com", password_hash="x",
+            first_name="Sara", last_name="Ali", role="PATIENT"
+        ))
+
+    customers = []
+
+    def create_customer(**params):
+        customers.append(params)
+        return SimpleNamespace(id="cus_1")
+
+    def create_intent(**params):
+        return SimpleNamespace(id="pi_1", client_secret="secret", status="requires_payment_method")
+
+    monkeypatch.setattr(stripe.Customer, "create", create_customer)
+    monkeypatch.setattr(stripe.PaymentIntent, "create", create_intent)
+    payload = {"order_id": "order-1", "amount": 42.5, "user_id": "user-1", "payment_method": "card"}
+    for _ in range(2):
+        async with SyncBackedSession(Session(engine, expire_on_commit=False)) as db:
+            await outbox_handlers.create_payment(db, payload, "e2")
+
+    assert len(customers) == 1
+    with engine.connect() as connection:
+        assert connection.execute(select(users.c.stripe_customer_id)).scalar() == "cus_1"
+        [payment] = connection.execute(select(payments)).all()
+    assert (payment.id, payment.amount, payment.status) == ("pi_1", 42.5, "requires_payment_method")
+    assert payment.metadata == {"order_id": "order-1", "payment_method": "card"}
@@ -0,0 +1,144 @@
+"""
+Keyset pagination tests
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, String, create_engine, select
+from sqlalchemy.orm import Session, declarative_base
+
+from app.config.settings import settings
+from app.core import pagination
+from app.core.pagination import (
+    CountMode,
+    InvalidCursor,
+    Total,
+    decode_cursor,
+    encode_cursor,
+    page_with_total,
+    paginate,
+)
+from app.tests.sqlite_support import SyncBackedSession
+
+pytestmark = pytest.mark.asyncio
+
+Base = declarative_base()
+
+class Row(Base):
+    __tablename__ = "rows"
+
+    id = Column(Integer, primary_key=True)
+    owner = Column(String(10))
+    created_at = Column(DateTime, nullable=False)
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    start = datetime(2024, 1, 1, 9, 0)
+    with Session(engine) as session:
+        # pairs of rows share a timestamp, so the id has to break ties
+        session.add_all(
+            Row(id=i, owner="a" if i % 3 else "b", created_at=start + timedelta(hours=i // 2))
+            for i in range(1, 12)
+        )
+        session.commit()
+        yield SyncBackedSession(session)
+
+async def all_pages(db, query, limit, **options):
+    pages, cursor = [], None
+    while True:
+        page = await paginate(db, query, Row.created_at, Row.id, limit, cursor, **options)
+        pages.append([row.id for row in page.items])
+        cursor = page.next_cursor
+        if cursor is None:
+            return pages
+
+async def test_pages_cover_every_row_once_newest_first(db):
+    pages = await all_pages(db, select(Row), 4)
+    assert pages == [[11, 10, 9, 8], [7, 6, 5, 4], [3, 2, 1]]
+
+async def test_ascending_pages_with_filter(db):
+    pages = await all_pages(db, select(Row).where(Row.owner == "a"), 3, descending=False)
+    assert pages == [[1, 2, 4], [5, 7, 8], [10, 11]]
+
+async def test_total_is_only_counted_on_request(db):
+    page = await paginate(db, select(Row), Row.created_at, Row.id, 5)
+    assert page.total is None and page.has_more
+    assert len(db.statements) == 1
+
+async def test_first_page_total_comes_from_the_page_query(db):
+    query = select(Row).where(Row.owner == "a")
+    page = await paginate(db, query, Row.created_at, Row.id, 5, with_total=True)
+    assert [row.id for row in page.items] == [11, 10, 8, 7, 5]
+    assert page.total == Total(8, exact=True)
+    assert len(db.statements) == 1
+    assert page.headers()["X-Total-Count"] == "8"
+    assert page.headers()["X-Total-Count-Exact"] == "true"
+
+    # later pages still report the whole listing, not what is left of it
+    page = await paginate(db, query, Row.created_at, Row.id, 5, page.next_cursor, with_total=True)
+    assert page.total == Total(8)
+
+async def test_offset_page_and_total_in_one_statement(db):
+    query = select(Row.id, Row.owner).order_by(Row.id)
+    rows, total = await page_with_total(db, query, limit=3, offset=3)
+    assert rows == [(4, "a"), (5, "a"), (6, "b")]
+    assert total == Total(11)
+    assert len(db.statements) == 1
+
+    # past the end the count has to be run on its own
+    rows, total = await page_with_total(db, query, limit=3, offset=30)
+    assert (rows, total) == ([], Total(11))
+
+async def test_estimated_total_is_flagged(db, monkeypatch):
+    async def estimate_rows(db, query):
+        return 50_000
+
+    monkeypatch.setattr(pagination, "estimate_rows", estimate_rows)
+    monkeypatch.setattr(settings, "COUNT_ESTIMATE_THRESHOLD", 10_000)
+    query = select(Row).order_by(Row.id)
+
+    rows, total = await page_with_total(db, query, 2, count_mode=CountMode.AUTO)
+    assert len(rows) == 2
+    assert total == Total(50_000, exact=False)
+
+    # narrow queries are counted exactly in auto mode
+    monkeypatch.setattr(settings, "COUNT_ESTIMATE_THRESHOLD", 100_000)
+    rows, total = await page_with_total(db, query, 2, count_mode=CountMode.AUTO)
+    assert total == Total(11, exact=True)
+
+    page = await paginate(
+        db, select(Row), Row.created_at, Row.id, 2,
+        with_total=True, count_mode=CountMode.ESTIMATED
+    )
+    assert page.headers()["X-Total-Count-Exact"] == "false"
+
+async def test_estimate_needs_postgres(db):
+    assert await pagination.estimate_rows(db, select(Row)) is None
+    _, total = await page_with_total(db, select(Row), 2, count_mode=CountMode.ESTIMATED)
+    assert total == Total(11, exact=True)
+
+async def test_last_page_has_no_cursor(db):
+    page = await paginate(db, select(Row), Row.created_at, Row.id, 11)
+    assert len(page.items) == 11
+    assert page.next_cursor is None
+    assert "X-Next-Cursor" not in page.headers()
+
+async def test_cursor_round_trips_typed_values():
+    moment = datetime(2024, 5, 1, 12, 30, 15, 120)
+    cursor = encode_cursor("orders.created_at:desc", [moment, "c0ffee"])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "orders.created_at:desc") == [moment, "c0ffee"]
+
+async def test_cursor_from_another_listing_is_rejected(db):
+    cursor = encode_cursor("rows.created_at:asc", [datetime(2024, 1, 1), 1])
+    with pytest.raises(InvalidCursor):
+        await paginate(db, select(Row), Row.created_at, Row.id, 5, cursor)
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor!", "rows.created_at:desc")
+
+async def test_invalid_cursor_is_rejected_before_counting(db):
+    with pytest.raises(InvalidCursor):
+        await paginate(db, select(Row), Row.created_at, Row.id, 5, "not-a-cursor!", with_total=True)
+    assert db.statements == []
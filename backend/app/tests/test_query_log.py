@@ -0,0 +1,201 @@
+"""
+Slow-query log and query counting tests
+"""
+import pytest
+from types import SimpleNamespace
+from typing import List
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.util import greenlet_spawn
+
+from app.config.settings import settings
+from app.core import query_log
+from app.core.query_log import (
+    QueryBudgetExceeded,
+    SlowQueryStats,
+    normalize_sql,
+    parameter_shapes,
+    query_budget,
+)
+
+pytestmark = pytest.mark.asyncio
+
+def service_function():
+    """A function that looks like it lives in app.services"""
+    namespace = {"__name__": "app.services.doctor_search"}
+    exec("def search_doctors(run):\n    return run()\n", namespace)
+    return namespace["search_doctors"]
+
+async def test_normalize_sql_groups_executions_under_one_template():
+    first = normalize_sql(
+        "SELECT doctors.id FROM doctors\n WHERE doctors.city = 'Cairo' "
+        "AND doctors.rating >= 4.5 AND doctors.id IN ($1, $2, $3) LIMIT 10"
+    )
+    second = normalize_sql(
+        "SELECT doctors.id FROM doctors WHERE doctors.city = 'Giza' "
+        "AND doctors.rating >= 3 AND doctors.id IN ($1) LIMIT 20"
+    )
+    assert first == second
+    assert first == (
+        "SELECT doctors.id FROM doctors WHERE doctors.city = ? "
+        "AND doctors.rating >= ? AND doctors.id IN (...) LIMIT ?"
+    )
+
+async def test_normalize_sql_keeps_casts_and_identifiers():
+    sql = normalize_sql("SELECT anon_1.name::text FROM t1 WHERE a = :a_1")
+    assert sql == "SELECT anon_1.name::text FROM t1 WHERE a = ?"
+
+async def test_parameter_shapes_never_include_values():
+    shapes = parameter_shapes(("secret@example.com", 3, ["a", "b"]))
+    assert shapes == ["str(18)", "int", "list[2]"]
+    assert parameter_shapes([{"id": 1}, {"id": 2}], executemany=True) == {
+        "rows": 2,
+        "row": {"id": "int"},
+    }
+
+async def test_stats_keep_the_costliest_templates():
+    stats = SlowQueryStats(max_templates=2)
+    stats.record("SELECT a", 300)
+    stats.record("SELECT b", 900)
+    stats.record("SELECT a", 400, route="/doctors/search", caller="app.services.geo_service.search_doctors")
+    stats.record("SELECT c", 1000)
+
+    top = stats.top()
+    assert [q.statement for q in top] == ["SELECT c", "SELECT b"]
+    assert stats.top(order_by="count")[0].count == 1
+
+    stats.reset()
+    stats.record("SELECT a", 300)
+    stats.record("SELECT a", 500, route="/doctors/search")
+    entry = stats.top()[0]
+    assert (entry.count, entry.max_ms, entry.mean_ms) == (2, 500, 400)
+    assert entry.routes == {"/doctors/search": 1}
+
+async def test_stats_reject_unknown_ordering():
+    with pytest.raises(ValueError):
+        SlowQueryStats(1).top(order_by="statement")
+
+@pytest.fixture
+def instrumented_engine(monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 0.0)
+    monkeypatch.setattr(query_log, "slow_queries", SlowQueryStats(10))
+    engine = create_engine("sqlite://")
+    query_log.instrument_slow_queries(engine)
+    return engine
+
+async def test_slow_statements_are_recorded_with_route_and_caller(instrumented_engine):
+    scope = {
+        "type": "http",
+        "path": "/api/v1/doctors/search/",
+        "route": SimpleNamespace(path="/api/v1/doctors/search"),
+    }
+    token = query_log._request_scope.set(scope)
+    try:
+        def run():
+            with instrumented_engine.connect() as conn:
+                conn.execute(text("SELECT :value + 1"), {"value": 41})
+
+        service_function()(run)
+    finally:
+        query_log._request_scope.reset(token)
+
+    entry = query_log.slow_queries.top()[0]
+    assert entry.statement == "SELECT ? + ?"
+    assert entry.routes == {"/api/v1/doctors/search": 1}
+    assert entry.callers == {"app.services.doctor_search.search_doctors": 1}
+    assert entry.parameter_shapes == ["int"]
+
+async def test_caller_is_found_across_the_async_greenlet_boundary():
+    def in_driver():
+        return query_log.calling_function()
+
+    async def run():
+        return await greenlet_spawn(in_driver)
+
+    namespace = {"__name__": "app.services.geo_service", "run": run}
+    exec("async def search_hospitals():\n    return await run()\n", namespace)
+    assert await namespace["search_hospitals"]() == "app.services.geo_service.search_hospitals"
+
+async def test_only_plain_reads_are_explained():
+    assert query_log._explainable("SELECT * FROM doctors")
+    assert query_log._explainable("WITH t AS (SELECT 1) SELECT * FROM t")
+    assert not query_log._explainable("UPDATE doctors SET rating = 5")
+    assert not query_log._explainable("SELECT * FROM outbox FOR UPDATE SKIP LOCKED")
+
+@pytest.fixture
+def counting_engine():
+    engine = create_engine("sqlite://")
+    query_log.instrument_query_counting(engine)
+    return engine
+
+def run_queries(engine, times: int) -> None:
+    with engine.connect() as conn:
+        for i in range(times):
+            conn.execute(text("SELECT :id"), {"id": i})
+
+async def test_count_queries_groups_repeated_templates(counting_engine):
+    with query_log.count_queries() as count:
+        run_queries(counting_engine, 12)
+        with counting_engine.connect() as conn:
+            conn.execute(text("SELECT 1, 2"))
+
+    assert count.total == 13
+    assert count.repeated(10) == {"SELECT ?": 12}
+
+def budget_app(engine, budget: int, queries: int):
+    from fastapi import FastAPI
+
+    app = FastAPI()
+
+    @app.get("/doctors/{doctor_id}/alerts")
+    @query_budget(budget)
+    async def alerts(doctor_id: int):
+        run_queries(engine, queries)
+        return {"ok": True}
+
+    return query_log.RequestScopeMiddleware(app)
+
+async def call(app) -> List[dict]:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/doctors/1/alerts",
+        "raw_path": b"/doctors/1/alerts",
+        "query_string": b"",
+        "headers": [],
+        "client": ("127.0.0.1", 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+async def test_query_count_header_in_debug(counting_engine, monkeypatch):
+    monkeypatch.setattr(settings, "DEBUG", True)
+    messages = await call(budget_app(counting_engine, budget=5, queries=3))
+    headers = dict(messages[0]["headers"])
+    assert headers[b"x-db-queries"] == b"3"
+
+async def test_no_query_count_header_outside_debug(counting_engine, monkeypatch):
+    monkeypatch.setattr(settings, "DEBUG", False)
+    messages = await call(budget_app(counting_engine, budget=5, queries=3))
+    assert b"x-db-queries" not in dict(messages[0]["headers"])
+
+async def test_route_over_budget_fails_when_enforced(counting_engine, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_BUDGET_ENFORCE", True)
+    with pytest.raises(QueryBudgetExceeded, match=r"/doctors/\{doctor_id\}/alerts ran 4 queries, budget is 2"):
+        await call(budget_app(counting_engine, budget=2, queries=4))
+
+async def test_route_over_budget_is_logged_when_not_enforced(counting_engine, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "QUERY_BUDGET_ENFORCE", False)
+    monkeypatch.setattr(settings, "TESTING", False)
+    monkeypatch.setattr(settings, "N_PLUS_ONE_THRESHOLD", 3)
+    await call(budget_app(counting_engine, budget=2, queries=4))
+    assert "budget is 2" in caplog.text
+    assert "Possible N+1 on /doctors/{doctor_id}/alerts: 4x SELECT ?" in caplog.text
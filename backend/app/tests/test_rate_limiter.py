@@ -0,0 +1,354 @@
+"""
+Rate limiter tests
+"""
+import time
+
+import fakeredis
+import pytest
+from types import SimpleNamespace
+from typing import Dict, List
+
+from starlette.responses import PlainTextResponse
+
+from app.core.middleware import RateLimitMiddleware
+from app.core.rate_limiter import HybridRateLimiter, RateLimitAlgorithm, RateLimiter
+
+pytestmark = pytest.mark.asyncio
+
+class Clock:
+    """Wall clock of fakeredis (its TIME command reads time.time)"""
+
+    def __init__(self, monkeypatch, now: float = 1_700_000_000.0):
+        self.now = now
+        monkeypatch.setattr(time, "time", lambda: self.now)
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    return Clock(monkeypatch)
+
+@pytest.fixture
+def lua_redis():
+    """Redis running the limiter scripts, with an empty script cache"""
+    return fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+
+def outcome(result) -> tuple:
+    return result.allowed, result.remaining, result.reset_after, result.retry_after
+
+async def test_sliding_window_counts_cost_and_reports_reset(clock, lua_redis):
+    limiter = RateLimiter(lua_redis, RateLimitAlgorithm.SLIDING_WINDOW)
+    key = "rate_limit:api:1.1.1.1"
+
+    assert outcome(await limiter.hit(key, 3, 10)) == (True, 2, 10.0, 0.0)
+    clock.advance(4)
+    assert outcome(await limiter.hit(key, 3, 10, cost=2)) == (True, 0, 6.0, 0.0)
+    # a rejected hit consumes nothing and waits for the oldest request to leave
+    assert outcome(await limiter.hit(key, 3, 10)) == (False, 0, 6.0, 6.0)
+    assert await lua_redis.zcard(f"{key}:sw") == 3
+
+async def test_sliding_window_frees_requests_leaving_the_window(clock, lua_redis):
+    limiter = RateLimiter(lua_redis, RateLimitAlgorithm.SLIDING_WINDOW)
+    key = "rate_limit:api:2.2.2.2"
+
+    await limiter.hit(key, 3, 10)
+    clock.advance(4)
+    await limiter.hit(key, 3, 10, cost=2)
+    assert not (await limiter.hit(key, 3, 10)).allowed
+
+    # the first request is out of the window, the two later ones are not
+    clock.advance(6)
+    assert outcome(await limiter.hit(key, 3, 10)) == (True, 0, 4.0, 0.0)
+    assert not (await limiter.hit(key, 3, 10)).allowed
+
+    clock.advance(10)
+    assert outcome(await limiter.hit(key, 3, 10, cost=3)) == (True, 0, 10.0, 0.0)
+
+async def test_sliding_window_rejects_cost_above_what_is_left(clock, lua_redis):
+    limiter = RateLimiter(lua_redis, RateLimitAlgorithm.SLIDING_WINDOW)
+    key = "rate_limit:api:3.3.3.3"
+
+    await limiter.hit(key, 5, 60, cost=3)
+    assert outcome(await limiter.hit(key, 5, 60, cost=3)) == (False, 2, 60.0, 60.0)
+    assert (await limiter.hit(key, 5, 60, cost=2)).allowed
+
+async def test_token_bucket_spends_and_refills(clock, lua_redis):
+    limiter = RateLimiter(lua_redis, RateLimitAlgorithm.TOKEN_BUCKET)
+    key = "rate_limit:api:4.4.4.4"
+
+    # 10 tokens refilled over 10 seconds: one token per second
+    assert outcome(await limiter.hit(key, 10, 10, cost=4)) == (True, 6, 4.0, 0.0)
+    assert outcome(await limiter.hit(key, 10, 10, cost=7)) == (False, 6, 4.0, 1.0)
+
+    clock.advance(2)
+    assert outcome(await limiter.hit(key, 10, 10, cost=7)) == (True, 1, 9.0, 0.0)
+
+    # refilling stops at the capacity
+    clock.advance(60)
+    assert outcome(await limiter.hit(key, 10, 10)) == (True, 9, 1.0, 0.0)
+
+async def test_limiter_falls_back_to_eval_when_the_script_is_not_loaded(clock, lua_redis):
+    limiter = RateLimiter(lua_redis, RateLimitAlgorithm.TOKEN_BUCKET)
+    calls = []
+    evalsha, eval_ = lua_redis.evalsha, lua_redis.eval
+
+    async def recording_evalsha(*args):
+        calls.append("evalsha")
+        return await evalsha(*args)
+
+    async def recording_eval(*args):
+        calls.append("eval")
+        return await eval_(*args)
+
+    lua_redis.evalsha, lua_redis.eval = recording_evalsha, recording_eval
+
+    assert (await limiter.hit("rate_limit:api:5.5.5.5", 10, 10)).allowed
+    assert calls == ["evalsha", "eval"]
+
+    # EVAL cached the script, the next check is a single EVALSHA
+    assert (await limiter.hit("rate_limit:api:5.5.5.5", 10, 10)).allowed
+    assert calls == ["evalsha", "eval", "evalsha"]
+
+class FakeRedis:
+    """In-memory Redis supporting the pipelined INCRBY/GET/EXPIRE used for syncing"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.ops: List[tuple] = []
+
+    def incrby(self, key: str, amount: int):
+        self.ops.append(("incrby", key, amount))
+
+    def get(self, key: str):
+        self.ops.append(("get", key, None))
+
+    def expire(self, key: str, seconds: int):
+        self.ops.append(("expire", key, seconds))
+
+    async def execute(self) -> list:
+        self.redis.round_trips += 1
+        results = []
+        for op, key, value in self.ops:
+            if op == "incrby":
+                self.redis.counters[key] = self.redis.counters.get(key, 0) + value
+                results.append(self.redis.counters[key])
+            elif op == "get":
+                value = self.redis.counters.get(key)
+                results.append(None if value is None else str(value).encode())
+            else:
+                results.append(True)
+        return results
+
+def make_limiter(redis: FakeRedis, worker_count: int = 1) -> HybridRateLimiter:
+    return HybridRateLimiter(redis, sync_interval=3600, sync_threshold=0.1, min_limit=0, worker_count=worker_count)
+
+async def test_hybrid_limiter_decides_locally_below_threshold():
+    """Requests far from the limit never touch Redis"""
+    redis = FakeRedis()
+    limiter = make_limiter(redis)
+
+    for _ in range(90):
+        result = await limiter.hit("rate_limit:api:1.2.3.4", 100, 3600)
+        assert result.allowed
+
+    assert redis.round_trips == 0
+    assert result.remaining == 10
+    await limiter.close()
+
+async def test_hybrid_limiter_syncs_near_limit_and_rejects_over_it():
+    """Crossing the threshold reconciles with Redis and the limit is enforced"""
+    redis = FakeRedis()
+    limiter = make_limiter(redis)
+    key = "rate_limit:api:1.2.3.4"
+
+    results = [await limiter.hit(key, 100, 3600) for _ in range(101)]
+
+    assert all(result.allowed for result in results[:100])
+    assert not results[100].allowed
+    assert results[100].retry_after > 0
+    assert redis.round_trips > 0
+    await limiter.close()
+
+async def test_hybrid_limiter_shares_budget_across_workers():
+    """Batched syncs make each worker see consumption from the others"""
+    redis = FakeRedis()
+    worker_a = make_limiter(redis, worker_count=2)
+    worker_b = make_limiter(redis, worker_count=2)
+    key = "rate_limit:api:5.6.7.8"
+
+    for _ in range(60):
+        assert (await worker_a.hit(key, 100, 3600)).allowed
+    await worker_a.flush()
+
+    # Worker B learns the fleet-wide count on its first batch sync
+    assert (await worker_b.hit(key, 100, 3600)).allowed
+    await worker_b.flush()
+
+    admitted_by_b = 1
+    for _ in range(60):
+        if (await worker_b.hit(key, 100, 3600)).allowed:
+            admitted_by_b += 1
+    await worker_b.flush()
+
+    assert admitted_by_b == 40
+    assert sum(redis.counters.values()) == 100
+
+    # Worker A's stale view may overshoot by at most its share of the
+    # headroom it last saw
+    admitted_by_a = 0
+    for _ in range(40):
+        if (await worker_a.hit(key, 100, 3600)).allowed:
+            admitted_by_a += 1
+    assert admitted_by_a == 15
+    assert not (await worker_a.hit(key, 100, 3600)).allowed
+
+    await worker_a.close()
+    await worker_b.close()
+
+async def test_fresh_hybrid_workers_share_the_limit():
+    """Workers starting a window from the same empty view do not each spend the whole limit"""
+    redis = FakeRedis()
+    workers = [make_limiter(redis, worker_count=4) for _ in range(4)]
+    key = "rate_limit:api:7.7.7.7"
+
+    admitted = 0
+    for _ in range(100):
+        for worker in workers:
+            if (await worker.hit(key, 100, 3600)).allowed:
+                admitted += 1
+    for worker in workers:
+        await worker.close()
+
+    # each spending its full local budget first would admit 4 * 90 + 1; a
+    # worker that synced before the others still spends a share of its older
+    # view, which bounds the overshoot to a fraction of the limit
+    assert admitted == sum(redis.counters.values())
+    assert 100 <= admitted < 130
+    assert redis.round_trips < 20
+
+async def test_hybrid_limiter_weighs_the_previous_window(clock):
+    """A burst at the end of a window is not followed by a full limit at the start of the next"""
+    redis = FakeRedis()
+    worker_a = make_limiter(redis, worker_count=2)
+    worker_b = make_limiter(redis, worker_count=2)
+    key = "rate_limit:api:3.3.3.3"
+    clock.now = 3600 * 1000 + 3590
+
+    admitted = 0
+    for _ in range(60):
+        for worker in (worker_a, worker_b):
+            if (await worker.hit(key, 100, 3600)).allowed:
+                admitted += 1
+    await worker_a.flush()
+    await worker_b.flush()
+    # the workers' share of the headroom bounds the overshoot, as in a single window
+    assert 100 <= admitted < 120
+
+    # 20 seconds later the previous window still weighs 3580/3600 of its count
+    clock.advance(20)
+    admitted = 0
+    for _ in range(60):
+        for worker in (worker_a, worker_b):
+            if (await worker.hit(key, 100, 3600)).allowed:
+                admitted += 1
+    assert admitted == 0
+    result = await worker_b.hit(key, 100, 3600)
+    assert not result.allowed and result.retry_after < 3600
+
+    # half way through the window half of the previous count has decayed
+    clock.advance(1780)
+    admitted = 0
+    for _ in range(60):
+        for worker in (worker_a, worker_b):
+            if (await worker.hit(key, 100, 3600)).allowed:
+                admitted += 1
+    assert 40 <= admitted < 55
+
+    await worker_a.close()
+    await worker_b.close()
+
+async def test_concurrent_syncs_do_not_lower_the_synced_count():
+    """An older INCRBY total applied last leaves the newer count in place"""
+    redis = FakeRedis()
+    limiter = make_limiter(redis)
+    key = "rate_limit:api:4.4.4.4"
+    await limiter.hit(key, 100, 3600)
+    [bucket] = limiter.buckets.values()
+
+    original_pipeline = redis.pipeline
+    def stale_pipeline(transaction: bool = True):
+        pipe = original_pipeline(transaction)
+        async def execute():
+            # another sync of the key finished with a higher total meanwhile
+            bucket.synced_count = 50
+            return [1, None, True]
+        pipe.execute = execute
+        return pipe
+    redis.pipeline = stale_pipeline
+
+    await limiter.flush()
+    assert bucket.synced_count == 50
+    redis.pipeline = original_pipeline
+    await limiter.close()
+
+async def test_hybrid_limiter_keeps_pending_counts_when_redis_fails():
+    """A failed batch sync is retried instead of dropping consumption"""
+    redis = FakeRedis()
+    limiter = make_limiter(redis)
+
+    async def failing_execute():
+        raise ConnectionError("redis unavailable")
+
+    for _ in range(10):
+        await limiter.hit("rate_limit:api:9.9.9.9", 100, 3600)
+
+    original_pipeline = redis.pipeline
+    def broken_pipeline(transaction: bool = True):
+        pipe = original_pipeline(transaction)
+        pipe.execute = failing_execute
+        return pipe
+    redis.pipeline = broken_pipeline
+
+    with pytest.raises(ConnectionError):
+        await limiter.flush()
+
+    redis.pipeline = original_pipeline
+    await limiter.flush()
+    assert sum(redis.counters.values()) == 10
+    await limiter.close()
+
+async def test_middleware_uses_the_app_limiter_flushed_on_shutdown():
+    """Hits counted by the middleware reach Redis when the lifespan closes the limiter"""
+    redis = FakeRedis()
+    limiter = make_limiter(redis)
+    middleware = RateLimitMiddleware(PlainTextResponse("ok"))
+    scope = {
+        "type": "http", "method": "GET", "path": "/api/v1/doctors", "query_string": b"",
+        "headers": [], "client": ("5.6.7.8", 1234),
+        "app": SimpleNamespace(state=SimpleNamespace(rate_limiter=limiter)),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    for _ in range(3):
+        await middleware(scope, receive, send)
+    assert middleware.limiter is limiter
+    assert messages[0]["status"] == 200
+    assert redis.counters == {}
+
+    await limiter.close()
+    assert sum(redis.counters.values()) == 3
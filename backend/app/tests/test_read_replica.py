@@ -0,0 +1,105 @@
+"""
+Read replica routing tests
+"""
+import pytest
+from types import SimpleNamespace
+
+from app.config import database
+
+pytestmark = pytest.mark.asyncio
+
+class FakeSession:
+    def __init__(self, name: str, fail: bool = False):
+        self.name = name
+        self.fail = fail
+        self.closed = False
+        self.committed = False
+
+    async def connection(self):
+        if self.fail:
+            raise OSError("connection refused")
+
+    async def commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Primary/replica session factories that record what they hand out"""
+    state = SimpleNamespace(replica_fails=False, opened=[])
+
+    def primary():
+        session = FakeSession("primary")
+        state.opened.append(session)
+        return session
+
+    def replica():
+        session = FakeSession("replica", fail=state.replica_fails)
+        state.opened.append(session)
+        return session
+
+    monkeypatch.setattr(database, "AsyncSessionLocal", primary)
+    monkeypatch.setattr(database, "ReadSessionLocal", replica)
+    monkeypatch.setattr(database, "replica_engine", object())
+    monkeypatch.setattr(database, "_replica_retry_at", 0.0)
+    return state
+
+def request_for(endpoint) -> SimpleNamespace:
+    return SimpleNamespace(scope={"endpoint": endpoint})
+
+async def session_from(dependency, request=None):
+    generator = dependency(request)
+    session = await generator.__anext__()
+    await generator.aclose()
+    return session
+
+async def test_read_db_uses_replica(sessions):
+    session = await session_from(database.get_read_db)
+    assert session.name == "replica"
+    assert session.closed and not session.committed
+
+async def test_get_db_stays_on_primary(sessions):
+    async def endpoint():
+        pass
+
+    assert (await session_from(database.get_db, request_for(endpoint))).name == "primary"
+
+async def test_read_replica_decorator_routes_get_db(sessions):
+    @database.read_replica
+    async def endpoint():
+        pass
+
+    assert (await session_from(database.get_db, request_for(endpoint))).name == "replica"
+
+async def test_primary_only_pins_read_db(sessions):
+    @database.primary_only
+    async def endpoint():
+        pass
+
+    assert (await session_from(database.get_read_db, request_for(endpoint))).name == "primary"
+
+async def test_falls_back_to_primary_when_replica_is_down(sessions):
+    sessions.replica_fails = True
+    session = await session_from(database.get_read_db)
+    assert session.name == "primary"
+    assert sessions.opened[0].closed
+
+    # the replica is not retried until the retry window has passed
+    sessions.replica_fails = False
+    assert (await session_from(database.get_read_db)).name == "primary"
+    assert not database.replica_available()
+
+async def test_without_replica_reads_use_primary_engine(sessions, monkeypatch):
+    monkeypatch.setattr(database, "replica_engine", None)
+    assert (await session_from(database.get_read_db)).name == "primary"
@@ -0,0 +1,145 @@
+"""
+Shared Redis pool tests
+"""
+import pytest
+from typing import Dict, List
+
+from app.config import redis as redis_config
+from app.config.settings import settings
+from app.core.metrics import InstrumentedRedis, observe_redis
+from app.core.tracing import (
+    InMemorySpanExporter,
+    SpanKind,
+    configure_tracing,
+    shutdown_tracing,
+    start_span,
+)
+from prometheus_client import REGISTRY
+from redis.asyncio import Redis
+
+pytestmark = pytest.mark.asyncio
+
+class RecordingPipeline:
+    def __init__(self, client: "RecordingRedis"):
+        self.client = client
+        self.commands: List[tuple] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def set(self, key: str, value, ex=None):
+        self.commands.append(("set", key, value, ex))
+
+    async def execute(self):
+        self.client.round_trips += 1
+        for _, key, value, ex in self.commands:
+            self.client.data[key] = (value, ex)
+        return [True] * len(self.commands)
+
+class RecordingRedis:
+    """Counts round trips of the commands used by the helpers"""
+
+    def __init__(self):
+        self.data: Dict[str, tuple] = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction: bool = True):
+        return RecordingPipeline(self)
+
+    async def mget(self, keys):
+        self.round_trips += 1
+        return [self.data.get(key, (None,))[0] for key in keys]
+
+    async def mset(self, mapping):
+        self.round_trips += 1
+        self.data.update({key: (value, None) for key, value in mapping.items()})
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    client = RecordingRedis()
+    monkeypatch.setattr(redis_config, "redis_client", client)
+    return client
+
+async def test_shared_client_is_created_once_with_bounded_pool(monkeypatch):
+    """Every caller gets the same client backed by REDIS_POOL_SIZE connections"""
+    monkeypatch.setattr(redis_config, "redis_client", None)
+    monkeypatch.setattr(redis_config, "redis_pool", None)
+    monkeypatch.setattr(settings, "ENABLE_PROMETHEUS", True)
+
+    client = await redis_config.init_redis()
+    assert await redis_config.get_redis_client() is client
+    assert await redis_config.init_redis() is client
+    assert isinstance(client, InstrumentedRedis)
+    assert client.connection_pool.max_connections == settings.REDIS_POOL_SIZE
+
+    await redis_config.close_redis()
+    assert redis_config.redis_client is None
+
+@pytest.mark.parametrize("prometheus, tracing, client_class", [
+    (True, False, InstrumentedRedis),
+    (False, True, InstrumentedRedis),
+    (False, False, Redis),
+])
+async def test_client_is_instrumented_when_metrics_or_tracing_is_on(monkeypatch, prometheus, tracing, client_class):
+    monkeypatch.setattr(redis_config, "redis_client", None)
+    monkeypatch.setattr(redis_config, "redis_pool", None)
+    monkeypatch.setattr(settings, "ENABLE_PROMETHEUS", prometheus)
+    monkeypatch.setattr(settings, "TRACING_ENABLED", tracing)
+
+    client = await redis_config.init_redis()
+    assert type(client) is client_class
+    await redis_config.close_redis()
+
+def observed(command: str) -> float:
+    count = REGISTRY.get_sample_value("redis_command_duration_seconds_count", {"command": command})
+    return count or 0
+
+@pytest.mark.parametrize("prometheus, tracing", [(True, False), (False, True)])
+async def test_redis_span_and_metric_follow_their_own_flags(monkeypatch, prometheus, tracing):
+    monkeypatch.setattr(settings, "ENABLE_PROMETHEUS", prometheus)
+    monkeypatch.setattr(settings, "TRACING_ENABLED", tracing)
+    exporter = InMemorySpanExporter()
+    configure_tracing(exporter, sample_rate=1.0)
+    before = observed("PING")
+    try:
+        with start_span("request", SpanKind.SERVER, root=True):
+            with observe_redis("PING", {"db.system": "redis"}):
+                pass
+    finally:
+        shutdown_tracing()
+
+    assert [span.name for span in exporter.spans] == (["redis.PING", "request"] if tracing else ["request"])
+    assert (observed("PING") > before) is prometheus
+
+async def test_bytes_client_has_its_own_undecoded_pool(monkeypatch):
+    """Binary values are read through a second client that returns raw bytes"""
+    monkeypatch.setattr(redis_config, "redis_client", None)
+    monkeypatch.setattr(redis_config, "redis_pool", None)
+    monkeypatch.setattr(redis_config, "redis_bytes_client", None)
+    monkeypatch.setattr(redis_config, "redis_bytes_pool", None)
+
+    client = await redis_config.get_redis_client()
+    bytes_client = await redis_config.get_redis_bytes_client()
+    assert await redis_config.get_redis_bytes_client() is bytes_client
+    assert bytes_client.connection_pool is not client.connection_pool
+    assert bytes_client.connection_pool.connection_kwargs["decode_responses"] is False
+    assert client.connection_pool.connection_kwargs["decode_responses"] is True
+
+    await redis_config.close_redis()
+    assert redis_config.redis_bytes_client is None
+
+async def test_multi_key_helpers_use_one_round_trip(fake_client):
+    """set_many/get_many batch all keys into a single request"""
+    await redis_config.set_many({f"doctor:{i}": str(i) for i in range(50)}, ttl=60)
+    assert fake_client.round_trips == 1
+    assert fake_client.data["doctor:7"] == ("7", 60)
+
+    values = await redis_config.get_many(["doctor:1", "doctor:2", "missing"])
+    assert values == ["1", "2", None]
+    assert fake_client.round_trips == 2
+
+    assert await redis_config.get_many([]) == []
+    assert fake_client.round_trips == 2
@@ -0,0 +1,125 @@
+"""
+Reminder sender tests: a reminder only counts as sent if it reached someone
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from firebase_admin import messaging
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.user import FCMToken, User
+from app.services import reminder_channels
+from app.services.notification_service import NotificationService
+from app.services.reminder_dispatcher import DueReminder
+from app.tests.sqlite_support import SyncBackedSession
+
+pytestmark = pytest.mark.asyncio
+
+class NoSession:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        pass
+
+def notification_service(db) -> NotificationService:
+    """NotificationService on `db` without the SMTP settings, which push does not use"""
+    service = NotificationService.__new__(NotificationService)
+    service.db = db
+    return service
+
+def reminder(recipient_id: str) -> DueReminder:
+    return DueReminder("appointment", recipient_id, recipient_id, "push", "Reminder", "tomorrow")
+
+async def test_push_reaching_no_device_fails(monkeypatch):
+    delivered = {"u1": 2, "u2": 0}
+
+    class FakeNotificationService:
+        def __init__(self, db):
+            pass
+
+        async def send_push_notification(self, user_id, title, body, data=None):
+            if user_id not in delivered:
+                raise RuntimeError("token lookup failed")
+            return delivered[user_id]
+
+    monkeypatch.setattr(reminder_channels, "NotificationService", FakeNotificationService)
+    errors = await reminder_channels.send_pushes(
+        NoSession, [reminder("u1"), reminder("u2"), reminder("u3")], asyncio.Semaphore(2)
+    )
+
+    assert errors[0] is None
+    assert errors[1] == "LookupError: Push reached no device of user u2"
+    assert errors[2] == "RuntimeError: token lookup failed"
+
+async def test_push_without_tokens_reports_no_delivery(monkeypatch):
+    async def no_tokens(self, user_id):
+        return []
+
+    monkeypatch.setattr(NotificationService, "_get_user_fcm_tokens", no_tokens)
+    assert await notification_service(None).send_push_notification("u1", "Reminder", "tomorrow") == 0
+
+async def test_failed_token_lookup_is_raised():
+    class BrokenSession:
+        async def execute(self, statement):
+            raise ConnectionError("database unavailable")
+
+    # whatever breaks the lookup fails the send instead of reading as no tokens
+    with pytest.raises(Exception):
+        await notification_service(BrokenSession())._get_user_fcm_tokens("u1")
+
+async def test_push_goes_to_active_tokens_and_deactivates_unregistered(monkeypatch):
+    users, tokens = User.__table__, FCMToken.__table__
+    engine = create_engine("sqlite://")
+    users.create(engine)
+    tokens.create(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(tokens), [
+            dict(id="t1", user_id="u1", token="phone", is_active=True),
+            dict(id="t2", user_id="u1", token="old-tablet", is_active=True),
+            dict(id="t3", user_id="u1", token="retired", is_active=False),
+        ])
+
+    sent = []
+
+    def send_multicast(message):
+        sent.append(message.tokens)
+        return SimpleNamespace(success_count=1, failure_count=1, responses=[
+            SimpleNamespace(success=True, exception=None),
+            SimpleNamespace(success=False, exception=messaging.UnregisteredError("gone")),
+        ])
+
+    monkeypatch.setattr(messaging, "send_multicast", send_multicast)
+    async with SyncBackedSession(Session(engine)) as db:
+        delivered = await notification_service(db).send_push_notification("u1", "Reminder", "tomorrow")
+
+    assert delivered == 1
+    assert sent == [["phone", "old-tablet"]]
+    with engine.connect() as connection:
+        active = connection.execute(select(tokens.c.token).where(tokens.c.is_active == True)).scalars().all()
+    assert active == ["phone"]
+
+async def test_email_reminders_render_the_message(monkeypatch):
+    users = User.__table__
+    engine = create_engine("sqlite://")
+    users.create(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(users).values(
+            id="u1", email="patient@example.com", password_hash="x",
+            first_name="Sara", last_name="Ali", role="PATIENT"
+        ))
+
+    sent = []
+    monkeypatch.setattr(NotificationService, "_send_smtp", lambda self, msg: sent.append(msg))
+    errors = await reminder_channels.send_emails(
+        lambda: SyncBackedSession(Session(engine)),
+        [DueReminder("appointment", "r1", "u1", "email", "Reminder", "Dr <Omar> at 10:00")],
+        asyncio.Semaphore(1),
+    )
+
+    assert errors == [None]
+    [message] = sent
+    assert message["To"] == "patient@example.com"
+    assert "Dr &lt;Omar&gt; at 10:00" in message.get_payload()[0].get_payload()
@@ -0,0 +1,124 @@
+"""
+Reminder dispatcher tests
+"""
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from app.models.appointment import AppointmentReminder
+from app.models.follow_up import FollowUp, FollowUpReminder
+from app.services import reminder_dispatcher
+from app.services.reminder_dispatcher import FAILED, SENT, ReminderDispatcher, reminder_channel, send_each
+from app.tests.sqlite_support import SyncBackedSession
+
+pytestmark = pytest.mark.asyncio
+
+TABLES = [AppointmentReminder.__table__, FollowUp.__table__, FollowUpReminder.__table__]
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        for table in TABLES:
+            # users, appointments and patients are not needed here
+            conn.execute(CreateTable(table, include_foreign_key_constraints=[]))
+    return engine
+
+@pytest.fixture
+def session_factory(engine):
+    return lambda: SyncBackedSession(Session(engine, expire_on_commit=False))
+
+@pytest.fixture
+def senders(monkeypatch):
+    registry = {}
+    monkeypatch.setattr(reminder_dispatcher, "_senders", registry)
+    return registry
+
+def seed(engine, now):
+    follow_up_id = str(uuid4())
+    with engine.begin() as conn:
+        conn.execute(insert(FollowUp.__table__), [dict(
+            id=follow_up_id, patient_id=str(uuid4()), doctor_id=str(uuid4()),
+            follow_up_type="GENERAL", title="Blood pressure check",
+            scheduled_date=now + timedelta(days=1), duration_days=7,
+        )])
+        conn.execute(insert(AppointmentReminder.__table__), [
+            dict(appointment_id=uuid4(), recipient_id=uuid4(), reminder_type="email",
+                 scheduled_time=now - timedelta(minutes=5), message="tomorrow"),
+            dict(appointment_id=uuid4(), recipient_id=uuid4(), reminder_type="sms",
+                 scheduled_time=now - timedelta(minutes=1), message="in two hours"),
+            # not due yet
+            dict(appointment_id=uuid4(), recipient_id=uuid4(), reminder_type="email",
+                 scheduled_time=now + timedelta(hours=1), message="later"),
+        ])
+        conn.execute(insert(FollowUpReminder.__table__), [
+            dict(follow_up_id=follow_up_id, recipient_id=str(uuid4()), reminder_type="SMS",
+                 scheduled_at=now - timedelta(minutes=2)),
+        ])
+
+def rows(engine, model):
+    with engine.connect() as conn:
+        return conn.execute(select(model.__table__)).all()
+
+async def test_sends_due_reminders_by_channel(engine, session_factory, senders):
+    seed(engine, datetime.utcnow())
+    batches = {}
+
+    @reminder_channel("email")
+    async def emails(factory, reminders, limit):
+        batches["email"] = [r.message for r in reminders]
+        return [None] * len(reminders)
+
+    @reminder_channel("sms")
+    async def sms(factory, reminders, limit):
+        batches["sms"] = sorted(r.source for r in reminders)
+
+        async def send(reminder):
+            if reminder.source == "follow_up":
+                raise ConnectionError("twilio unavailable")
+        return await send_each(reminders, limit, send)
+
+    claimed, outcomes = await ReminderDispatcher(session_factory).run_once()
+    assert claimed == 3
+    assert outcomes == {SENT: 2, FAILED: 1}
+    # both tables' sms reminders went to the sms sender in one group
+    assert batches == {"email": ["tomorrow"], "sms": ["appointment", "follow_up"]}
+
+    statuses = {r.message: (r.status, r.sent_at is not None) for r in rows(engine, AppointmentReminder)}
+    assert statuses == {
+        "tomorrow": ("sent", True),
+        "in two hours": ("sent", True),
+        "later": ("pending", False),
+    }
+    [follow_up] = rows(engine, FollowUpReminder)
+    assert follow_up.status == "FAILED"
+    assert "twilio unavailable" in follow_up.error
+
+    # nothing else is due
+    assert await ReminderDispatcher(session_factory).run_once() == (0, {})
+
+async def test_unknown_channel_fails(engine, session_factory, senders):
+    seed(engine, datetime.utcnow())
+    claimed, outcomes = await ReminderDispatcher(session_factory).run_once()
+    assert (claimed, outcomes) == (3, {FAILED: 3})
+    assert {r.status for r in rows(engine, AppointmentReminder) if r.message != "later"} == {"failed"}
+
+async def test_sends_of_a_channel_are_bounded():
+    running = peak = 0
+
+    async def send(reminder):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    errors = await send_each(list(range(10)), asyncio.Semaphore(3), send)
+    assert errors == [None] * 10
+    assert peak == 3
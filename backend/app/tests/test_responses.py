@@ -0,0 +1,62 @@
+"""
+Fast JSON response path tests
+"""
+import json
+import pytest
+from datetime import datetime
+from enum import Enum
+from types import SimpleNamespace
+from typing import List, Optional
+from uuid import UUID, uuid4
+
+from pydantic import BaseModel
+
+from app.core.responses import FastJSONResponse, get_type_adapter, list_adapter, orm_response
+
+pytestmark = pytest.mark.asyncio
+
+class Role(str, Enum):
+    USER = "user"
+    ASSISTANT = "assistant"
+
+class MessageOut(BaseModel):
+    id: UUID
+    role: Role
+    content: str
+    citations: List[dict] = []
+    escalation_reason: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+def make_row(i: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=uuid4(),
+        role=Role.ASSISTANT,
+        content=f"message {i}",
+        citations=[{"page": i}],
+        escalation_reason=None,
+        created_at=datetime(2024, 1, 1, 12, 0, i),
+        internal_notes="not part of the schema",
+    )
+
+async def test_orm_response_matches_model_dump():
+    """The one-pass path produces the same JSON as per-row model dumps"""
+    rows = [make_row(i) for i in range(5)]
+    response = orm_response(MessageOut, rows)
+
+    expected = [MessageOut.model_validate(row).model_dump(mode="json") for row in rows]
+    assert json.loads(response.body) == expected
+    assert response.media_type == "application/json"
+    assert "internal_notes" not in response.body.decode()
+
+async def test_list_adapters_are_cached():
+    """TypeAdapters are built once per schema"""
+    assert list_adapter(MessageOut) is list_adapter(MessageOut)
+    assert get_type_adapter(List[MessageOut]) is list_adapter(MessageOut)
+
+async def test_fast_json_response_encodes_non_string_keys():
+    """FastJSONResponse handles payloads the stdlib encoder would reject"""
+    response = FastJSONResponse({"counts": {1: 2}, "total": 3})
+    assert json.loads(response.body) == {"counts": {"1": 2}, "total": 3}
@@ -0,0 +1,56 @@
+"""
+Search index tests: the models declare what migration 20261016_0002 builds
+"""
+import importlib.util
+from pathlib import Path
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from app.models.doctor import Doctor, DoctorClinic, Hospital
+from app.models.follow_up import Interaction
+from app.models.medication import Medication
+
+pytestmark = pytest.mark.asyncio
+
+MIGRATION = Path(__file__).parents[2] / "migrations/alembic/versions/20261016_0002_search_indexes.py"
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location("search_indexes", MIGRATION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def model_indexes():
+    return {
+        index.name: str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        for model in (Doctor, DoctorClinic, Hospital, Interaction, Medication)
+        for index in model.__table__.indexes
+    }
+
+async def test_models_declare_the_migration_indexes():
+    migration = load_migration()
+    declared = model_indexes()
+
+    for name, table, column in migration.GIN_INDEXES:
+        assert f"ON {table} USING gin ({column})" in declared[name]
+    for name, table, column in migration.TRGM_INDEXES:
+        assert f"ON {table} USING gin ({column} gin_trgm_ops)" in declared[name]
+    for name, table, column in migration.GIST_INDEXES:
+        # the same expression the geo search filters on
+        assert f"ON {table} USING gist (CAST({column} AS geography))" in declared[name]
+
+async def test_migration_adds_the_indexed_columns_the_initial_schema_lacks():
+    migration = load_migration()
+    added = {
+        (table, column.name)
+        for table, columns in migration.NEW_COLUMNS.items()
+        for column in columns()
+    }
+
+    assert {("doctors", "specializations"), ("doctors", "languages"), ("doctors", "insurance_providers"),
+            ("doctors", "consultation_types"), ("hospitals", "location"), ("medications", "brand_name")} <= added
+    for table, column in added:
+        model = {"doctors": Doctor, "hospitals": Hospital, "medications": Medication}[table]
+        assert column in model.__table__.c
@@ -0,0 +1,320 @@
+"""
+Slot bitmap availability tests
+"""
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+from typing import Dict
+from uuid import uuid4
+
+import fakeredis.aioredis
+import pytest
+from fastapi import HTTPException
+
+from redis.exceptions import NoScriptError
+
+from app.config.settings import settings
+from app.schemas.doctor import DoctorSearchParams
+from app.services import appointment_service, slot_bitmap
+from app.services.slot_bitmap import (
+    MARK_SCRIPT,
+    STORE_SCRIPT,
+    SlotBitmapCache,
+    build_day,
+    earliest_slots,
+    get_day_bitmaps,
+    get_doctors_bitmaps,
+    update_appointment_slots,
+)
+
+pytestmark = pytest.mark.asyncio
+
+DAY = date(2026, 10, 19)
+
+class FakeRedis:
+    """In-memory Redis running the bitmap scripts in Python; replies are raw bytes"""
+
+    def __init__(self):
+        self.values: Dict[str, object] = {}
+        self.scripts: Dict[str, str] = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+    async def script_load(self, script):
+        sha = slot_bitmap._SCRIPT_SHAS[script]
+        self.scripts[sha] = script
+        return sha
+
+    async def unlink(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def run(self, script, keys, argv):
+        version_key, day_keys = keys[0], keys[1:]
+        if script == STORE_SCRIPT:
+            if self.values.get(version_key, "0") != argv[0]:
+                return 0
+            for key, value in zip(day_keys, argv[2:]):
+                self.values[key] = bytearray(value)
+            return 1
+        if script == MARK_SCRIPT:
+            self.values[version_key] = str(int(self.values.get(version_key, "0")) + 1)
+            for i, key in enumerate(day_keys):
+                if not argv[0]:
+                    self.values.pop(key, None)
+                elif key in self.values:
+                    for offset in range(argv[2 + 2 * i], argv[3 + 2 * i]):
+                        self.values[key][offset // 8] |= 0x80 >> (offset % 8)
+            return 1
+        raise AssertionError("unknown script")
+
+    def mget(self, keys):
+        values = [self.values.get(key) for key in keys]
+        return [value.encode() if isinstance(value, str) else value and bytes(value) for value in values]
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def evalsha(self, sha, numkeys, *args):
+        self.calls.append((sha, list(args[:numkeys]), list(args[numkeys:])))
+
+    def mget(self, keys):
+        self.calls.append((None, list(keys), []))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        if any(sha is not None and sha not in self.redis.scripts for sha, _, _ in self.calls):
+            raise NoScriptError("NOSCRIPT")
+        return [
+            self.redis.mget(keys) if sha is None else self.redis.run(self.redis.scripts[sha], keys, argv)
+            for sha, keys, argv in self.calls
+        ]
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis()
+
+    async def get_redis_client():
+        return client
+
+    monkeypatch.setattr(slot_bitmap, "get_redis_client", get_redis_client)
+    monkeypatch.setattr(slot_bitmap, "get_redis_bytes_client", get_redis_client)
+    return client
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Replace the database build with the schedule below, counting builds"""
+    calls = []
+
+    async def build_bitmaps(db, doctor_ids, first, last):
+        calls.append((first, last))
+        return {
+            (doctor_id, day): build_day(day, schedule(), [])
+            for doctor_id in doctor_ids
+            for day in slot_bitmap.days_between(first, last)
+        }
+
+    monkeypatch.setattr(slot_bitmap, "build_bitmaps", build_bitmaps)
+    return calls
+
+def schedule():
+    return SimpleNamespace(
+        time_slots=[{"start_time": "09:00", "end_time": "12:00"}],
+        break_times=[{"start_time": "10:00", "end_time": "10:30"}],
+    )
+
+def times(bitmap):
+    return [(s.start_time, s.end_time) for s in bitmap.time_slots()]
+
+async def test_build_day_subtracts_breaks_and_appointments():
+    appointment = SimpleNamespace(scheduled_at=datetime(2026, 10, 19, 9, 0), duration_minutes=30)
+    bitmap = build_day(DAY, schedule(), [appointment])
+
+    assert times(bitmap) == [(time(9, 30), time(10, 0)), (time(10, 30), time(12, 0))]
+    assert bitmap.is_free(9 * 12 + 6, 10 * 12)
+    assert not bitmap.is_free(9 * 12, 9 * 12 + 6)
+    # the break is never free, even if the booking is released
+    assert not bitmap.release(9 * 12, 9 * 12 + 6).is_free(10 * 12, 10 * 12 + 6)
+    assert bitmap.release(9 * 12, 9 * 12 + 6).is_free(9 * 12, 10 * 12)
+
+    # bytes round trip in Redis bit order
+    assert bitmap.to_bytes()[9 * 12 // 8 + 1] == 0xFF  # 09:20-09:55 is open
+    assert slot_bitmap.DayBitmap.from_bytes(DAY, bitmap.to_bytes()) == bitmap
+
+async def test_days_are_built_once_and_updated_incrementally(redis, builds):
+    doctor_id = uuid4()
+    first = await get_day_bitmaps(None, doctor_id, DAY, DAY)
+    again = await get_day_bitmaps(None, doctor_id, DAY, DAY)
+    assert builds == [(DAY, DAY)]
+    assert again == first
+
+    booking = (datetime(2026, 10, 19, 11, 0), 45)
+    await update_appointment_slots(doctor_id, None, booking)
+    [day] = (await get_day_bitmaps(None, doctor_id, DAY, DAY)).values()
+    assert times(day) == [
+        (time(9, 0), time(10, 0)), (time(10, 30), time(11, 0)), (time(11, 45), time(12, 0))
+    ]
+
+    # releasing drops the day, which is rebuilt from the database
+    await update_appointment_slots(doctor_id, booking, None)
+    assert await get_day_bitmaps(None, doctor_id, DAY, DAY) == first
+    assert len(builds) == 2
+
+async def test_build_racing_a_booking_is_not_stored(redis):
+    doctor_id = uuid4()
+    cache = SlotBitmapCache(redis)
+    version, cached = (await cache.read([doctor_id], [DAY]))[doctor_id]
+    assert (version, cached) == ("0", {})
+
+    # a booking is committed while the day is being built from the database
+    await update_appointment_slots(doctor_id, None, (datetime(2026, 10, 19, 9, 0), 30))
+    stored = await cache.store({doctor_id: (version, [build_day(DAY, schedule(), [])])})
+    assert stored == {doctor_id: False}
+    assert (await cache.read([doctor_id], [DAY]))[doctor_id][1] == {}
+
+async def test_earliest_slots_merge_doctors(redis, builds):
+    # ties at the same start are broken by doctor id
+    doctors = sorted((uuid4() for _ in range(3)), key=str)
+    bitmaps = await get_doctors_bitmaps(None, doctors, DAY, date(2026, 10, 20))
+    # one build for all doctors, one pipeline each for reading and storing
+    # (the store retried once here, after loading its script)
+    assert len(builds) == 1
+    assert redis.round_trips == 3
+
+    # the first doctor is booked all morning on the first day
+    bitmaps[doctors[0]][DAY] = build_day(DAY, schedule(), [
+        SimpleNamespace(scheduled_at=datetime(2026, 10, 19, 9, 0), duration_minutes=180)
+    ])
+    # the second is booked until 09:30
+    bitmaps[doctors[1]][DAY] = build_day(DAY, schedule(), [
+        SimpleNamespace(scheduled_at=datetime(2026, 10, 19, 9, 0), duration_minutes=30)
+    ])
+
+    start, end = datetime(2026, 10, 19, 8, 0), datetime(2026, 10, 21, 0, 0)
+    slots = earliest_slots(bitmaps, start, end, duration_minutes=30, limit=3)
+    assert slots == [
+        (doctors[2], datetime(2026, 10, 19, 9, 0)),
+        (doctors[1], datetime(2026, 10, 19, 9, 30)),
+        (doctors[0], datetime(2026, 10, 20, 9, 0)),
+    ]
+
+    slots = earliest_slots(bitmaps, start, end, duration_minutes=30, limit=3, per_doctor=2)
+    assert slots == [
+        (doctors[2], datetime(2026, 10, 19, 9, 0)),
+        (doctors[1], datetime(2026, 10, 19, 9, 30)),
+        (doctors[2], datetime(2026, 10, 19, 9, 30)),
+    ]
+
+async def test_earliest_slot_search_rejects_filters_over_the_doctor_cap(monkeypatch):
+    class Doctors:
+        """Session whose doctor query returns the first `limit` of 4 matching doctors"""
+        async def execute(self, statement):
+            ids = [uuid4() for _ in range(4)][:statement._limit]
+            return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: ids))
+
+    async def no_bitmaps(db, doctor_ids, start, end):
+        return {}
+
+    monkeypatch.setattr(appointment_service, "get_doctors_bitmaps", no_bitmaps)
+    start = datetime.utcnow() + timedelta(days=1)
+
+    # four doctors are within a cap of four
+    monkeypatch.setattr(settings, "EARLIEST_SLOTS_MAX_DOCTORS", 4)
+    assert await appointment_service.find_earliest_slots(
+        Doctors(), DoctorSearchParams(), start, start + timedelta(days=2)
+    ) == []
+
+    # a cap of three would search an arbitrary three of them
+    monkeypatch.setattr(settings, "EARLIEST_SLOTS_MAX_DOCTORS", 3)
+    with pytest.raises(HTTPException) as error:
+        await appointment_service.find_earliest_slots(
+            Doctors(), DoctorSearchParams(), start, start + timedelta(days=2)
+        )
+    assert error.value.status_code == 422
+
+def unaligned_pair():
+    """A at 09:00 for 17 minutes and B right after it at 09:17; both hold cell 111 (09:15-09:20)"""
+    return (
+        SimpleNamespace(id=uuid4(), doctor_id=None, scheduled_at=datetime(2026, 10, 19, 9, 0), duration_minutes=17),
+        SimpleNamespace(id=uuid4(), doctor_id=None, scheduled_at=datetime(2026, 10, 19, 9, 17), duration_minutes=15),
+    )
+
+async def test_releasing_an_unaligned_booking_keeps_the_neighbours_cells(redis, monkeypatch):
+    doctor_id = uuid4()
+    a, b = unaligned_pair()
+    booked = [a, b]
+
+    async def build_bitmaps(db, doctor_ids, first, last):
+        return {
+            (doctor, day): build_day(day, schedule(), booked)
+            for doctor in doctor_ids
+            for day in slot_bitmap.days_between(first, last)
+        }
+
+    monkeypatch.setattr(slot_bitmap, "build_bitmaps", build_bitmaps)
+    [day] = (await get_day_bitmaps(None, doctor_id, DAY, DAY)).values()
+    assert not day.is_free(111, 112)
+
+    # A is cancelled: clearing its cells would free 09:15-09:20, which B still holds
+    booked.remove(a)
+    await update_appointment_slots(doctor_id, (a.scheduled_at, a.duration_minutes), None)
+    [day] = (await get_day_bitmaps(None, doctor_id, DAY, DAY)).values()
+    assert day.is_free(108, 111)
+    assert not day.is_free(111, 112)
+
+async def test_rescheduling_does_not_free_cells_shared_with_the_next_booking(monkeypatch):
+    doctor_id = uuid4()
+    a, b = unaligned_pair()
+    a.doctor_id = b.doctor_id = doctor_id
+
+    async def get_day_bitmaps(db, doctor, first, last):
+        return {DAY: build_day(DAY, schedule(), [a, b])}
+
+    Span = namedtuple("Span", "scheduled_at duration_minutes")
+    Row = namedtuple("Row", "doctor_id scheduled_at duration_minutes")
+
+    class Appointments:
+        """Returns the excluded appointment's span, then its neighbours"""
+        def __init__(self):
+            self.calls = 0
+
+        async def execute(self, statement):
+            self.calls += 1
+            if self.calls == 1:
+                return SimpleNamespace(first=lambda: Span(a.scheduled_at, a.duration_minutes))
+            return [Row(b.doctor_id, b.scheduled_at, b.duration_minutes)]
+
+    monkeypatch.setattr(appointment_service, "get_day_bitmaps", get_day_bitmaps)
+
+    # moving A to 09:05 for 10 minutes stays within cells A alone holds
+    assert await appointment_service.is_slot_available(
+        Appointments(), doctor_id, datetime(2026, 10, 19, 9, 5), 10, exclude_appointment_id=a.id
+    )
+    # moving A to 09:10 for 10 minutes needs cell 111, which B still occupies
+    assert not await appointment_service.is_slot_available(
+        Appointments(), doctor_id, datetime(2026, 10, 19, 9, 10), 10, exclude_appointment_id=a.id
+    )
+
+async def test_mark_script_sets_booked_bits_and_drops_released_days():
+    client = fakeredis.aioredis.FakeRedis()
+    cache = SlotBitmapCache(client)
+    doctor_id = uuid4()
+    key = cache.day_key(doctor_id, DAY)
+    await client.set(key, build_day(DAY, schedule(), []).to_bytes())
+
+    await cache.mark(doctor_id, {DAY: (108, 113)}, booked=True)
+    assert not slot_bitmap.DayBitmap.from_bytes(DAY, await client.get(key)).is_free(108, 113)
+
+    await cache.mark(doctor_id, {DAY: (108, 113)}, booked=False)
+    assert await client.get(key) is None
+    assert await client.get(cache.version_key(doctor_id)) == b"2"
@@ -0,0 +1,102 @@
+"""
+Worker startup tests: schema version check and pool prewarm
+"""
+import pytest
+from typing import List
+
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, text
+
+from app.config import database
+from app.config import redis as redis_config
+
+pytestmark = pytest.mark.asyncio
+
+class SyncBackedConnection:
+    """Async connection facade over a sync (sqlite) connection"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def run_sync(self, fn):
+        return fn(self.connection)
+
+class SyncBackedEngine:
+    def __init__(self):
+        self.sync_engine = create_engine("sqlite://")
+        self.connection = self.sync_engine.connect()
+
+    def connect(self):
+        return SyncBackedConnection(self.connection)
+
+@pytest.fixture
+def sqlite_engine(monkeypatch):
+    engine = SyncBackedEngine()
+    monkeypatch.setattr(database, "engine", engine)
+    yield engine
+    engine.connection.close()
+
+def stamp(engine: SyncBackedEngine, revision: str) -> None:
+    engine.connection.execute(text("CREATE TABLE alembic_version (version_num VARCHAR(32) PRIMARY KEY)"))
+    engine.connection.execute(text(f"INSERT INTO alembic_version VALUES ('{revision}')"))
+
+async def test_schema_check_passes_at_head(sqlite_engine):
+    head = ScriptDirectory(str(database.MIGRATIONS_DIR)).get_heads()[0]
+    stamp(sqlite_engine, head)
+    assert await database.DatabaseManager.check_schema_version() == head
+
+async def test_schema_check_fails_on_unmigrated_database(sqlite_engine):
+    with pytest.raises(database.SchemaVersionError, match="no revision"):
+        await database.DatabaseManager.check_schema_version()
+
+async def test_schema_check_fails_behind_head(sqlite_engine):
+    stamp(sqlite_engine, "00000000_0000")
+    with pytest.raises(database.SchemaVersionError, match="alembic upgrade head"):
+        await database.DatabaseManager.check_schema_version()
+
+class FakeConnection:
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+
+    async def send_command(self, *args):
+        self.pool.commands.append(args)
+
+    async def read_response(self):
+        return "PONG"
+
+class FakePool:
+    max_connections = 3
+
+    def __init__(self):
+        self.checked_out = 0
+        self.peak = 0
+        self.commands: List[tuple] = []
+
+    async def get_connection(self, command_name, *keys, **options):
+        self.checked_out += 1
+        self.peak = max(self.peak, self.checked_out)
+        return FakeConnection(self)
+
+    async def release(self, connection):
+        self.checked_out -= 1
+
+class FakeRedis:
+    def __init__(self):
+        self.connection_pool = FakePool()
+
+async def test_redis_prewarm_holds_connections_open_together(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(redis_config, "redis_client", client)
+
+    # capped at the pool size
+    assert await redis_config.prewarm_redis(10) == 3
+    pool = client.connection_pool
+    assert pool.peak == 3
+    assert pool.checked_out == 0
+    assert pool.commands == [("PING",)] * 3
@@ -0,0 +1,143 @@
+"""
+Request tracing tests
+"""
+import json
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlalchemy import create_engine, text
+
+from stripe.http_client import RequestsClient
+from twilio.http.http_client import TwilioHttpClient
+
+from app.core.middleware import TracingMiddleware
+from app.core.tracing import (
+    TRACEPARENT_HEADER,
+    InMemorySpanExporter,
+    JSONFileSpanExporter,
+    SpanKind,
+    client_span,
+    configure_tracing,
+    instrument_engine_tracing,
+    parse_traceparent,
+    shutdown_tracing,
+    start_span,
+)
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.fixture
+def exporter():
+    exporter = InMemorySpanExporter()
+    configure_tracing(exporter, sample_rate=1.0)
+    yield exporter
+    shutdown_tracing()
+
+async def test_child_spans_share_trace_and_link_to_parent(exporter):
+    """Spans opened inside a root span form one trace"""
+    with start_span("request", SpanKind.SERVER, root=True) as root:
+        with start_span("ml.generate", attributes={"ml.model": "medical"}):
+            pass
+
+    # Without an enclosing trace nothing is recorded
+    with start_span("orphan") as orphan:
+        assert orphan is None
+
+    child, parent = exporter.spans
+    assert parent is root
+    assert child.trace_id == root.trace_id
+    assert child.parent_id == root.span_id
+    assert child.attributes["ml.model"] == "medical"
+    assert child.duration_ms >= 0
+
+async def test_parse_traceparent_rejects_malformed_headers():
+    """Only well-formed W3C traceparent values are accepted"""
+    context = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+    assert context.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert context.sampled
+
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("00-xyz-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("garbage") is None
+
+async def test_middleware_continues_incoming_trace(exporter):
+    """The server span joins the caller's trace and is named by route template"""
+    app = FastAPI()
+
+    @app.get("/doctors/{doctor_id}")
+    async def get_doctor(doctor_id: str):
+        with start_span("db.SELECT", SpanKind.CLIENT):
+            return {"id": doctor_id}
+
+    app.add_middleware(TracingMiddleware)
+    incoming = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/doctors/42", headers={"traceparent": incoming})
+
+    assert response.status_code == 200
+    trace = exporter.get_trace("4bf92f3577b34da6a3ce929d0e0e4736")
+    server = next(span for span in trace if span.kind == SpanKind.SERVER)
+    db_span = next(span for span in trace if span.name == "db.SELECT")
+
+    assert server.name == "GET /doctors/{doctor_id}"
+    assert server.parent_id == "00f067aa0ba902b7"
+    assert server.attributes["http.status_code"] == 200
+    assert db_span.parent_id == server.span_id
+    assert response.headers["traceresponse"] == server.context.traceparent
+
+async def test_unsampled_incoming_trace_is_not_recorded(exporter):
+    """A caller's sampled=0 decision is honoured"""
+    with start_span("request", parent=parse_traceparent(
+        "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00"
+    )) as span:
+        assert span is None
+    assert exporter.spans == []
+
+async def test_sqlalchemy_statements_are_traced(exporter):
+    """Every cursor execution becomes a client span with its statement"""
+    engine = create_engine("sqlite://")
+    instrument_engine_tracing(engine)
+
+    with start_span("request", root=True) as root:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    db_spans = [span for span in exporter.spans if span.name == "db.SELECT"]
+    assert len(db_spans) == 1
+    assert db_spans[0].parent_id == root.span_id
+    assert db_spans[0].attributes["db.statement"] == "SELECT 1"
+    assert db_spans[0].attributes["db.system"] == "sqlite"
+
+async def test_outgoing_stripe_and_twilio_requests_carry_the_client_span(exporter, monkeypatch):
+    """The SDK HTTP clients send the traceparent of the span around the call"""
+    from app.services.notification_service import TracedTwilioClient
+    from app.services.payment_service import TracedStripeClient
+
+    sent = []
+    monkeypatch.setattr(RequestsClient, "request", lambda self, method, url, headers, post_data=None: sent.append(headers))
+    monkeypatch.setattr(TwilioHttpClient, "request", lambda self, method, url, headers=None, **kwargs: sent.append(headers))
+
+    with start_span("request", root=True):
+        with client_span("stripe", "Refund.create") as stripe_span:
+            TracedStripeClient().request("post", "https://api.stripe.com/v1/refunds", {"Idempotency-Key": "k"})
+        with client_span("twilio", "messages.create") as twilio_span:
+            TracedTwilioClient().request("POST", "https://api.twilio.com/Messages.json", data={"To": "+1"})
+
+    assert sent == [
+        {"Idempotency-Key": "k", TRACEPARENT_HEADER: stripe_span.context.traceparent},
+        {TRACEPARENT_HEADER: twilio_span.context.traceparent},
+    ]
+
+async def test_json_file_exporter_writes_span_lines(tmp_path):
+    """The file exporter flushes batched spans as JSON lines on shutdown"""
+    path = tmp_path / "traces.jsonl"
+    configure_tracing(JSONFileSpanExporter(str(path)), sample_rate=1.0)
+    with start_span("request", root=True):
+        with start_span("redis.GET", SpanKind.CLIENT):
+            pass
+    shutdown_tracing()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["name"] for record in records] == ["redis.GET", "request"]
+    assert records[0]["parent_id"] == records[1]["span_id"]
+    assert records[0]["kind"] == "client"
@@ -0,0 +1,108 @@
+"""
+Unit of work tests
+"""
+import pytest
+
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine, event, func, select
+from sqlalchemy.orm import Session, declarative_base
+
+from app.core.unit_of_work import unit_of_work
+from app.tests.sqlite_support import SyncBackedSession
+
+pytestmark = pytest.mark.asyncio
+
+Base = declarative_base()
+
+class Booking(Base):
+    __tablename__ = "bookings"
+
+    id = Column(Integer, primary_key=True)
+    reason = Column(String(50))
+
+class Reminder(Base):
+    __tablename__ = "reminders"
+
+    id = Column(Integer, primary_key=True)
+    booking_id = Column(Integer, ForeignKey("bookings.id"), nullable=False)
+    channel = Column(String(10))
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    stats = {"commits": 0, "statements": []}
+
+    @event.listens_for(engine, "commit")
+    def on_commit(conn):
+        stats["commits"] += 1
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        stats["statements"].append(statement)
+
+    with Session(engine) as session:
+        facade = SyncBackedSession(session)
+        facade.stats = stats
+        yield facade
+
+async def add_reminders(db, booking_id: int, channels):
+    """A helper that writes on its own, like create_appointment_reminders"""
+    async with unit_of_work(db) as uow:
+        uow.insert(Reminder, [dict(booking_id=booking_id, channel=channel) for channel in channels])
+
+async def count(db, model) -> int:
+    return await db.scalar(select(func.count()).select_from(model))
+
+async def test_operation_commits_once_with_bulk_inserts(db):
+    async with unit_of_work(db) as uow:
+        uow.add(Booking(id=1, reason="checkup"))
+        await add_reminders(db, 1, ["email", "sms"])
+        await add_reminders(db, 1, ["push"])
+        assert uow.pending_rows == 3
+        assert db.stats["commits"] == 0
+
+    assert db.stats["commits"] == 1
+    inserts = [s for s in db.stats["statements"] if s.startswith("INSERT INTO reminders")]
+    # the three rows go out as a single executemany
+    assert len(inserts) == 1
+    assert await count(db, Reminder) == 3
+    assert "unit_of_work" not in db.info
+
+async def test_helper_on_its_own_commits(db):
+    async with unit_of_work(db) as uow:
+        uow.add(Booking(id=1))
+    await add_reminders(db, 1, ["email"])
+    assert db.stats["commits"] == 2
+    assert await count(db, Reminder) == 1
+
+async def test_failure_rolls_back_every_write(db):
+    with pytest.raises(ValueError):
+        async with unit_of_work(db) as uow:
+            uow.add(Booking(id=1))
+            await uow.flush()
+            await add_reminders(db, 1, ["email"])
+            raise ValueError("slot taken")
+
+    assert db.stats["commits"] == 0
+    assert await count(db, Booking) == 0
+    assert await count(db, Reminder) == 0
+    assert "unit_of_work" not in db.info
+
+async def test_after_commit_runs_only_once_committed(db):
+    seen = []
+
+    async def record(label):
+        seen.append((label, db.stats["commits"]))
+
+    async with unit_of_work(db) as uow:
+        uow.add(Booking(id=1))
+        async with unit_of_work(db) as inner:
+            inner.after_commit(record, "booked")
+        assert seen == []
+    assert seen == [("booked", 1)]
+
+    with pytest.raises(ValueError):
+        async with unit_of_work(db) as uow:
+            uow.after_commit(record, "rolled back")
+            raise ValueError("slot taken")
+    assert seen == [("booked", 1)]
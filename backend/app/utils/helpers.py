@@ -3,6 +3,7 @@ Helper utilities and functions
 """
 from typing import Any, Dict, List, Optional, Union
 from datetime import datetime, timedelta
+import html
 import json
 import re
 import uuid
@@ -10,6 +11,14 @@ import pytz
 from geopy.distance import geodesic
 from slugify import slugify
 
+EMAIL_TEMPLATE = """<!DOCTYPE html>
+<html>
+<body style="font-family: Arial, sans-serif; color: #222;">
+<div class="{template_type}">{body}</div>
+</body>
+</html>
+"""
+
 def generate_uuid() -> str:
     """Generate UUID string"""
     return str(uuid.uuid4())
@@ -154,3 +163,11 @@ def deep_merge(dict1: Dict[str, Any], dict2: Dict[str, Any]) -> Dict[str, Any]:
             result[key] = value
     
     return result
+
+def render_template(template_type: str, context: Dict[str, Any]) -> str:
+    """Render the HTML body of a notification email; values are escaped, newlines kept"""
+    message = html.escape(str(context.get("message", "")))
+    return EMAIL_TEMPLATE.format(
+        template_type=html.escape(template_type),
+        body=message.replace("\n", "<br>")
+    )
@@ -1,9 +1,12 @@
 """
 Logging configuration and utilities
 """
+import atexit
+import copy
 import logging
 import logging.handlers
 import json
+import queue
 from datetime import datetime
 from pathlib import Path
 import sys
@@ -12,9 +15,22 @@ from typing import Any, Dict, Optional
 
 from app.config.settings import settings
 
-# Create logs directory if it doesn't exist
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
 log_dir = Path("logs")
-log_dir.mkdir(exist_ok=True)
+
+# Background listener owning every real handler; None until setup_logging()
+_queue_listener: Optional["DrainingQueueListener"] = None
+_listener_running = False
+
+def _dumps(data: Dict[str, Any]) -> str:
+    """Serialize a log record dict with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    return json.dumps(data, default=str)
 
 class JSONFormatter(logging.Formatter):
     """
@@ -43,7 +59,55 @@ class JSONFormatter(logging.Formatter):
         if hasattr(record, "extra_fields"):
             log_data.update(record.extra_fields)
         
-        return json.dumps(log_data)
+        return _dumps(log_data)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler for an in-process listener thread
+    
+    Only the message is rendered on the calling thread; JSON encoding,
+    traceback formatting and file I/O happen on the listener thread.
+    Records are dropped rather than blocking when the queue is full.
+    """
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now, since they may be mutated after this call returns.
+        # exc_info is kept: the queue is never pickled, so the listener can
+        # still build the structured exception payload.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """
+    Queue listener that can be stopped while the queue is full
+    
+    The stock listener enqueues its stop sentinel with put_nowait and raises
+    queue.Full when the bounded queue has no room. The listener thread is
+    still draining at that point, so the sentinel waits for a free slot; only
+    a listener that stopped draining costs the oldest queued record.
+    """
+    
+    sentinel_timeout = 5.0
+    
+    def enqueue_sentinel(self) -> None:
+        try:
+            self.queue.put(self._sentinel, timeout=self.sentinel_timeout)
+        except queue.Full:
+            self.queue.get_nowait()
+            self.queue.put_nowait(self._sentinel)
 
 def setup_logging(
     level: str = settings.LOGGING_LEVEL,
@@ -52,19 +116,36 @@ def setup_logging(
 ) -> None:
     """
     Setup logging configuration
+    
+    Safe to call more than once: handlers are installed only on the first
+    call, later calls update the level and restart the listener after
+    shutdown_logging().
     """
+    global _queue_listener, _listener_running
+    
     # Create root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
     
+    if _queue_listener is not None:
+        if not _listener_running:
+            _queue_listener.start()
+            _listener_running = True
+        return
+    
     # Create formatters
     json_formatter = JSONFormatter()
     console_formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
+    handlers = []
+    
     # Add file handler if enabled
     if log_to_file:
+        # Create logs directory if it doesn't exist
+        log_dir.mkdir(exist_ok=True)
+        
         # Regular log file
         file_handler = logging.handlers.RotatingFileHandler(
             log_dir / "app.log",
@@ -73,7 +154,7 @@ def setup_logging(
             encoding="utf-8"
         )
         file_handler.setFormatter(json_formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
         
         # Error log file
         error_handler = logging.handlers.RotatingFileHandler(
@@ -84,13 +165,43 @@ def setup_logging(
         )
         error_handler.setLevel(logging.ERROR)
         error_handler.setFormatter(json_formatter)
-        root_logger.addHandler(error_handler)
+        handlers.append(error_handler)
     
     # Add stdout handler if enabled
     if log_to_stdout:
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(console_formatter)
-        root_logger.addHandler(console_handler)
+        handlers.append(console_handler)
+    
+    # The root logger only enqueues; a background thread does the writing
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    root_logger.addHandler(NonBlockingQueueHandler(log_queue))
+    
+    _queue_listener = DrainingQueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _queue_listener.start()
+    _listener_running = True
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """
+    Flush queued records and stop the background listener
+    
+    The queue handler stays on the root logger: records logged afterwards wait
+    in the queue (or are dropped once it is full) until setup_logging()
+    restarts the listener, e.g. in the next application lifespan.
+    """
+    global _listener_running
+    
+    if not _listener_running:
+        return
+    
+    _listener_running = False
+    _queue_listener.stop()
+    # File handlers reopen their file on the next record after a restart
+    for handler in _queue_listener.handlers:
+        handler.close()
 
 class Logger:
     """
@@ -136,5 +247,5 @@ def get_logger(name: str) -> Logger:
     """
     return Logger(name)
 
-# Setup logging on module import
-setup_logging()
+# Default application logger for modules that import it directly
+logger = get_logger("app")
@@ -0,0 +1,3 @@
+"""
+Background workers run as their own processes
+"""
@@ -0,0 +1,35 @@
+"""
+Outbox relay worker
+
+Carries out the side effects recorded in the outbox_events table. Several
+relays can run at once; each claims its own batches.
+
+Usage (from the backend directory):
+    python -m app.workers.outbox_relay
+"""
+import asyncio
+import signal
+
+from app.config.database import AsyncSessionLocal, engine
+from app.core.outbox import OutboxRelay
+from app.utils.logger import logger, setup_logging
+
+# registers the handlers of every topic
+import app.services.outbox_handlers  # noqa: F401
+
+async def main() -> None:
+    relay = OutboxRelay(AsyncSessionLocal)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, relay.stop)
+
+    logger.info(f"Outbox relay started (batch {relay.batch_size})")
+    try:
+        await relay.run()
+    finally:
+        await engine.dispose()
+        logger.info("Outbox relay stopped")
+
+if __name__ == "__main__":
+    setup_logging(log_to_file=False)
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+"""
+Reminder dispatcher worker
+
+Sends the due appointment and follow-up reminders. Several dispatchers can
+run at once; each claims its own batches.
+
+Usage (from the backend directory):
+    python -m app.workers.reminder_dispatcher
+"""
+import asyncio
+import signal
+
+from app.config.database import AsyncSessionLocal, engine
+from app.services.reminder_dispatcher import ReminderDispatcher
+from app.utils.logger import logger, setup_logging
+
+# registers the sender of every channel
+import app.services.reminder_channels  # noqa: F401
+
+async def main() -> None:
+    dispatcher = ReminderDispatcher(AsyncSessionLocal)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, dispatcher.stop)
+
+    logger.info(f"Reminder dispatcher started (batch {dispatcher.batch_size})")
+    try:
+        await dispatcher.run()
+    finally:
+        await engine.dispose()
+        logger.info("Reminder dispatcher stopped")
+
+if __name__ == "__main__":
+    setup_logging(log_to_file=False)
+    asyncio.run(main())
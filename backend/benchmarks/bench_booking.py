@@ -0,0 +1,141 @@
+"""
+Booking write path benchmark
+
+Books appointments against the configured database two ways and reports
+commits, statements, latency and WAL bytes per booking:
+
+- per-step: the previous flow, committing the appointment, then the
+  reminders, then the notifications (three commits and a refresh).
+- unit-of-work: app.services.appointment_service.create_appointment, which
+  writes all of it in one transaction with bulk inserts.
+
+The availability check is skipped so only the writes are measured. The
+appointments, reminders and notifications created are deleted afterwards.
+Needs the ids of an existing doctor and patient user.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_booking --doctor-id <uuid> --patient-id <uuid> --bookings 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+from uuid import UUID, uuid4
+
+from sqlalchemy import delete, event, text
+
+from app.config.database import AsyncSessionLocal, engine
+from app.core.query_log import count_queries, instrument_query_counting
+from app.models.appointment import Appointment, AppointmentNotification, AppointmentReminder
+from app.schemas.appointment import AppointmentCreate, AppointmentType
+from app.services.appointment_service import (
+    create_appointment,
+    create_appointment_reminders,
+    notify_appointment_creation,
+)
+
+Booking = Callable[[object, AppointmentCreate], Awaitable[Appointment]]
+
+async def book_per_step(db, data: AppointmentCreate) -> Appointment:
+    appointment = Appointment(id=uuid4(), **data.dict())
+    db.add(appointment)
+    await db.commit()
+    await db.refresh(appointment)
+    # outside an operation's unit of work each helper commits on its own
+    await create_appointment_reminders(db, appointment)
+    await notify_appointment_creation(db, appointment)
+    return appointment
+
+async def book_unit_of_work(db, data: AppointmentCreate) -> Appointment:
+    return await create_appointment(db, data, check_availability=False)
+
+MODES: Dict[str, Booking] = {
+    "per-step": book_per_step,
+    "unit-of-work": book_unit_of_work,
+}
+
+commits = 0
+
+@event.listens_for(engine.sync_engine, "commit")
+def count_commit(conn):
+    global commits
+    commits += 1
+
+async def wal_lsn() -> str:
+    async with engine.connect() as conn:
+        return (await conn.execute(text("SELECT pg_current_wal_lsn()"))).scalar()
+
+async def wal_bytes_since(lsn: str) -> int:
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), CAST(:lsn AS pg_lsn))"),
+            {"lsn": lsn},
+        )
+        return int(result.scalar())
+
+async def cleanup(appointment_ids: List[UUID]) -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (AppointmentNotification, AppointmentReminder):
+            await db.execute(delete(model).where(model.appointment_id.in_(appointment_ids)))
+        await db.execute(delete(Appointment).where(Appointment.id.in_(appointment_ids)))
+        await db.commit()
+
+async def run_mode(name: str, book: Booking, args: argparse.Namespace) -> dict:
+    global commits
+    start_at = datetime.utcnow().replace(microsecond=0) + timedelta(days=365)
+    latencies, ids = [], []
+    commits = 0
+    lsn = await wal_lsn()
+
+    with count_queries() as queries:
+        for i in range(args.bookings):
+            data = AppointmentCreate(
+                doctor_id=args.doctor_id,
+                patient_id=args.patient_id,
+                appointment_type=AppointmentType.IN_PERSON,
+                scheduled_at=start_at + timedelta(minutes=30 * i),
+                duration_minutes=30,
+                reason="benchmark",
+                fee=0,
+            )
+            async with AsyncSessionLocal() as db:
+                started = time.perf_counter()
+                appointment = await book(db, data)
+                latencies.append((time.perf_counter() - started) * 1000)
+            ids.append(appointment.id)
+
+    booking_commits = commits
+    wal = await wal_bytes_since(lsn)
+    await cleanup(ids)
+
+    latencies.sort()
+    return {
+        "mode": name,
+        "commits": booking_commits / args.bookings,
+        "statements": queries.total / args.bookings,
+        "mean_ms": statistics.mean(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "wal_bytes": wal / args.bookings,
+    }
+
+async def main(args: argparse.Namespace) -> None:
+    instrument_query_counting(engine)
+    results = [await run_mode(name, book, args) for name, book in MODES.items()]
+    await engine.dispose()
+
+    print(f"{args.bookings} bookings per mode, values per booking")
+    print(f"{'mode':<14}{'commits':>9}{'statements':>12}{'mean ms':>10}{'p95 ms':>10}{'WAL bytes':>11}")
+    for r in results:
+        print(
+            f"{r['mode']:<14}{r['commits']:>9.1f}{r['statements']:>12.1f}"
+            f"{r['mean_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['wal_bytes']:>11.0f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--doctor-id", type=UUID, required=True)
+    parser.add_argument("--patient-id", type=UUID, required=True)
+    parser.add_argument("--bookings", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
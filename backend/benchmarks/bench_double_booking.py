@@ -0,0 +1,182 @@
+"""
+Double booking load test
+
+Fires concurrent booking attempts for a few doctors and slots at the
+configured database and reports, per mode, how many attempts were booked
+or rejected, the throughput and how many overlapping active bookings ended
+up in the table:
+
+- check-then-insert: the previous flow, an overlap COUNT and then the
+  INSERT in one transaction; concurrent attempts both pass the check.
+- advisory-lock: the same check serialized per doctor with
+  pg_advisory_xact_lock; correct, but bookings of a doctor queue up.
+- exclusion: a plain INSERT into a table with the appointments exclusion
+  constraint (ex_appointments_doctor_time); a conflicting attempt fails
+  with SQLSTATE 23P01 and nothing waits on a lock held in application code.
+
+Each mode books into its own unlogged scratch table with the columns the
+constraint uses, created in the configured database and dropped at the end,
+so real appointments are not touched and the race stays observable for the
+unconstrained modes. The btree_gist extension is created if missing.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_double_booking --attempts 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config.database import engine
+
+TABLE_COLUMNS = """
+    id uuid PRIMARY KEY,
+    doctor_id uuid NOT NULL,
+    scheduled_at timestamp NOT NULL,
+    duration_minutes integer NOT NULL,
+    status varchar(20) NOT NULL DEFAULT 'PENDING',
+    time_range tsrange GENERATED ALWAYS AS
+        (tsrange(scheduled_at, scheduled_at + duration_minutes * interval '1 minute', '[)')) STORED
+"""
+
+EXCLUSION = """,
+    EXCLUDE USING gist (doctor_id WITH =, time_range WITH &&)
+        WHERE (status IN ('PENDING', 'CONFIRMED'))
+"""
+
+Attempt = Callable[[AsyncConnection, str, UUID, datetime, int], Awaitable[bool]]
+
+async def insert(conn: AsyncConnection, table: str, doctor_id: UUID, start: datetime, minutes: int) -> None:
+    await conn.execute(
+        text(f"INSERT INTO {table} (id, doctor_id, scheduled_at, duration_minutes) VALUES (:id, :doctor, :start, :minutes)"),
+        {"id": uuid4(), "doctor": doctor_id, "start": start, "minutes": minutes},
+    )
+
+async def overlaps(conn: AsyncConnection, table: str, doctor_id: UUID, start: datetime, minutes: int) -> int:
+    result = await conn.execute(
+        text(
+            f"SELECT count(*) FROM {table} WHERE doctor_id = :doctor "
+            f"AND status IN ('PENDING', 'CONFIRMED') "
+            f"AND scheduled_at < :end "
+            f"AND scheduled_at + duration_minutes * interval '1 minute' > :start"
+        ),
+        {"doctor": doctor_id, "start": start, "end": start + timedelta(minutes=minutes)},
+    )
+    return result.scalar()
+
+async def check_then_insert(conn, table, doctor_id, start, minutes) -> bool:
+    if await overlaps(conn, table, doctor_id, start, minutes):
+        return False
+    await insert(conn, table, doctor_id, start, minutes)
+    return True
+
+async def advisory_lock(conn, table, doctor_id, start, minutes) -> bool:
+    await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": str(doctor_id)})
+    return await check_then_insert(conn, table, doctor_id, start, minutes)
+
+async def exclusion(conn, table, doctor_id, start, minutes) -> bool:
+    # a conflict raises 23P01 and rolls the transaction back, see worker()
+    await insert(conn, table, doctor_id, start, minutes)
+    return True
+
+MODES: Dict[str, Tuple[Attempt, bool]] = {
+    "check-then-insert": (check_then_insert, False),
+    "advisory-lock": (advisory_lock, False),
+    "exclusion": (exclusion, True),
+}
+
+async def double_booked(table: str) -> int:
+    """Pairs of active bookings of the same doctor whose ranges overlap"""
+    async with engine.connect() as conn:
+        result = await conn.execute(text(
+            f"SELECT count(*) FROM {table} a JOIN {table} b "
+            f"ON a.doctor_id = b.doctor_id AND a.id < b.id AND a.time_range && b.time_range"
+        ))
+        return result.scalar()
+
+async def run_mode(name: str, attempt: Attempt, constrained: bool, args: argparse.Namespace) -> dict:
+    table = f"bench_double_booking_{name.replace('-', '_')}"
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        await conn.execute(text(f"CREATE UNLOGGED TABLE {table} ({TABLE_COLUMNS}{EXCLUSION if constrained else ''})"))
+
+    # the same workload for every mode: random doctor and start, 30 minute
+    # bookings on a 15 minute grid so neighbouring attempts overlap partially
+    rng = random.Random(args.seed)
+    doctors = [uuid4() for _ in range(args.doctors)]
+    day = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    work = [
+        (rng.choice(doctors), day + timedelta(minutes=15 * rng.randrange(args.slots)))
+        for _ in range(args.attempts)
+    ]
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in work:
+        queue.put_nowait(item)
+
+    latencies: List[float] = []
+    booked = 0
+
+    async def worker() -> None:
+        nonlocal booked
+        while not queue.empty():
+            doctor_id, start = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                async with engine.begin() as conn:
+                    if await attempt(conn, table, doctor_id, start, 30):
+                        booked += 1
+            except IntegrityError as e:
+                if getattr(e.orig, "sqlstate", None) != "23P01":
+                    raise
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    conflicts = await double_booked(table)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE {table}"))
+
+    latencies.sort()
+    return {
+        "mode": name,
+        "booked": booked,
+        "rejected": args.attempts - booked,
+        "double_booked": conflicts,
+        "per_second": args.attempts / elapsed,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+async def main(args: argparse.Namespace) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    results = [await run_mode(name, attempt, constrained, args) for name, (attempt, constrained) in MODES.items()]
+    await engine.dispose()
+
+    print(
+        f"{args.attempts} attempts, {args.concurrency} concurrent, "
+        f"{args.doctors} doctors x {args.slots} start times"
+    )
+    print(f"{'mode':<19}{'booked':>8}{'rejected':>10}{'double':>8}{'attempts/s':>12}{'p95 ms':>10}")
+    for r in results:
+        print(
+            f"{r['mode']:<19}{r['booked']:>8}{r['rejected']:>10}{r['double_booked']:>8}"
+            f"{r['per_second']:>12.0f}{r['p95_ms']:>10.2f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--slots", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
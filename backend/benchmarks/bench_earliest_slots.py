@@ -0,0 +1,121 @@
+"""
+Earliest available slot search benchmark
+
+Times the in-process part of find_earliest_slots for many doctors with
+random schedules and bookings over a date window:
+
+- build: bitmaps built from schedule and appointment rows, as
+  build_bitmaps does after its two queries (cache misses)
+- decode: bitmaps decoded from the hex values the Redis read script returns
+- merge: the heap merge picking the earliest slots
+
+The database query for the doctors and the Redis pipeline add one round
+trip each (two more queries for days missing from Redis).
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_earliest_slots --doctors 1000 --days 7
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+from uuid import uuid4
+
+from app.services.slot_bitmap import (
+    DayBitmap,
+    booked_masks,
+    days_between,
+    earliest_slots,
+    open_mask,
+)
+
+def random_day(rng: random.Random, doctor_id, day: date) -> tuple:
+    """A schedule row and the appointment rows of one doctor day"""
+    if rng.random() < 0.2:
+        return None, []
+    opens = rng.choice([8, 9, 10])
+    schedule = SimpleNamespace(
+        time_slots=[
+            {"start_time": f"{opens:02d}:00", "end_time": "13:00"},
+            {"start_time": "14:00", "end_time": f"{rng.choice([17, 18, 20])}:00"},
+        ],
+        break_times=[{"start_time": "11:00", "end_time": "11:15"}],
+    )
+    appointments = [
+        SimpleNamespace(
+            doctor_id=doctor_id,
+            scheduled_at=datetime.combine(day, datetime.min.time()) + timedelta(minutes=30 * slot),
+            duration_minutes=30,
+        )
+        for slot in rng.sample(range(opens * 2, 40), rng.randint(5, 20))
+    ]
+    return schedule, appointments
+
+def timed(runs: int, work: Callable[[], object]) -> List[float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        work()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    first = date.today() + timedelta(days=1)
+    days = days_between(first, first + timedelta(days=args.days - 1))
+    doctor_ids = [uuid4() for _ in range(args.doctors)]
+    schedules, appointments = {}, []
+    for doctor_id in doctor_ids:
+        for day in days:
+            schedules[(doctor_id, day)], day_appointments = random_day(rng, doctor_id, day)
+            appointments.extend(day_appointments)
+
+    def build() -> Dict:
+        booked = booked_masks(appointments)
+        return {
+            doctor_id: {
+                day: DayBitmap(
+                    day,
+                    open=open_mask(schedules[(doctor_id, day)]),
+                    booked=booked.get((doctor_id, day), 0),
+                )
+                for day in days
+            }
+            for doctor_id in doctor_ids
+        }
+
+    bitmaps = build()
+    cached = {
+        doctor_id: {day: b.to_bytes().hex() for day, b in doctor_days.items()}
+        for doctor_id, doctor_days in bitmaps.items()
+    }
+
+    def decode() -> Dict:
+        return {
+            doctor_id: {day: DayBitmap.from_bytes(day, bytes.fromhex(value)) for day, value in values.items()}
+            for doctor_id, values in cached.items()
+        }
+
+    start = datetime.combine(first, datetime.min.time())
+    end = start + timedelta(days=args.days)
+
+    def merge() -> List:
+        return earliest_slots(bitmaps, start, end, 30, args.limit)
+
+    print(f"{args.doctors} doctors, {args.days} days, {args.limit} slots, {args.runs} runs")
+    print(f"{'stage':<8}{'mean ms':>10}{'p95 ms':>10}")
+    for name, work in (("build", build), ("decode", decode), ("merge", merge)):
+        timings = sorted(timed(args.runs, work))
+        print(f"{name:<8}{statistics.mean(timings):>10.2f}{timings[int(len(timings) * 0.95) - 1]:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--doctors", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
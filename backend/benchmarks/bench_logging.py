@@ -0,0 +1,136 @@
+"""
+Request logging overhead benchmark
+
+Measures the time the request path spends in logging calls, comparing the
+previous setup (two f-string log lines per request written synchronously
+through RotatingFileHandlers with a json.dumps formatter) against the
+queue-based pipeline in app.utils.logger with one sampled access line.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_logging --requests 20000
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+from app.core.middleware import LoggingMiddleware
+from app.utils.logger import JSONFormatter, NonBlockingQueueHandler
+
+class LegacyJSONFormatter(logging.Formatter):
+    """Previous JSONFormatter, encoding with the stdlib json module"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_data = {
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno
+        }
+        if record.exc_info:
+            log_data["exception"] = {
+                "type": record.exc_info[0].__name__,
+                "message": str(record.exc_info[1]),
+                "traceback": traceback.format_exception(*record.exc_info)
+            }
+        return json.dumps(log_data)
+
+def build_handlers(directory: Path, formatter: logging.Formatter):
+    file_handler = logging.handlers.RotatingFileHandler(
+        directory / "app.log", maxBytes=10485760, backupCount=5, encoding="utf-8"
+    )
+    file_handler.setFormatter(formatter)
+    error_handler = logging.handlers.RotatingFileHandler(
+        directory / "error.log", maxBytes=10485760, backupCount=5, encoding="utf-8"
+    )
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(open(os.devnull, "w"))
+    console_handler.setFormatter(
+        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+    return [file_handler, error_handler, console_handler]
+
+def isolated_logger(name: str) -> logging.Logger:
+    bench_logger = logging.getLogger(name)
+    bench_logger.handlers.clear()
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.propagate = False
+    return bench_logger
+
+def bench_legacy(directory: Path, requests: int) -> float:
+    bench_logger = isolated_logger("bench.legacy")
+    for handler in build_handlers(directory, LegacyJSONFormatter()):
+        bench_logger.addHandler(handler)
+
+    started = time.perf_counter()
+    for i in range(requests):
+        bench_logger.info(
+            f"Request: GET /api/v1/doctors/search "
+            f"from 10.0.0.{i % 255} - User-Agent: {'Mozilla/5.0'[:100]}"
+        )
+        bench_logger.info(
+            f"Response: 200 "
+            f"in {0.0123:.4f}s for GET /api/v1/doctors/search"
+        )
+    elapsed = time.perf_counter() - started
+
+    for handler in bench_logger.handlers:
+        handler.close()
+    return elapsed
+
+def bench_queue(directory: Path, requests: int, sample_rate: float) -> float:
+    bench_logger = isolated_logger("app.core.middleware")
+    log_queue: queue.Queue = queue.Queue(maxsize=requests + 1)
+    bench_logger.addHandler(NonBlockingQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(
+        log_queue, *build_handlers(directory, JSONFormatter()), respect_handler_level=True
+    )
+    listener.start()
+
+    middleware = LoggingMiddleware(app=None, sample_rate=sample_rate, slow_threshold=1.0)
+    started = time.perf_counter()
+    for i in range(requests):
+        scope = {
+            "method": "GET",
+            "path": "/api/v1/doctors/search",
+            "headers": [(b"user-agent", b"Mozilla/5.0")],
+            "client": (f"10.0.0.{i % 255}", 50000),
+        }
+        if middleware.should_log(200, 0.0123):
+            middleware.log_access(scope, 200, 0.0123)
+    elapsed = time.perf_counter() - started
+
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    return elapsed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "sync handlers, 2 lines/request": bench_legacy(Path(tmp), args.requests),
+            "queue pipeline, 1 line/request": bench_queue(Path(tmp), args.requests, 1.0),
+            "queue pipeline, 10% sampled": bench_queue(Path(tmp), args.requests, 0.1),
+        }
+
+    print(f"{'configuration':<34}{'us/request':>12}")
+    for name, elapsed in results.items():
+        print(f"{name:<34}{elapsed / args.requests * 1e6:>12.2f}")
+
+if __name__ == "__main__":
+    main()
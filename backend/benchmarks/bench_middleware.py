@@ -0,0 +1,242 @@
+"""
+Middleware stack benchmark
+
+Compares the pure ASGI middleware stack in app.core.middleware against the
+previous BaseHTTPMiddleware implementation on a trivial /health route.
+Requests are driven straight through the ASGI callable so the numbers only
+contain middleware and routing overhead.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_middleware --requests 20000
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from app.config.settings import settings
+from app.core.rate_limiter import RateLimitResult
+from app.core.middleware import (
+    SecurityHeadersMiddleware,
+    RateLimitMiddleware,
+    LoggingMiddleware,
+    CompressionMiddleware,
+)
+
+logger = logging.getLogger("app.core.middleware")
+
+class InMemoryRedis:
+    """Minimal async Redis stand-in so the benchmark measures middleware cost only"""
+
+    def __init__(self):
+        self.data: Dict[str, int] = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def setex(self, key, window, value):
+        self.data[key] = int(value)
+
+    async def incr(self, key):
+        self.data[key] = self.data.get(key, 0) + 1
+        return self.data[key]
+
+class InMemoryLimiter:
+    """RateLimiter stand-in with the same interface as app.core.rate_limiter"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    async def hit(self, key, limit, window, cost=1):
+        count = self.counts.get(key, 0) + cost
+        self.counts[key] = count
+        return RateLimitResult(
+            allowed=count <= limit,
+            limit=limit,
+            remaining=max(0, limit - count),
+            reset_after=window,
+            retry_after=0,
+        )
+
+# Previous BaseHTTPMiddleware implementation, kept here as the baseline
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        response.headers["Permissions-Policy"] = (
+            "geolocation=(), microphone=(), camera=(), "
+            "payment=(), usb=(), magnetometer=(), gyroscope=()"
+        )
+        response.headers["Strict-Transport-Security"] = (
+            "max-age=31536000; includeSubDomains; preload"
+        )
+        response.headers["Content-Security-Policy"] = (
+            "default-src 'self'; "
+            "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+            "style-src 'self' 'unsafe-inline'; "
+            "img-src 'self' data: https:; "
+            "font-src 'self'; "
+            "connect-src 'self'; "
+            "frame-ancestors 'none';"
+        )
+        return response
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, redis_client, limit: int, window: int):
+        super().__init__(app)
+        self.redis_client = redis_client
+        self.limit = limit
+        self.window = window
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        key = f"rate_limit:api:{request.client.host}"
+        current_count = await self.redis_client.get(key)
+        if current_count is None:
+            await self.redis_client.setex(key, self.window, 1)
+        else:
+            await self.redis_client.incr(key)
+        response = await call_next(request)
+        remaining = max(0, self.limit - int(await self.redis_client.get(key) or 0))
+        response.headers["X-RateLimit-Limit"] = str(self.limit)
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        response.headers["X-RateLimit-Reset"] = str(int(time.time()) + self.window)
+        return response
+
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        start_time = time.time()
+        logger.info(f"Request: {request.method} {request.url.path} from {request.client.host}")
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.info(f"Response: {response.status_code} in {process_time:.4f}s")
+        response.headers["X-Process-Time"] = str(process_time)
+        return response
+
+class LegacyCompressionMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        response = await call_next(request)
+        if "gzip" not in request.headers.get("Accept-Encoding", "").lower():
+            return response
+        if (
+            response.headers.get("Content-Type", "").startswith("application/json")
+            and hasattr(response, "body")
+            and len(response.body) > 1024
+        ):
+            body = gzip.compress(response.body)
+            response.headers["Content-Encoding"] = "gzip"
+            return Response(content=body, status_code=response.status_code,
+                             headers=response.headers)
+        return response
+
+async def health(request: Request) -> JSONResponse:
+    return JSONResponse({"status": "healthy", "timestamp": int(time.time()), "version": "1.0.0"})
+
+def build_legacy_stack(limit: int, window: int):
+    app = Starlette(routes=[Route("/health", health)])
+    app = LegacySecurityHeadersMiddleware(app)
+    app = LegacyRateLimitMiddleware(app, InMemoryRedis(), limit, window)
+    app = LegacyLoggingMiddleware(app)
+    return LegacyCompressionMiddleware(app)
+
+def build_asgi_stack():
+    app = Starlette(routes=[Route("/health", health)])
+    app = SecurityHeadersMiddleware(app, debug=False)
+    rate_limiter = RateLimitMiddleware(app)
+    rate_limiter.limiter = InMemoryLimiter()
+    app = LoggingMiddleware(rate_limiter)
+    return CompressionMiddleware(app)
+
+async def call_once(app, scope: dict) -> None:
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            # Block like a real server until the client disconnects
+            await asyncio.Event().wait()
+        request_sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(dict(scope), receive, send)
+
+async def run(app, total: int, concurrency: int) -> Dict[str, float]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/health",
+        "raw_path": b"/health",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"accept-encoding", b"gzip")],
+        "client": ("10.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    latencies: List[float] = []
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            start = time.perf_counter()
+            await call_once(app, scope)
+            latencies.append(time.perf_counter() - start)
+
+    # Warm up routing and code paths before measuring
+    for _ in range(200):
+        await call_once(app, scope)
+
+    per_worker = total // concurrency
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "req_per_s": len(latencies) / elapsed,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    # Keep the limiter on its normal code path without ever returning 429
+    limit = args.requests * 10
+    settings.RATE_LIMIT_REQUESTS = limit
+    results = {
+        "BaseHTTPMiddleware": asyncio.run(
+            run(build_legacy_stack(limit, 3600), args.requests, args.concurrency)
+        ),
+        "pure ASGI": asyncio.run(
+            run(build_asgi_stack(), args.requests, args.concurrency)
+        ),
+    }
+
+    print(f"{'stack':<20}{'p50 (ms)':>12}{'p99 (ms)':>12}{'req/s':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<20}{result['p50_ms']:>12.3f}"
+            f"{result['p99_ms']:>12.3f}{result['req_per_s']:>12.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
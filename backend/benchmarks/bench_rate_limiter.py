@@ -0,0 +1,123 @@
+"""
+Rate limiter Redis traffic benchmark
+
+Replays the same simulated traffic through the atomic RateLimiter and the
+HybridRateLimiter for several gunicorn-style workers sharing one Redis, and
+reports Redis commands, round trips and how closely the fleet-wide limit
+was enforced for the hottest client.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_rate_limiter --workers 4 --clients 500
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+from typing import Dict, List
+
+from app.core.rate_limiter import HybridRateLimiter, RateLimiter
+
+class CountingRedis:
+    """In-memory Redis stand-in that counts commands and round trips"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.commands = 0
+        self.round_trips = 0
+
+    async def evalsha(self, sha, numkeys, key, limit, window, cost, *args):
+        # Fixed-window approximation of the Lua script; only traffic is measured
+        self.commands += 1
+        self.round_trips += 1
+        count = self.counters.get(key, 0)
+        allowed = count + cost <= limit
+        if allowed:
+            count += cost
+            self.counters[key] = count
+        return [int(allowed), limit - count, window, 0 if allowed else window]
+
+    def pipeline(self, transaction=True):
+        return CountingPipeline(self)
+
+class CountingPipeline:
+    def __init__(self, redis: CountingRedis):
+        self.redis = redis
+        self.ops: List[tuple] = []
+
+    def incrby(self, key, amount):
+        self.ops.append(("incrby", key, amount))
+
+    def expire(self, key, seconds):
+        self.ops.append(("expire", key, seconds))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        self.redis.commands += len(self.ops)
+        results = []
+        for op, key, value in self.ops:
+            if op == "incrby":
+                self.redis.counters[key] = self.redis.counters.get(key, 0) + value
+                results.append(self.redis.counters[key])
+            else:
+                results.append(True)
+        return results
+
+def build_traffic(clients: int, requests: int, seed: int) -> List[str]:
+    """Zipf-like client distribution: a few hot clients, a long tail"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(clients)]
+    ips = [f"10.0.{rank // 256}.{rank % 256}" for rank in range(clients)]
+    return rng.choices(ips, weights=weights, k=requests)
+
+async def replay(limiters, traffic: List[str], limit: int, window: int, ticks: int):
+    """Spread traffic round-robin over workers, syncing hybrid limiters each tick"""
+    admitted = Counter()
+    per_tick = max(1, len(traffic) // ticks)
+    for index, ip in enumerate(traffic):
+        limiter = limiters[index % len(limiters)]
+        result = await limiter.hit(f"rate_limit:api:{ip}", limit, window)
+        if result.allowed:
+            admitted[ip] += 1
+        if (index + 1) % per_tick == 0:
+            for worker in limiters:
+                if isinstance(worker, HybridRateLimiter):
+                    await worker.flush()
+    for worker in limiters:
+        if isinstance(worker, HybridRateLimiter):
+            await worker.close()
+    return admitted
+
+async def main_async(args) -> None:
+    traffic = build_traffic(args.clients, args.requests, args.seed)
+    hottest = Counter(traffic).most_common(1)[0][0]
+
+    print(f"{'mode':<10}{'commands':>12}{'round trips':>14}{'cmd/request':>14}{'hot client admitted':>22}")
+    for mode in ("redis", "hybrid"):
+        redis = CountingRedis()
+        if mode == "redis":
+            limiters = [RateLimiter(redis, "sliding_window") for _ in range(args.workers)]
+        else:
+            limiters = [
+                HybridRateLimiter(redis, sync_interval=3600, sync_threshold=args.threshold, min_limit=0)
+                for _ in range(args.workers)
+            ]
+        admitted = await replay(limiters, traffic, args.limit, 3600, args.ticks)
+        print(
+            f"{mode:<10}{redis.commands:>12}{redis.round_trips:>14}"
+            f"{redis.commands / len(traffic):>14.3f}"
+            f"{admitted[hottest]:>16} / {args.limit}"
+        )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--ticks", type=int, default=100, help="simulated sync intervals")
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Query replay and index usage report
+
+Runs representative doctor, hospital and medication searches and the
+follow-up satisfaction query through the real service functions against the
+configured database, EXPLAINs every statement they issue and reports which
+indexes each plan used and which tables it still scanned sequentially. Point
+it at a staging copy with production-like data: on a near-empty database the
+planner prefers sequential scans whatever indexes exist.
+
+Usage (from the backend directory):
+    python -m benchmarks.replay_queries
+    python -m benchmarks.replay_queries --analyze --json
+"""
+import argparse
+import asyncio
+import json
+import uuid
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.database import AsyncSessionLocal, engine
+from app.schemas.doctor import DoctorSearchParams, GeoLocation, HospitalSearchParams
+from app.services.follow_up_service import calculate_patient_satisfaction
+from app.services.geo_service import search_doctors, search_hospitals
+from app.services.medication_service import MedicationService
+
+CAIRO = GeoLocation(latitude=30.0444, longitude=31.2357)
+
+Scenario = Callable[[AsyncSession], Awaitable[Any]]
+
+def medication_search(**filters) -> Scenario:
+    async def run(db: AsyncSession):
+        return await MedicationService(db, None, None).search_medications(**filters)
+    return run
+
+SCENARIOS: Dict[str, Scenario] = {
+    "doctors by specialization": lambda db: search_doctors(
+        db, DoctorSearchParams(specialization="cardiology")
+    ),
+    "doctors by language and insurance": lambda db: search_doctors(
+        db, DoctorSearchParams(language="ar", insurance_provider="AXA")
+    ),
+    "doctors by name": lambda db: search_doctors(db, DoctorSearchParams(query="ahmed")),
+    "doctors near a point": lambda db: search_doctors(
+        db, DoctorSearchParams(location=CAIRO, radius_km=10)
+    ),
+    "hospitals by name": lambda db: search_hospitals(db, HospitalSearchParams(query="general")),
+    "hospitals by specialty": lambda db: search_hospitals(
+        db, HospitalSearchParams(specialty="cardiology")
+    ),
+    "hospitals near a point": lambda db: search_hospitals(
+        db, HospitalSearchParams(location=CAIRO, radius_km=25)
+    ),
+    "medications by name": medication_search(query="para", with_total=True),
+    "patient satisfaction": lambda db: calculate_patient_satisfaction(db, uuid.UUID(int=1)),
+}
+
+_captured: ContextVar[Optional[List[Tuple[str, Any]]]] = ContextVar("captured", default=None)
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def capture_statement(conn, cursor, statement, parameters, context, executemany):
+    captured = _captured.get()
+    if captured is not None and not statement.lstrip().upper().startswith("EXPLAIN"):
+        captured.append((statement, parameters))
+
+def plan_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+def summarize_plan(plan: dict) -> dict:
+    """Indexes used and tables scanned sequentially by one EXPLAIN (FORMAT JSON) plan"""
+    nodes = list(plan_nodes(plan["Plan"]))
+    summary = {
+        "indexes": sorted({node["Index Name"] for node in nodes if "Index Name" in node}),
+        "seq_scans": sorted({
+            node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"
+        }),
+        "total_cost": plan["Plan"]["Total Cost"],
+        "estimated_rows": plan["Plan"]["Plan Rows"],
+    }
+    if "Execution Time" in plan:
+        summary["execution_ms"] = plan["Execution Time"]
+    return summary
+
+async def explain(statement: str, parameters: Any, analyze: bool) -> dict:
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    async with engine.connect() as conn:
+        # ANALYZE runs the statement; never keep what it did
+        async with conn.begin() as transaction:
+            result = await conn.exec_driver_sql(f"EXPLAIN ({options}) {statement}", parameters)
+            plan = result.scalar()
+            await transaction.rollback()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return summarize_plan(plan[0])
+
+async def replay(name: str, scenario: Scenario, analyze: bool) -> List[dict]:
+    captured: List[Tuple[str, Any]] = []
+    token = _captured.set(captured)
+    try:
+        async with AsyncSessionLocal() as db:
+            await scenario(db)
+            await db.rollback()
+    finally:
+        _captured.reset(token)
+
+    reports = []
+    for statement, parameters in captured:
+        report = await explain(statement, parameters, analyze)
+        report["scenario"] = name
+        report["statement"] = " ".join(statement.split())
+        reports.append(report)
+    return reports
+
+def print_report(reports: List[dict]) -> None:
+    for report in reports:
+        timing = f"{report['execution_ms']:.2f} ms" if "execution_ms" in report else f"cost {report['total_cost']:.0f}"
+        print(f"{report['scenario']} ({timing}, ~{report['estimated_rows']} rows)")
+        print(f"  {report['statement'][:160]}")
+        print(f"  indexes:   {', '.join(report['indexes']) or '-'}")
+        print(f"  seq scans: {', '.join(report['seq_scans']) or '-'}")
+    unindexed = sorted({report["scenario"] for report in reports if report["seq_scans"]})
+    if unindexed:
+        print(f"\nStill scanning sequentially: {', '.join(unindexed)}")
+
+async def main(selected: List[str], analyze: bool, as_json: bool) -> None:
+    reports = []
+    for name in selected:
+        reports.extend(await replay(name, SCENARIOS[name], analyze))
+    await engine.dispose()
+
+    if as_json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_report(reports)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="replay only this scenario (repeatable)")
+    parser.add_argument("--analyze", action="store_true",
+                        help="EXPLAIN ANALYZE: run the statements and report real timings")
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    args = parser.parse_args()
+    asyncio.run(main(args.scenario or list(SCENARIOS), args.analyze, args.json))
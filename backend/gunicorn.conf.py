@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration
+"""
+import os
+import shutil
+
+bind = "0.0.0.0:8000"
+workers = int(os.getenv("WORKERS_COUNT", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+def on_starting(server):
+    """Start every deployment with an empty Prometheus multiprocess directory"""
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    """Stop reporting live gauges of a worker that exited"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,244 @@
+"""Search and analytics indexes
+
+Revision ID: 20261016_0002
+Revises: 20240318_0001
+Create Date: 2026-10-16 00:02:00.000000
+
+GIN indexes for the ARRAY filters of the doctor/hospital search (`@>`), the
+JSONB key lookups on interactions (`?`), pg_trgm indexes for the
+`ilike('%q%')` text search and GiST indexes for the radius search on
+clinic/hospital locations (`ST_DWithin` on geography).
+
+The initial schema predates the search: it has no doctor_clinics or
+interactions table and none of the doctor/hospital columns the search filters
+on. They are created first (columns are added nullable, existing rows have no
+values for them); `location` is generated from latitude/longitude. A database
+that still lacks an indexed column afterwards fails the migration instead of
+silently going without the index.
+
+Indexes are built CONCURRENTLY so the tables stay writable, which has to
+happen outside the migration transaction. An index that already exists (a
+rerun after a failed build) is left alone.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from geoalchemy2 import Geometry
+
+# revision identifiers, used by Alembic.
+revision = '20261016_0002'
+down_revision = '20240318_0001'
+branch_labels = None
+depends_on = None
+
+LOCATION = sa.Computed('ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)', persisted=True)
+
+CONSULTATION_TYPE = postgresql.ENUM(
+    'IN_PERSON', 'VIDEO', 'CHAT', 'HOME_VISIT', name='consultationtype', create_type=False
+)
+
+
+def location_column() -> sa.Column:
+    return sa.Column('location', Geometry('POINT', srid=4326, spatial_index=False), LOCATION)
+
+
+# columns of the search filters missing from the initial schema
+NEW_COLUMNS = {
+    'doctors': lambda: [
+        sa.Column('first_name', sa.String(100)),
+        sa.Column('last_name', sa.String(100)),
+        sa.Column('gender', sa.String(20)),
+        sa.Column('languages', postgresql.ARRAY(sa.String)),
+        sa.Column('specializations', postgresql.ARRAY(sa.String)),
+        sa.Column('consultation_types', postgresql.ARRAY(CONSULTATION_TYPE)),
+        sa.Column('consultation_fees', sa.JSON),
+        sa.Column('insurance_providers', postgresql.ARRAY(sa.String)),
+    ],
+    'hospitals': lambda: [
+        sa.Column('type', sa.String(50)),
+        sa.Column('city', sa.String(100)),
+        sa.Column('emergency_phone', sa.String(20)),
+        sa.Column('departments', postgresql.ARRAY(sa.String)),
+        sa.Column('specialties', postgresql.ARRAY(sa.String)),
+        sa.Column('insurance_providers', postgresql.ARRAY(sa.String)),
+        sa.Column('rating', sa.Float, server_default='0'),
+        location_column(),
+    ],
+    'medications': lambda: [
+        sa.Column('brand_name', sa.String(255)),
+    ],
+}
+
+# (index name, table, column)
+GIN_INDEXES = [
+    ('ix_doctors_specializations_gin', 'doctors', 'specializations'),
+    ('ix_doctors_languages_gin', 'doctors', 'languages'),
+    ('ix_doctors_insurance_providers_gin', 'doctors', 'insurance_providers'),
+    ('ix_doctors_consultation_types_gin', 'doctors', 'consultation_types'),
+    ('ix_hospitals_specialties_gin', 'hospitals', 'specialties'),
+    ('ix_hospitals_departments_gin', 'hospitals', 'departments'),
+    ('ix_hospitals_insurance_providers_gin', 'hospitals', 'insurance_providers'),
+    ('ix_interactions_metadata_gin', 'interactions', 'metadata'),
+]
+
+TRGM_INDEXES = [
+    ('ix_doctors_first_name_trgm', 'doctors', 'first_name'),
+    ('ix_doctors_last_name_trgm', 'doctors', 'last_name'),
+    ('ix_doctors_bio_trgm', 'doctors', 'bio'),
+    ('ix_hospitals_name_trgm', 'hospitals', 'name'),
+    ('ix_medications_name_trgm', 'medications', 'name'),
+    ('ix_medications_generic_name_trgm', 'medications', 'generic_name'),
+    ('ix_medications_brand_name_trgm', 'medications', 'brand_name'),
+    ('ix_medications_description_trgm', 'medications', 'description'),
+]
+
+GIST_INDEXES = [
+    ('ix_doctor_clinics_location_gist', 'doctor_clinics', 'location'),
+    ('ix_hospitals_location_gist', 'hospitals', 'location'),
+]
+
+
+def existing_columns() -> dict:
+    inspector = sa.inspect(op.get_bind())
+    return {
+        table: {column['name'] for column in inspector.get_columns(table)}
+        for table in inspector.get_table_names()
+    }
+
+
+def existing_indexes() -> set:
+    inspector = sa.inspect(op.get_bind())
+    return {
+        index['name']
+        for table in inspector.get_table_names()
+        for index in inspector.get_indexes(table)
+    }
+
+
+def create_search_tables(tables: set) -> None:
+    if 'doctor_clinics' not in tables:
+        op.create_table(
+            'doctor_clinics',
+            sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column('doctor_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('name', sa.String(255), nullable=False),
+            sa.Column('branch', sa.String(100)),
+            sa.Column('address', sa.Text, nullable=False),
+            sa.Column('city', sa.String(100), nullable=False),
+            sa.Column('state', sa.String(100), nullable=False),
+            sa.Column('country', sa.String(100), nullable=False),
+            sa.Column('postal_code', sa.String(20)),
+            sa.Column('latitude', sa.Float, nullable=False),
+            sa.Column('longitude', sa.Float, nullable=False),
+            location_column(),
+            sa.Column('phone', sa.String(20), nullable=False),
+            sa.Column('email', sa.String(255)),
+            sa.Column('website', sa.String(255)),
+            sa.Column('working_hours', sa.JSON, nullable=False),
+            sa.Column('breaks', sa.JSON),
+            sa.Column('facilities', postgresql.ARRAY(sa.String)),
+            sa.Column('services', postgresql.ARRAY(sa.String)),
+            sa.Column('payment_methods', postgresql.ARRAY(sa.String), nullable=False),
+            sa.Column('insurance_accepted', sa.Boolean(), default=True),
+            sa.Column('images', postgresql.ARRAY(sa.String)),
+            sa.Column('virtual_tour', sa.String(255)),
+            sa.Column('is_primary', sa.Boolean(), default=False),
+            sa.Column('is_active', sa.Boolean(), default=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+            sa.Column('updated_at', sa.DateTime(timezone=True), onupdate=sa.text('now()')),
+            sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id'], ondelete='CASCADE')
+        )
+
+    if 'interactions' not in tables:
+        op.create_table(
+            'interactions',
+            sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column('type', sa.String, nullable=False),
+            sa.Column('title', sa.String, nullable=False),
+            sa.Column('description', sa.String),
+            sa.Column('metadata', postgresql.JSONB),
+            sa.Column('timestamp', sa.DateTime, nullable=False),
+            sa.Column('status', sa.String, nullable=False),
+            sa.Column('importance', sa.Integer, nullable=False),
+            sa.Column('requires_action', sa.Boolean(), default=False),
+            sa.Column('action_by', sa.DateTime),
+            sa.Column('patient_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('doctor_id', postgresql.UUID(as_uuid=True)),
+            sa.Column('reference_id', postgresql.UUID(as_uuid=True)),
+            sa.Column('reference_type', sa.String),
+            sa.Column('created_at', sa.DateTime),
+            sa.Column('updated_at', sa.DateTime),
+            sa.ForeignKeyConstraint(['patient_id'], ['users.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['doctor_id'], ['users.id'])
+        )
+        op.create_index('ix_interactions_patient_timestamp', 'interactions', ['patient_id', 'timestamp'])
+        op.create_index('ix_interactions_doctor_timestamp', 'interactions', ['doctor_id', 'timestamp'])
+        op.create_index('ix_interactions_reference', 'interactions', ['reference_id', 'reference_type'])
+        op.create_index('ix_interactions_type_status', 'interactions', ['type', 'status'])
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+    CONSULTATION_TYPE.create(op.get_bind(), checkfirst=True)
+
+    columns = existing_columns()
+    for table, new_columns in NEW_COLUMNS.items():
+        for column in new_columns():
+            if column.name not in columns[table]:
+                op.add_column(table, column)
+    create_search_tables(set(columns))
+
+    columns = existing_columns()
+    missing = [
+        f'{table}.{column}'
+        for _, table, column in GIN_INDEXES + TRGM_INDEXES + GIST_INDEXES
+        if column not in columns.get(table, ())
+    ]
+    if missing:
+        raise RuntimeError(f"Cannot build the search indexes, missing columns: {', '.join(missing)}")
+
+    indexes = existing_indexes()
+
+    with op.get_context().autocommit_block():
+        for name, table, column in GIN_INDEXES:
+            if name not in indexes:
+                op.create_index(
+                    name, table, [column],
+                    postgresql_using='gin',
+                    postgresql_concurrently=True,
+                )
+
+        for name, table, column in TRGM_INDEXES:
+            if name not in indexes:
+                op.create_index(
+                    name, table, [column],
+                    postgresql_using='gin',
+                    postgresql_ops={column: 'gin_trgm_ops'},
+                    postgresql_concurrently=True,
+                )
+
+        # the searches compare distances as geography
+        for name, table, column in GIST_INDEXES:
+            if name not in indexes:
+                op.create_index(
+                    name, table, [sa.text(f'({column}::geography)')],
+                    postgresql_using='gist',
+                    postgresql_concurrently=True,
+                )
+
+
+def downgrade() -> None:
+    indexes = existing_indexes()
+
+    with op.get_context().autocommit_block():
+        for name, table, _ in GIN_INDEXES + TRGM_INDEXES + GIST_INDEXES:
+            if name in indexes:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+    op.drop_table('interactions')
+    op.drop_table('doctor_clinics')
+    for table, new_columns in NEW_COLUMNS.items():
+        for column in new_columns():
+            op.drop_column(table, column.name)
+    CONSULTATION_TYPE.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,64 @@
+"""Appointment overlap exclusion constraint
+
+Revision ID: 20261016_0004
+Revises: 20261016_0003
+Create Date: 2026-10-16 00:04:00.000000
+
+A generated `time_range` column (tsrange [scheduled_at, scheduled_at +
+duration)) and a GiST exclusion constraint on (doctor_id =, time_range &&)
+for PENDING and CONFIRMED appointments, so PostgreSQL rejects a second
+booking of the same doctor time with SQLSTATE 23P01 however many requests
+race for it. btree_gist provides the `=` operator class for doctor_id.
+
+Adding the stored column rewrites the table and the constraint cannot be
+built concurrently, so both hold an exclusive lock on appointments for the
+duration of the migration. Existing overlapping active appointments would
+make the constraint fail; they are reported and have to be resolved first.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261016_0004'
+down_revision = '20261016_0003'
+branch_labels = None
+depends_on = None
+
+CONSTRAINT = 'ex_appointments_doctor_time'
+ACTIVE_STATUSES = "('PENDING', 'CONFIRMED')"
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    columns = {c['name']: c for c in sa.inspect(bind).get_columns('appointments')}
+    # timestamptz + interval is not immutable; the initial schema created
+    # scheduled_at with a time zone, the models store naive UTC
+    start = 'scheduled_at'
+    if getattr(columns['scheduled_at']['type'], 'timezone', False):
+        start = "(scheduled_at AT TIME ZONE 'UTC')"
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute(
+        f"ALTER TABLE appointments ADD COLUMN time_range tsrange "
+        f"GENERATED ALWAYS AS (tsrange({start}, {start} + duration_minutes * interval '1 minute', '[)')) STORED"
+    )
+
+    overlaps = bind.execute(sa.text(
+        f"SELECT count(*) FROM appointments a JOIN appointments b "
+        f"ON a.doctor_id = b.doctor_id AND a.id < b.id AND a.time_range && b.time_range "
+        f"WHERE a.status IN {ACTIVE_STATUSES} AND b.status IN {ACTIVE_STATUSES}"
+    )).scalar()
+    if overlaps:
+        raise RuntimeError(
+            f"{overlaps} pairs of active appointments overlap; "
+            f"cancel or reschedule them before adding {CONSTRAINT}"
+        )
+
+    op.execute(
+        f"ALTER TABLE appointments ADD CONSTRAINT {CONSTRAINT} "
+        f"EXCLUDE USING gist (doctor_id WITH =, time_range WITH &&) "
+        f"WHERE (status IN {ACTIVE_STATUSES})"
+    )
+
+def downgrade() -> None:
+    op.execute(f'ALTER TABLE appointments DROP CONSTRAINT IF EXISTS {CONSTRAINT}')
+    op.drop_column('appointments', 'time_range')
@@ -0,0 +1,53 @@
+"""Reminder dispatch indexes
+
+Revision ID: 20261016_0005
+Revises: 20261016_0004
+Create Date: 2026-10-16 00:05:00.000000
+
+The reminder dispatcher claims due reminders ordered by their scheduled time
+and filtered on status. appointment_reminders declares its (scheduled_time,
+status) index in the model; follow_up_reminders gets the matching
+(scheduled_at, status) one. Both are built CONCURRENTLY and skipped when the
+table is missing from an older schema or the index already exists.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261016_0005'
+down_revision = '20261016_0004'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_appointment_reminders_scheduled', 'appointment_reminders', ['scheduled_time', 'status']),
+    ('ix_follow_up_reminders_scheduled', 'follow_up_reminders', ['scheduled_at', 'status']),
+]
+
+
+def existing_indexes() -> dict:
+    inspector = sa.inspect(op.get_bind())
+    return {
+        table: {index['name'] for index in inspector.get_indexes(table)}
+        for table in inspector.get_table_names()
+    }
+
+
+def upgrade() -> None:
+    indexes = existing_indexes()
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if table in indexes and name not in indexes[table]:
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    indexes = existing_indexes()
+
+    with op.get_context().autocommit_block():
+        # the appointment_reminders index belongs to the model
+        for name, table, _ in INDEXES[1:]:
+            if name in indexes.get(table, ()):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,24 @@
+"""Outbox event lease
+
+Revision ID: 20261016_0006
+Revises: 20261016_0005
+Create Date: 2026-10-16 00:06:00.000000
+
+The outbox relay no longer holds row locks while handlers call external
+services: it leases the events it claims until locked_until and records the
+outcomes in a separate transaction. Events without a lease are free to claim.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261016_0006'
+down_revision = '20261016_0005'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('outbox_events', sa.Column('locked_until', sa.DateTime()))
+
+def downgrade() -> None:
+    op.drop_column('outbox_events', 'locked_until')
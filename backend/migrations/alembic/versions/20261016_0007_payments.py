@@ -0,0 +1,46 @@
+"""Payments
+
+Revision ID: 20261016_0007
+Revises: 20261016_0006
+Create Date: 2026-10-16 00:07:00.000000
+
+The payments table PaymentService records Stripe intents, outcomes and
+refunds in, and the Stripe customer id it keeps on each user. The outbox
+payment.create and payment.refund handlers go through both.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '20261016_0007'
+down_revision = '20261016_0006'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('stripe_customer_id', sa.String(255)))
+    op.create_table(
+        'payments',
+        sa.Column('id', sa.String(255), primary_key=True),
+        sa.Column('user_id', sa.String(36), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('currency', sa.String(3), nullable=False),
+        sa.Column('payment_type', sa.String(20), nullable=False),
+        sa.Column('status', sa.String(30), nullable=False),
+        sa.Column('charge_id', sa.String(255)),
+        sa.Column('metadata', postgresql.JSONB),
+        sa.Column('error', sa.Text()),
+        sa.Column('refund_amount', sa.Float()),
+        sa.Column('refund_reason', sa.String(100)),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()')),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()')),
+        sa.Column('completed_at', sa.DateTime()),
+        sa.Column('refunded_at', sa.DateTime()),
+    )
+    op.create_index('ix_payments_user_created', 'payments', ['user_id', 'created_at', 'id'])
+
+def downgrade() -> None:
+    op.drop_index('ix_payments_user_created', table_name='payments')
+    op.drop_table('payments')
+    op.drop_column('users', 'stripe_customer_id')
@@ -0,0 +1,34 @@
+"""FCM device tokens
+
+Revision ID: 20261016_0008
+Revises: 20261016_0007
+Create Date: 2026-10-16 00:08:00.000000
+
+The device tokens NotificationService sends push notifications to, which the
+reminder dispatcher's push channel goes through. Tokens Firebase reports as
+unregistered are deactivated rather than deleted.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261016_0008'
+down_revision = '20261016_0007'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'fcm_tokens',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('user_id', sa.String(36), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('token', sa.String(255), nullable=False, unique=True),
+        sa.Column('is_active', sa.Boolean(), server_default=sa.true()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()')),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()')),
+    )
+    op.create_index('ix_fcm_tokens_user_id', 'fcm_tokens', ['user_id'])
+
+def downgrade() -> None:
+    op.drop_index('ix_fcm_tokens_user_id', table_name='fcm_tokens')
+    op.drop_table('fcm_tokens')